@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步运行时
+后台常驻一个事件循环线程，生成器的异步接口都在该事件循环中执行；
+同步接口通过 run_sync 提交协程并等待结果，超时或被取消时取消对应的任务（关闭连接），
+调用方的上下文变量（如大模型调用记录的收集器）会带到任务中，
+异步HTTP客户端绑定在同一个事件循环上，可以在多次请求之间复用连接
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+from llm_metrics import mark_enqueued
+
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+def get_event_loop():
+    """获取（必要时启动）后台事件循环"""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or not _thread.is_alive():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="llm-async-loop", daemon=True)
+            _thread.start()
+        return _loop
+
+def run_sync(coro, timeout=None, cancel_event=None):
+    """
+    在后台事件循环中执行协程并等待结果
+
+    Args:
+        coro: 协程对象
+        timeout: 超时时间（秒），None表示一直等待
+        cancel_event: 可选，threading.Event，被设置后取消任务
+
+    Returns:
+        协程的返回值（协程抛出的异常会原样抛出）
+
+    Raises:
+        TimeoutError: 等待超时（任务已被取消）
+        concurrent.futures.CancelledError: cancel_event 被设置（任务已被取消）
+        RuntimeError: 在事件循环线程内调用（会造成死锁）
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("不能在事件循环线程内调用 run_sync，请直接 await 异步接口")
+
+    # 在调用方上下文的副本中提交：任务继承调用方的上下文变量，并记录提交时间用于统计排队时间
+    context = contextvars.copy_context()
+    context.run(mark_enqueued)
+    future = context.run(asyncio.run_coroutine_threadsafe, coro, loop)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        wait_for = None
+        if cancel_event is not None:
+            wait_for = 0.05
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            wait_for = remaining if wait_for is None else min(wait_for, remaining)
+        try:
+            return future.result(timeout=wait_for)
+        except FutureTimeoutError:
+            if cancel_event is not None and cancel_event.is_set():
+                future.cancel()
+                raise CancelledError()
+            if deadline is not None and time.monotonic() >= deadline:
+                future.cancel()
+                raise TimeoutError(f"异步调用超时（>{timeout}秒）")
+
+if __name__ == '__main__':
+    async def slow(seconds):
+        try:
+            await asyncio.sleep(seconds)
+            return f"完成 {seconds} 秒"
+        except asyncio.CancelledError:
+            print("任务已取消")
+            raise
+
+    print(run_sync(slow(0.1)))
+    try:
+        run_sync(slow(5), timeout=0.2)
+    except TimeoutError as e:
+        print(f"超时: {e}")
+    time.sleep(0.1)
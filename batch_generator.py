@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量SQL生成
+离线批量任务中大量问题使用同一个数据库结构，逐条调用时每次都要重复发送完整结构。
+本模块把多个问题打包进一次请求，要求模型以JSON返回每个问题的SQL，再拆分回单条结果；
+每批的问题数按上下文窗口和输出长度自适应选择，只重试失败的问题
+"""
+
+import json
+import re
+import time
+from sql_extractor import extract_sql
+from token_counter import estimate_tokens
+
+# 截断或夹杂其他文字的响应中，逐项提取已完整的结果
+_ITEM_PATTERN = re.compile(r'\{\s*"id"\s*:\s*"?(\d+)"?\s*,\s*"sql"\s*:\s*("(?:[^"\\]|\\.)*")\s*\}')
+
+def create_batch_system_prompt(schema_description):
+    """创建批量生成的系统提示词（与单条生成的要求一致，输出改为JSON）"""
+    return f'''你是一个专业的SQL查询助手。请根据用户给出的多个自然语言查询需求，分别生成对应的MySQL SQL查询语句。
+
+数据库结构信息：
+{schema_description}
+
+重要要求：
+1. 只生成SELECT查询语句，不要生成INSERT、UPDATE、DELETE等修改数据的语句
+2. 确保生成的SQL语法正确，适用于MySQL数据库
+3. 使用反引号包围表名和字段名以避免关键字冲突
+4. 如果查询涉及多表，请正确使用JOIN语句
+5. 各个问题相互独立，不要互相引用
+6. 以JSON对象返回，格式为 {{"results": [{{"id": 问题编号, "sql": "SQL语句"}}]}}，每个问题对应一项，不要包含其他文字
+7. 如果无法理解某个问题或数据库中没有相关表，该问题的sql填写"ERROR: 无法生成对应的SQL查询"'''
+
+def create_batch_user_content(items):
+    """
+    创建批量问题内容
+
+    Args:
+        items: [(id, question), ...]
+    """
+    return json.dumps([{'id': item_id, 'question': question} for item_id, question in items], ensure_ascii=False)
+
+def parse_batch_response(text):
+    """
+    解析批量生成的响应
+
+    Args:
+        text: 模型原始响应
+
+    Returns:
+        dict: {id: sql}，无法解析的项不包含在内
+    """
+    text = (text or "").strip()
+    start = min([pos for pos in (text.find('{'), text.find('[')) if pos != -1], default=-1)
+    if start != -1:
+        try:
+            data, _ = json.JSONDecoder().raw_decode(text[start:])
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            data = data.get('results', data)
+        if isinstance(data, list):
+            answers = {}
+            for item in data:
+                if isinstance(item, dict) and 'id' in item and isinstance(item.get('sql'), str):
+                    try:
+                        answers[int(item['id'])] = item['sql']
+                    except (TypeError, ValueError):
+                        continue
+            return answers
+        if isinstance(data, dict):
+            # 也接受 {"1": "SELECT ...", ...} 这种形式
+            return {int(key): value for key, value in data.items()
+                    if str(key).isdigit() and isinstance(value, str)}
+
+    # JSON不完整（如输出被截断）时保留已完整的项
+    return {int(item_id): json.loads(sql) for item_id, sql in _ITEM_PATTERN.findall(text)}
+
+class BatchSQLGenerator:
+    """把多个问题打包进一次请求的批量SQL生成器"""
+
+    def __init__(self, generator, context_tokens=8192, max_batch=20, max_output_tokens=4096,
+                 answer_tokens=120, max_rounds=3, reserve_tokens=256):
+        """
+        Args:
+            generator: SQL生成器，需实现 complete(messages, max_tokens, json_mode)
+            context_tokens: 模型上下文窗口大小（估算token数）
+            max_batch: 每批最多的问题数
+            max_output_tokens: 单次请求最多生成的token数
+            answer_tokens: 每个问题的预估输出token数，运行中根据实际结果调整
+            max_rounds: 最多的生成轮数（第一轮之后只重试失败的问题）
+            reserve_tokens: 为格式和误差预留的token数
+        """
+        self.generator = generator
+        self.context_tokens = context_tokens
+        self.max_batch = max_batch
+        self.max_output_tokens = max_output_tokens
+        self.answer_tokens = answer_tokens
+        self.max_rounds = max_rounds
+        self.reserve_tokens = reserve_tokens
+
+        # 整批失败（如输出被截断）时减半，成功后逐步恢复
+        self.batch_limit = max_batch
+
+        self.questions = 0
+        self.calls = 0
+        self.failed_calls = 0
+        self.retried = 0
+        self.prompt_tokens = 0
+        self.single_prompt_tokens = 0
+        self.wall_time = 0.0
+
+    def _answer_cost(self):
+        """每个问题的预估输出token数（含JSON格式开销）"""
+        return int(self.answer_tokens * 1.5) + 20
+
+    def plan_batches(self, items, system_tokens):
+        """
+        按上下文窗口、输出长度和当前批大小上限分批
+
+        Args:
+            items: [(index, question), ...]
+            system_tokens: 系统提示词的估算token数
+
+        Returns:
+            list: 每批的 items 列表
+        """
+        input_budget = self.context_tokens - system_tokens - self.reserve_tokens
+        batches, current, used, output = [], [], 0, 0
+        for item in items:
+            cost = estimate_tokens(item[1]) + 10
+            answer = self._answer_cost()
+            if current and (len(current) >= self.batch_limit
+                            or used + cost + output + answer > input_budget
+                            or output + answer > self.max_output_tokens):
+                batches.append(current)
+                current, used, output = [], 0, 0
+            current.append(item)
+            used += cost
+            output += answer
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run_batch(self, batch, system_prompt):
+        """
+        发送一批问题
+
+        Returns:
+            dict: {index: sql}，整批失败时返回空字典
+        """
+        local = [(position + 1, question) for position, (_, question) in enumerate(batch)]
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": create_batch_user_content(local)},
+        ]
+        max_tokens = min(self.max_output_tokens, len(batch) * self._answer_cost() + 50)
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(messages[0]['content']) + estimate_tokens(messages[1]['content'])
+
+        try:
+            response = self.generator.complete(messages, max_tokens=max_tokens, json_mode=True)
+            answers = parse_batch_response(response)
+        except Exception as e:
+            print(f"⚠️ [Batch] 批量请求失败（{len(batch)}个问题）: {e}")
+            answers = {}
+
+        if not answers:
+            self.failed_calls += 1
+            self.batch_limit = max(1, self.batch_limit // 2)
+            print(f"⚠️ [Batch] 未能解析批量结果，每批问题数降为 {self.batch_limit}")
+            return {}
+
+        if len(answers) < len(batch) and len(batch) > 1:
+            # 部分结果缺失，通常是输出被截断
+            self.batch_limit = max(1, min(self.batch_limit, len(answers)))
+        elif self.batch_limit < self.max_batch:
+            self.batch_limit = min(self.max_batch, self.batch_limit + 2)
+
+        # 根据实际SQL长度调整每个问题的预估输出token数
+        lengths = [estimate_tokens(sql) for sql in answers.values()]
+        self.answer_tokens = int(0.7 * self.answer_tokens + 0.3 * (sum(lengths) / len(lengths)))
+
+        return {batch[local_id - 1][0]: sql for local_id, sql in answers.items() if 1 <= local_id <= len(batch)}
+
+    def generate_batch(self, questions, schema_description):
+        """
+        批量生成SQL
+
+        Args:
+            questions: 问题列表
+            schema_description: 所有问题共用的数据库结构描述
+
+        Returns:
+            list: 与questions一一对应的 (success: bool, sql_or_error: str)
+        """
+        start = time.perf_counter()
+        system_prompt = create_batch_system_prompt(schema_description)
+        system_tokens = estimate_tokens(system_prompt)
+        self.questions += len(questions)
+        self.single_prompt_tokens += sum(system_tokens + estimate_tokens(question) for question in questions)
+
+        results = [(False, "ERROR: 批量结果中缺少该问题")] * len(questions)
+        pending = list(enumerate(questions))
+
+        for round_number in range(1, self.max_rounds + 1):
+            if not pending:
+                break
+            if round_number > 1:
+                self.retried += len(pending)
+                print(f"🔁 [Batch] 第{round_number}轮，重试 {len(pending)} 个失败的问题")
+
+            batches = self.plan_batches(pending, system_tokens)
+            print(f"📦 [Batch] {len(pending)} 个问题分为 {len(batches)} 批（每批最多 {self.batch_limit} 个）")
+            failed = []
+            for batch in batches:
+                answers = self._run_batch(batch, system_prompt)
+                for index, question in batch:
+                    if index not in answers:
+                        failed.append((index, question))
+                        continue
+                    sql = extract_sql(answers[index])
+                    if sql.upper().startswith("SELECT"):
+                        results[index] = (True, sql)
+                    elif sql.startswith("ERROR:"):
+                        # 模型明确表示无法生成，重试也不会改变结果
+                        results[index] = (False, sql)
+                    else:
+                        results[index] = (False, "ERROR: 生成的不是SELECT查询语句")
+                        failed.append((index, question))
+            pending = failed
+
+        self.wall_time += time.perf_counter() - start
+        succeeded = sum(1 for success, _ in results if success)
+        print(f"✅ [Batch] 完成 {succeeded}/{len(questions)} 个问题，共 {self.calls} 次请求")
+        return results
+
+    def get_stats(self):
+        """获取批量生成统计（token数为估算值）"""
+        return {
+            'questions': self.questions,
+            'calls': self.calls,
+            'failed_calls': self.failed_calls,
+            'retried': self.retried,
+            'batch_limit': self.batch_limit,
+            'answer_tokens': self.answer_tokens,
+            'prompt_tokens': self.prompt_tokens,
+            'single_prompt_tokens': self.single_prompt_tokens,
+            'prompt_token_saving': round(1 - self.prompt_tokens / self.single_prompt_tokens, 3)
+            if self.single_prompt_tokens else 0.0,
+            'wall_time': round(self.wall_time, 2),
+        }
+
+if __name__ == '__main__':
+    from schema_formatter import _demo_snapshot, format_schema
+
+    class DemoGenerator:
+        def complete(self, messages, max_tokens=2048, json_mode=False):
+            items = json.loads(messages[-1]['content'])
+            return json.dumps({'results': [
+                {'id': item['id'], 'sql': f"SELECT COUNT(*) FROM `sys_user` -- {item['question']}"} for item in items
+            ]}, ensure_ascii=False)
+
+    questions = [f"统计第{i}个部门的用户数" for i in range(1, 101)]
+    schema = format_schema(_demo_snapshot(), 'compact')
+    batch = BatchSQLGenerator(DemoGenerator())
+    results = batch.generate_batch(questions, schema)
+    print(results[0])
+    print(batch.get_stats())
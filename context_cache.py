@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端上下文缓存
+数据库结构和生成要求组成的系统提示词在多次请求之间保持不变，
+可以缓存在模型服务端，之后的请求只发送对话内容。
+本模块按结构指纹管理缓存的生命周期（创建、续期、失效），
+并提供Gemini cachedContents接口的客户端和通义千问的显式缓存标记
+"""
+
+import threading
+import time
+from collections import OrderedDict
+import requests
+from generation_cache import schema_fingerprint
+from token_counter import estimate_tokens
+
+class ContextCacheManager:
+    """按结构指纹管理服务端缓存的生命周期"""
+
+    def __init__(self, create_fn, refresh_fn=None, delete_fn=None, ttl=3600, refresh_margin=300,
+                 max_entries=8, min_tokens=0, retry_after=600, name="ContextCache"):
+        """
+        Args:
+            create_fn: create_fn(content, ttl) -> handle，在服务端创建缓存，返回缓存标识
+            refresh_fn: 可选，refresh_fn(handle, ttl)，延长缓存有效期；为None时每次使用视为自动续期
+            delete_fn: 可选，delete_fn(handle)，删除服务端缓存
+            ttl: 缓存有效期（秒）
+            refresh_margin: 剩余有效期少于该值时续期（秒）
+            max_entries: 最多同时保留的缓存数，超出时删除最久未使用的缓存
+            min_tokens: 内容估算token数低于该值时不缓存（服务端通常有最小长度要求）
+            retry_after: 创建失败后，同一内容在该时间内不再尝试（秒）
+            name: 日志中显示的名称
+        """
+        self.create_fn = create_fn
+        self.refresh_fn = refresh_fn
+        self.delete_fn = delete_fn
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+        self.name = name
+
+        self._entries = OrderedDict()
+        self._failures = {}
+        # 正在创建缓存的内容指纹，避免并发请求重复创建
+        self._creating = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.creates = 0
+        self.refreshes = 0
+        self.invalidations = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def get(self, content, fingerprint=None):
+        """
+        获取内容对应的服务端缓存，不存在或即将过期时创建/续期
+
+        创建、续期和删除请求都在锁外进行，不会阻塞其他请求；同一内容正在创建时，
+        其他请求不重复创建，直接使用完整内容
+
+        Args:
+            content: 要缓存的内容（系统提示词）
+            fingerprint: 可选，内容指纹，默认根据内容计算
+
+        Returns:
+            缓存标识；内容太短或服务端不可用时返回None，调用方应直接发送完整内容
+        """
+        fingerprint = fingerprint or schema_fingerprint(content)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and entry['expire_at'] <= now:
+                # 已过期，服务端已自动删除
+                del self._entries[fingerprint]
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                refresh = entry['expire_at'] - now < self.refresh_margin and not entry['refreshing']
+                if refresh and self.refresh_fn is None:
+                    entry['expire_at'] = now + self.ttl
+                    refresh = False
+                elif refresh:
+                    entry['refreshing'] = True
+                handle = entry['handle']
+            else:
+                if fingerprint in self._creating or self._failures.get(fingerprint, 0) > now:
+                    return None
+                if self.min_tokens and estimate_tokens(content) < self.min_tokens:
+                    self.skipped += 1
+                    return None
+                self._creating.add(fingerprint)
+
+        if entry is not None:
+            if refresh:
+                # 续期期间缓存仍然有效，续期完成前直接使用
+                self._refresh(fingerprint, entry, now)
+            return handle
+
+        try:
+            handle = self.create_fn(content, self.ttl)
+        except Exception as e:
+            with self._lock:
+                self._creating.discard(fingerprint)
+                self.errors += 1
+                self._failures[fingerprint] = now + self.retry_after
+            print(f"⚠️ [{self.name}] 创建服务端缓存失败，暂时使用完整提示词: {e}")
+            return None
+
+        evicted = []
+        with self._lock:
+            self._creating.discard(fingerprint)
+            self.creates += 1
+            self._entries[fingerprint] = {'handle': handle, 'expire_at': now + self.ttl,
+                                          'created_at': now, 'refreshing': False}
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1])
+        print(f"🗄️ [{self.name}] 已创建服务端缓存 {handle}（有效期 {self.ttl} 秒）")
+
+        for entry in evicted:
+            self._delete(entry['handle'])
+        return handle
+
+    def _refresh(self, fingerprint, entry, now):
+        """延长缓存有效期（不持有锁时调用）"""
+        try:
+            self.refresh_fn(entry['handle'], self.ttl)
+        except Exception as e:
+            # 续期失败时丢弃该缓存，下次请求重新创建
+            with self._lock:
+                self.errors += 1
+                if self._entries.get(fingerprint) is entry:
+                    del self._entries[fingerprint]
+            print(f"⚠️ [{self.name}] 缓存续期失败: {e}")
+            return
+        with self._lock:
+            entry['expire_at'] = now + self.ttl
+            entry['refreshing'] = False
+            self.refreshes += 1
+
+    def _delete(self, handle):
+        """删除服务端缓存，失败时只记录日志（到期后服务端会自动删除）"""
+        if self.delete_fn is None:
+            return
+        try:
+            self.delete_fn(handle)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"⚠️ [{self.name}] 删除服务端缓存失败: {e}")
+
+    def invalidate(self, fingerprint=None):
+        """
+        使缓存失效（数据库结构变化时调用）
+
+        Args:
+            fingerprint: 要失效的内容指纹，为None时清除全部缓存
+        """
+        with self._lock:
+            if fingerprint is None:
+                entries = list(self._entries.values())
+                self._entries.clear()
+                self._failures.clear()
+            else:
+                entry = self._entries.pop(fingerprint, None)
+                entries = [entry] if entry else []
+            self.invalidations += len(entries)
+        for entry in entries:
+            self._delete(entry['handle'])
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'creating': len(self._creating),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'creates': self.creates,
+                'refreshes': self.refreshes,
+                'invalidations': self.invalidations,
+                'errors': self.errors,
+                'skipped_short': self.skipped,
+            }
+
+class GeminiCacheClient:
+    """Gemini cachedContents REST接口客户端"""
+
+    def __init__(self, api_key, model_name, base_url="https://generativelanguage.googleapis.com", timeout=10):
+        """
+        Args:
+            api_key: Gemini API Key
+            model_name: 模型名称，缓存只能被同一模型使用
+            base_url: 接口地址（测试时可指向本地模拟服务）
+            timeout: 请求超时时间（秒）
+        """
+        self.api_key = api_key
+        self.model_name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, **kwargs):
+        response = requests.request(
+            method, f"{self.base_url}/v1beta/{path}",
+            headers={'x-goog-api-key': self.api_key},
+            timeout=self.timeout, **kwargs
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response.json() if response.content else {}
+
+    def create(self, system_instruction, ttl):
+        """创建缓存，返回缓存名称（cachedContents/xxx）"""
+        data = self._request('POST', 'cachedContents', json={
+            'model': self.model_name,
+            'systemInstruction': {'parts': [{'text': system_instruction}]},
+            'ttl': f"{int(ttl)}s",
+        })
+        return data['name']
+
+    def refresh(self, name, ttl):
+        """延长缓存有效期"""
+        self._request('PATCH', name, params={'updateMask': 'ttl'}, json={'ttl': f"{int(ttl)}s"})
+
+    def delete(self, name):
+        """删除缓存"""
+        self._request('DELETE', name)
+
+def should_cache_full_schema(context_cache, full_tokens, max_tokens):
+    """
+    是否改用缓存在服务端的完整结构（不做结构检索）
+
+    完整结构需要达到缓存的最小长度，同时不超过 max_tokens，
+    否则每次请求都要发送（或首次上传）过大的结构，应继续按问题检索相关的表
+
+    Args:
+        context_cache: 生成器的 ContextCacheManager，未启用时为None
+        full_tokens: 完整结构的估算token数
+        max_tokens: 使用完整结构的token上限，0表示不使用完整结构
+
+    Returns:
+        bool
+    """
+    if context_cache is None or max_tokens <= 0:
+        return False
+    return context_cache.min_tokens <= full_tokens <= max_tokens
+
+def mark_cache_control(messages):
+    """
+    为系统消息加上通义千问显式缓存标记（cache_control），其余消息保持不变
+
+    Returns:
+        list: 新的消息列表
+    """
+    marked = []
+    for message in messages:
+        if message['role'] == 'system' and isinstance(message['content'], str):
+            message = {
+                'role': 'system',
+                'content': [{'type': 'text', 'text': message['content'], 'cache_control': {'type': 'ephemeral'}}]
+            }
+        marked.append(message)
+    return marked
+
+def to_gemini_contents(messages):
+    """把OpenAI格式的对话消息（不含系统消息）转换为Gemini的contents，合并相邻的同角色消息"""
+    contents = []
+    for message in messages:
+        if message['role'] == 'system':
+            continue
+        role = 'model' if message['role'] == 'assistant' else 'user'
+        if contents and contents[-1]['role'] == role:
+            contents[-1]['parts'].append(message['content'])
+        else:
+            contents.append({'role': role, 'parts': [message['content']]})
+    return contents
+
+if __name__ == '__main__':
+    created = []
+    manager = ContextCacheManager(
+        create_fn=lambda content, ttl: created.append(content) or f"cachedContents/demo{len(created)}",
+        ttl=60, name="Demo"
+    )
+    print(manager.get("数据库结构信息：..."))
+    print(manager.get("数据库结构信息：..."))
+    manager.invalidate()
+    print(manager.get_stats())
@@ -63,13 +63,42 @@ class ConversationManager:
         
         self.conversation_history.append(entry)
     
-    def get_context_for_prompt(self, schema_description: str, current_query: str) -> str:
+    def update_last_response(self, sql: str, success: bool, error_msg: Optional[str] = None):
+        """
+        更新最近一条助手响应（如SQL在执行前被本地修正或校验失败）
+        
+        Args:
+            sql: 最终的SQL语句
+            success: 是否成功
+            error_msg: 错误信息（如果有）
+        """
+        for entry in reversed(self.conversation_history):
+            if entry["role"] == "assistant":
+                entry.update(sql=sql, success=success, error=error_msg)
+                return
+        self.add_assistant_response(sql, success, error_msg)
+    
+    def get_last_successful_sql(self) -> Optional[str]:
+        """
+        获取最近一次成功生成的SQL
+        
+        Returns:
+            SQL语句，没有成功记录时返回None
+        """
+        for entry in reversed(self.conversation_history):
+            if entry["role"] == "assistant" and entry.get("success") and entry.get("sql"):
+                return entry["sql"]
+        return None
+    
+    def get_context_for_prompt(self, schema_description: str, current_query: str,
+                               examples: Optional[str] = None) -> str:
         """
         构建包含上下文的提示词
         
         Args:
             schema_description: 数据库结构描述
             current_query: 当前查询
+            examples: 可选，相似问题和SQL的示例文本，放在当前查询之前
             
         Returns:
             完整的提示词
@@ -101,17 +130,22 @@ class ConversationManager:
                 elif entry["role"] == "assistant" and entry.get("success"):
                     base_prompt += f"\n助手返回SQL: {entry['sql']}"
         
+        if examples:
+            base_prompt += f"\n\n{examples}"
+        
         base_prompt += f"\n\n当前用户查询: {current_query}\n\n请生成对应的SQL查询语句："
         
         return base_prompt
     
-    def get_messages_for_openai_format(self, schema_description: str, current_query: str) -> List[Dict]:
+    def get_messages_for_openai_format(self, schema_description: str, current_query: str,
+                                       examples: Optional[str] = None) -> List[Dict]:
         """
         构建OpenAI格式的messages数组（用于通义千问和Gemini）
         
         Args:
             schema_description: 数据库结构描述
             current_query: 当前查询
+            examples: 可选，相似问题和SQL的示例文本，放在当前查询之前
             
         Returns:
             messages数组
@@ -136,16 +170,34 @@ class ConversationManager:
         messages.append({"role": "system", "content": system_prompt})
         
         # 添加历史对话
-        recent_history = self.conversation_history[-8:]  # 最近4轮对话
+        messages.extend(self.get_history_messages(current_query))
+        
+        # 添加当前查询（有相似示例时放在问题之前，系统消息保持不变）
+        content = f"{examples}\n\n当前问题: {current_query}" if examples else current_query
+        messages.append({"role": "user", "content": content})
+        
+        return messages
+    
+    def get_history_messages(self, current_query: str) -> List[Dict]:
+        """
+        最近几轮对话的消息（用户问题和成功的SQL），当前查询已先记录到历史中时不重复添加
+        
+        Args:
+            current_query: 当前查询
+            
+        Returns:
+            messages数组（不含系统消息和当前查询）
+        """
+        history = self.conversation_history
+        if history and history[-1]["role"] == "user" and history[-1]["query"] == current_query:
+            history = history[:-1]
+        messages = []
+        recent_history = history[-8:]  # 最近4轮对话
         for entry in recent_history:
             if entry["role"] == "user":
                 messages.append({"role": "user", "content": entry["query"]})
             elif entry["role"] == "assistant" and entry.get("success") and entry.get("sql"):
                 messages.append({"role": "assistant", "content": entry["sql"]})
-        
-        # 添加当前查询
-        messages.append({"role": "user", "content": current_query})
-        
         return messages
     
     def get_conversation_summary(self) -> Dict:
@@ -1,6 +1,7 @@
 import configparser
 import mysql.connector
 from mysql.connector import Error
+from schema_formatter import format_schema_verbose
 
 def get_db_config(config_file='config.ini'):
     """从指定的.ini文件读取数据库配置"""
@@ -67,20 +68,36 @@ class DatabaseConnector:
             raise Exception("数据库未连接")
         
         cursor = self.connection.cursor()
-        cursor.execute(f"SHOW COLUMNS FROM `{table_name}`")
+        # FULL COLUMNS 额外返回字段注释（Collation, Privileges, Comment）
+        cursor.execute(f"SHOW FULL COLUMNS FROM `{table_name}`")
         columns = []
         for row in cursor.fetchall():
             columns.append({
                 'field': row[0],
                 'type': row[1],
-                'null': row[2],
-                'key': row[3],
-                'default': row[4],
-                'extra': row[5]
+                'null': row[3],
+                'key': row[4],
+                'default': row[5],
+                'extra': row[6],
+                'comment': row[8] or ''
             })
         cursor.close()
         return columns
     
+    def get_table_comments(self):
+        """获取当前数据库所有表的注释"""
+        if not self.connection or not self.connection.is_connected():
+            raise Exception("数据库未连接")
+        
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT TABLE_NAME, TABLE_COMMENT FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        comments = {row[0]: row[1] or '' for row in cursor.fetchall()}
+        cursor.close()
+        return comments
+    
     def get_database_schema(self):
         """获取整个数据库的表结构信息"""
         schema = {}
@@ -92,14 +109,61 @@ class DatabaseConnector:
             
         return schema
     
-    def get_schema_description(self, selected_tables=None):
+    def get_foreign_keys(self):
+        """
+        获取当前数据库中声明的外键
+        
+        Returns:
+            list: [{'constraint', 'table', 'column', 'referenced_table', 'referenced_column'}]，
+                复合外键的每个字段各占一项（constraint 相同）
+        """
+        if not self.connection or not self.connection.is_connected():
+            raise Exception("数据库未连接")
+        
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT k.CONSTRAINT_NAME, k.TABLE_NAME, k.COLUMN_NAME, "
+            "k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME "
+            "FROM information_schema.KEY_COLUMN_USAGE k "
+            "JOIN information_schema.REFERENTIAL_CONSTRAINTS r "
+            "ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME "
+            "AND r.TABLE_NAME = k.TABLE_NAME "
+            "WHERE k.TABLE_SCHEMA = DATABASE() AND k.REFERENCED_TABLE_NAME IS NOT NULL "
+            "ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION"
+        )
+        foreign_keys = [
+            {'constraint': row[0], 'table': row[1], 'column': row[2],
+             'referenced_table': row[3], 'referenced_column': row[4]}
+            for row in cursor.fetchall()
+        ]
+        cursor.close()
+        return foreign_keys
+    
+    def get_schema_snapshot(self):
+        """
+        获取包含表注释和字段注释的完整结构快照，供本地检索和校验使用
+        
+        Returns:
+            dict: {表名: {'comment': str, 'columns': [字段信息, ...]}}
+        """
+        comments = self.get_table_comments()
+        return {
+            table: {'comment': comments.get(table, ''), 'columns': columns}
+            for table, columns in self.get_database_schema().items()
+        }
+    
+    def get_schema_description(self, selected_tables=None, snapshot=None):
         """
         获取数据库结构的文本描述，用于提供给大模型
         
         Args:
             selected_tables: 可选，指定要包含的表列表。如果为None，返回所有表
+            snapshot: 可选，get_schema_snapshot() 的结果，提供时直接从快照生成，不再查询数据库
         """
-        if selected_tables:
+        if snapshot is not None:
+            tables = selected_tables or list(snapshot)
+            schema = {table: snapshot[table]['columns'] for table in tables if table in snapshot}
+        elif selected_tables:
             # 只获取指定表的结构
             schema = {}
             for table in selected_tables:
@@ -109,16 +173,7 @@ class DatabaseConnector:
             # 获取所有表的结构
             schema = self.get_database_schema()
         
-        description = "数据库表结构信息：\n\n"
-        
-        for table_name, columns in schema.items():
-            description += f"表名: {table_name}\n"
-            description += "字段信息:\n"
-            for col in columns:
-                description += f"  - {col['field']} ({col['type']}) {col['key']} {col['null']}\n"
-            description += "\n"
-            
-        return description
+        return format_schema_verbose(schema)
     
     def get_tables_info(self):
         """获取所有表的基本信息，用于前端表选择"""
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+少样本示例库
+收集执行成功的（问题, SQL）对，按问题文本建立倒排索引，
+生成SQL时检索最相似的几个示例，在token预算内放进当前问题之前作为参考。
+示例来源：对话导出文件（ConversationManager.export_conversation）、SQL生成缓存中的历史结果，以及运行中新执行成功的查询。
+依赖上一条SQL的追问（如“只要前5条”）单独看没有意义，不作为示例
+
+本次生成使用的示例经 format_examples 格式化后作为 examples 参数传给各生成器的 generate_sql，
+示例放在当前问题之前而不是系统消息中，不影响Ollama的前缀复用
+"""
+
+import heapq
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from generation_cache import normalize_question
+from schema_retriever import tokenize
+from token_counter import estimate_tokens
+
+# 追问的开头和标志词
+_FOLLOW_UP_PREFIXES = ('只要', '只看', '只显示', '按', '再', '去掉', '加上', '还要', '那', '其中', '换成', '改成')
+_FOLLOW_UP_MARKERS = ('其中', '它们', '这些', '那些', '上面', '上述', '刚才', '之前', '刚刚', '结果中')
+
+def is_standalone_question(question):
+    """判断问题能否脱离上下文单独理解（太短或像追问的不能）"""
+    text = normalize_question(question)
+    if len(text) < 6:
+        return False
+    return not text.startswith(_FOLLOW_UP_PREFIXES) and not any(marker in text for marker in _FOLLOW_UP_MARKERS)
+
+def load_conversation_export(path):
+    """
+    读取对话导出文件中执行成功的（问题, SQL）对
+
+    Returns:
+        list: [(question, sql), ...]，追问不包含在内
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        conversation = json.load(f).get('conversation', [])
+    pairs = []
+    question = None
+    for entry in conversation:
+        if entry.get('role') == 'user':
+            question = entry.get('query')
+        elif entry.get('role') == 'assistant' and question:
+            if entry.get('success') and entry.get('sql') and is_standalone_question(question):
+                pairs.append((question, entry['sql']))
+            question = None
+    return pairs
+
+class ExampleStore:
+    """按问题相似度检索的少样本示例库"""
+
+    def __init__(self, max_examples=2000, min_similarity=0.2, common_ratio=0.5):
+        """
+        Args:
+            max_examples: 最多保留的示例数，超过后淘汰最早加入的示例
+            min_similarity: 示例与问题的最低相似度（0~1，按共有词项的IDF加权占比计算）
+            common_ratio: 出现在超过该比例示例中的词项检索时忽略
+        """
+        self.max_examples = max_examples
+        self.min_similarity = min_similarity
+        self.common_ratio = common_ratio
+        self._examples = OrderedDict()
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.total_ms = 0.0
+
+    def add(self, question, sql, validator=None):
+        """
+        加入一个示例
+
+        Args:
+            question: 问题
+            sql: 执行成功的SQL
+            validator: 可选，sql -> bool，过滤与当前数据库结构不符的示例
+
+        Returns:
+            bool: 是否加入（追问、重复或校验失败时不加入）
+        """
+        key = normalize_question(question)
+        if not sql or not is_standalone_question(question):
+            return False
+        if validator is not None and not validator(sql):
+            return False
+        terms = set(tokenize(question))
+        if not terms:
+            return False
+        with self._lock:
+            self._remove(key)
+            self._examples[key] = {'question': question, 'sql': sql, 'terms': terms, 'weight': None}
+            for term in terms:
+                self._postings[term].add(key)
+            while len(self._examples) > self.max_examples:
+                self._remove(next(iter(self._examples)))
+        return True
+
+    def _remove(self, key):
+        """删除示例（调用方负责加锁）"""
+        example = self._examples.pop(key, None)
+        if example is None:
+            return
+        for term in example['terms']:
+            self._postings[term].discard(key)
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def add_many(self, pairs, validator=None):
+        """批量加入示例，返回实际加入的数量"""
+        return sum(1 for question, sql in pairs if self.add(question, sql, validator))
+
+    def load_export(self, path, validator=None):
+        """从对话导出文件加载示例，返回加入的数量"""
+        try:
+            added = self.add_many(load_conversation_export(path), validator)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [Examples] 读取对话导出文件 {path} 失败: {e}")
+            return 0
+        print(f"📚 [Examples] 从 {path} 加载 {added} 个示例")
+        return added
+
+    def _idf(self, term, total):
+        # 平滑的IDF，只出现在少数示例中的词项权重更高
+        return 1.0 + (total / (1 + len(self._postings.get(term, ()))))
+
+    def search(self, question, top_k=3):
+        """
+        检索与问题最相似的示例
+
+        Returns:
+            list: [{'question', 'sql', 'similarity'}, ...]，按相似度降序
+        """
+        start = time.perf_counter()
+        terms = set(tokenize(question))
+        key = normalize_question(question)
+        results = []
+        with self._lock:
+            total = len(self._examples)
+            weights = {term: self._idf(term, total) for term in terms}
+            query_weight = sum(weights.values())
+            scores = defaultdict(float)
+            for term, weight in weights.items():
+                postings = self._postings.get(term, ())
+                # 出现在大多数示例中的词项区分度很低，跳过以免遍历整个示例库
+                if total >= 20 and len(postings) > total * self.common_ratio:
+                    continue
+                for example_key in postings:
+                    scores[example_key] += weight
+            scores.pop(key, None)  # 完全相同的问题由生成缓存处理
+            # 先按共有词项的权重粗排，只对前几名计算归一化的相似度
+            for example_key, shared in heapq.nlargest(top_k * 5, scores.items(), key=lambda item: item[1]):
+                example = self._examples[example_key]
+                if example['weight'] is None or example['weight'][0] != total:
+                    example['weight'] = (total, sum(self._idf(term, total) for term in example['terms']))
+                # 同时考虑示例中没有出现在问题里的词项，避免长示例占优
+                similarity = shared / max(query_weight, example['weight'][1])
+                if similarity >= self.min_similarity:
+                    results.append({'question': example['question'], 'sql': example['sql'],
+                                    'similarity': round(similarity, 3)})
+        results.sort(key=lambda item: -item['similarity'])
+        results = results[:top_k]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.lookups += 1
+            self.total_ms += elapsed_ms
+            if results:
+                self.hits += 1
+        return results
+
+    def select(self, question, top_k=3, token_budget=400):
+        """
+        检索示例并按token预算截取（相似度高的优先）
+
+        Returns:
+            list: [{'question', 'sql', 'similarity'}, ...]
+        """
+        selected = []
+        used = 0
+        for example in self.search(question, top_k):
+            tokens = estimate_tokens(f"问题: {example['question']}\nSQL: {example['sql']}\n")
+            if used + tokens > token_budget:
+                continue
+            selected.append(example)
+            used += tokens
+        if selected:
+            print(f"📚 [Examples] 附上 {len(selected)} 个相似示例（约 {used} tokens）: "
+                  f"{', '.join(example['question'] for example in selected)}")
+        return selected
+
+    def get_stats(self):
+        """获取示例库统计"""
+        with self._lock:
+            return {
+                'size': len(self._examples),
+                'terms': len(self._postings),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'avg_ms': round(self.total_ms / self.lookups, 4) if self.lookups else 0.0,
+            }
+
+def format_examples(examples):
+    """把示例格式化为提示词片段，没有示例时返回空字符串"""
+    if not examples:
+        return ""
+    lines = ["以下是与当前问题相似的历史问题及其正确SQL，仅供参考："]
+    for example in examples:
+        lines.append(f"问题: {example['question']}")
+        lines.append(f"SQL: {example['sql']}")
+    return "\n".join(lines)
+
+if __name__ == '__main__':
+    store = ExampleStore()
+    store.load_export('context_test_export.json')
+    store.add_many([
+        ("查询每个部门的用户数量", "SELECT d.dept_name, COUNT(*) AS total FROM sys_user u "
+                            "JOIN sys_dept d ON u.dept_id = d.dept_id GROUP BY d.dept_name"),
+        ("查询最近7天登录过的用户", "SELECT * FROM sys_user WHERE login_date >= DATE_SUB(NOW(), INTERVAL 7 DAY)"),
+        ("统计每个角色的用户数量", "SELECT r.role_name, COUNT(*) FROM sys_user_role ur "
+                            "JOIN sys_role r ON ur.role_id = r.role_id GROUP BY r.role_name"),
+    ])
+    print(format_examples(store.select("查询每个部门的用户人数")))
+    print(store.get_stats())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后端降级链与熔断器
+按配置顺序（如 ollama → qwen_api → gemini）依次尝试各大模型后端，
+每个后端有独立的熔断器：连续失败或超时达到阈值后熔断，一段时间后放行一个试探请求（半开），
+成功则恢复。后端不可用时在同一次请求内切换到下一个后端，而不是直接返回失败
+"""
+
+import threading
+import time
+from health_monitor import is_backend_failure
+
+# 各后端未指定模型时使用的默认模型
+DEFAULT_MODELS = {
+    'ollama': 'qwen2',
+    'qwen_api': 'qwen-plus',
+    'gemini': 'gemini-1.5-flash',
+}
+
+def parse_chain(spec):
+    """
+    解析降级链配置
+
+    Args:
+        spec: 逗号分隔的 "后端" 或 "后端:模型"，如 "qwen_api:qwen-turbo, gemini"
+
+    Returns:
+        list: [(backend, model), ...]
+
+    Raises:
+        ValueError: 后端名称不受支持
+    """
+    chain = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        backend, _, model = item.partition(':')
+        backend = backend.strip()
+        if backend not in DEFAULT_MODELS:
+            raise ValueError(f"不支持的后端: {backend}")
+        chain.append((backend, model.strip() or DEFAULT_MODELS[backend]))
+    return chain
+
+class CircuitBreaker:
+    """单个后端的熔断器（closed → open → half_open → closed）"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=3, recovery_timeout=30):
+        """
+        Args:
+            name: 后端名称
+            failure_threshold: 连续失败多少次后熔断
+            recovery_timeout: 熔断后多久放行试探请求（秒）
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+        self.trips = 0
+        self.rejected = 0
+        self.last_error = None
+
+    def allow_request(self):
+        """
+        判断是否放行请求；熔断超时后只放行一个试探请求
+
+        Returns:
+            bool: 是否可以调用该后端
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                print(f"🔌 [Breaker] {self.name} 半开，放行一个试探请求")
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"✅ [Breaker] {self.name} 已恢复")
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._probing = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.last_error = error
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.trips += 1
+                    print(f"⛔ [Breaker] {self.name} 连续失败 {self._consecutive_failures} 次，"
+                          f"熔断 {self.recovery_timeout} 秒")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def get_stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self._consecutive_failures,
+            'trips': self.trips,
+            'rejected': self.rejected,
+            'last_error': self.last_error,
+        }
+
+class FallbackChain:
+    """按顺序尝试多个后端的SQL生成器，对外接口与单个生成器相同"""
+
+    def __init__(self, generators, failure_threshold=3, recovery_timeout=30, report_fn=None):
+        """
+        Args:
+            generators: [(name, generator), ...]，按优先级排列
+            failure_threshold: 熔断器连续失败阈值
+            recovery_timeout: 熔断器恢复等待时间（秒）
+            report_fn: 可选，report_fn(name, success, sql_or_error)，每次尝试后回调（用于更新健康状态）
+        """
+        self.generators = list(generators)
+        self.breakers = {
+            name: CircuitBreaker(name, failure_threshold, recovery_timeout) for name, _ in self.generators
+        }
+        self.report_fn = report_fn
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.fallbacks = 0
+        self.exhausted = 0
+        self.served = {name: 0 for name, _ in self.generators}
+
+    @property
+    def names(self):
+        return [name for name, _ in self.generators]
+
+    def generate_sql(self, user_query, schema_description, conversation_manager=None, examples=None):
+        """
+        生成SQL，接口与单个生成器相同
+
+        Returns:
+            tuple: (success: bool, sql_or_error: str)
+        """
+        success, result, _ = self.generate_sql_with_backend(
+            user_query, schema_description, conversation_manager, examples=examples
+        )
+        return success, result
+
+    def generate_sql_with_backend(self, user_query, schema_description, conversation_manager=None, examples=None):
+        """
+        依次尝试各后端生成SQL
+
+        只有后端不可用类的错误（调用失败、超时、空响应）才会切换到下一个后端；
+        模型正常返回但无法生成查询时直接返回该结果。examples（示例文本）为空时不传给生成器
+
+        Returns:
+            tuple: (success: bool, sql_or_error: str, backend_name: str 或 None)
+        """
+        with self._lock:
+            self.requests += 1
+
+        errors = []
+        for index, (name, generator) in enumerate(self.generators):
+            breaker = self.breakers[name]
+            if not breaker.allow_request():
+                errors.append(f"{name}: 熔断中")
+                continue
+
+            if index > 0 and errors:
+                print(f"↪️ [Fallback] 切换到 {name}")
+            try:
+                success, result = generator.generate_sql(
+                    user_query, schema_description, conversation_manager, **({'examples': examples} if examples else {})
+                )
+            except Exception as e:
+                success, result = False, f"ERROR: 大模型调用失败 - {str(e)}"
+
+            if self.report_fn is not None:
+                self.report_fn(name, success, result)
+
+            if success or not is_backend_failure(result):
+                breaker.record_success()
+                with self._lock:
+                    self.served[name] += 1
+                    if errors:
+                        self.fallbacks += 1
+                return success, result, name
+
+            breaker.record_failure(result)
+            errors.append(f"{name}: {result}")
+
+        with self._lock:
+            self.exhausted += 1
+        return False, "ERROR: 所有大模型后端均调用失败（" + "；".join(errors) + "）", None
+
+    def available_backends(self):
+        """当前未熔断（或可以试探）的后端名称"""
+        return [name for name in self.names if self.breakers[name].state != CircuitBreaker.OPEN]
+
+    def get_stats(self):
+        """获取降级链统计信息"""
+        with self._lock:
+            stats = {
+                'chain': self.names,
+                'requests': self.requests,
+                'fallbacks': self.fallbacks,
+                'exhausted': self.exhausted,
+                'served': dict(self.served),
+            }
+        stats['breakers'] = {name: breaker.get_stats() for name, breaker in self.breakers.items()}
+        return stats
+
+if __name__ == '__main__':
+    class DemoGenerator:
+        def __init__(self, up):
+            self.up = up
+
+        def generate_sql(self, user_query, schema_description, conversation_manager=None):
+            if not self.up:
+                return False, "ERROR: 本地模型调用失败"
+            return True, "SELECT COUNT(*) FROM sys_user"
+
+    chain = FallbackChain([('ollama:qwen2', DemoGenerator(False)), ('qwen_api:qwen-plus', DemoGenerator(True))],
+                          failure_threshold=2, recovery_timeout=5)
+    for _ in range(3):
+        print(chain.generate_sql_with_backend("统计用户数", "数据库结构信息：..."))
+    print(chain.get_stats())
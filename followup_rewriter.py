@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+追问的本地改写
+“只要前5条”“按年龄排序”“再加上邮箱字段”“去掉备注”“只看状态为正常的”这类追问只是在上一条SQL上做小修改，
+用 sqlparse 把上一条成功的SQL拆成 SELECT/FROM/WHERE/GROUP BY/ORDER BY/LIMIT 子句，
+识别出修改意图后直接改写对应子句，不再把完整的表结构和对话历史发给大模型。
+问题中只要有一部分无法识别，或者字段无法唯一确定，就整体交给大模型处理
+"""
+
+import re
+import threading
+import time
+import unicodedata
+import sqlparse
+from sqlparse.sql import Where
+from sqlparse.tokens import DML, Keyword, Punctuation
+from rule_parser import add_alias, column_aliases, parse_number, table_aliases
+
+# 追问中各个修改之间的分隔
+_CLAUSE_SEPARATOR = re.compile(r'[，,；;。！!？?]+|并且|然后|同时|而且')
+_LEADING_FILLER = re.compile(r'^(?:那么?|好的?|请|帮我|麻烦|能不能|可以)+')
+_NUMBER = r'(?P<n>\d+|[一两二三四五六七八九十]{1,3})'
+
+_LIMIT = re.compile(rf'^(?:再)?(?:只|仅)?(?:要|看|显示|保留|取|返回|列出|限制为?)?(?:前|最前面的?)?{_NUMBER}'
+                    r'(?:条|个|行|笔|项|名)(?:就行|就好|即可|就够了)?(?:的)?(?:数据|记录|结果)?$')
+_ORDER_DIRECTIONS = {'升序': 'ASC', '正序': 'ASC', '从小到大': 'ASC', '从低到高': 'ASC', '从旧到新': 'ASC', '从早到晚': 'ASC',
+                     '降序': 'DESC', '倒序': 'DESC', '逆序': 'DESC', '从大到小': 'DESC', '从高到低': 'DESC',
+                     '从新到旧': 'DESC', '从晚到早': 'DESC'}
+_ORDER = re.compile(r'^(?:再)?(?:改成|改为)?(?P<by>按照?|根据|以)?(?P<column>.+?)'
+                    r'(?P<direction>' + '|'.join(_ORDER_DIRECTIONS) + r')?(?:来)?(?P<sort>排序|排列|排一下序?|排)?$')
+_ADD_COLUMNS = re.compile(r'^(?:再|也|还|顺便|另外)*(?:要|需要)?(?:加上|加入|增加|添加|加|带上|显示|包含|列出|要)(?:上)?'
+                          r'(?P<columns>.+?)(?:这一?列|这个字段|字段|列|信息)?$')
+_REMOVE_COLUMNS = re.compile(r'^(?:再)?(?:去掉|去除|删掉|删除|移除|不要|不显示|隐藏|别显示)(?:掉)?'
+                             r'(?P<columns>.+?)(?:这一?列|这个字段|字段|列)?$')
+_COLUMN_SEPARATOR = re.compile(r'以及|和|与|及|跟|、|/')
+_FILTER_OPERATORS = [('大于等于', '>='), ('不小于', '>='), ('>=', '>='), ('小于等于', '<='), ('不大于', '<='), ('<=', '<='),
+                     ('不等于', '!='), ('不是', '!='), ('!=', '!='), ('大于', '>'), ('超过', '>'), ('高于', '>'),
+                     ('>', '>'), ('小于', '<'), ('低于', '<'), ('不到', '<'), ('<', '<'),
+                     ('等于', '='), ('为', '='), ('是', '='), ('=', '=')]
+_FILTER = re.compile(r'^(?:再|也|还)?(?:只|仅)?(?:看|要|显示|保留|筛选出?|过滤出?|查)?(?P<column>.+?)'
+                     r'(?P<operator>' + '|'.join(re.escape(word) for word, _ in _FILTER_OPERATORS) + r')'
+                     r'(?P<value>[^的]+?)(?:的.{0,6})?$')
+
+_NUMERIC_TYPE = re.compile(r'^(?:tinyint|smallint|mediumint|int|integer|bigint|decimal|numeric|float|double|real|bit)\b')
+_NUMBER_VALUE = re.compile(r'^-?\d+(?:\.\d+)?$')
+_AGGREGATE = re.compile(r'\b(?:count|sum|avg|min|max|group_concat)\s*\(', re.IGNORECASE)
+# FROM 子句中的表和别名
+_FROM_TABLE = re.compile(r'(?:\bFROM|\bJOIN|,)\s+`?(?:\w+`?\.`?)?(?P<table>\w+)`?'
+                         r'(?:\s+(?:AS\s+)?`?(?P<alias>\w+)`?)?', re.IGNORECASE)
+_NOT_ALIAS = {'ON', 'USING', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'CROSS', 'JOIN', 'NATURAL', 'FULL', 'STRAIGHT_JOIN',
+              'WHERE', 'GROUP', 'ORDER', 'LIMIT', 'HAVING'}
+# 顶层子句关键字（sqlparse 归一化后的写法）
+_CLAUSES = {'GROUP BY': 'group_by', 'HAVING': 'having', 'ORDER BY': 'order_by', 'LIMIT': 'limit'}
+
+def _split_top_level(text, separator=','):
+    """按顶层的分隔符拆分（忽略括号和引号内的分隔符）"""
+    parts = []
+    depth = 0
+    quote = None
+    current = []
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"`':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    parts.append(''.join(current).strip())
+    return [part for part in parts if part]
+
+def _bare_name(expression):
+    """表达式为简单字段（可带限定名和别名）时返回小写字段名，否则返回None"""
+    match = re.match(r'^(?:`?\w+`?\.)?`?(\w+)`?(?:\s+(?:AS\s+)?`?\w+`?)?$', expression.strip(), re.IGNORECASE)
+    return match.group(1).lower() if match else None
+
+def _output_name(expression):
+    """SELECT 项的输出名（别名或字段名），小写"""
+    match = re.search(r'(?:\bAS\s+|\s)`?(\w+)`?$', expression.strip(), re.IGNORECASE)
+    if match and not expression.strip().endswith(')'):
+        return match.group(1).lower()
+    return _bare_name(expression)
+
+def _value_codes(comment):
+    """从注释中解析取值说明，如“帐号状态（0正常 1停用）” → {'正常': '0', '停用': '1'}"""
+    comment = unicodedata.normalize('NFKC', comment or '')
+    codes = {}
+    for note in re.findall(r'\(([^)]*)\)', comment):
+        for code, label in re.findall(r'([0-9A-Za-z]+)\s*[=:]?\s*([一-鿿]+)', note):
+            codes[label] = code
+    return codes
+
+class SelectQuery:
+    """按顶层子句拆分的SELECT语句，修改子句后重新拼接"""
+
+    def __init__(self, distinct, columns, from_clause, where=None, group_by=None, having=None, order_by=None, limit=None):
+        self.distinct = distinct
+        self.columns = columns
+        self.from_clause = from_clause
+        self.where = where
+        self.group_by = group_by
+        self.having = having
+        self.order_by = order_by
+        self.limit = limit
+
+    @classmethod
+    def parse(cls, sql):
+        """
+        解析单条SELECT语句
+
+        Returns:
+            SelectQuery: 含 UNION、多条语句或无法识别的子句时返回None
+        """
+        statements = [statement for statement in sqlparse.parse(sql) if str(statement).strip(' \n;')]
+        if len(statements) != 1 or statements[0].get_type() != 'SELECT':
+            return None
+
+        parts = {'select': [], 'from': []}
+        current = None
+        distinct = False
+        for token in statements[0].tokens:
+            if token.is_whitespace or (token.ttype is Punctuation and str(token) == ';'):
+                continue
+            keyword = token.normalized if token.ttype in (DML, Keyword) else None
+            if keyword == 'SELECT' and current is None:
+                current = 'select'
+            elif keyword == 'DISTINCT' and current == 'select' and not parts['select']:
+                distinct = True
+            elif keyword == 'FROM' and current == 'select':
+                current = 'from'
+            elif isinstance(token, Where) and current == 'from':
+                parts['where'] = [str(token)[len('WHERE'):]]
+                current = 'where'
+            elif keyword in _CLAUSES and current is not None and current != 'select':
+                current = _CLAUSES[keyword]
+                if current in parts:
+                    return None
+                parts[current] = []
+            elif keyword in ('UNION', 'INTERSECT', 'EXCEPT', 'INTO', 'FOR', 'WINDOW', 'SELECT') or current is None:
+                return None
+            elif current == 'where':
+                # WHERE 之后只能是已知的子句
+                return None
+            else:
+                parts[current].append(str(token))
+
+        if current in (None, 'select') or not parts['select'] or not parts['from']:
+            return None
+        text = {name: ' '.join(tokens).strip() for name, tokens in parts.items()}
+        return cls(distinct, _split_top_level(text['select']), text['from'],
+                   text.get('where') or None, text.get('group_by'), text.get('having'),
+                   text.get('order_by'), text.get('limit'))
+
+    @property
+    def is_aggregate(self):
+        return bool(self.group_by) or any(_AGGREGATE.search(column) for column in self.columns)
+
+    def tables(self):
+        """FROM 子句中的 [(表名, 别名或None)]，含子查询时返回None"""
+        if '(' in self.from_clause:
+            return None
+        tables = []
+        for match in _FROM_TABLE.finditer('FROM ' + self.from_clause):
+            alias = match.group('alias')
+            if alias and alias.upper() in _NOT_ALIAS:
+                alias = None
+            tables.append((match.group('table'), alias))
+        return tables
+
+    def add_condition(self, condition):
+        if not self.where:
+            self.where = condition
+        elif re.search(r'\bOR\b', self.where, re.IGNORECASE):
+            self.where = f"({self.where}) AND {condition}"
+        else:
+            self.where = f"{self.where} AND {condition}"
+
+    def to_sql(self):
+        sql = f"SELECT {'DISTINCT ' if self.distinct else ''}{', '.join(self.columns)} FROM {self.from_clause}"
+        for keyword, value in (('WHERE', self.where), ('GROUP BY', self.group_by), ('HAVING', self.having),
+                               ('ORDER BY', self.order_by), ('LIMIT', self.limit)):
+            if value:
+                sql += f" {keyword} {value}"
+        return sql
+
+class FollowUpRewriter:
+    """在上一条成功的SQL上本地应用追问中的修改"""
+
+    def __init__(self, snapshot, min_confidence=0.85, max_limit=1000):
+        """
+        Args:
+            snapshot: DatabaseConnector.get_schema_snapshot() 的结果
+            min_confidence: 字段匹配的最低置信度（字段名1.0，注释0.95，去掉表名前缀的注释0.85）
+            max_limit: 条数限制的上限，超过时交给大模型
+        """
+        self.snapshot = snapshot
+        self.min_confidence = min_confidence
+        self.max_limit = max_limit
+        self._tables = {table.lower(): table for table in snapshot}
+        self._column_aliases = {}
+        for table, info in snapshot.items():
+            names = table_aliases(table, info.get('comment', ''))
+            aliases = {}
+            for column in info['columns']:
+                for alias, score in column_aliases(column, names).items():
+                    add_alias(aliases, alias, column['field'], score)
+            self._column_aliases[table] = aliases
+
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.total_ms = 0.0
+        self.intents = {}
+
+    # ---------- 字段解析 ----------
+
+    def _resolve_column(self, query, text):
+        """
+        把追问中的名称解析为上一条SQL中某个表的字段
+
+        Returns:
+            tuple: (表名, 字段名, 用于SQL的表达式)，无法唯一确定时返回None
+        """
+        tables = query.tables()
+        if not tables:
+            return None
+        text = unicodedata.normalize('NFKC', text).strip().lower().removeprefix('的')
+        best = []
+        best_score = 0
+        for table, alias in tables:
+            table = self._tables.get(table.lower())
+            if table is None:
+                continue
+            column, score = self._column_aliases[table].get(text, (None, 0))
+            if column is None or score < self.min_confidence:
+                continue
+            if score > best_score:
+                best, best_score = [(table, alias, column)], score
+            elif score == best_score and all(entry[:2] != (table, alias) for entry in best):
+                best.append((table, alias, column))
+        if len(best) != 1:
+            return None
+        table, alias, column = best[0]
+        if len(tables) == 1:
+            return table, column, f"`{column}`"
+        return table, column, f"{alias or f'`{table}`'}.`{column}`"
+
+    def _resolve_output(self, query, text):
+        """把名称解析为SELECT中的输出列（别名、字段名），用于排序，没有时返回None"""
+        key = unicodedata.normalize('NFKC', text).strip().lower()
+        for column in query.columns:
+            if _output_name(column) == key:
+                name = _output_name(column)
+                return f"`{name}`" if _bare_name(column) == name and ' ' not in column.strip() else name
+        return None
+
+    # ---------- 各类修改 ----------
+
+    def _apply_limit(self, query, clause):
+        match = _LIMIT.match(clause)
+        limit = match and parse_number(match.group('n'))
+        if not limit or limit > self.max_limit:
+            return False
+        query.limit = str(limit)
+        return True
+
+    def _apply_order(self, query, clause):
+        match = _ORDER.match(clause)
+        if not match or not (match.group('sort') or match.group('direction')) or \
+                not (match.group('by') or match.group('direction')):
+            return False
+        direction = _ORDER_DIRECTIONS.get(match.group('direction'), 'ASC')
+        expression = self._resolve_output(query, match.group('column'))
+        if expression is None:
+            if query.is_aggregate:
+                # 聚合查询只能按输出列排序
+                return False
+            resolved = self._resolve_column(query, match.group('column'))
+            if resolved is None:
+                return False
+            expression = resolved[2]
+        query.order_by = f"{expression} {direction}"
+        return True
+
+    def _apply_add_columns(self, query, clause):
+        match = _ADD_COLUMNS.match(clause)
+        if not match or query.is_aggregate or query.distinct:
+            return False
+        additions = []
+        for text in _COLUMN_SEPARATOR.split(match.group('columns')):
+            resolved = self._resolve_column(query, text)
+            if resolved is None:
+                return False
+            additions.append(resolved)
+        for table, column, expression in additions:
+            present = any(item.strip() == '*' or item.strip().endswith('.*') or _bare_name(item) == column.lower()
+                          for item in query.columns)
+            if not present:
+                query.columns.append(expression)
+        return True
+
+    def _apply_remove_columns(self, query, clause):
+        match = _REMOVE_COLUMNS.match(clause)
+        if not match:
+            return False
+        removals = []
+        for text in _COLUMN_SEPARATOR.split(match.group('columns')):
+            resolved = self._resolve_column(query, text)
+            if resolved is None:
+                return False
+            removals.append(resolved[1].lower())
+
+        columns = query.columns
+        if columns == ['*']:
+            # SELECT * 展开为全部字段后再去掉（仅限单表）
+            tables = query.tables()
+            if len(tables) != 1:
+                return False
+            columns = [f"`{column['field']}`" for column in self.snapshot[self._tables[tables[0][0].lower()]]['columns']]
+        remaining = [column for column in columns if _bare_name(column) not in removals]
+        if len(remaining) == len(columns) or not remaining:
+            return False
+        query.columns = remaining
+        return True
+
+    def _apply_filter(self, query, clause):
+        match = _FILTER.match(clause)
+        if not match:
+            return False
+        resolved = self._resolve_column(query, match.group('column'))
+        if resolved is None:
+            return False
+        table, column, expression = resolved
+        operator = dict(_FILTER_OPERATORS)[match.group('operator')]
+        value = match.group('value').strip().strip('\'"“”‘’')
+        info = next(item for item in self.snapshot[table]['columns'] if item['field'] == column)
+
+        codes = _value_codes(info.get('comment'))
+        if value in codes:
+            value = codes[value]
+        elif codes and value not in codes.values():
+            return False
+
+        if _NUMERIC_TYPE.match(info.get('type', '').lower()):
+            if not _NUMBER_VALUE.match(value):
+                return False
+            literal = value
+        else:
+            if operator not in ('=', '!=') and re.search(r'[一-鿿]', value):
+                return False
+            literal = "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+        query.add_condition(f"{expression} {operator} {literal}")
+        return True
+
+    def rewrite(self, question, previous_sql):
+        """
+        尝试在上一条SQL上应用追问中的修改
+
+        Args:
+            question: 追问
+            previous_sql: 上一条成功的SQL
+
+        Returns:
+            str: 改写后的SQL，无法完整处理时返回None（交给大模型）
+        """
+        start = time.perf_counter()
+        sql = None
+        applied = []
+        query = SelectQuery.parse(previous_sql) if previous_sql else None
+        if query is not None:
+            text = unicodedata.normalize('NFKC', question or '')
+            clauses = [_LEADING_FILLER.sub('', clause.strip()) for clause in _CLAUSE_SEPARATOR.split(text)]
+            clauses = [re.sub(r'\s+', '', clause) for clause in clauses if clause.strip()]
+            handlers = (('limit', self._apply_limit), ('order', self._apply_order),
+                        ('remove_columns', self._apply_remove_columns), ('filter', self._apply_filter),
+                        ('add_columns', self._apply_add_columns))
+            for clause in clauses:
+                intent = next((name for name, handler in handlers if handler(query, clause)), None)
+                if intent is None:
+                    applied = []
+                    break
+                applied.append(intent)
+            if applied:
+                sql = query.to_sql()
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.lookups += 1
+            self.total_ms += elapsed_ms
+            if sql:
+                self.hits += 1
+                for intent in applied:
+                    self.intents[intent] = self.intents.get(intent, 0) + 1
+        if sql:
+            print(f"⚡ [FollowUp] 本地改写上一条SQL（{', '.join(applied)}，{elapsed_ms:.2f}ms）: {sql}")
+        return sql
+
+    def get_stats(self):
+        """获取追问改写统计"""
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'deferred': self.lookups - self.hits,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'avg_ms': round(self.total_ms / self.lookups, 3) if self.lookups else 0.0,
+                'intents': dict(self.intents),
+            }
+
+if __name__ == '__main__':
+    from schema_formatter import _demo_snapshot
+
+    rewriter = FollowUpRewriter(_demo_snapshot())
+    previous = "SELECT `user_name`, `nick_name` FROM `sys_user` WHERE `del_flag` = '0'"
+    for question in ["只要前5条", "按最后登录时间降序排列", "再加上邮箱字段", "去掉用户昵称",
+                     "只看状态为正常的", "按部门统计一下人数"]:
+        print(f"{question} -> {rewriter.rewrite(question, previous)}")
+    print(rewriter.get_stats())
@@ -5,25 +5,39 @@
 """
 
 import os
+import asyncio
 import configparser
+import hashlib
+from concurrent.futures import CancelledError
 import google.generativeai as genai
 import json
 import requests
+from async_runtime import run_sync
+from rate_limiter import RateLimitExceeded, get_rate_limiter
+from llm_cassette import get_cassette
+from llm_executor import get_llm_executor
+from llm_metrics import LLMCall, current_call
+from model_list_cache import get_model_list_cache
+from context_cache import ContextCacheManager, GeminiCacheClient, to_gemini_contents
+from generation_cache import schema_fingerprint
+from sql_extractor import SQLStreamExtractor, extract_sql, get_stop_sequences
 
 class GeminiSQLGenerator:
     """使用Google Gemini大模型生成SQL的类"""
     
-    def __init__(self, model_name="gemini-1.5-flash", api_key=None, config_file="config.ini"):
+    def __init__(self, model_name="gemini-1.5-flash", api_key=None, config_file="config.ini", stream=True):
         """
         初始化Gemini客户端
         model_name: 模型名称，可选 gemini-1.5-flash, gemini-1.5-pro, gemini-pro, gemini-2.5-flash-preview-05-20, gemini-2.0-flash-preview-image-generation
         api_key: API密钥，如果为None则从配置文件或环境变量获取
         config_file: 配置文件路径
+        stream: 是否使用流式生成（SQL完整后提前结束）
         """
         print(f"🔮 [Gemini] 开始初始化 Gemini 客户端...")
         print(f"🔮 [Gemini] 模型名称: {model_name}")
         
         self.model_name = model_name
+        self.stream = stream
         
         # 获取API Key的优先级：传入参数 > 配置文件 > 环境变量
         if api_key:
@@ -70,6 +84,7 @@ class GeminiSQLGenerator:
             "top_p": 0.95,
             "top_k": 40,
             "max_output_tokens": 1000,
+            "stop_sequences": get_stop_sequences('gemini'),
         }
         
         # 安全设置
@@ -104,10 +119,59 @@ class GeminiSQLGenerator:
         except Exception as e:
             print(f"❌ [Gemini] 生成模型初始化失败: {e}")
             raise
+        
+        # 服务端上下文缓存：数据库结构和生成要求作为cachedContent上传一次，之后只发送对话内容
+        self.context_cache = None
+        self._cached_models = {}
+        llm_config = configparser.ConfigParser()
+        llm_config.read(config_file, encoding='utf-8')
+        # 同一API Key和模型共用的客户端限流器，被限流（429/配额不足）时退避重试
+        self.rate_limiter = get_rate_limiter(llm_config, 'gemini', self.api_key, self.model_name)
+        if llm_config.getboolean('llm', 'context_cache_enabled', fallback=True):
+            self.cache_client = GeminiCacheClient(
+                self.api_key, self.model_name,
+                base_url=llm_config.get('llm', 'gemini_api_url', fallback='https://generativelanguage.googleapis.com')
+            )
+            self.context_cache = ContextCacheManager(
+                self.cache_client.create,
+                refresh_fn=self.cache_client.refresh,
+                delete_fn=self._delete_cached_content,
+                ttl=llm_config.getint('llm', 'context_cache_ttl', fallback=3600),
+                min_tokens=llm_config.getint('llm', 'gemini_cache_min_tokens', fallback=4096),
+                name="Gemini"
+            )
     
-    def create_sql_prompt(self, user_query, schema_description):
-        """创建用于生成SQL的提示词"""
-        prompt = f"""你是一个专业的SQL查询助手。请根据用户的自然语言查询需求，生成对应的MySQL SQL查询语句。
+    def _cached_model(self, cache_name):
+        """获取绑定了服务端缓存的生成模型"""
+        model = self._cached_models.get(cache_name)
+        if model is None:
+            model = genai.GenerativeModel.from_cached_content(
+                cached_content=cache_name,
+                generation_config=self.generation_config,
+                safety_settings=self.safety_settings
+            )
+            self._cached_models[cache_name] = model
+        return model
+    
+    def _delete_cached_content(self, cache_name):
+        """删除服务端缓存及对应的模型实例"""
+        self._cached_models.pop(cache_name, None)
+        self.cache_client.delete(cache_name)
+    
+    def invalidate_context_cache(self):
+        """数据库结构变化或切换实例时清除服务端缓存"""
+        if self.context_cache is not None:
+            self.context_cache.invalidate()
+    
+    def get_cache_stats(self):
+        """获取上下文缓存统计"""
+        if self.context_cache is None:
+            return {'enabled': False}
+        return self.context_cache.get_stats()
+    
+    def create_system_prompt(self, schema_description):
+        """创建系统提示词（数据库结构和要求），同一数据库的多次请求之间保持不变"""
+        return f'''你是一个专业的SQL查询助手。请根据用户的自然语言查询需求，生成对应的MySQL SQL查询语句。
 
 数据库结构信息：
 {schema_description}
@@ -118,7 +182,11 @@ class GeminiSQLGenerator:
 3. 使用反引号包围表名和字段名以避免关键字冲突
 4. 如果查询涉及多表，请正确使用JOIN语句
 5. 只返回SQL语句，不要包含其他解释文字
-6. 如果无法理解用户查询或数据库中没有相关表，请返回"ERROR: 无法生成对应的SQL查询"
+6. 如果无法理解用户查询或数据库中没有相关表，请返回"ERROR: 无法生成对应的SQL查询"'''
+    
+    def create_sql_prompt(self, user_query, schema_description):
+        """创建用于生成SQL的提示词"""
+        prompt = self.create_system_prompt(schema_description) + f"""
 
 用户查询: {user_query}
 
@@ -128,122 +196,272 @@ class GeminiSQLGenerator:
     
     def _clean_sql_response(self, response):
         """清理模型响应，提取纯SQL语句"""
-        cleaned_sql = response.strip()
+        cleaned_sql = extract_sql(response)
+        print(f"🧹 [Gemini] 清理后的SQL: {cleaned_sql}")
+        return cleaned_sql
+    
+    async def _agenerate_text(self, prompt, model=None):
+        """
+        调用Gemini异步生成接口，返回模型原始文本
         
-        # 移除markdown代码块标记
-        if "```sql" in cleaned_sql:
-            # 提取SQL代码块
-            parts = cleaned_sql.split("```sql")
-            if len(parts) > 1:
-                sql_part = parts[1].split("```")[0]
-                cleaned_sql = sql_part.strip()
-        elif "```" in cleaned_sql:
-            # 提取一般代码块
-            parts = cleaned_sql.split("```")
-            if len(parts) >= 3:
-                sql_part = parts[1]
-                cleaned_sql = sql_part.strip()
+        流式模式下SQL语句完整后立即停止读取，不再等待模型后续的解释文字；任务被取消时同样停止读取
         
-        # 移除可能的其他标记
-        prefixes_to_remove = [
-            "根据您的查询需求，生成的SQL语句如下：",
-            "SQL语句：",
-            "查询语句：",
-            "生成的SQL：",
-            "答案：",
-            "结果：",
-        ]
+        Args:
+            prompt: 提示词或contents列表
+            model: 可选，使用的模型实例（如绑定了服务端缓存的模型），默认使用 self.model
+        """
+        cassette = get_cassette()
+        if cassette is not None:
+            return await cassette.acall('gemini', self.model_name, {'prompt': prompt},
+                                        lambda: self._asend_text(prompt, model))
+        return await self._asend_text(prompt, model)
+    
+    async def _asend_text(self, prompt, model=None):
+        """发送生成请求，返回模型原始文本"""
+        model = model or self.model
+        call = current_call()
+        if call is not None:
+            call.prompt_text = prompt if isinstance(prompt, str) else \
+                "\n".join(part for content in prompt for part in content['parts'])
+        
+        if not self.stream:
+            response = await model.generate_content_async(prompt)
+            self._record_usage(call, response)
+            if call is not None:
+                call.completion_text = response.text
+            return response.text
+        
+        extractor = SQLStreamExtractor()
+        response = await model.generate_content_async(prompt, stream=True)
+        try:
+            async for chunk in response:
+                # 每个片段的用量统计是累计值，提前结束时保留最后收到的一次
+                self._record_usage(call, chunk)
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # 没有文本内容的片段（如仅包含安全评级信息）
+                    continue
+                if call is not None and text:
+                    call.mark_first_token()
+                if extractor.feed(text):
+                    print("⏹️ [Gemini] SQL语句已完整，提前结束生成")
+                    break
+        finally:
+            await self._aclose_stream(response)
         
-        for prefix in prefixes_to_remove:
-            if cleaned_sql.startswith(prefix):
-                cleaned_sql = cleaned_sql[len(prefix):].strip()
+        if call is not None:
+            call.completion_text = extractor.text
+        return extractor.text
+    
+    @staticmethod
+    async def _aclose_stream(response):
+        """
+        关闭流式响应，提前结束或被取消时服务端不再继续生成
         
-        # 移除末尾的分号（如果有的话，我们统一处理）
-        if cleaned_sql.endswith(';'):
-            cleaned_sql = cleaned_sql[:-1].strip()
+        响应对象本身没有关闭接口：REST传输下底层是异步生成器（aclose），gRPC传输下是流式调用（cancel）
+        """
+        for target in (response, getattr(response, '_iterator', None)):
+            try:
+                if hasattr(target, 'aclose'):
+                    await target.aclose()
+                    return
+                if hasattr(target, 'cancel'):
+                    target.cancel()
+                    return
+            except Exception as e:
+                print(f"⚠️ [Gemini] 关闭流式响应失败: {e}")
+                return
+    
+    @staticmethod
+    def _record_usage(call, response):
+        """把响应中的 usage_metadata 记录到调用指标"""
+        usage = getattr(response, 'usage_metadata', None)
+        if call is None or not usage or not getattr(usage, 'prompt_token_count', 0):
+            return
+        call.set_usage(
+            prompt_tokens=usage.prompt_token_count,
+            completion_tokens=getattr(usage, 'candidates_token_count', None),
+            cached_tokens=getattr(usage, 'cached_content_token_count', 0) or 0
+        )
+    
+    def complete(self, messages, max_tokens=2048, json_mode=False, timeout=120):
+        """完整生成（同步接口）"""
+        return run_sync(self.acomplete(messages, max_tokens, json_mode), timeout=timeout)
+    
+    async def acomplete(self, messages, max_tokens=2048, json_mode=False):
+        """
+        完整生成，不使用停止序列、不提前结束（用于批量生成等结构化输出场景）
+        
+        Args:
+            messages: OpenAI格式的消息列表，系统消息会放在提示词开头
+            max_tokens: 最多生成的token数
+            json_mode: 是否要求输出JSON
             
-        print(f"🧹 [Gemini] 清理后的SQL: {cleaned_sql}")
-        return cleaned_sql
+        Returns:
+            str: 模型原始文本
+        """
+        cassette = get_cassette()
+        if cassette is not None:
+            request = {'messages': messages, 'max_tokens': max_tokens, 'json_mode': json_mode}
+            return await cassette.acall('gemini', self.model_name, request,
+                                        lambda: self._asend_complete(messages, max_tokens, json_mode))
+        return await self._asend_complete(messages, max_tokens, json_mode)
+    
+    async def _asend_complete(self, messages, max_tokens, json_mode):
+        """发送完整生成请求"""
+        prompt = "\n\n".join(message['content'] for message in messages)
+        generation_config = dict(self.generation_config, max_output_tokens=max_tokens, stop_sequences=[])
+        if json_mode:
+            generation_config['response_mime_type'] = "application/json"
+        response = await self._arate_limited(
+            lambda: self.model.generate_content_async(prompt, generation_config=generation_config)
+        )
+        return response.text
+    
+    async def _arate_limited(self, fn):
+        """在客户端限流下发送请求，被限流时按服务端建议的间隔或指数退避重试"""
+        if self.rate_limiter is None:
+            return await fn()
+        return await self.rate_limiter.run(fn)
+    
+    def _prepare_context_cache(self, user_query, schema_description, conversation_manager=None, examples=None):
+        """
+        获取系统提示词对应的服务端缓存
+        
+        Returns:
+            tuple: (cached_model, messages, system_prompt)，messages 为系统提示词之后的对话消息；
+                未启用缓存或缓存不可用时 cached_model 为None
+        """
+        if self.context_cache is None:
+            return None, None, None
+        
+        if conversation_manager:
+            messages = conversation_manager.get_messages_for_openai_format(schema_description, user_query, examples)
+        else:
+            messages = [
+                {"role": "system", "content": self.create_system_prompt(schema_description)},
+                {"role": "user", "content": user_query}
+            ]
+        system_prompt = messages[0]['content']
+        
+        cache_name = self.context_cache.get(system_prompt)
+        if not cache_name:
+            return None, None, None
+        try:
+            return self._cached_model(cache_name), messages[1:], system_prompt
+        except Exception as e:
+            print(f"⚠️ [Gemini] 加载服务端缓存失败: {e}")
+            self.context_cache.invalidate(schema_fingerprint(system_prompt))
+            return None, None, None
+    
+    def generate_sql(self, user_query, schema_description, conversation_manager=None, cancel_event=None,
+                     examples=None):
+        """
+        根据用户查询和数据库结构生成SQL（同步接口，在后台事件循环中执行 agenerate_sql）
+        
+        Args:
+            user_query: 用户的自然语言查询
+            schema_description: 数据库结构描述
+            conversation_manager: 对话管理器（可选，用于上下文支持）
+            cancel_event: 可选，被设置后取消请求（对冲请求落败时使用）
+            examples: 可选，相似问题和SQL的示例文本（上下文模式下放在当前问题之前）
+            
+        Returns:
+            tuple: (success: bool, sql_or_error: str)
+        """
+        try:
+            return run_sync(
+                self.agenerate_sql(user_query, schema_description, conversation_manager, examples=examples),
+                cancel_event=cancel_event
+            )
+        except CancelledError:
+            return False, "ERROR: Gemini请求已取消"
     
-    def generate_sql(self, user_query, schema_description, conversation_manager=None):
+    async def agenerate_sql(self, user_query, schema_description, conversation_manager=None, timeout=20,
+                           examples=None):
         """
-        根据用户查询和数据库结构生成SQL
+        根据用户查询和数据库结构生成SQL，token用量和耗时记录到调用指标中
         
         Args:
             user_query: 用户的自然语言查询
             schema_description: 数据库结构描述
             conversation_manager: 对话管理器（可选，用于上下文支持）
+            timeout: 每次调用的超时时间（秒），超时后取消请求
+            examples: 可选，相似问题和SQL的示例文本（上下文模式下放在当前问题之前）
             
         Returns:
             tuple: (success: bool, sql_or_error: str)
         """
+        with LLMCall('gemini', self.model_name) as call:
+            success, result = await self._agenerate_sql(
+                user_query, schema_description, conversation_manager, timeout, examples
+            )
+            call.success = success
+            return success, result
+    
+    async def _agenerate_sql(self, user_query, schema_description, conversation_manager, timeout, examples=None):
+        """生成SQL的具体实现"""
         print(f"🔮 [Gemini] 开始生成SQL...")
         print(f"🔮 [Gemini] 用户查询: {user_query}")
         try:
-            import threading
-            import time
-            
-            result = {'success': False, 'response': None, 'error': None}
-            
             # 判断是否使用上下文模式
             if conversation_manager:
                 # 使用上下文对话模式 (注意：Gemini目前暂用单次模式，可扩展为chat session)
-                prompt = conversation_manager.get_context_for_prompt(schema_description, user_query)
-                print("📤 [Gemini] 使用上下文对话模式")
-                print("📤 [Gemini] 发送的提示词（含历史上下文）:")
-                print("-" * 60)
-                print(prompt)
-                print("-" * 60)
+                prompt = conversation_manager.get_context_for_prompt(schema_description, user_query, examples)
             else:
                 # 使用传统单次对话模式
                 print("🔮 [Gemini] 构建提示词...")
                 prompt = self.create_sql_prompt(user_query, schema_description)
-                
-                print("📤 [Gemini] 使用单次对话模式")
+            
+            # 系统提示词已缓存在服务端时，只发送对话内容（缓存管理使用同步HTTP请求，放到共享线程池中执行）
+            cached_model, messages, system_prompt = await get_llm_executor().arun(
+                self._prepare_context_cache, user_query, schema_description, conversation_manager, examples
+            )
+            if cached_model is not None:
+                full_prompt = prompt
+                prompt = to_gemini_contents(messages)
+                print("📤 [Gemini] 使用服务端缓存，只发送对话内容:")
+                print("-" * 60)
+                for content in prompt:
+                    print(f"[{content['role']}] {' / '.join(content['parts'])}")
+                print("-" * 60)
+            else:
+                print("📤 [Gemini] 使用上下文对话模式" if conversation_manager else "📤 [Gemini] 使用单次对话模式")
                 print("📤 [Gemini] 发送的提示词:")
                 print("-" * 60)
                 print(prompt)
                 print("-" * 60)
             
             print("🔮 [Gemini] 调用 Gemini API 生成SQL...")
+            print(f"🔮 [Gemini] 等待SQL生成响应（最多{timeout}秒）...")
             
-            def make_sql_request():
+            try:
                 try:
-                    response = self.model.generate_content(prompt)
-                    result['response'] = response
-                    result['success'] = True
+                    response = await asyncio.wait_for(
+                        self._arate_limited(lambda: self._agenerate_text(prompt, cached_model)), timeout
+                    )
+                except (asyncio.TimeoutError, RateLimitExceeded):
+                    raise
                 except Exception as e:
-                    result['error'] = e
-            
-            # 创建线程发送请求
-            request_thread = threading.Thread(target=make_sql_request)
-            request_thread.daemon = True
-            request_thread.start()
-            
-            # 等待最多20秒
-            timeout = 20
-            print(f"🔮 [Gemini] 等待SQL生成响应（最多{timeout}秒）...")
-            
-            for i in range(timeout):
-                if result['success'] or result['error']:
-                    break
-                time.sleep(1)
-                if i % 5 == 0 and i > 0:  # 每5秒打印一次状态
-                    print(f"🔮 [Gemini] SQL生成中... ({i}/{timeout}秒)")
-            
-            if result['error']:
-                raise result['error']
-            elif not result['success']:
+                    if cached_model is None:
+                        raise
+                    # 服务端缓存可能已过期或被删除：清除后使用完整提示词重试一次
+                    print(f"⚠️ [Gemini] 使用服务端缓存生成失败，改用完整提示词: {e}")
+                    await get_llm_executor().arun(self.context_cache.invalidate, schema_fingerprint(system_prompt))
+                    response = await asyncio.wait_for(
+                        self._arate_limited(lambda: self._agenerate_text(full_prompt)), timeout
+                    )
+            except asyncio.TimeoutError:
                 return False, "ERROR: Gemini API请求超时，请稍后重试"
             
-            response = result['response']
             print("🔮 [Gemini] 收到 API 响应，正在处理...")
             
-            if not response.text:
+            if not response:
                 print("❌ [Gemini] 收到空响应")
                 return False, "ERROR: Gemini模型返回空响应"
             
-            generated_sql = response.text.strip()
+            generated_sql = response.strip()
             print("📥 [Gemini] 完整原始响应:")
             print("-" * 60)
             print(generated_sql)
@@ -270,61 +488,52 @@ class GeminiSQLGenerator:
             print(f"❌ [Gemini] 异常类型: {type(e).__name__}")
             return False, f"ERROR: Gemini模型调用失败 - {str(e)}"
     
+    def health_check(self, timeout=5):
+        """轻量级健康检查（同步接口）"""
+        return run_sync(self.ahealth_check(timeout))
+    
+    async def ahealth_check(self, timeout=5):
+        """
+        轻量级健康检查：只获取模型元信息，不进行生成
+        
+        Returns:
+            tuple: (healthy: bool, message: str)
+        """
+        model_path = self.model_name if self.model_name.startswith('models/') else f"models/{self.model_name}"
+        try:
+            # SDK没有异步版本的 get_model，放到共享线程池中执行，超时后仍在运行的调用计入线程池指标
+            await get_llm_executor().arun(genai.get_model, model_path, timeout=timeout)
+            return True, "Gemini API正常"
+        except (asyncio.TimeoutError, TimeoutError):
+            return False, f"Gemini API响应超时（>{timeout}秒）"
+        except Exception as e:
+            return False, f"Gemini API不可用: {str(e)}"
+    
     def test_connection(self):
+        """测试Gemini API连接（同步接口）"""
+        return run_sync(self.atest_connection())
+    
+    async def atest_connection(self, timeout=15):
         """测试Gemini API连接"""
         print("🔮 [Gemini] 开始测试 API 连接...")
+        print("🔮 [Gemini] 发送测试请求...")
+        print(f"🔮 [Gemini] 使用模型: {self.model_name}")
+        print(f"🔮 [Gemini] API Key: {self.api_key[:20]}...{self.api_key[-10:]}")
         
-        import threading
-        import time
-        
-        result = {'success': False, 'response': None, 'error': None}
-        
-        def make_request():
-            try:
-                print("🔮 [Gemini] 发送测试请求...")
-                print(f"🔮 [Gemini] 使用模型: {self.model_name}")
-                print(f"🔮 [Gemini] API Key: {self.api_key[:20]}...{self.api_key[-10:]}")
-                
-                test_prompt = "请回复：连接测试成功"
-                print(f"📤 [Gemini] 测试提示词: {test_prompt}")
-                
-                response = self.model.generate_content(test_prompt)
-                result['response'] = response
-                result['success'] = True
-                print("🔮 [Gemini] 收到响应，正在处理...")
-            except Exception as e:
-                result['error'] = e
-                print(f"🔮 [Gemini] 请求异常: {e}")
-                print(f"🔮 [Gemini] 异常详情: {type(e).__name__}: {str(e)}")
-        
-        # 创建线程发送请求
-        request_thread = threading.Thread(target=make_request)
-        request_thread.daemon = True
-        request_thread.start()
-        
-        # 等待最多15秒
-        timeout = 15
+        test_prompt = "请回复：连接测试成功"
+        print(f"📤 [Gemini] 测试提示词: {test_prompt}")
         print(f"🔮 [Gemini] 等待响应（最多{timeout}秒）...")
         
-        for i in range(timeout):
-            if result['success'] or result['error']:
-                break
-            time.sleep(1)
-            if i % 3 == 0:  # 每3秒打印一次状态
-                print(f"🔮 [Gemini] 等待中... ({i+1}/{timeout}秒)")
-        
-        if result['success']:
-            response = result['response']
-            if response and response.text:
-                text = response.text.strip()
-                print(f"📥 [Gemini] 测试响应: {text}")
-                print(f"✅ [Gemini] 连接测试成功")
-                return True
-            else:
-                print("❌ [Gemini] 连接失败: 无响应内容")
-                return False
-        elif result['error']:
-            e = result['error']
+        try:
+            response = await asyncio.wait_for(self.model.generate_content_async(test_prompt), timeout)
+        except asyncio.TimeoutError:
+            print(f"❌ [Gemini] 连接超时（{timeout}秒），可能的原因:")
+            print("   - 网络连接不稳定")
+            print("   - API服务响应缓慢")
+            print("   - 防火墙阻止连接")
+            print("   - 建议切换到其他后端或稍后重试")
+            return False
+        except Exception as e:
             error_str = str(e)
             print(f"❌ [Gemini] 连接测试失败: {e}")
             print(f"❌ [Gemini] 错误类型: {type(e).__name__}")
@@ -343,31 +552,43 @@ class GeminiSQLGenerator:
                 print("   - 获取API Key: https://makersuite.google.com/app/apikey")
             
             return False
-        else:
-            print(f"❌ [Gemini] 连接超时（{timeout}秒），可能的原因:")
-            print("   - 网络连接不稳定")
-            print("   - API服务响应缓慢")
-            print("   - 防火墙阻止连接")
-            print("   - 建议切换到其他后端或稍后重试")
-            return False
+        
+        print("🔮 [Gemini] 收到响应，正在处理...")
+        if response and response.text:
+            text = response.text.strip()
+            print(f"📥 [Gemini] 测试响应: {text}")
+            print(f"✅ [Gemini] 连接测试成功")
+            return True
+        print("❌ [Gemini] 连接失败: 无响应内容")
+        return False
     
-    def get_available_models(self):
-        """获取可用的Gemini模型列表"""
-        try:
-            models = []
-            for model in genai.list_models():
-                if 'generateContent' in model.supported_generation_methods:
-                    models.append(model.name)
+    def get_available_models(self, refresh=False):
+        """获取可用的Gemini模型列表，优先使用模型列表缓存
+        
+        Args:
+            refresh: 是否忽略缓存重新获取
+        """
+        cache = get_model_list_cache()
+        # 不同API Key可用的模型可能不同，按Key的摘要区分（不保存原文）
+        key = f"gemini:{hashlib.sha256((self.api_key or '').encode('utf-8')).hexdigest()[:8]}"
+        if refresh:
+            cache.invalidate(key)
+        models = cache.get(key, self._list_models)
+        if models is not None:
             return models
-        except Exception as e:
-            print(f"获取Gemini模型列表失败: {e}")
-            return [
-                "gemini-1.5-flash", 
-                "gemini-1.5-pro", 
-                "gemini-pro",
-                "gemini-2.5-flash-preview-05-20",
-                "gemini-2.0-flash-preview-image-generation"
-            ]
+        return [
+            "gemini-1.5-flash", 
+            "gemini-1.5-pro", 
+            "gemini-pro",
+            "gemini-2.5-flash-preview-05-20",
+            "gemini-2.0-flash-preview-image-generation"
+        ]
+    
+    @staticmethod
+    def _list_models():
+        """通过网络获取支持generateContent的模型，失败时抛出异常"""
+        return [model.name for model in genai.list_models()
+                if 'generateContent' in model.supported_generation_methods]
 
 if __name__ == '__main__':
     # 测试Gemini连接和SQL生成
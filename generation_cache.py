@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL生成结果缓存
+以归一化后的问题文本、数据库结构指纹、选定表、后端和模型为键，
+缓存大模型成功生成的SQL，支持LRU淘汰和SQLite持久化
+命中时只在内存中记录使用时间，写入、淘汰和使用时间在写入缓存或关闭时批量写入SQLite
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 数字前的这些符号属于数值本身（小数点、正负号、日期和时间的分隔符），归一化时保留
+_NUMERIC_MARKS = '.-+/:'
+
+def normalize_question(question):
+    """
+    归一化问题文本：全角转半角、统一小写、去除空白和标点
+
+    比较符号（如 > < =）属于数学符号而不是标点，会被保留；
+    紧挨在数字前的小数点、正负号和日期分隔符也会保留，“1.5”与“15”、“-100”与“100”、“2024-01-05”与“20240105”不会混淆
+    """
+    text = unicodedata.normalize('NFKC', question or '').lower()
+    kept = []
+    for i, ch in enumerate(text):
+        if ch.isspace():
+            continue
+        if unicodedata.category(ch).startswith('P'):
+            if not (ch in _NUMERIC_MARKS and i + 1 < len(text) and text[i + 1].isdigit()):
+                continue
+        kept.append(ch)
+    return ''.join(kept)
+
+def schema_fingerprint(schema_description):
+    """计算数据库结构描述的指纹"""
+    return hashlib.sha1((schema_description or '').encode('utf-8')).hexdigest()[:16]
+
+class GenerationCache:
+    """带持久化的SQL生成结果LRU缓存"""
+
+    def __init__(self, max_entries=1000, db_path=None):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大缓存条目数，超过后淘汰最久未使用的条目
+            db_path: SQLite持久化文件路径，为None时只使用内存
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 持久化存储的写入使用单独的锁，提交时不阻塞缓存读写
+        self._store_lock = threading.Lock()
+        self._conn = None
+
+        # 待写入持久化存储的变更 [(语句, 参数列表), ...]，按发生顺序写入
+        self._pending = []
+        # 命中的条目及最近使用时间，批量写入持久化存储
+        self._touched = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            self._open_store()
+
+    def _open_store(self):
+        """打开持久化存储并加载最近使用的条目"""
+        try:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generation_cache ("
+                " cache_key TEXT PRIMARY KEY,"
+                " question TEXT,"
+                " sql TEXT NOT NULL,"
+                " created_at REAL,"
+                " last_used REAL)"
+            )
+            self._conn.commit()
+
+            rows = self._conn.execute(
+                "SELECT cache_key, question, sql FROM generation_cache"
+                " ORDER BY last_used DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            # 按最近使用时间从旧到新插入，保持LRU顺序
+            for cache_key, question, sql in reversed(rows):
+                self._entries[cache_key] = {'question': question, 'sql': sql}
+            print(f"💾 [Cache] 从 {self.db_path} 加载 {len(rows)} 条SQL缓存")
+        except sqlite3.Error as e:
+            print(f"⚠️ [Cache] 打开缓存文件失败，仅使用内存缓存: {e}")
+            self._conn = None
+
+    @staticmethod
+    def make_key(question, schema_fp, selected_tables=None, backend=None, model=None, context=None):
+        """
+        生成缓存键
+
+        Args:
+            question: 用户的自然语言查询
+            schema_fp: 数据库结构指纹
+            selected_tables: 用户选择的表列表
+            backend: 大模型后端
+            model: 模型名称
+            context: 对话上下文（上一条成功的SQL），追问类问题的结果依赖于它
+        """
+        raw = json.dumps([
+            normalize_question(question),
+            schema_fp,
+            sorted(selected_tables) if selected_tables else None,
+            backend,
+            model,
+            context or '',
+        ], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key):
+        """
+        查询缓存
+
+        Returns:
+            str: 缓存的SQL，未命中时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            # 使用时间只记录在内存中，下次写入缓存或关闭时批量更新，重启后按真实的LRU顺序加载
+            if self._conn is not None:
+                self._touched[cache_key] = time.time()
+            return entry['sql']
+
+    def put(self, cache_key, question, sql):
+        """写入缓存（同时写入持久化存储）"""
+        now = time.time()
+        with self._lock:
+            self._entries[cache_key] = {'question': question, 'sql': sql}
+            self._entries.move_to_end(cache_key)
+
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                evicted.append(old_key)
+                self.evictions += 1
+
+            if self._conn is not None:
+                self._touched.pop(cache_key, None)
+                self._pending.append((
+                    "INSERT OR REPLACE INTO generation_cache"
+                    " (cache_key, question, sql, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                    [(cache_key, question, sql, now, now)]
+                ))
+                if evicted:
+                    self._pending.append((
+                        "DELETE FROM generation_cache WHERE cache_key = ?", [(key,) for key in evicted]
+                    ))
+        self.flush()
+
+    def flush(self):
+        """把待写入的变更和命中条目的使用时间批量写入持久化存储（提交时不占用缓存读写锁）"""
+        with self._store_lock:
+            with self._lock:
+                if self._conn is None:
+                    return
+                pending, self._pending = self._pending, []
+                touched, self._touched = self._touched, {}
+            if not pending and not touched:
+                return
+            try:
+                for statement, params in pending:
+                    self._conn.executemany(statement, params)
+                if touched:
+                    self._conn.executemany(
+                        "UPDATE generation_cache SET last_used = ? WHERE cache_key = ?",
+                        [(last_used, key) for key, last_used in touched.items()]
+                    )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ [Cache] 写入缓存文件失败: {e}")
+
+    def entries(self):
+        """
+        获取缓存中的所有（问题, SQL）对（用于构建少样本示例库）
+
+        Returns:
+            list: [(question, sql), ...]，按最近使用时间从旧到新
+        """
+        with self._lock:
+            return [(entry['question'], entry['sql']) for entry in self._entries.values() if entry['question']]
+
+    def invalidate(self, cache_key):
+        """删除指定缓存条目"""
+        with self._lock:
+            self._entries.pop(cache_key, None)
+            if self._conn is not None:
+                self._touched.pop(cache_key, None)
+                self._pending.append(("DELETE FROM generation_cache WHERE cache_key = ?", [(cache_key,)]))
+        self.flush()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._touched.clear()
+                self._pending.append(("DELETE FROM generation_cache", [()]))
+        self.flush()
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'persistent': self._conn is not None,
+            }
+
+    def close(self):
+        """关闭持久化存储（先写入尚未保存的变更和使用时间）"""
+        self.flush()
+        with self._store_lock, self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+if __name__ == '__main__':
+    cache = GenerationCache(max_entries=2)
+    fp = schema_fingerprint("表名: users")
+
+    key = GenerationCache.make_key("查询所有用户的姓名和邮箱", fp, backend='ollama', model='qwen2')
+    cache.put(key, "查询所有用户的姓名和邮箱", "SELECT `name`, `email` FROM `users`")
+
+    # 全角字符、空格和标点不同的同一问题
+    same_key = GenerationCache.make_key(" 查询所有用户的姓名和邮箱？", fp, backend='ollama', model='qwen2')
+    start = time.perf_counter()
+    print(cache.get(same_key))
+    print(f"命中耗时: {(time.perf_counter() - start) * 1e6:.1f}μs")
+    print(cache.get_stats())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型后端健康监控
+后台线程定期对各后端进行轻量级探测并缓存状态，
+请求路径只读取缓存状态，仅在真实调用失败后才重新探测
+"""
+
+import threading
+import time
+from datetime import datetime
+from llm_cassette import get_cassette
+
+# 表示后端本身不可用（而不是模型无法理解查询）的错误特征
+BACKEND_FAILURE_MARKERS = ("调用失败", "请求超时", "返回空响应", "连接失败")
+
+def is_backend_failure(error_message):
+    """判断生成失败是否由后端不可用导致"""
+    if not error_message:
+        return False
+    return any(marker in error_message for marker in BACKEND_FAILURE_MARKERS)
+
+class BackendHealthMonitor:
+    """大模型后端健康监控器"""
+
+    def __init__(self, interval=30, failure_interval=5):
+        """
+        初始化健康监控器
+
+        Args:
+            interval: 正常状态下的探测间隔（秒）
+            failure_interval: 后端异常时的探测间隔（秒）
+        """
+        self.interval = interval
+        self.failure_interval = failure_interval
+        self._backends = {}
+        self._states = {}
+        # 各后端最近一次探测的时间（time.monotonic），用于判断缓存状态是否仍然有效
+        self._checked_at = {}
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def register(self, name, generator):
+        """
+        注册需要监控的后端
+
+        Args:
+            name: 后端名称，如 'ollama'、'qwen_api'、'gemini'
+            generator: SQL生成器实例
+        """
+        with self._lock:
+            self._backends[name] = generator
+            self._states.setdefault(name, {
+                'healthy': None,
+                'message': '尚未检查',
+                'last_check': None,
+                'latency_ms': None,
+                'consecutive_failures': 0,
+            })
+
+    def probe(self, name):
+        """
+        立即探测指定后端并更新缓存状态
+
+        Returns:
+            bool: 后端是否健康
+        """
+        generator = self._backends.get(name)
+        if generator is None:
+            return False
+
+        start = time.perf_counter()
+        cassette = get_cassette()
+        try:
+            if cassette is not None and cassette.replaying:
+                # 回放录制的响应时不访问后端
+                healthy, message = True, "回放录制的响应"
+            elif hasattr(generator, 'health_check'):
+                healthy, message = generator.health_check()
+            else:
+                healthy = generator.test_connection()
+                message = "连接正常" if healthy else "连接失败"
+        except Exception as e:
+            healthy, message = False, f"健康检查异常: {str(e)}"
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            state = self._states[name]
+            state['healthy'] = healthy
+            state['message'] = message
+            state['last_check'] = datetime.now().isoformat()
+            state['latency_ms'] = round(latency_ms, 1)
+            state['consecutive_failures'] = 0 if healthy else state['consecutive_failures'] + 1
+            self._checked_at[name] = time.monotonic()
+
+        icon = "✅" if healthy else "⚠️"
+        print(f"{icon} [Health] {name}: {message} ({latency_ms:.0f}ms)")
+        return healthy
+
+    def probe_all(self):
+        """探测所有已注册的后端"""
+        for name in list(self._backends):
+            self.probe(name)
+
+    def is_healthy(self, name):
+        """
+        读取缓存的健康状态（不会发起网络请求）
+
+        Returns:
+            bool: 后端是否健康；尚未检查过或未注册时返回None
+        """
+        with self._lock:
+            state = self._states.get(name)
+            return state['healthy'] if state else None
+
+    def _is_fresh(self, name):
+        """缓存状态是否仍在探测间隔内（异常状态按异常时的间隔计算）"""
+        with self._lock:
+            checked_at = self._checked_at.get(name)
+            if checked_at is None:
+                return False
+            interval = self.interval if self._states[name]['healthy'] else self.failure_interval
+            return time.monotonic() - checked_at < interval
+
+    def ensure_healthy(self, name):
+        """
+        请求路径使用：缓存状态为健康时直接返回，否则重新探测一次
+
+        Returns:
+            bool: 后端是否健康
+        """
+        if self.is_healthy(name):
+            return True
+        return self.probe(name)
+
+    def report_success(self, name):
+        """真实调用成功后更新状态"""
+        with self._lock:
+            state = self._states.get(name)
+            if state:
+                state['healthy'] = True
+                state['consecutive_failures'] = 0
+
+    def report_failure(self, name, error_message=None):
+        """真实调用失败后标记后端异常，并唤醒后台线程立即重新探测"""
+        with self._lock:
+            state = self._states.get(name)
+            if not state:
+                return
+            state['healthy'] = False
+            state['message'] = error_message or "调用失败"
+            state['consecutive_failures'] += 1
+        self._wake_event.set()
+
+    def get_status(self):
+        """获取所有后端的缓存状态"""
+        with self._lock:
+            return {name: dict(state) for name, state in self._states.items()}
+
+    def start(self):
+        """启动后台探测线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="llm-health-monitor", daemon=True)
+        self._thread.start()
+        print(f"🩺 [Health] 后台健康监控已启动（间隔{self.interval}秒）")
+
+    def stop(self):
+        """停止后台探测线程"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        """后台探测循环，启动前刚探测过（如初始化时）的后端第一轮不再重复探测"""
+        first_round = True
+        while not self._stop_event.is_set():
+            for name in list(self._backends):
+                if first_round and self._is_fresh(name):
+                    continue
+                self.probe(name)
+            first_round = False
+
+            # 有后端异常时缩短探测间隔
+            with self._lock:
+                any_unhealthy = any(state['healthy'] is False for state in self._states.values())
+            wait_time = self.failure_interval if any_unhealthy else self.interval
+
+            self._wake_event.wait(wait_time)
+            self._wake_event.clear()
+
+if __name__ == '__main__':
+    class _FakeGenerator:
+        def __init__(self):
+            self.calls = 0
+
+        def health_check(self):
+            self.calls += 1
+            return self.calls % 2 == 1, f"第{self.calls}次检查"
+
+    monitor = BackendHealthMonitor(interval=1, failure_interval=0.5)
+    monitor.register('fake', _FakeGenerator())
+    monitor.start()
+    time.sleep(2)
+    monitor.stop()
+    print(monitor.get_status())
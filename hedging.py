@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对冲请求
+托管模型的尾延迟很高：主模型在其历史P90耗时内仍未返回时，
+向备用后端（或另一个模型）再发一次相同的请求，先返回有效SELECT语句的一方胜出，
+另一方被取消。同时统计对冲带来的额外调用成本和节省的延迟
+"""
+
+import inspect
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from llm_executor import LLMExecutor
+from token_counter import estimate_tokens
+
+class LatencyTracker:
+    """记录最近若干次成功调用的耗时，计算分位数"""
+
+    def __init__(self, window=100):
+        """
+        Args:
+            window: 保留的最近样本数
+        """
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p):
+        """
+        计算分位数（最近邻法）
+
+        Args:
+            p: 分位，0~1
+
+        Returns:
+            float: 分位耗时（秒），没有样本时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(p * len(samples)) - 1))
+        return samples[index]
+
+class HedgedGenerator:
+    """对冲式SQL生成器，对外接口与单个生成器相同"""
+
+    def __init__(self, primary, secondary, primary_name="primary", secondary_name="secondary",
+                 percentile=0.9, initial_delay=5.0, min_delay=1.0, max_delay=15.0,
+                 min_samples=5, timeout=30, window=100):
+        """
+        Args:
+            primary: 主生成器（需实现 generate_sql(user_query, schema_description, conversation_manager)）
+            secondary: 备用生成器，可以是另一个后端或同一后端的另一个模型
+            primary_name: 主生成器名称（日志和统计用）
+            secondary_name: 备用生成器名称
+            percentile: 超过主生成器该分位耗时仍未返回时发出对冲请求
+            initial_delay: 样本不足时使用的对冲等待时间（秒）
+            min_delay: 对冲等待时间下限（秒），避免过早对冲造成大量额外调用
+            max_delay: 对冲等待时间上限（秒）
+            min_samples: 至少有这么多次成功调用后才使用观测到的分位耗时
+            timeout: 整个请求的最长等待时间（秒）
+            window: 耗时统计窗口大小
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.primary_name = primary_name
+        self.secondary_name = secondary_name
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.timeout = timeout
+
+        self.latency = {primary_name: LatencyTracker(window), secondary_name: LatencyTracker(window)}
+
+        # 独立的小线程池：同步生成接口会阻塞等待后台事件循环中的结果，与共享线程池互不影响
+        self._executor = LLMExecutor(max_workers=4, max_pending=8, name="hedge")
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.extra_calls = 0
+        self.extra_prompt_tokens = 0
+        self.saved_seconds = 0.0
+
+    def hedge_delay(self):
+        """当前的对冲等待时间：主生成器观测到的P90耗时，限制在上下限之间"""
+        tracker = self.latency[self.primary_name]
+        if tracker.count() < self.min_samples:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, tracker.percentile(self.percentile)))
+
+    @staticmethod
+    def _supports_cancel(generator):
+        try:
+            return 'cancel_event' in inspect.signature(generator.generate_sql).parameters
+        except (TypeError, ValueError):
+            return False
+
+    def _call(self, name, generator, user_query, schema_description, conversation_manager, cancel_event, examples):
+        """执行一次生成，返回 (name, success, sql_or_error, elapsed)；examples（示例文本）为空时不传给生成器"""
+        start = time.perf_counter()
+        kwargs = {'examples': examples} if examples else {}
+        if self._supports_cancel(generator):
+            kwargs['cancel_event'] = cancel_event
+        success, result = generator.generate_sql(user_query, schema_description, conversation_manager, **kwargs)
+        elapsed = time.perf_counter() - start
+        if success and not result.upper().strip().startswith("SELECT"):
+            success, result = False, "ERROR: 生成的不是SELECT查询语句"
+        if success and not cancel_event.is_set():
+            self.latency[name].record(elapsed)
+        return name, success, result, elapsed
+
+    def generate_sql(self, user_query, schema_description, conversation_manager=None, examples=None):
+        """
+        生成SQL，接口与单个生成器相同
+
+        Returns:
+            tuple: (success: bool, sql_or_error: str)
+        """
+        success, result, _ = self.generate_sql_with_winner(
+            user_query, schema_description, conversation_manager, examples=examples
+        )
+        return success, result
+
+    def generate_sql_with_winner(self, user_query, schema_description, conversation_manager=None, examples=None):
+        """
+        生成SQL，并返回实际给出结果的生成器名称
+
+        Returns:
+            tuple: (success: bool, sql_or_error: str, winner: str 或 None)
+        """
+        with self._lock:
+            self.requests += 1
+
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        delay = self.hedge_delay()
+        cancel_events = {self.primary_name: threading.Event(), self.secondary_name: threading.Event()}
+        futures = {}
+
+        def launch(name, generator):
+            future = self._executor.submit(
+                self._call, name, generator, user_query, schema_description,
+                conversation_manager, cancel_events[name], examples
+            )
+            futures[future] = name
+
+        launch(self.primary_name, self.primary)
+        hedged = False
+        errors = []
+
+        while futures:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            wait_for = deadline - now if hedged else max(0.0, min(deadline, start + delay) - now)
+            done, _ = wait(list(futures), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if hedged:
+                    break
+                # 主生成器超过P90仍未返回，发出对冲请求
+                hedged = True
+                self._record_hedge(schema_description, user_query)
+                print(f"🔀 [Hedge] {self.primary_name} 超过 {delay:.1f} 秒未返回，同时请求 {self.secondary_name}")
+                launch(self.secondary_name, self.secondary)
+                continue
+
+            for future in done:
+                futures.pop(future)
+                try:
+                    name, success, result, elapsed = future.result()
+                except Exception as e:
+                    errors.append(f"ERROR: 生成SQL失败 - {e}")
+                    continue
+                if success:
+                    self._finish(name, hedged, futures, cancel_events, time.perf_counter() - start)
+                    return True, result, name
+                errors.append(result)
+
+            if not hedged and not futures:
+                # 主生成器直接失败，无需等到P90
+                hedged = True
+                self._record_hedge(schema_description, user_query)
+                print(f"🔀 [Hedge] {self.primary_name} 生成失败，改用 {self.secondary_name}")
+                launch(self.secondary_name, self.secondary)
+
+        # 超时或全部失败
+        self._cancel(futures, cancel_events)
+        with self._lock:
+            self.failures += 1
+        if not errors:
+            return False, f"ERROR: 大模型调用超时（>{self.timeout}秒），请稍后重试", None
+        return False, errors[-1], None
+
+    def _record_hedge(self, schema_description, user_query):
+        """记录一次额外调用的成本（按提示词估算token数）"""
+        with self._lock:
+            self.hedges += 1
+            self.extra_calls += 1
+            self.extra_prompt_tokens += estimate_tokens(schema_description) + estimate_tokens(user_query)
+
+    def _finish(self, winner, hedged, futures, cancel_events, elapsed):
+        """记录胜出方，取消仍在运行的请求"""
+        self._cancel(futures, cancel_events)
+        with self._lock:
+            if winner == self.primary_name:
+                self.primary_wins += 1
+            else:
+                self.hedge_wins += 1
+                # 备用生成器胜出时，主生成器至少还需要等到现在才可能返回
+                p90 = self.latency[self.primary_name].percentile(self.percentile)
+                if p90 is not None and p90 > elapsed:
+                    self.saved_seconds += p90 - elapsed
+        if hedged:
+            print(f"🏁 [Hedge] {winner} 胜出（{elapsed:.2f} 秒）")
+
+    def _cancel(self, futures, cancel_events):
+        """取消落败方：未开始的直接取消，正在运行的通知其关闭连接"""
+        for future, name in list(futures.items()):
+            cancel_events[name].set()
+            future.cancel()
+            with self._lock:
+                self.cancelled += 1
+        futures.clear()
+
+    def get_stats(self):
+        """获取对冲统计信息"""
+        with self._lock:
+            stats = {
+                'primary': self.primary_name,
+                'secondary': self.secondary_name,
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_rate': round(self.hedges / self.requests, 3) if self.requests else 0.0,
+                'primary_wins': self.primary_wins,
+                'hedge_wins': self.hedge_wins,
+                'failures': self.failures,
+                'cancelled': self.cancelled,
+                'extra_calls': self.extra_calls,
+                'extra_prompt_tokens': self.extra_prompt_tokens,
+                'saved_seconds': round(self.saved_seconds, 2),
+            }
+        stats['hedge_delay'] = round(self.hedge_delay(), 2)
+        for name, tracker in self.latency.items():
+            p50 = tracker.percentile(0.5)
+            p90 = tracker.percentile(0.9)
+            stats.setdefault('latency', {})[name] = {
+                'samples': tracker.count(),
+                'p50': round(p50, 3) if p50 is not None else None,
+                'p90': round(p90, 3) if p90 is not None else None,
+            }
+        return stats
+
+    def shutdown(self):
+        """关闭对冲线程池"""
+        self._executor.shutdown(wait=False)
+
+if __name__ == '__main__':
+    class DemoGenerator:
+        def __init__(self, delay):
+            self.delay = delay
+
+        def generate_sql(self, user_query, schema_description, conversation_manager=None, cancel_event=None):
+            if cancel_event is not None and cancel_event.wait(self.delay):
+                return False, "ERROR: 已取消"
+            return True, "SELECT COUNT(*) FROM sys_user"
+
+    hedged = HedgedGenerator(DemoGenerator(2.0), DemoGenerator(0.2), "slow", "fast", initial_delay=0.5)
+    print(hedged.generate_sql("统计用户数", "数据库结构信息：..."))
+    print(hedged.get_stats())
+    hedged.shutdown()
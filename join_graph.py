@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+表关联关系图
+由数据库外键（information_schema）构建表之间的关联图；数据库没有声明外键时，
+按 xxx_id 字段名推断关联。可在本地计算表之间的最短JOIN路径，
+只把本次查询涉及的表之间的关联条件放进提示词
+"""
+
+import re
+from collections import deque
+
+_ID_COLUMN = re.compile(r'^(.+?)_?(?:id|Id|ID)$')
+
+def _infer_edges(snapshot):
+    """
+    按字段名推断关联：A.xxx_id 对应主键同名的表（sys_dept.dept_id），
+    或名称为 xxx / xxxs / *_xxx 且主键为 id 的表
+    """
+    primary_keys = {
+        table: [col['field'] for col in info['columns'] if col.get('key') == 'PRI']
+        for table, info in snapshot.items()
+    }
+    edges = []
+    for table, info in snapshot.items():
+        for col in info['columns']:
+            field = col['field']
+            if col.get('key') == 'PRI' and len(primary_keys[table]) == 1:
+                continue
+            match = _ID_COLUMN.match(field)
+            if not match:
+                continue
+            prefix = match.group(1).lower()
+
+            candidates = [
+                (other, field) for other, pks in primary_keys.items()
+                if other != table and pks == [field]
+            ]
+            if not candidates:
+                names = {prefix, prefix + 's', prefix + 'es'}
+                candidates = [
+                    (other, 'id') for other, pks in primary_keys.items()
+                    if other != table and pks == ['id']
+                    and (other.lower() in names or any(other.lower().endswith('_' + name) for name in names))
+                ]
+            # 有多个候选表时无法判断，放弃推断
+            if len(candidates) == 1:
+                other, other_field = candidates[0]
+                edges.append({
+                    'from_table': table, 'to_table': other,
+                    'columns': [(field, other_field)], 'inferred': True
+                })
+    return edges
+
+class JoinGraph:
+    """表关联关系图"""
+
+    def __init__(self, snapshot, foreign_keys=None, infer=None):
+        """
+        构建关联图
+
+        Args:
+            snapshot: DatabaseConnector.get_schema_snapshot() 的结果
+            foreign_keys: DatabaseConnector.get_foreign_keys() 的结果
+            infer: 是否按字段名推断关联，None表示仅在数据库没有声明任何外键时推断
+        """
+        self.tables = set(snapshot)
+        self.edges = []
+
+        grouped = {}
+        for fk in foreign_keys or []:
+            if fk['table'] not in self.tables or fk['referenced_table'] not in self.tables:
+                continue
+            key = (fk['table'], fk['constraint'])
+            edge = grouped.setdefault(key, {
+                'from_table': fk['table'], 'to_table': fk['referenced_table'],
+                'columns': [], 'inferred': False
+            })
+            edge['columns'].append((fk['column'], fk['referenced_column']))
+        self.edges.extend(grouped.values())
+
+        if infer is None:
+            infer = not self.edges
+        if infer:
+            self.edges.extend(_infer_edges(snapshot))
+
+        self._adjacency = {table: [] for table in self.tables}
+        for edge in self.edges:
+            self._adjacency[edge['from_table']].append((edge['to_table'], edge))
+            self._adjacency[edge['to_table']].append((edge['from_table'], edge))
+
+    def find_join_path(self, source, target, max_hops=4):
+        """
+        查找两个表之间的最短关联路径
+
+        Returns:
+            list: 路径上的关联边列表（源表为 source 时为空列表），不连通时返回None
+        """
+        paths = self._shortest_paths({source}, max_hops)
+        return paths.get(target)
+
+    def _shortest_paths(self, sources, max_hops):
+        """从一组表出发的广度优先搜索，返回到达每个表的边列表"""
+        paths = {table: [] for table in sources if table in self.tables}
+        queue = deque(paths)
+        while queue:
+            table = queue.popleft()
+            if len(paths[table]) >= max_hops:
+                continue
+            for neighbor, edge in self._adjacency[table]:
+                if neighbor not in paths:
+                    paths[neighbor] = paths[table] + [edge]
+                    queue.append(neighbor)
+        return paths
+
+    def connect(self, tables, max_hops=3, allow_bridges=True):
+        """
+        找出连接一组表所需的关联边
+
+        从第一个表开始，每次把离已连接部分最近的表接入（近似最小连接树）
+
+        Args:
+            tables: 需要连接的表，按重要程度排序
+            max_hops: 两个表之间允许的最大路径长度
+            allow_bridges: 是否允许经过不在 tables 中的中间表
+
+        Returns:
+            tuple: (edges, bridge_tables) 关联边列表和需要额外加入的中间表
+        """
+        tables = [table for table in tables if table in self.tables]
+        if len(tables) < 2:
+            return [], []
+
+        wanted = set(tables)
+        connected = {tables[0]}
+        edges = []
+        bridges = []
+        if not allow_bridges:
+            max_hops = 1
+
+        remaining = list(tables[1:])
+        while remaining:
+            paths = self._shortest_paths(connected, max_hops)
+            reachable = [table for table in remaining if table in paths]
+            if not reachable:
+                break
+            nearest = min(reachable, key=lambda table: len(paths[table]))
+            for edge in paths[nearest]:
+                if edge not in edges:
+                    edges.append(edge)
+                for table in (edge['from_table'], edge['to_table']):
+                    if table not in connected:
+                        connected.add(table)
+                        if table not in wanted:
+                            bridges.append(table)
+            remaining = [table for table in remaining if table not in connected]
+
+        if not allow_bridges:
+            # 已选表之间的其他直接关联也一并列出
+            for edge in self.edges:
+                if edge not in edges and edge['from_table'] in wanted and edge['to_table'] in wanted:
+                    edges.append(edge)
+        return edges, bridges
+
+    def edges_between(self, tables):
+        """返回两端都在 tables 中的所有关联边"""
+        tables = set(tables)
+        return [edge for edge in self.edges if edge['from_table'] in tables and edge['to_table'] in tables]
+
+def format_join_condition(edge):
+    """格式化一条关联边的JOIN条件"""
+    return ' AND '.join(
+        f"{edge['from_table']}.{a} = {edge['to_table']}.{b}" for a, b in edge['columns']
+    )
+
+def describe_edges(edges):
+    """生成放进提示词的表关联说明"""
+    if not edges:
+        return ''
+    lines = ["表关联关系（JOIN条件）："]
+    for edge in edges:
+        line = f"  - {format_join_condition(edge)}"
+        if edge['inferred']:
+            line += "（按字段名推断）"
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+if __name__ == '__main__':
+    from schema_formatter import _demo_snapshot
+
+    graph = JoinGraph(_demo_snapshot())
+    print(describe_edges(graph.edges))
+    path = graph.find_join_path('sys_user', 'sys_dept')
+    print(' -> '.join(format_join_condition(edge) for edge in path))
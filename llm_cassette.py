@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型响应的录制与回放
+录制模式下正常调用后端，把每次请求的提示词、模型原始回复、耗时（含首个token时间）和token用量追加写入录制文件（JSON Lines）；
+回放模式下不访问任何后端，按请求内容返回录制的原始回复，可以保留原始耗时或不等待。
+原始回复仍然经过各生成器自己的SQL提取和后续流程，用于在没有网络的情况下重复测量 process_query 的端到端耗时
+
+请求先按完整内容匹配；提示词有变化（如数据库结构格式不同、Gemini服务端缓存未命中）时按同一后端的同一问题匹配。
+同一请求录制了多次时按录制顺序依次返回，用完后重复最后一次
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from llm_metrics import current_call
+
+class CassetteMiss(RuntimeError):
+    """回放时录制文件中没有对应的请求"""
+
+# 提示词中当前问题前面的标记（ConversationManager 和各生成器使用的格式）
+_QUESTION_MARKERS = re.compile(r'(?:当前用户查询|当前问题|用户查询)[:：]\s*(.+)')
+
+def _content_text(content):
+    """消息内容转为文本（带 cache_control 标记的内容为分段列表）"""
+    if isinstance(content, list):
+        return "".join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+def request_text(request):
+    """请求的完整提示词文本"""
+    if 'messages' in request:
+        return "\n".join(_content_text(message.get('content')) for message in request['messages'])
+    prompt = request.get('prompt', "")
+    if isinstance(prompt, list):
+        # Gemini contents 列表
+        return "\n".join(part for content in prompt for part in content.get('parts', []) if isinstance(part, str))
+    return str(prompt)
+
+def request_question(request):
+    """请求中的当前问题：最后一条用户消息，或提示词中当前问题标记之后的内容"""
+    if 'messages' in request:
+        users = [message for message in request['messages'] if message.get('role') == 'user']
+        text = _content_text(users[-1].get('content')) if users else ""
+    elif isinstance(request.get('prompt'), list) and request['prompt']:
+        text = "".join(part for part in request['prompt'][-1].get('parts', []) if isinstance(part, str))
+    else:
+        text = str(request.get('prompt', ""))
+    matches = _QUESTION_MARKERS.findall(text)
+    return (matches[-1] if matches else text).strip()
+
+def request_key(backend, model, request):
+    """请求的唯一标识（后端、模型和请求内容的摘要）"""
+    data = json.dumps({'backend': backend, 'model': model, 'request': request},
+                      sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+class LLMCassette:
+    """录制或回放大模型原始响应"""
+
+    def __init__(self, path, mode='replay', latency='original'):
+        """
+        Args:
+            path: 录制文件路径（JSON Lines，录制时追加写入）
+            mode: 'record' 录制，'replay' 回放
+            latency: 回放时的耗时，'original' 按录制的耗时等待，'zero' 立即返回
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"无效的录制模式: {mode}（可选 record / replay）")
+        if latency not in ('original', 'zero'):
+            raise ValueError(f"无效的回放耗时: {latency}（可选 original / zero）")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._by_key = defaultdict(list)
+        self._by_question = defaultdict(list)
+        self._positions = defaultdict(int)
+
+        self.recorded = 0
+        self.replayed = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+        if self.replaying:
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def _load(self):
+        """读取录制文件，建立按请求和按问题的索引"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = [line for line in f if line.strip()]
+        except OSError as e:
+            print(f"⚠️ [Cassette] 读取录制文件 {self.path} 失败: {e}")
+            return
+        for line in lines:
+            entry = json.loads(line)
+            self._by_key[entry['key']].append(entry)
+            self._by_question[(entry['backend'], entry['question'])].append(entry)
+        print(f"📼 [Cassette] 从 {self.path} 加载 {len(lines)} 条录制的响应（回放耗时: {self.latency}）")
+
+    def _next(self, index, key):
+        """按录制顺序取出下一条，用完后重复最后一条（调用方负责加锁）"""
+        entries = index.get(key)
+        if not entries:
+            return None
+        position = self._positions[(id(index), key)]
+        self._positions[(id(index), key)] = position + 1
+        return entries[min(position, len(entries) - 1)]
+
+    async def acall(self, backend, model, request, fn):
+        """
+        录制或回放一次大模型调用
+
+        Args:
+            backend: 后端名称（ollama / qwen_api / gemini）
+            model: 模型名称
+            request: 决定回复内容的请求部分（提示词或消息列表等），需要能序列化为JSON
+            fn: 无参异步函数，真实调用后端并返回模型原始文本
+
+        Returns:
+            str: 模型原始文本（调用失败时可能为None）
+
+        Raises:
+            CassetteMiss: 回放时没有对应的录制
+        """
+        key = request_key(backend, model, request)
+        if self.replaying:
+            return await self._areplay(backend, key, request)
+
+        start = time.perf_counter()
+        response = await fn()
+        latency_ms = (time.perf_counter() - start) * 1000
+        call = current_call()
+        first_token_ms = None
+        if call is not None and call.first_token_at is not None and call.first_token_at >= start:
+            first_token_ms = round((call.first_token_at - start) * 1000, 1)
+        usage = None
+        if call is not None and call.prompt_tokens is not None:
+            usage = {'prompt_tokens': call.prompt_tokens, 'completion_tokens': call.completion_tokens,
+                     'cached_tokens': call.cached_tokens}
+        entry = {
+            'key': key,
+            'backend': backend,
+            'model': model,
+            'question': request_question(request),
+            'request': request,
+            'response': response,
+            'latency_ms': round(latency_ms, 1),
+            'first_token_ms': first_token_ms,
+            'usage': usage,
+            'recorded_at': datetime.now().isoformat(),
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+            self.recorded += 1
+        return response
+
+    async def _areplay(self, backend, key, request):
+        """返回录制的响应，按设置等待原始耗时"""
+        with self._lock:
+            entry = self._next(self._by_key, key)
+            if entry is None:
+                entry = self._next(self._by_question, (backend, request_question(request)))
+                if entry is not None:
+                    self.fuzzy_hits += 1
+            if entry is None:
+                self.misses += 1
+            else:
+                self.replayed += 1
+        if entry is None:
+            raise CassetteMiss(f"录制文件中没有该请求: {backend} {request_question(request)[:50]}")
+
+        call = current_call()
+        if call is not None:
+            call.prompt_text = request_text(request)
+        if self.latency == 'original':
+            first_token_s = (entry.get('first_token_ms') or entry['latency_ms']) / 1000
+            await asyncio.sleep(first_token_s)
+            if call is not None and entry.get('first_token_ms') is not None:
+                call.mark_first_token()
+            await asyncio.sleep(max(entry['latency_ms'] / 1000 - first_token_s, 0))
+        elif call is not None:
+            call.mark_first_token()
+        if call is not None:
+            if entry.get('usage'):
+                call.set_usage(**entry['usage'])
+            call.completion_text = entry['response'] or ""
+        return entry['response']
+
+    def get_stats(self):
+        """获取录制/回放统计"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'path': self.path,
+                'latency': self.latency,
+                'entries': sum(len(entries) for entries in self._by_key.values()),
+                'recorded': self.recorded,
+                'replayed': self.replayed,
+                'fuzzy_hits': self.fuzzy_hits,
+                'misses': self.misses,
+            }
+
+_cassette = None
+
+def get_cassette():
+    """获取当前生效的录制/回放器，未启用时返回None"""
+    return _cassette
+
+def set_cassette(cassette):
+    """设置当前生效的录制/回放器（None表示关闭）"""
+    global _cassette
+    _cassette = cassette
+
+def configure_cassette(config):
+    """
+    根据配置文件 [llm] cassette_mode / cassette_path / cassette_latency 设置录制/回放器
+
+    同一文件和模式重复配置时（如Web服务重新初始化）沿用已有实例，回放进度不会重置
+
+    Returns:
+        LLMCassette: 未启用时返回None
+    """
+    mode = config.get('llm', 'cassette_mode', fallback='off').strip().lower()
+    if mode in ('', 'off'):
+        set_cassette(None)
+        return None
+    path = config.get('llm', 'cassette_path', fallback='llm_cassette.jsonl')
+    latency = config.get('llm', 'cassette_latency', fallback='original').strip().lower()
+    current = get_cassette()
+    if current is not None and (current.path, current.mode, current.latency) == (path, mode, latency):
+        return current
+    cassette = LLMCassette(path, mode, latency)
+    set_cassette(cassette)
+    action = "录制到" if mode == 'record' else "回放"
+    print(f"📼 [Cassette] {action} {path}")
+    return cassette
+
+if __name__ == '__main__':
+    import sys
+
+    # 查看录制文件的概况：python llm_cassette.py llm_cassette.jsonl
+    path = sys.argv[1] if len(sys.argv) > 1 else 'llm_cassette.jsonl'
+    summary = defaultdict(list)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                summary[f"{entry['backend']}:{entry['model']}"].append(entry)
+    for name, entries in summary.items():
+        latencies = sorted(entry['latency_ms'] for entry in entries)
+        print(f"{name}: {len(entries)} 条，平均 {sum(latencies) / len(latencies):.0f}ms，"
+              f"P90 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]:.0f}ms")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用线程池
+所有需要超时控制的阻塞式大模型调用共享一个有界线程池，
+基于Future等待结果，结果就绪后立即返回，并记录超时后仍在运行的任务
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from llm_metrics import mark_enqueued
+
+class LLMExecutor:
+    """有界的大模型调用线程池"""
+
+    def __init__(self, max_workers=8, max_pending=32, name="llm"):
+        """
+        初始化线程池
+
+        Args:
+            max_workers: 最大工作线程数
+            max_pending: 最大排队任务数，超过后直接拒绝新任务
+            name: 线程名前缀
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+
+        # 已超时但仍在运行的任务（无法中断的阻塞调用）
+        self._leaked = set()
+
+        self._submitted = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._leaked_total = 0
+
+    def _wrap(self, fn, args, kwargs):
+        """包装任务，统计运行中的任务数；任务在提交方上下文的副本中执行，排队时间计入调用指标"""
+        context = contextvars.copy_context()
+        context.run(mark_enqueued)
+
+        def task():
+            with self._lock:
+                self._running += 1
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+        return task
+
+    def _on_done(self, future):
+        """任务结束回调"""
+        with self._lock:
+            self._leaked.discard(future)
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        提交任务
+
+        Returns:
+            Future: 任务的Future对象
+
+        Raises:
+            RuntimeError: 排队任务过多时拒绝提交
+        """
+        with self._lock:
+            pending = self._submitted - self._completed - self._failed - self._cancelled
+            if pending >= self.max_workers + self.max_pending:
+                self._rejected += 1
+                raise RuntimeError(f"大模型调用线程池已满（{pending}个任务未完成），请稍后重试")
+            self._submitted += 1
+
+        future = self._executor.submit(self._wrap(fn, args, kwargs))
+        future.add_done_callback(self._on_done)
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        在线程池中执行任务并等待结果
+
+        Args:
+            fn: 要执行的函数
+            timeout: 超时时间（秒），None表示一直等待
+
+        Returns:
+            函数返回值（函数抛出的异常会原样抛出）
+
+        Raises:
+            TimeoutError: 等待超时
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._handle_timeout(future)
+            raise TimeoutError(f"大模型调用超时（>{timeout}秒）")
+
+    async def arun(self, fn, *args, timeout=None, **kwargs):
+        """
+        在线程池中执行阻塞任务并异步等待结果（供异步生成器调用同步SDK和HTTP接口）
+
+        Args:
+            fn: 要执行的函数
+            timeout: 超时时间（秒），None表示一直等待
+
+        Returns:
+            函数返回值（函数抛出的异常会原样抛出）
+
+        Raises:
+            TimeoutError: 等待超时
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self._handle_timeout(future)
+            raise TimeoutError(f"大模型调用超时（>{timeout}秒）")
+
+    def _handle_timeout(self, future):
+        """处理超时任务：未开始的取消，已在运行的记录为泄漏"""
+        with self._lock:
+            self._timed_out += 1
+
+        if future.cancel():
+            with self._lock:
+                self._cancelled += 1
+            return
+
+        with self._lock:
+            if not future.done():
+                self._leaked.add(future)
+                self._leaked_total += 1
+
+    def get_metrics(self):
+        """获取线程池运行指标"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'thread_count': len(self._executor._threads),
+                'running': self._running,
+                'queued': max(0, self._submitted - self._completed - self._failed - self._cancelled - self._running),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timed_out': self._timed_out,
+                'cancelled': self._cancelled,
+                'rejected': self._rejected,
+                'leaked': len(self._leaked),
+                'leaked_total': self._leaked_total,
+            }
+
+    def shutdown(self, wait=False):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+# 全局共享线程池
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+def get_llm_executor():
+    """获取全局共享的大模型调用线程池"""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = LLMExecutor()
+        return _default_executor
+
+if __name__ == '__main__':
+    executor = LLMExecutor(max_workers=2, max_pending=2)
+
+    print(executor.run(lambda: "立即返回", timeout=1))
+
+    try:
+        executor.run(time.sleep, 2, timeout=0.5)
+    except TimeoutError as e:
+        print(f"超时: {e}")
+
+    print(executor.get_metrics())
+    time.sleep(2)
+    print(executor.get_metrics())
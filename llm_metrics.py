@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用指标
+记录每次SQL生成调用的prompt/completion token数、首个token时间、生成速度和排队时间，
+汇总到进程内的指标注册表（GET /api/metrics 的 llm 字段）；
+同时可以收集某一次查询内发生的调用，作为Web查询结果的 llm_stats 字段返回。
+
+调用记录通过 contextvars 传递：run_sync 和 LLMExecutor 会把调用方的上下文带到事件循环任务/工作线程中，
+并在上下文中标记提交时间，用于计算排队时间
+"""
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import CancelledError
+from token_counter import estimate_tokens
+
+_current_call = contextvars.ContextVar('llm_current_call', default=None)
+_collector = contextvars.ContextVar('llm_call_collector', default=None)
+_enqueued_at = contextvars.ContextVar('llm_enqueued_at', default=None)
+
+def mark_enqueued():
+    """标记请求的提交时间（已有标记时保留最早的时间）"""
+    if _enqueued_at.get() is None:
+        _enqueued_at.set(time.perf_counter())
+
+def current_call():
+    """获取当前上下文中正在进行的调用记录，没有时返回None"""
+    return _current_call.get()
+
+class LLMCall:
+    """一次大模型调用的计时和用量记录，作为上下文管理器使用"""
+
+    def __init__(self, backend, model, registry=None):
+        """
+        Args:
+            backend: 后端名称（ollama / qwen_api / gemini）
+            model: 模型名称
+            registry: 指标注册表，默认使用全局注册表
+        """
+        self.backend = backend
+        self.model = model
+        self.registry = registry
+        self.success = False
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.cached_tokens = None
+        self.generation_ms = None
+        self.prompt_text = ""
+        self.completion_text = ""
+        self.start = None
+        self.first_token_at = None
+        self.queue_ms = 0.0
+        self._token = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        enqueued_at = _enqueued_at.get()
+        if enqueued_at is not None:
+            self.queue_ms = max(0.0, (self.start - enqueued_at) * 1000)
+        self._token = _current_call.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_call.reset(self._token)
+        status = 'ok' if self.success else 'error'
+        if exc_type is not None and issubclass(exc_type, (asyncio.CancelledError, CancelledError)):
+            status = 'cancelled'
+        record = self.to_record(status)
+        (self.registry or get_llm_metrics()).record(record)
+        collector = _collector.get()
+        if collector is not None:
+            collector.append(record)
+        return False
+
+    def mark_first_token(self):
+        """收到第一个输出片段时调用"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def set_usage(self, prompt_tokens=None, completion_tokens=None, cached_tokens=None, generation_ms=None):
+        """
+        记录服务端返回的用量
+
+        Args:
+            prompt_tokens: 输入token数
+            completion_tokens: 输出token数
+            cached_tokens: 命中服务端缓存的输入token数
+            generation_ms: 服务端统计的生成耗时（毫秒），用于计算生成速度
+        """
+        if prompt_tokens is not None:
+            self.prompt_tokens = prompt_tokens
+        if completion_tokens is not None:
+            self.completion_tokens = completion_tokens
+        if cached_tokens is not None:
+            self.cached_tokens = cached_tokens
+        if generation_ms is not None:
+            self.generation_ms = generation_ms
+
+    def to_record(self, status):
+        """生成调用记录；服务端没有返回用量时（如流式提前结束）按文本估算token数"""
+        end = time.perf_counter()
+        estimated = self.prompt_tokens is None or self.completion_tokens is None
+        prompt_tokens = self.prompt_tokens if self.prompt_tokens is not None else estimate_tokens(self.prompt_text)
+        completion_tokens = self.completion_tokens if self.completion_tokens is not None \
+            else estimate_tokens(self.completion_text)
+
+        record = {
+            'backend': self.backend,
+            'model': self.model,
+            'status': status,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated': estimated,
+            'total_ms': round((end - self.start) * 1000, 1),
+            'first_token_ms': round((self.first_token_at - self.start) * 1000, 1)
+            if self.first_token_at is not None else None,
+            'queue_ms': round(self.queue_ms, 1),
+            'tokens_per_second': None,
+        }
+        if self.cached_tokens:
+            record['cached_tokens'] = self.cached_tokens
+
+        # 生成速度：优先使用服务端统计的生成耗时，否则使用首个token之后的耗时
+        generation_ms = self.generation_ms
+        if generation_ms is None and self.first_token_at is not None:
+            generation_ms = (end - self.first_token_at) * 1000
+        if completion_tokens and generation_ms:
+            record['tokens_per_second'] = round(completion_tokens / (generation_ms / 1000), 1)
+        return record
+
+@contextmanager
+def collect_llm_calls():
+    """
+    收集代码块内（包括在事件循环和线程池中）发生的大模型调用记录
+
+    Yields:
+        list: 调用记录列表，代码块结束后可读取
+    """
+    calls = []
+    token = _collector.set(calls)
+    try:
+        yield calls
+    finally:
+        _collector.reset(token)
+
+def summarize_calls(calls):
+    """
+    汇总一次查询内的调用记录
+
+    Returns:
+        dict: 汇总值和每次调用的记录，没有调用时返回None
+    """
+    if not calls:
+        return None
+    calls = list(calls)
+    return {
+        'calls': len(calls),
+        'prompt_tokens': sum(call['prompt_tokens'] for call in calls),
+        'completion_tokens': sum(call['completion_tokens'] for call in calls),
+        'total_ms': max(call['total_ms'] for call in calls),
+        'details': calls,
+    }
+
+class LLMMetricsRegistry:
+    """进程内的大模型调用指标注册表，按 "后端:模型" 汇总"""
+
+    def __init__(self, window=200):
+        """
+        Args:
+            window: 计算分位数时保留的最近调用数
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def record(self, record):
+        """记录一次调用并打印摘要"""
+        name = f"{record['backend']}:{record['model']}"
+        with self._lock:
+            entry = self._models.setdefault(name, {
+                'calls': 0, 'errors': 0, 'cancelled': 0,
+                'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0,
+                'recent': deque(maxlen=self.window),
+            })
+            entry['calls'] += 1
+            if record['status'] == 'error':
+                entry['errors'] += 1
+            elif record['status'] == 'cancelled':
+                entry['cancelled'] += 1
+            entry['prompt_tokens'] += record['prompt_tokens']
+            entry['completion_tokens'] += record['completion_tokens']
+            entry['cached_tokens'] += record.get('cached_tokens', 0)
+            entry['recent'].append(record)
+
+        parts = [f"prompt {record['prompt_tokens']} / completion {record['completion_tokens']} tokens"
+                 + ("（估算）" if record['estimated'] else ""),
+                 f"总耗时 {record['total_ms']}ms"]
+        if record['first_token_ms'] is not None:
+            parts.append(f"首个token {record['first_token_ms']}ms")
+        if record['tokens_per_second'] is not None:
+            parts.append(f"{record['tokens_per_second']} tokens/s")
+        if record['queue_ms']:
+            parts.append(f"排队 {record['queue_ms']}ms")
+        print(f"📊 [LLM] {name} {record['status']}: {', '.join(parts)}")
+
+    @staticmethod
+    def _percentile(values, p):
+        values = sorted(value for value in values if value is not None)
+        if not values:
+            return None
+        return values[min(len(values) - 1, max(0, math.ceil(p * len(values)) - 1))]
+
+    def get_stats(self):
+        """获取各模型的汇总指标"""
+        with self._lock:
+            entries = {name: dict(entry, recent=list(entry['recent'])) for name, entry in self._models.items()}
+
+        stats = {}
+        for name, entry in entries.items():
+            recent = entry.pop('recent')
+            summary = dict(entry)
+            for key in ('total_ms', 'first_token_ms', 'queue_ms', 'tokens_per_second'):
+                values = [record[key] for record in recent if record['status'] == 'ok']
+                summary[f'{key}_p50'] = self._percentile(values, 0.5)
+                summary[f'{key}_p90'] = self._percentile(values, 0.9)
+            summary['last'] = recent[-1] if recent else None
+            stats[name] = summary
+        return stats
+
+    def reset(self):
+        """清空指标"""
+        with self._lock:
+            self._models.clear()
+
+# 全局指标注册表
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+def get_llm_metrics():
+    """获取全局大模型调用指标注册表"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = LLMMetricsRegistry()
+        return _default_registry
+
+if __name__ == '__main__':
+    registry = LLMMetricsRegistry()
+    with collect_llm_calls() as calls:
+        with LLMCall('ollama', 'qwen2', registry) as call:
+            time.sleep(0.05)
+            call.mark_first_token()
+            time.sleep(0.05)
+            call.set_usage(prompt_tokens=1200, completion_tokens=30)
+            call.success = True
+    print(summarize_calls(calls))
+    print(registry.get_stats())
@@ -1,19 +1,30 @@
 import os
+import asyncio
 import configparser
-from openai import OpenAI
+from concurrent.futures import CancelledError
+from openai import AsyncOpenAI, BadRequestError
 import json
+from async_runtime import run_sync
+from llm_cassette import get_cassette
+from llm_metrics import LLMCall, current_call
+from sql_extractor import SQLStreamExtractor, extract_sql, get_stop_sequences
+from context_cache import ContextCacheManager, mark_cache_control
+from rate_limiter import get_rate_limiter
 
 class LLMSQLGenerator:
     """使用通义千问大模型生成SQL的类"""
     
-    def __init__(self, model_name="qwen-plus", api_key=None, config_file="config.ini"):
+    def __init__(self, model_name="qwen-plus", api_key=None, config_file="config.ini", stream=True):
         """
         初始化大模型客户端
         model_name: 模型名称，可选 qwen-turbo, qwen-plus, qwen-max
         api_key: API密钥，如果为None则从配置文件或环境变量获取
         config_file: 配置文件路径
+        stream: 是否使用流式生成（SQL完整后提前结束）
         """
         self.model_name = model_name
+        self.stream = stream
+        self.stop_sequences = get_stop_sequences('qwen_api')
         
         # 获取API Key的优先级：传入参数 > 配置文件 > 环境变量
         if api_key:
@@ -45,15 +56,32 @@ class LLMSQLGenerator:
                     print("❌ [Qwen] API Key 未设置")
                     raise ValueError(f"请在配置文件 {config_file} 中设置 qwen_api_key 或设置环境变量 DASHSCOPE_API_KEY")
         
-        # 使用兼容OpenAI的接口
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
+        llm_config = configparser.ConfigParser()
+        llm_config.read(config_file, encoding='utf-8')
+        
+        # 使用兼容OpenAI的异步接口（地址可配置，便于使用代理或本地模拟服务）
+        self.base_url = llm_config.get('llm', 'qwen_base_url', fallback="https://dashscope.aliyuncs.com/compatible-mode/v1")
+        self._async_client = None
+        self._async_client_loop = None
+        
+        # 同一API Key和模型共用的客户端限流器；启用时由限流器负责429重试，关闭SDK自带的重试
+        self.rate_limiter = get_rate_limiter(llm_config, 'qwen_api', self.api_key, self.model_name)
+        
+        # 显式上下文缓存：系统消息带上 cache_control 标记，服务端缓存5分钟，每次命中自动续期
+        self.context_cache = None
+        if llm_config.getboolean('llm', 'context_cache_enabled', fallback=True):
+            self.context_cache = ContextCacheManager(
+                create_fn=lambda content, ttl: "ephemeral",
+                ttl=300,
+                min_tokens=llm_config.getint('llm', 'qwen_cache_min_tokens', fallback=1024),
+                name="Qwen"
+            )
+        self.cached_prompt_tokens = 0
+        self.total_prompt_tokens = 0
     
-    def create_sql_prompt(self, user_query, schema_description):
-        """创建用于生成SQL的提示词"""
-        prompt = f"""你是一个专业的SQL查询助手。请根据用户的自然语言查询需求，生成对应的MySQL SQL查询语句。
+    def create_system_prompt(self, schema_description):
+        """创建系统提示词（数据库结构和要求），同一数据库的多次请求之间保持不变"""
+        return f'''你是一个专业的SQL查询助手。请根据用户的自然语言查询需求，生成对应的MySQL SQL查询语句。
 
 数据库结构信息：
 {schema_description}
@@ -64,7 +92,11 @@ class LLMSQLGenerator:
 3. 使用反引号包围表名和字段名以避免关键字冲突
 4. 如果查询涉及多表，请正确使用JOIN语句
 5. 只返回SQL语句，不要包含其他解释文字
-6. 如果无法理解用户查询或数据库中没有相关表，请返回"ERROR: 无法生成对应的SQL查询"
+6. 如果无法理解用户查询或数据库中没有相关表，请返回"ERROR: 无法生成对应的SQL查询"'''
+    
+    def create_sql_prompt(self, user_query, schema_description):
+        """创建用于生成SQL的提示词"""
+        prompt = self.create_system_prompt(schema_description) + f"""
 
 用户查询: {user_query}
 
@@ -74,60 +106,227 @@ class LLMSQLGenerator:
     
     def _clean_sql_response(self, response):
         """清理模型响应，提取纯SQL语句"""
-        cleaned_sql = response.strip()
+        cleaned_sql = extract_sql(response)
+        print(f"🧹 [Qwen] 清理后的SQL: {cleaned_sql}")
+        return cleaned_sql
+    
+    def _get_async_client(self):
+        """获取当前事件循环的异步客户端（连接池绑定事件循环，同一事件循环内复用连接）"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                **({'max_retries': 0} if self.rate_limiter is not None else {})
+            )
+            self._async_client_loop = loop
+        return self._async_client
+    
+    async def _achat_completion(self, messages):
+        """调用对话补全接口，返回模型原始文本（启用录制/回放时经过录制文件）"""
+        cassette = get_cassette()
+        if cassette is not None:
+            return await cassette.acall('qwen_api', self.model_name, {'messages': messages},
+                                        lambda: self._asend_chat(messages))
+        return await self._asend_chat(messages)
+    
+    async def _asend_chat(self, messages):
+        """
+        调用对话补全接口，返回模型原始文本
         
-        # 移除markdown代码块标记
-        if "```sql" in cleaned_sql:
-            # 提取SQL代码块
-            parts = cleaned_sql.split("```sql")
-            if len(parts) > 1:
-                sql_part = parts[1].split("```")[0]
-                cleaned_sql = sql_part.strip()
-        elif "```" in cleaned_sql:
-            # 提取一般代码块
-            parts = cleaned_sql.split("```")
-            if len(parts) >= 3:
-                sql_part = parts[1]
-                cleaned_sql = sql_part.strip()
+        系统消息达到最小长度时带上显式缓存标记；服务端不支持该标记时关闭显式缓存并重试
+        """
+        call = current_call()
+        if call is not None:
+            call.prompt_text = "\n".join(message['content'] for message in messages)
+        system_prompt = messages[0]['content'] if messages and messages[0]['role'] == 'system' else None
+        if self.context_cache is not None and system_prompt and self.context_cache.get(system_prompt):
+            try:
+                return await self._arate_limited(lambda: self._acreate_completion(mark_cache_control(messages)))
+            except BadRequestError as e:
+                print(f"⚠️ [Qwen] 当前模型不支持显式缓存，关闭后重试: {e}")
+                self.context_cache = None
+        return await self._arate_limited(lambda: self._acreate_completion(messages))
+    
+    async def _arate_limited(self, fn):
+        """在客户端限流下发送请求，被限流（429）时按 Retry-After 或指数退避重试"""
+        if self.rate_limiter is None:
+            return await fn()
+        return await self.rate_limiter.run(fn)
+    
+    def _record_usage(self, usage):
+        """记录token用量和缓存命中的token数"""
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+        self.total_prompt_tokens += usage.prompt_tokens or 0
+        self.cached_prompt_tokens += cached
+        call = current_call()
+        if call is not None:
+            call.set_usage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                           cached_tokens=cached)
+        if cached:
+            print(f"🗄️ [Qwen] 命中服务端缓存 {cached}/{usage.prompt_tokens} prompt tokens")
+    
+    async def _acreate_completion(self, messages):
+        """
+        发送请求
         
-        # 移除可能的其他标记
-        prefixes_to_remove = [
-            "根据您的查询需求，生成的SQL语句如下：",
-            "SQL语句：",
-            "查询语句：",
-            "生成的SQL：",
-            "答案：",
-            "结果：",
-        ]
+        流式模式下SQL语句完整后立即关闭连接，不再等待模型后续的解释文字；
+        任务被取消时同样关闭连接
+        """
+        if not self.stream:
+            completion = await self._get_async_client().chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=0.1,  # 降低随机性，提高一致性
+                max_tokens=1000,
+                stop=self.stop_sequences
+            )
+            self._record_usage(completion.usage)
+            text = completion.choices[0].message.content or ""
+            if current_call() is not None:
+                current_call().completion_text = text
+            return text
         
-        for prefix in prefixes_to_remove:
-            if cleaned_sql.startswith(prefix):
-                cleaned_sql = cleaned_sql[len(prefix):].strip()
+        call = current_call()
+        extractor = SQLStreamExtractor()
+        stream = await self._get_async_client().chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=0.1,
+            max_tokens=1000,
+            stop=self.stop_sequences,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    # 最后一个片段只包含用量统计（提前结束时不会收到）
+                    self._record_usage(getattr(chunk, 'usage', None))
+                    continue
+                content = chunk.choices[0].delta.content or ""
+                if call is not None and content:
+                    call.mark_first_token()
+                if extractor.feed(content):
+                    print("⏹️ [Qwen] SQL语句已完整，提前结束生成")
+                    break
+        finally:
+            await stream.close()
         
-        # 移除末尾的分号（如果有的话，我们统一处理）
-        if cleaned_sql.endswith(';'):
-            cleaned_sql = cleaned_sql[:-1].strip()
+        if call is not None:
+            call.completion_text = extractor.text
+        return extractor.text
+    
+    def complete(self, messages, max_tokens=2048, json_mode=False):
+        """完整生成（同步接口）"""
+        return run_sync(self.acomplete(messages, max_tokens, json_mode))
+    
+    async def acomplete(self, messages, max_tokens=2048, json_mode=False):
+        """
+        完整生成，不使用停止序列、不提前结束（用于批量生成等结构化输出场景）
+        
+        Args:
+            messages: 消息列表
+            max_tokens: 最多生成的token数
+            json_mode: 是否要求输出JSON（模型不支持时自动去掉该要求）
             
-        print(f"🧹 [Qwen] 清理后的SQL: {cleaned_sql}")
-        return cleaned_sql
+        Returns:
+            str: 模型原始文本
+        """
+        cassette = get_cassette()
+        if cassette is not None:
+            request = {'messages': messages, 'max_tokens': max_tokens, 'json_mode': json_mode}
+            return await cassette.acall('qwen_api', self.model_name, request,
+                                        lambda: self._asend_complete(messages, max_tokens, json_mode))
+        return await self._asend_complete(messages, max_tokens, json_mode)
+    
+    async def _asend_complete(self, messages, max_tokens, json_mode):
+        """发送完整生成请求"""
+        kwargs = {
+            'model': self.model_name,
+            'messages': messages,
+            'temperature': 0.1,
+            'max_tokens': max_tokens,
+        }
+        if json_mode:
+            kwargs['response_format'] = {"type": "json_object"}
+        try:
+            completion = await self._arate_limited(lambda: self._get_async_client().chat.completions.create(**kwargs))
+        except BadRequestError:
+            if not json_mode:
+                raise
+            kwargs.pop('response_format')
+            completion = await self._arate_limited(lambda: self._get_async_client().chat.completions.create(**kwargs))
+        self._record_usage(completion.usage)
+        return completion.choices[0].message.content or ""
     
-    def generate_sql(self, user_query, schema_description, conversation_manager=None):
+    def invalidate_context_cache(self):
+        """数据库结构变化时清除缓存记录（服务端缓存到期后自动删除）"""
+        if self.context_cache is not None:
+            self.context_cache.invalidate()
+    
+    def get_cache_stats(self):
+        """获取上下文缓存统计"""
+        stats = self.context_cache.get_stats() if self.context_cache is not None else {'enabled': False}
+        stats['cached_prompt_tokens'] = self.cached_prompt_tokens
+        stats['total_prompt_tokens'] = self.total_prompt_tokens
+        return stats
+    
+    def generate_sql(self, user_query, schema_description, conversation_manager=None, cancel_event=None,
+                     examples=None):
+        """
+        根据用户查询和数据库结构生成SQL（同步接口，在后台事件循环中执行 agenerate_sql）
+        
+        Args:
+            user_query: 用户的自然语言查询
+            schema_description: 数据库结构描述
+            conversation_manager: 对话管理器（可选，用于上下文支持）
+            cancel_event: 可选，被设置后取消请求并关闭连接（对冲请求落败时使用）
+            examples: 可选，相似问题和SQL的示例文本（上下文模式下放在当前问题之前）
+            
+        Returns:
+            tuple: (success: bool, sql_or_error: str)
+        """
+        try:
+            return run_sync(
+                self.agenerate_sql(user_query, schema_description, conversation_manager, examples=examples),
+                cancel_event=cancel_event
+            )
+        except CancelledError:
+            return False, "ERROR: 大模型请求已取消"
+    
+    async def agenerate_sql(self, user_query, schema_description, conversation_manager=None, timeout=60,
+                           examples=None):
         """
-        根据用户查询和数据库结构生成SQL
+        根据用户查询和数据库结构生成SQL，token用量和耗时记录到调用指标中
         
         Args:
             user_query: 用户的自然语言查询
             schema_description: 数据库结构描述
             conversation_manager: 对话管理器（可选，用于上下文支持）
+            timeout: 整个生成过程的超时时间（秒），超时后关闭连接
+            examples: 可选，相似问题和SQL的示例文本（上下文模式下放在当前问题之前）
             
         Returns:
             tuple: (success: bool, sql_or_error: str)
         """
+        with LLMCall('qwen_api', self.model_name) as call:
+            success, result = await self._agenerate_sql(
+                user_query, schema_description, conversation_manager, timeout, examples
+            )
+            call.success = success
+            return success, result
+    
+    async def _agenerate_sql(self, user_query, schema_description, conversation_manager, timeout, examples=None):
+        """生成SQL的具体实现"""
         try:
             # 判断是否使用上下文模式
             if conversation_manager:
                 # 使用上下文对话模式
-                messages = conversation_manager.get_messages_for_openai_format(schema_description, user_query)
+                messages = conversation_manager.get_messages_for_openai_format(schema_description, user_query, examples)
                 print("📤 [Qwen] 使用上下文对话模式")
                 print("📤 [Qwen] 发送的消息数组:")
                 print("-" * 60)
@@ -136,33 +335,26 @@ class LLMSQLGenerator:
                     print(msg['content'][:200] + ('...' if len(msg['content']) > 200 else ''))
                     print()
                 print("-" * 60)
-                
-                completion = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    temperature=0.1,
-                    max_tokens=1000
-                )
             else:
-                # 使用传统单次对话模式
-                prompt = self.create_sql_prompt(user_query, schema_description)
+                # 使用传统单次对话模式（系统消息在前，便于服务端缓存）
+                messages = [
+                    {"role": "system", "content": self.create_system_prompt(schema_description)},
+                    {"role": "user", "content": user_query}
+                ]
                 
                 print("📤 [Qwen] 使用单次对话模式")
-                print("📤 [Qwen] 发送的提示词:")
+                print("📤 [Qwen] 发送的消息:")
                 print("-" * 60)
-                print(prompt)
+                for msg in messages:
+                    print(f"[{msg['role']}] {msg['content']}")
                 print("-" * 60)
-                
-                completion = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.1,  # 降低随机性，提高一致性
-                    max_tokens=1000
-                )
             
-            generated_sql = completion.choices[0].message.content.strip()
+            try:
+                generated_sql = await asyncio.wait_for(self._achat_completion(messages), timeout)
+            except asyncio.TimeoutError:
+                return False, f"ERROR: 大模型调用失败 - 请求超时（>{timeout}秒）"
+            
+            generated_sql = generated_sql.strip()
             
             print("📥 [Qwen] 完整原始响应:")
             print("-" * 60)
@@ -185,18 +377,42 @@ class LLMSQLGenerator:
         except Exception as e:
             return False, f"ERROR: 大模型调用失败 - {str(e)}"
     
+    def health_check(self, timeout=5):
+        """轻量级健康检查（同步接口）"""
+        return run_sync(self.ahealth_check(timeout))
+    
+    async def ahealth_check(self, timeout=5):
+        """
+        轻量级健康检查：只查询模型列表，不消耗生成额度
+        
+        Returns:
+            tuple: (healthy: bool, message: str)
+        """
+        try:
+            await self._get_async_client().with_options(timeout=timeout, max_retries=0).models.list()
+            return True, "通义千问API正常"
+        except Exception as e:
+            return False, f"通义千问API不可用: {str(e)}"
+    
     def test_connection(self):
+        """测试大模型API连接（同步接口）"""
+        return run_sync(self.atest_connection())
+    
+    async def atest_connection(self, timeout=15):
         """测试大模型API连接"""
         try:
             test_prompt = "请回复：连接测试成功"
             print(f"📤 [Qwen] 测试提示词: {test_prompt}")
             
-            completion = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "user", "content": test_prompt}
-                ],
-                max_tokens=50
+            completion = await asyncio.wait_for(
+                self._get_async_client().chat.completions.create(
+                    model=self.model_name,
+                    messages=[
+                        {"role": "user", "content": test_prompt}
+                    ],
+                    max_tokens=50
+                ),
+                timeout
             )
             
             response = completion.choices[0].message.content.strip()
@@ -204,6 +420,9 @@ class LLMSQLGenerator:
             print(f"大模型连接测试: {response}")
             return True
             
+        except asyncio.TimeoutError:
+            print(f"大模型连接失败: 请求超时（>{timeout}秒）")
+            return False
         except Exception as e:
             print(f"大模型连接失败: {e}")
             return False
@@ -8,11 +8,32 @@
 
 import os
 import sys
+import json
 import argparse
+import configparser
 from database_connector import DatabaseConnector
 from sql_security_checker import SQLSecurityChecker
 from result_formatter import QueryResultDisplay
 from conversation_manager import ConversationManager
+from health_monitor import BackendHealthMonitor, is_backend_failure
+from generation_cache import GenerationCache, schema_fingerprint
+from semantic_cache import SemanticCache, create_embedder
+from template_cache import TemplateCache
+from schema_retriever import SchemaRetriever, find_referenced_tables
+from schema_formatter import format_schema
+from join_graph import JoinGraph, describe_edges
+from sql_validator import SQLValidator
+from rule_parser import RuleBasedParser
+from followup_rewriter import FollowUpRewriter
+from example_store import ExampleStore, format_examples, is_standalone_question
+from token_counter import estimate_tokens
+from context_cache import should_cache_full_schema
+from model_list_cache import get_model_list_cache
+from llm_cassette import configure_cassette
+from llm_metrics import collect_llm_calls, summarize_calls
+from hedging import HedgedGenerator
+from fallback_chain import FallbackChain, parse_chain
+from batch_generator import BatchSQLGenerator
 
 class NaturalLanguageToSQL:
     """自然语言转SQL查询工具主类"""
@@ -34,6 +55,10 @@ class NaturalLanguageToSQL:
         self.ollama_url = ollama_url
         self.api_key = api_key
         
+        # 读取可选的性能相关配置（[llm] 等分组），缺失时使用默认值
+        self.config = configparser.ConfigParser()
+        self.config.read(config_file, encoding='utf-8')
+        
         # 初始化各个模块
         try:
             self.db_connector = DatabaseConnector(config_file)
@@ -41,38 +66,248 @@ class NaturalLanguageToSQL:
             self.result_display = QueryResultDisplay()
             self.conversation_manager = ConversationManager()
             
+            # 录制/回放大模型原始响应（[llm] cassette_mode），回放时不访问任何后端
+            self.cassette = configure_cassette(self.config)
+            
+            # 所有后端共用的模型列表缓存，过期后先返回旧列表并在后台刷新
+            get_model_list_cache().configure(
+                ttl=self.config.getfloat('llm', 'model_list_ttl', fallback=300),
+                stale_ttl=self.config.getfloat('llm', 'model_list_stale_ttl', fallback=3600)
+            )
+            
             # 根据后端类型初始化大模型生成器
-            if llm_backend == 'ollama':
-                from ollama_sql_generator import OllamaLLMGenerator
-                self.sql_generator = OllamaLLMGenerator(model_name, ollama_url)
-                print(f"🤖 使用本地Ollama模型: {model_name}")
-            elif llm_backend == 'gemini':
-                print(f"📡 [Main] 正在创建 Gemini SQL 生成器...")
-                print(f"📡 [Main] 模型: {model_name}")
-                from gemini_sql_generator import GeminiSQLGenerator
-                self.sql_generator = GeminiSQLGenerator(model_name, api_key, config_file)
-                print(f"✅ [Main] Gemini SQL 生成器创建完成")
-                print(f"🔮 使用Google Gemini模型: {model_name}")
-            else:  # qwen_api
-                from llm_sql_generator import LLMSQLGenerator
-                self.sql_generator = LLMSQLGenerator(model_name, api_key, config_file)
-                print(f"🌐 使用在线API模型: {model_name}")
+            self.sql_generator = self._create_sql_generator(llm_backend, model_name, api_key)
+            
+            # 后端健康监控（后台线程由Web服务启动）
+            self.health_monitor = BackendHealthMonitor(
+                interval=self.config.getint('llm', 'health_check_interval', fallback=30),
+                failure_interval=self.config.getint('llm', 'health_retry_interval', fallback=5)
+            )
+            self.health_monitor.register(llm_backend, self.sql_generator)
+            
+            # 对冲请求：主模型超过P90耗时仍未返回时，同时请求备用后端/模型，默认关闭
+            self.hedged_generator = None
+            if self.config.getboolean('hedge', 'enabled', fallback=False):
+                self.hedged_generator = self._create_hedged_generator()
+            
+            # 后端降级链：主后端不可用时在同一次请求内切换到下一个后端，默认不启用
+            self.fallback_chain = self._create_fallback_chain()
+            
+            # 批量生成器（首次批量生成时创建）
+            self.batch_generator = None
+            
+            # SQL生成结果缓存（相同问题不再重复调用大模型）
+            self.generation_cache = None
+            if self.config.getboolean('cache', 'generation_cache_enabled', fallback=True):
+                self.generation_cache = GenerationCache(
+                    max_entries=self.config.getint('cache', 'generation_cache_size', fallback=1000),
+                    db_path=self.config.get('cache', 'generation_cache_path', fallback='nl2sql_cache.db') or None
+                )
+            
+            # 参数化模板缓存（只有数字、日期、名称不同的问题在本地填值）
+            self.template_cache = None
+            if self.config.getboolean('cache', 'template_cache_enabled', fallback=True):
+                self.template_cache = TemplateCache(
+                    max_templates=self.config.getint('cache', 'template_cache_size', fallback=5000)
+                )
+            
+            # 语义缓存（换一种说法的相同问题也能复用SQL），默认关闭
+            self.semantic_cache = None
+            if self.config.getboolean('cache', 'semantic_cache_enabled', fallback=False):
+                embedder = create_embedder(
+                    self.config.get('cache', 'semantic_embedder', fallback='ollama'),
+                    ollama_url,
+                    self.config.get('cache', 'semantic_embedding_model', fallback='nomic-embed-text')
+                )
+                self.semantic_cache = SemanticCache(
+                    embedder,
+                    threshold=self.config.getfloat('cache', 'semantic_cache_threshold', fallback=0.92)
+                )
             
             # 数据库schema缓存
             self.schema_description = None
+            self.schema_snapshot = None
+            self.schema_retriever = None
+            self.join_graph = None
+            self.sql_validator = None
+            self.rule_parser = None
+            self.followup_rewriter = None
+            self.example_store = None
             self.all_tables_info = None
             
+            # 执行前按表结构校验和修正SQL中的表名、字段名
+            self.validation_enabled = self.config.getboolean('schema', 'validation_enabled', fallback=True)
+            
+            # 规则解析：简单问题（查询所有X、前N条、数量、最大/最小）不调用大模型
+            self.rules_enabled = self.config.getboolean('rules', 'enabled', fallback=True)
+            # 追问改写：“只要前5条”“按年龄排序”等追问直接在上一条SQL上修改
+            self.followup_enabled = self.config.getboolean('followup', 'enabled', fallback=True)
+            # 少样本示例：调用大模型时附上相似的历史问题和SQL
+            self.examples_enabled = self.config.getboolean('examples', 'enabled', fallback=True)
+            self.examples_top_k = self.config.getint('examples', 'top_k', fallback=3)
+            self.examples_token_budget = self.config.getint('examples', 'token_budget', fallback=400)
+            
+            # 结构检索：表较多时只把与问题相关的表放进提示词
+            self.retrieval_enabled = self.config.getboolean('schema', 'retrieval_enabled', fallback=True)
+            self.retrieval_min_tables = self.config.getint('schema', 'retrieval_min_tables', fallback=8)
+            self.retrieval_top_k = self.config.getint('schema', 'retrieval_top_k', fallback=5)
+            self.retrieval_max_columns = self.config.getint('schema', 'retrieval_max_columns', fallback=30)
+            
+            # 结构描述格式和token预算，可按后端分别设置（如 format_ollama = compact）
+            self.schema_format = self.config.get(
+                'schema', f'format_{llm_backend}',
+                fallback=self.config.get('schema', 'format', fallback='verbose')
+            )
+            self.schema_token_budget = self.config.getint(
+                'schema', f'token_budget_{llm_backend}',
+                fallback=self.config.getint('schema', 'token_budget', fallback=0)
+            )
+            # 启用服务端上下文缓存时，完整结构不超过该token数才直接使用完整结构（不超过结构token预算）
+            self.context_cache_max_schema_tokens = self.config.getint(
+                'llm', 'context_cache_max_schema_tokens', fallback=8000
+            )
+            if self.schema_token_budget > 0:
+                self.context_cache_max_schema_tokens = min(self.context_cache_max_schema_tokens,
+                                                           self.schema_token_budget)
+            
         except Exception as e:
             print(f"初始化失败: {e}")
             sys.exit(1)
     
+    def _create_sql_generator(self, llm_backend, model_name, api_key=None):
+        """
+        根据后端类型创建大模型生成器
+        
+        Args:
+            llm_backend: 大模型后端 ('ollama'、'qwen_api' 或 'gemini')
+            model_name: 模型名称
+            api_key: API密钥（为None时从配置文件读取）
+        """
+        if llm_backend == 'ollama':
+            from ollama_sql_generator import OllamaLLMGenerator
+            generator = OllamaLLMGenerator(
+                model_name, self.ollama_url,
+                keep_alive=self.config.get('llm', 'ollama_keep_alive', fallback='30m'),
+                num_ctx=self.config.getint('llm', 'ollama_num_ctx', fallback=8192)
+            )
+            print(f"🤖 使用本地Ollama模型: {model_name}")
+        elif llm_backend == 'gemini':
+            print(f"📡 [Main] 正在创建 Gemini SQL 生成器...")
+            print(f"📡 [Main] 模型: {model_name}")
+            from gemini_sql_generator import GeminiSQLGenerator
+            generator = GeminiSQLGenerator(model_name, api_key, self.config_file)
+            print(f"✅ [Main] Gemini SQL 生成器创建完成")
+            print(f"🔮 使用Google Gemini模型: {model_name}")
+        else:  # qwen_api
+            from llm_sql_generator import LLMSQLGenerator
+            generator = LLMSQLGenerator(model_name, api_key, self.config_file)
+            print(f"🌐 使用在线API模型: {model_name}")
+        return generator
+    
+    def _create_hedged_generator(self):
+        """根据 [hedge] 配置创建对冲生成器，备用后端创建失败时返回None（不影响主流程）"""
+        hedge_backend = self.config.get('hedge', 'backend', fallback=self.llm_backend)
+        hedge_model = self.config.get('hedge', 'model', fallback='')
+        if not hedge_model:
+            print("⚠️ [Hedge] 未配置备用模型（[hedge] model），不启用对冲请求")
+            return None
+        if hedge_backend == self.llm_backend and hedge_model == self.model_name:
+            print("⚠️ [Hedge] 备用模型与主模型相同，不启用对冲请求")
+            return None
+        
+        try:
+            # 同一后端时沿用命令行传入的API密钥，其他后端从配置文件读取
+            api_key = self.api_key if hedge_backend == self.llm_backend else None
+            secondary = self._create_sql_generator(hedge_backend, hedge_model, api_key)
+        except Exception as e:
+            print(f"⚠️ [Hedge] 创建备用生成器失败，不启用对冲请求: {e}")
+            return None
+        
+        if hedge_backend != self.llm_backend:
+            self.health_monitor.register(hedge_backend, secondary)
+        
+        print(f"🔀 [Hedge] 已启用对冲请求: {self.llm_backend}:{self.model_name} → {hedge_backend}:{hedge_model}")
+        return HedgedGenerator(
+            self.sql_generator, secondary,
+            primary_name=f"{self.llm_backend}:{self.model_name}",
+            secondary_name=f"{hedge_backend}:{hedge_model}",
+            percentile=self.config.getfloat('hedge', 'percentile', fallback=0.9),
+            initial_delay=self.config.getfloat('hedge', 'initial_delay', fallback=5.0),
+            min_delay=self.config.getfloat('hedge', 'min_delay', fallback=1.0),
+            max_delay=self.config.getfloat('hedge', 'max_delay', fallback=15.0),
+            timeout=self.config.getfloat('hedge', 'timeout', fallback=30.0)
+        )
+    
+    def _create_fallback_chain(self):
+        """根据 [llm] fallback_chain 配置创建降级链，未配置时返回None"""
+        try:
+            fallbacks = parse_chain(self.config.get('llm', 'fallback_chain', fallback=''))
+        except ValueError as e:
+            print(f"⚠️ [Fallback] 降级链配置错误，不启用: {e}")
+            return None
+        
+        primary_name = f"{self.llm_backend}:{self.model_name}"
+        generators = [(primary_name, self.hedged_generator or self.sql_generator)]
+        for backend, model in fallbacks:
+            name = f"{backend}:{model}"
+            if name in dict(generators):
+                continue
+            try:
+                api_key = self.api_key if backend == self.llm_backend else None
+                generator = self._create_sql_generator(backend, model, api_key)
+            except Exception as e:
+                print(f"⚠️ [Fallback] 创建 {name} 失败，已跳过: {e}")
+                continue
+            if backend not in self.health_monitor.get_status():
+                self.health_monitor.register(backend, generator)
+            generators.append((name, generator))
+        
+        if len(generators) < 2:
+            return None
+        
+        print(f"🔗 [Fallback] 后端降级链: {' → '.join(name for name, _ in generators)}")
+        return FallbackChain(
+            generators,
+            failure_threshold=self.config.getint('llm', 'breaker_failure_threshold', fallback=3),
+            recovery_timeout=self.config.getfloat('llm', 'breaker_recovery_timeout', fallback=30),
+            report_fn=lambda name, success, result: self._report_generation_health(
+                success, result, name.split(':', 1)[0]
+            )
+        )
+    
+    def llm_backends(self):
+        """参与生成SQL的后端名称（主后端在前）"""
+        backends = [self.llm_backend]
+        if self.fallback_chain is not None:
+            for name in self.fallback_chain.names:
+                backend = name.split(':', 1)[0]
+                if backend not in backends:
+                    backends.append(backend)
+        return backends
+    
+    def ensure_llm_available(self):
+        """
+        请求路径使用：主后端或降级链中任一后端可用即可
+        
+        Returns:
+            tuple: (available: bool, message: str)
+        """
+        for backend in self.llm_backends():
+            if self.health_monitor.ensure_healthy(backend):
+                return True, backend
+        status = self.health_monitor.get_status().get(self.llm_backend, {})
+        return False, status.get('message', '未知错误')
+    
     def initialize(self):
         """初始化连接和获取数据库结构"""
         print("正在初始化...")
         
-        # 测试大模型连接
+        # 测试大模型连接（轻量级探测，结果同时写入健康监控缓存）
         print("1. 检查大模型连接...")
-        if not self.sql_generator.test_connection():
+        primary_healthy = self.health_monitor.probe(self.llm_backend)
+        if not primary_healthy and any(self.health_monitor.probe(backend) for backend in self.llm_backends()[1:]):
+            print(f"⚠️ 主后端 {self.llm_backend} 连接失败，查询将由降级链中的其他后端处理")
+        elif not primary_healthy:
             if self.llm_backend == 'ollama':
                 print("✗ 本地Ollama模型连接失败")
                 print("\n🔧 解决方案:")
@@ -95,17 +330,361 @@ class NaturalLanguageToSQL:
         # 获取数据库结构
         print("3. 读取数据库结构...")
         try:
-            self.schema_description = self.db_connector.get_schema_description()
+            self.schema_snapshot = self.db_connector.get_schema_snapshot()
             self.all_tables_info = self.db_connector.get_tables_info()
-            tables = self.db_connector.get_all_tables()
+            tables = list(self.schema_snapshot)
             print(f"✓ 成功读取 {len(tables)} 个表的结构信息")
+            try:
+                foreign_keys = self.db_connector.get_foreign_keys()
+            except Exception as e:
+                print(f"⚠️ 读取外键信息失败，将按字段名推断表关联: {e}")
+                foreign_keys = []
+            self.join_graph = JoinGraph(self.schema_snapshot, foreign_keys)
+            inferred = sum(1 for edge in self.join_graph.edges if edge['inferred'])
+            print(f"✓ 表关联关系: {len(self.join_graph.edges) - inferred} 个外键，{inferred} 个推断关联")
+            self.schema_description = self._render_schema(self.schema_snapshot)
+            if self.validation_enabled:
+                self.sql_validator = SQLValidator(self.schema_snapshot)
+            if self.rules_enabled:
+                self.rule_parser = RuleBasedParser(
+                    self.schema_snapshot,
+                    min_confidence=self.config.getfloat('rules', 'min_confidence', fallback=0.85),
+                    max_limit=self.config.getint('rules', 'max_limit', fallback=1000)
+                )
+            if self.followup_enabled:
+                self.followup_rewriter = FollowUpRewriter(
+                    self.schema_snapshot,
+                    min_confidence=self.config.getfloat('followup', 'min_confidence', fallback=0.85),
+                    max_limit=self.config.getint('rules', 'max_limit', fallback=1000)
+                )
+            if self.examples_enabled:
+                self._build_example_store()
+            if self.retrieval_enabled and len(tables) >= self.retrieval_min_tables:
+                self.schema_retriever = SchemaRetriever(self.schema_snapshot)
+                print(f"✓ 已建立结构检索索引（完整结构约 {estimate_tokens(self.schema_description)} tokens）")
+            # 本地模型的系统消息使用完整结构，不随检索结果变化，保证前缀复用
+            for generator in self.local_generators():
+                generator.set_stable_schema(self.schema_description)
         except Exception as e:
             print(f"✗ 读取数据库结构失败: {e}")
             return False
         
+        # 预热本地模型，首次查询不再等待模型加载
+        if self.config.getboolean('llm', 'ollama_warmup', fallback=True):
+            self._warm_up_models()
+        
         print("初始化完成！\n")
         return True
     
+    def local_generators(self):
+        """参与生成SQL的本地模型生成器（主模型、对冲备用模型、降级链中的Ollama模型）"""
+        candidates = [self.sql_generator]
+        if getattr(self, 'hedged_generator', None) is not None:
+            candidates.append(self.hedged_generator.secondary)
+        if getattr(self, 'fallback_chain', None) is not None:
+            candidates.extend(generator for _, generator in self.fallback_chain.generators)
+        generators = []
+        for generator in candidates:
+            if hasattr(generator, 'warm_up') and all(generator is not known for known in generators):
+                generators.append(generator)
+        return generators
+    
+    def _warm_up_models(self):
+        """预热本地模型并启动常驻检查（[llm] ollama_keepwarm_interval 为0时不检查）"""
+        if self.cassette is not None and self.cassette.replaying:
+            return
+        timeout = self.config.getfloat('llm', 'ollama_warmup_timeout', fallback=120)
+        interval = self.config.getint('llm', 'ollama_keepwarm_interval', fallback=300)
+        for generator in self.local_generators():
+            if generator.warm_up(timeout) and interval > 0:
+                generator.start_keep_warm(interval)
+    
+    def _build_example_store(self):
+        """建立少样本示例库：对话导出文件和生成缓存中的历史结果，只保留与当前数据库结构相符的示例"""
+        self.example_store = ExampleStore(
+            max_examples=self.config.getint('examples', 'max_examples', fallback=2000),
+            min_similarity=self.config.getfloat('examples', 'min_similarity', fallback=0.2)
+        )
+        validator = None
+        if self.sql_validator is not None:
+            validator = lambda sql: self.sql_validator.validate(sql, quiet=True)[0]
+        seed_files = self.config.get('examples', 'seed_files', fallback='context_test_export.json')
+        for path in filter(None, (item.strip() for item in seed_files.split(','))):
+            if os.path.exists(path):
+                self.example_store.load_export(path, validator)
+        if self.generation_cache is not None:
+            added = self.example_store.add_many(self.generation_cache.entries(), validator)
+            if added:
+                print(f"📚 [Examples] 从SQL生成缓存加载 {added} 个示例")
+        print(f"✓ 少样本示例库: {self.example_store.get_stats()['size']} 个示例")
+    
+    def _report_generation_health(self, success, sql_or_error, backend=None):
+        """根据真实调用结果更新后端健康状态"""
+        backend = backend or self.llm_backend
+        if success:
+            self.health_monitor.report_success(backend)
+        elif is_backend_failure(sql_or_error):
+            self.health_monitor.report_failure(backend, sql_or_error)
+    
+    def _render_schema(self, snapshot, edges=None):
+        """
+        按当前后端配置的格式和token预算生成结构描述，并附上表关联关系
+        
+        Args:
+            snapshot: 要描述的表结构
+            edges: 可选，要附上的关联边；为None时使用这些表之间的所有关联
+        """
+        description = format_schema(snapshot, self.schema_format, self.schema_token_budget)
+        if self.join_graph is not None:
+            if edges is None:
+                edges = self.join_graph.edges_between(snapshot)
+            if edges:
+                description += "\n" + describe_edges(edges)
+        return description
+    
+    def find_join_path(self, source_table, target_table):
+        """
+        在本地计算两个表之间的最短关联路径，不调用大模型
+        
+        Returns:
+            list: [{'from_table', 'to_table', 'columns', 'inferred'}, ...]，不连通时返回None
+        """
+        if self.join_graph is None:
+            return None
+        return self.join_graph.find_join_path(source_table, target_table)
+    
+    def _select_schema(self, user_query, selected_tables=None):
+        """
+        确定本次查询使用的数据库结构描述
+        
+        用户选择了表时使用选定的表；否则在表较多时按问题检索相关的表和字段，
+        上一条成功SQL用到的表始终保留，保证追问能引用之前的表
+        
+        Returns:
+            tuple: (schema_description, schema_info)，schema_info 记录使用的表和token数
+        """
+        if selected_tables:
+            # 用户选定的表不额外加入中间表，只列出它们之间的直接关联
+            edges, _ = self.join_graph.connect(selected_tables, allow_bridges=False)
+            schema_description = self._render_schema(
+                {table: self.schema_snapshot[table] for table in selected_tables if table in self.schema_snapshot},
+                edges
+            )
+            print(f"📋 使用选定的 {len(selected_tables)} 个表: {', '.join(selected_tables)}")
+            return schema_description, {'mode': 'selected', 'tables': list(selected_tables),
+                                        'tokens': estimate_tokens(schema_description)}
+        
+        full_tokens = estimate_tokens(self.schema_description)
+        context_cache = getattr(getattr(self, 'sql_generator', None), 'context_cache', None)
+        if self.schema_retriever is not None and should_cache_full_schema(
+                context_cache, full_tokens, self.context_cache_max_schema_tokens):
+            # 检索结果随问题变化，会让服务端缓存的系统提示词每次都不同；完整结构缓存后只需发送一次
+            print(f"📋 使用所有表（完整结构已缓存在模型服务端）")
+        elif self.schema_retriever is not None:
+            required = find_referenced_tables(
+                self.conversation_manager.get_last_successful_sql(), self.schema_snapshot
+            )
+            retrieved = self.schema_retriever.retrieve(
+                user_query,
+                top_k=self.retrieval_top_k,
+                max_columns=self.retrieval_max_columns,
+                required_tables=required
+            )
+            if retrieved:
+                pruned_snapshot = {
+                    table: {'comment': self.schema_snapshot[table]['comment'], 'columns': columns}
+                    for table, columns in retrieved['tables'].items()
+                }
+                # 只附上连接这些表的关联路径，路径经过的中间表一并加入
+                edges, bridges = self.join_graph.connect(list(pruned_snapshot))
+                for table in bridges:
+                    pruned_snapshot[table] = self.schema_snapshot[table]
+                schema_description = self._render_schema(pruned_snapshot, edges)
+                tokens = estimate_tokens(schema_description)
+                print(f"📋 结构检索选中 {len(pruned_snapshot)}/{len(self.schema_snapshot)} 个表: "
+                      f"{', '.join(pruned_snapshot)}（约 {tokens}/{full_tokens} tokens）")
+                return schema_description, {'mode': 'retrieved', 'tables': list(pruned_snapshot),
+                                            'scores': retrieved['scores'],
+                                            'tokens': tokens, 'full_tokens': full_tokens}
+            print("📋 结构检索未命中任何表，使用所有表")
+        else:
+            print(f"📋 使用所有表")
+        return self.schema_description, {'mode': 'all', 'tokens': full_tokens}
+    
+    def _generate_sql(self, user_query, schema_description, selected_tables=None):
+        """
+        生成SQL：优先查询生成缓存，未命中时调用大模型
+        
+        Args:
+            user_query: 用户的自然语言查询
+            schema_description: 本次使用的数据库结构描述
+            selected_tables: 可选，用户选择的表列表
+            
+        Returns:
+            tuple: (success: bool, sql_or_error: str, meta: dict)
+                meta['source'] 表示SQL来源（'cache'、'template_cache'、'followup'、'rules'、'semantic_cache' 或 'llm'）
+        """
+        meta = {'source': 'llm', 'cache_key': None, 'semantic_scope': None, 'semantic_vector': None}
+        schema_fp = schema_fingerprint(schema_description)
+        context = self.conversation_manager.get_last_successful_sql()
+        # 模板缓存与语义缓存共用的作用域：同一数据库结构和对话上下文
+        meta['scope'] = SemanticCache.make_scope(schema_fp, context)
+        
+        if self.generation_cache is not None:
+            meta['cache_key'] = self.generation_cache.make_key(
+                user_query,
+                schema_fp,
+                selected_tables,
+                self.llm_backend,
+                self.model_name,
+                context=context
+            )
+            cached_sql = self.generation_cache.get(meta['cache_key'])
+            if cached_sql:
+                print("⚡ 命中SQL生成缓存，跳过大模型调用")
+                meta['source'] = 'cache'
+                return True, cached_sql, meta
+        
+        if self.template_cache is not None:
+            template_sql = self.template_cache.lookup(user_query, meta['scope'])
+            if template_sql:
+                print("⚡ 命中参数化SQL模板，已在本地填入新的参数值")
+                meta['source'] = 'template_cache'
+                return True, template_sql, meta
+        
+        if self.followup_rewriter is not None and context:
+            rewritten_sql = self.followup_rewriter.rewrite(user_query, context)
+            if rewritten_sql:
+                print("⚡ 追问已在上一条SQL上本地改写，跳过大模型调用")
+                meta['source'] = 'followup'
+                return True, rewritten_sql, meta
+        
+        if self.rule_parser is not None:
+            rule_sql = self.rule_parser.parse(user_query, selected_tables)
+            if rule_sql:
+                print("⚡ 简单问题已由规则直接生成SQL，跳过大模型调用")
+                meta['source'] = 'rules'
+                return True, rule_sql, meta
+        
+        if self.semantic_cache is not None:
+            meta['semantic_scope'] = meta['scope']
+            meta['semantic_vector'] = self.semantic_cache.embed(user_query)
+            hit = self.semantic_cache.lookup(user_query, meta['semantic_scope'], meta['semantic_vector'])
+            if hit:
+                print(f"⚡ 命中语义缓存（相似问题: {hit['question']}，相似度 {hit['similarity']}），跳过大模型调用")
+                meta['source'] = 'semantic_cache'
+                return True, hit['sql'], meta
+        
+        # 附上相似的历史问题和SQL作为示例（追问依赖上下文，不检索示例）
+        examples = []
+        if self.example_store is not None and (not context or is_standalone_question(user_query)):
+            examples = self.example_store.select(user_query, self.examples_top_k, self.examples_token_budget)
+        meta['examples'] = len(examples)
+        return self._call_llm(user_query, schema_description, meta, format_examples(examples))
+    
+    def _call_llm(self, user_query, schema_description, meta, examples=None):
+        """调用大模型生成SQL（降级链、对冲请求或单个后端），examples 为格式化后的示例文本"""
+        if self.fallback_chain is not None:
+            # 降级链内部逐个后端更新健康状态
+            success, sql_or_error, backend_name = self.fallback_chain.generate_sql_with_backend(
+                user_query, schema_description, self.conversation_manager, examples=examples
+            )
+            meta['generator'] = backend_name
+            return success, sql_or_error, meta
+        
+        if self.hedged_generator is not None:
+            success, sql_or_error, winner = self.hedged_generator.generate_sql_with_winner(
+                user_query, schema_description, self.conversation_manager, examples=examples
+            )
+            meta['generator'] = winner
+            # 名称格式为 "后端:模型"，只把胜出方的结果计入其后端的健康状态
+            self._report_generation_health(success, sql_or_error, winner.split(':', 1)[0] if winner else None)
+            return success, sql_or_error, meta
+        
+        success, sql_or_error = self.sql_generator.generate_sql(
+            user_query, schema_description, self.conversation_manager, examples=examples
+        )
+        self._report_generation_health(success, sql_or_error)
+        return success, sql_or_error, meta
+    
+    def _validate_sql(self, sql):
+        """
+        执行前按表结构校验SQL：修正表名/字段名的近似拼写，引用不存在的表或字段时直接拒绝
+        
+        Returns:
+            tuple: (是否通过, 修正后的SQL或错误信息, 修正记录列表)
+        """
+        if self.sql_validator is None:
+            return True, sql, []
+        ok, sql_or_error, repairs = self.sql_validator.validate(sql)
+        if not ok:
+            self.conversation_manager.update_last_response(sql, False, f"SQL校验失败: {sql_or_error}")
+        elif repairs:
+            self.conversation_manager.update_last_response(sql_or_error, True)
+        return ok, sql_or_error, repairs
+    
+    def _remember_generation(self, user_query, sql, meta):
+        """SQL执行成功后写入生成缓存、模板缓存和语义缓存"""
+        if meta['source'] != 'llm':
+            return
+        if self.generation_cache is not None and meta['cache_key']:
+            self.generation_cache.put(meta['cache_key'], user_query, sql)
+        if self.template_cache is not None:
+            self.template_cache.learn(user_query, sql, meta['scope'])
+        if self.example_store is not None:
+            self.example_store.add(user_query, sql)
+        if self.semantic_cache is not None and meta['semantic_scope']:
+            self.semantic_cache.add(user_query, sql, meta['semantic_scope'], meta['semantic_vector'])
+    
+    def generate_sql_batch(self, questions, selected_tables=None):
+        """
+        批量生成SQL（离线任务使用，不执行查询）
+        
+        多个问题打包进一次请求，所有问题共用同一个结构描述（选定的表或完整结构），不进行逐题检索
+        
+        Args:
+            questions: 问题列表
+            selected_tables: 可选，限定使用的表
+            
+        Returns:
+            list: 与questions一一对应的 {'question', 'success', 'sql' 或 'error'}
+        """
+        if not hasattr(self.sql_generator, 'complete'):
+            raise RuntimeError("当前后端不支持批量生成")
+        
+        if selected_tables:
+            schema_description, _ = self._select_schema(None, selected_tables)
+        else:
+            schema_description = self.schema_description
+        
+        if self.batch_generator is None:
+            # 本地模型的上下文窗口就是 num_ctx，在线模型使用配置值
+            context_tokens = getattr(self.sql_generator, 'num_ctx', None) or \
+                self.config.getint('batch', 'context_tokens', fallback=32768)
+            self.batch_generator = BatchSQLGenerator(
+                self.sql_generator,
+                context_tokens=context_tokens,
+                max_batch=self.config.getint('batch', 'max_batch', fallback=20),
+                max_output_tokens=self.config.getint('batch', 'max_output_tokens', fallback=4096),
+                max_rounds=self.config.getint('batch', 'max_rounds', fallback=3)
+            )
+        
+        results = []
+        for question, (success, sql_or_error) in zip(
+                questions, self.batch_generator.generate_batch(questions, schema_description)):
+            if success:
+                is_safe, safety_message = self.security_checker.is_safe_sql(sql_or_error)
+                if not is_safe:
+                    success, sql_or_error = False, f"ERROR: 安全检查失败 - {safety_message}"
+            key = 'sql' if success else 'error'
+            results.append({'question': question, 'success': success, key: sql_or_error})
+        
+        stats = self.batch_generator.get_stats()
+        print(f"📦 [Batch] 累计 {stats['questions']} 个问题 / {stats['calls']} 次请求，"
+              f"估算prompt tokens {stats['prompt_tokens']}（逐条调用约 {stats['single_prompt_tokens']}），"
+              f"耗时 {stats['wall_time']} 秒")
+        return results
+    
     def process_query(self, user_query, format_type='table', show_sql=True):
         """
         处理用户的自然语言查询
@@ -125,9 +704,8 @@ class NaturalLanguageToSQL:
             # 记录用户查询到对话历史
             self.conversation_manager.add_user_query(user_query)
             
-            success, sql_or_error = self.sql_generator.generate_sql(
-                user_query, self.schema_description, self.conversation_manager
-            )
+            schema_description, _ = self._select_schema(user_query)
+            success, sql_or_error, meta = self._generate_sql(user_query, schema_description)
             
             if not success:
                 # 记录失败的响应
@@ -150,11 +728,18 @@ class NaturalLanguageToSQL:
                 )
             print("✓ 安全检查通过")
             
-            # 3. 执行SQL
+            # 3. 按表结构校验（本地修正近似的表名、字段名）
+            valid, checked, _ = self._validate_sql(generated_sql)
+            if not valid:
+                return self.result_display.display_error(f"SQL校验失败: {checked}", generated_sql)
+            generated_sql = checked
+            
+            # 4. 执行SQL
             print("正在执行查询...")
             column_names, rows = self.db_connector.execute_query(generated_sql)
+            self._remember_generation(user_query, generated_sql, meta)
             
-            # 4. 格式化并返回结果
+            # 5. 格式化并返回结果
             return self.result_display.display_query_result(
                 generated_sql, column_names, rows, show_sql, format_type
             )
@@ -177,6 +762,10 @@ class NaturalLanguageToSQL:
                 'columns': list,      # 列名列表
                 'rows': list,         # 数据行列表
                 'row_count': int,     # 行数
+                'source': str,        # SQL来源（cache/template_cache/followup/rules/semantic_cache/llm）
+                'schema': dict,       # 本次使用的表结构范围和估算token数
+                'repairs': list,      # 可选，执行前对表名/字段名的本地修正
+                'llm_stats': dict,    # 可选，本次查询的大模型调用用量和耗时（命中缓存时没有）
                 'error': str          # 错误信息（仅success=False时）
             }
         """
@@ -187,25 +776,24 @@ class NaturalLanguageToSQL:
             # 记录用户查询到对话历史
             self.conversation_manager.add_user_query(user_query)
             
-            # 获取表结构描述（可能是过滤后的）
-            if selected_tables:
-                schema_description = self.db_connector.get_schema_description(selected_tables)
-                print(f"📋 使用选定的 {len(selected_tables)} 个表: {', '.join(selected_tables)}")
-            else:
-                schema_description = self.schema_description
-                print(f"📋 使用所有表")
+            # 获取表结构描述（用户选定的表或按问题检索出的相关表）
+            schema_description, schema_info = self._select_schema(user_query, selected_tables)
             
-            success, sql_or_error = self.sql_generator.generate_sql(
-                user_query, schema_description, self.conversation_manager
-            )
+            # 收集本次查询中发生的大模型调用（包括对冲和降级链中的调用）
+            with collect_llm_calls() as llm_calls:
+                success, sql_or_error, meta = self._generate_sql(user_query, schema_description, selected_tables)
+            llm_stats = summarize_calls(llm_calls)
             
             if not success:
                 # 记录失败的响应
                 self.conversation_manager.add_assistant_response(sql_or_error, False, sql_or_error)
-                return {
+                result = {
                     'success': False,
                     'error': sql_or_error
                 }
+                if llm_stats:
+                    result['llm_stats'] = llm_stats
+                return result
             
             generated_sql = sql_or_error
             print(f"生成的SQL: {generated_sql}")
@@ -225,19 +813,37 @@ class NaturalLanguageToSQL:
                 }
             print("✓ 安全检查通过")
             
-            # 3. 执行SQL
+            # 3. 按表结构校验（本地修正近似的表名、字段名）
+            valid, checked, repairs = self._validate_sql(generated_sql)
+            if not valid:
+                return {
+                    'success': False,
+                    'error': f"SQL校验失败: {checked}",
+                    'sql': generated_sql
+                }
+            generated_sql = checked
+            
+            # 4. 执行SQL
             print("正在执行查询...")
             column_names, rows = self.db_connector.execute_query(generated_sql)
             print(f"✅ 查询成功，列数: {len(column_names)}, 行数: {len(rows)}")
+            self._remember_generation(user_query, generated_sql, meta)
             
-            # 4. 直接返回结构化数据
-            return {
+            # 5. 直接返回结构化数据
+            result = {
                 'success': True,
                 'sql': generated_sql,
                 'columns': column_names,
                 'rows': rows,
-                'row_count': len(rows)
+                'row_count': len(rows),
+                'source': meta['source'],
+                'schema': schema_info
             }
+            if repairs:
+                result['repairs'] = repairs
+            if llm_stats:
+                result['llm_stats'] = llm_stats
+            return result
             
         except Exception as e:
             return {
@@ -386,6 +992,19 @@ class NaturalLanguageToSQL:
     
     def cleanup(self):
         """清理资源"""
+        if hasattr(self, 'health_monitor'):
+            self.health_monitor.stop()
+        if hasattr(self, 'sql_generator'):
+            for generator in self.local_generators():
+                generator.stop_keep_warm()
+        if getattr(self, 'generation_cache', None) is not None:
+            self.generation_cache.close()
+        if hasattr(getattr(self, 'sql_generator', None), 'invalidate_context_cache'):
+            self.sql_generator.invalidate_context_cache()
+        if getattr(self, 'hedged_generator', None) is not None:
+            if hasattr(self.hedged_generator.secondary, 'invalidate_context_cache'):
+                self.hedged_generator.secondary.invalidate_context_cache()
+            self.hedged_generator.shutdown()
         if hasattr(self, 'db_connector'):
             self.db_connector.disconnect()
 
@@ -402,6 +1021,8 @@ def main():
     parser.add_argument('--format', default='table', 
                        choices=['table', 'json', 'csv', 'simple'],
                        help='结果显示格式')
+    parser.add_argument('--batch', help='批量生成SQL：问题文件路径（每行一个问题），只生成不执行')
+    parser.add_argument('--batch-output', help='批量生成结果输出文件（JSON Lines），默认输出到屏幕')
     
     args = parser.parse_args()
     
@@ -448,7 +1069,18 @@ def main():
             print("初始化失败，程序退出")
             sys.exit(1)
         
-        if args.query:
+        if args.batch:
+            # 批量模式：多个问题打包生成SQL
+            with open(args.batch, 'r', encoding='utf-8') as f:
+                questions = [line.strip() for line in f if line.strip()]
+            lines = [json.dumps(item, ensure_ascii=False) for item in tool.generate_sql_batch(questions)]
+            if args.batch_output:
+                with open(args.batch_output, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+                print(f"批量结果已写入 {args.batch_output}")
+            else:
+                print('\n'.join(lines))
+        elif args.query:
             # 非交互模式：直接执行查询
             result = tool.process_query(args.query, args.format)
             print(result)
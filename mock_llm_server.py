@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟大模型服务
+同时实现 Ollama（/api/generate、/api/chat、/api/tags、/api/ps）和OpenAI兼容接口（/v1/chat/completions、/v1/models），
+不需要真实模型和网络即可对整个流程做压力测试：
+- 支持流式（Ollama为NDJSON，OpenAI兼容接口为SSE）和非流式响应，遵守请求中的停止序列
+- 首个token延迟、每个片段的间隔可按分布随机（constant / uniform / normal / lognormal / exponential，单位毫秒）
+- 按比例注入500错误和429限流（带 Retry-After）
+- SQL来自规则文件（正则 → SQL模板，可引用分组），其次是基于结构快照的规则解析，最后是默认SQL
+
+使用方式：
+    python mock_llm_server.py --port 11434 --latency lognormal:800,0.4 --rate-limit-rate 0.05
+    python main.py --backend ollama --ollama-url http://127.0.0.1:11434
+    通义千问：配置文件中设置 [llm] qwen_base_url = http://127.0.0.1:11434/v1（API Key任意填写）
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rule_parser import RuleBasedParser
+from schema_formatter import _demo_snapshot
+from token_counter import estimate_tokens
+
+class LatencyDistribution:
+    """延迟分布，格式为 类型:参数（毫秒），如 constant:200、uniform:100,500、normal:300,50、lognormal:300,0.5"""
+
+    PARAM_COUNTS = {'constant': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'exponential': 1}
+
+    def __init__(self, spec='constant:0'):
+        """
+        Args:
+            spec: 分布描述；lognormal 的参数为中位数和sigma，exponential 的参数为均值
+        """
+        kind, _, params = str(spec).partition(':')
+        kind = kind.strip().lower()
+        try:
+            values = [float(value) for value in params.split(',')] if params.strip() else []
+        except ValueError:
+            values = None
+        if kind not in self.PARAM_COUNTS or values is None or len(values) != self.PARAM_COUNTS[kind]:
+            raise ValueError(f"无效的延迟分布: {spec}（可选 {', '.join(self.PARAM_COUNTS)}）")
+        self.spec = spec
+        self.kind = kind
+        self.params = values
+
+    def sample(self, rng):
+        """抽取一个延迟（秒）"""
+        if self.kind == 'constant':
+            ms = self.params[0]
+        elif self.kind == 'uniform':
+            ms = rng.uniform(*self.params)
+        elif self.kind == 'normal':
+            ms = rng.gauss(*self.params)
+        elif self.kind == 'lognormal':
+            median, sigma = self.params
+            ms = rng.lognormvariate(math.log(max(median, 1e-3)), sigma)
+        else:
+            ms = rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0
+        return max(ms, 0) / 1000
+
+def load_rules(path):
+    """读取规则文件：JSON对象，键为匹配问题的正则，值为SQL模板（可用 \\1 引用分组），按文件中的顺序匹配"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# 提示词中当前问题前面的标记（ConversationManager 和各生成器使用的格式）
+_QUESTION_MARKERS = re.compile(r'(?:当前用户查询|当前问题|用户查询)[:：]\s*(.+)')
+
+class MockResponder:
+    """根据问题生成模拟的模型回复"""
+
+    def __init__(self, snapshot=None, rules=None, default_sql=None, explain=True):
+        """
+        Args:
+            snapshot: 结构快照 {表名: {'comment', 'columns'}}，用于规则解析，默认使用演示结构
+            rules: {正则: SQL模板}，优先于规则解析
+            default_sql: 都无法处理时返回的SQL，默认查询第一张表的前10条
+            explain: 是否在SQL后附带解释文字（与真实模型一样，由停止序列或提前结束截断）
+        """
+        self.snapshot = snapshot or _demo_snapshot()
+        self.rules = [(re.compile(pattern), template) for pattern, template in (rules or {}).items()]
+        self.parser = RuleBasedParser(self.snapshot)
+        self.default_sql = default_sql or f"SELECT * FROM `{next(iter(self.snapshot))}` LIMIT 10"
+        self.explain = explain
+
+    @staticmethod
+    def extract_question(text):
+        """从提示词或最后一条用户消息中取出当前问题"""
+        matches = _QUESTION_MARKERS.findall(text)
+        return matches[-1].strip() if matches else text.strip()
+
+    def answer_sql(self, question):
+        """按 规则文件 → 规则解析 → 默认SQL 的顺序生成SQL"""
+        for pattern, template in self.rules:
+            match = pattern.search(question)
+            if match:
+                return match.expand(template)
+        return self.parser.parse(question) or self.default_sql
+
+    def respond(self, text, json_mode=False):
+        """
+        生成回复文本
+
+        Args:
+            text: 提示词或最后一条用户消息
+            json_mode: 是否要求输出JSON（批量生成时内容为 [{'id', 'question'}, ...]）
+        """
+        if "连接测试成功" in text:
+            return "连接测试成功"
+        if json_mode:
+            try:
+                items = json.loads(text)
+            except ValueError:
+                items = None
+            if isinstance(items, list):
+                return json.dumps({'results': [
+                    {'id': item.get('id'), 'sql': self.answer_sql(str(item.get('question', '')))}
+                    for item in items if isinstance(item, dict)
+                ]}, ensure_ascii=False)
+        sql = self.answer_sql(self.extract_question(text))
+        if self.explain:
+            return f"{sql};\n\n说明：该查询根据问题中提到的表和字段生成。"
+        return sql
+
+def _apply_stop(text, stop):
+    """在第一个停止序列处截断"""
+    positions = [text.find(sequence) for sequence in (stop or []) if sequence and sequence in text]
+    return text[:min(positions)] if positions else text
+
+def _split_pieces(text):
+    """按词切分为流式片段（保留空白）"""
+    return re.findall(r'\S+\s*|\s+', text) or [""]
+
+class MockLLMServer:
+    """模拟的Ollama / OpenAI兼容大模型服务"""
+
+    def __init__(self, host='127.0.0.1', port=11434, responder=None, latency='constant:0',
+                 token_delay='constant:0', load_latency=0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, models=None, seed=None):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            responder: MockResponder，默认使用演示结构
+            latency: 首个token之前的延迟分布（模拟预填充）
+            token_delay: 流式响应中每个片段之间的延迟分布
+            load_latency: 模型首次加载的延迟（毫秒），预热或第一次请求时发生一次
+            error_rate: 返回500错误的比例
+            rate_limit_rate: 返回429限流的比例
+            retry_after: 429响应中 Retry-After 的秒数
+            models: 模型名称列表，用于 /api/tags 和 /v1/models
+            seed: 随机种子，相同种子下延迟和错误注入可以复现
+        """
+        self.responder = responder or MockResponder()
+        self.latency = latency if isinstance(latency, LatencyDistribution) else LatencyDistribution(latency)
+        self.token_delay = token_delay if isinstance(token_delay, LatencyDistribution) \
+            else LatencyDistribution(token_delay)
+        self.load_latency = load_latency / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.models = list(models or ['qwen2:latest', 'qwen-plus'])
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.requests = {}
+        self.errors = 0
+        self.rate_limited = 0
+        self.disconnects = 0
+        self.warm_ups = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self._server = ThreadingHTTPServer((host, port), _MockHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """服务的基础URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程中启动服务，返回基础URL"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self):
+        """在当前线程中运行服务（命令行使用）"""
+        self._server.serve_forever()
+
+    def stop(self):
+        """停止服务并关闭监听端口"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def sample(self, distribution):
+        """抽取一个延迟（秒），多个请求线程共用一个随机数生成器"""
+        with self._lock:
+            return distribution.sample(self._rng)
+
+    def begin_request(self, path):
+        """
+        记录请求并决定是否注入错误
+
+        Returns:
+            int: 需要返回的错误状态码（500 / 429），正常处理时返回None
+        """
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                return 429
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return 500
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return None
+
+    def end_request(self, disconnected=False):
+        with self._lock:
+            self.in_flight -= 1
+            if disconnected:
+                self.disconnects += 1
+
+    def ensure_loaded(self, warm_up=False):
+        """
+        模拟模型加载：第一次请求（或预热）时等待加载延迟
+
+        Returns:
+            float: 本次加载耗时（秒），已加载时为0
+        """
+        with self._lock:
+            if warm_up:
+                self.warm_ups += 1
+            if self._loaded:
+                return 0.0
+            self._loaded = True
+        time.sleep(self.load_latency)
+        return self.load_latency
+
+    def loaded_models(self):
+        """/api/ps 返回的已加载模型"""
+        with self._lock:
+            if not self._loaded:
+                return []
+        expires_at = datetime.fromtimestamp(time.time() + 1800, timezone.utc).isoformat()
+        return [{'name': self.models[0], 'model': self.models[0], 'size': 0, 'size_vram': 0,
+                 'expires_at': expires_at}]
+
+    def get_stats(self):
+        """获取请求统计"""
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'total_requests': sum(self.requests.values()),
+                'errors': self.errors,
+                'rate_limited': self.rate_limited,
+                'disconnects': self.disconnects,
+                'warm_ups': self.warm_ups,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'latency': self.latency.spec,
+                'token_delay': self.token_delay.spec,
+            }
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """模拟服务的请求处理"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def _send_json(self, body, status=200, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, openai):
+        """返回注入的错误，格式与对应接口一致"""
+        message = "Rate limit exceeded (mock)" if status == 429 else "Internal server error (mock)"
+        headers = {'Retry-After': str(self.mock.retry_after)} if status == 429 else None
+        if openai:
+            error_type = 'rate_limit_error' if status == 429 else 'server_error'
+            body = {'error': {'message': message, 'type': error_type, 'code': str(status)}}
+        else:
+            body = {'error': message}
+        self._send_json(body, status, headers)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        mock = self.mock
+        if self.path == '/':
+            data = b"Ollama is running"
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            return self.wfile.write(data)
+        if self.path == '/api/tags':
+            return self._send_json({'models': [{'name': name, 'model': name} for name in mock.models]})
+        if self.path == '/api/ps':
+            return self._send_json({'models': mock.loaded_models()})
+        if self.path == '/v1/models':
+            return self._send_json({'object': 'list', 'data': [
+                {'id': name, 'object': 'model', 'owned_by': 'mock'} for name in mock.models
+            ]})
+        if self.path == '/mock/stats':
+            return self._send_json(mock.get_stats())
+        self._send_json({'error': f"not found: {self.path}"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json({'error': "invalid json"}, 400)
+
+        routes = {
+            '/api/generate': self._handle_ollama,
+            '/api/chat': self._handle_ollama,
+            '/v1/chat/completions': self._handle_openai,
+            '/chat/completions': self._handle_openai,
+        }
+        handler = routes.get(self.path)
+        if handler is None:
+            return self._send_json({'error': f"not found: {self.path}"}, 404)
+
+        status = self.mock.begin_request(self.path)
+        if status is not None:
+            return self._send_error(status, openai=handler == self._handle_openai)
+        disconnected = False
+        try:
+            handler(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前结束（如SQL已完整）时关闭连接
+            disconnected = True
+        finally:
+            self.mock.end_request(disconnected)
+
+    def _handle_ollama(self, payload):
+        mock = self.mock
+        model = payload.get('model') or mock.models[0]
+        is_chat = self.path == '/api/chat'
+        if not is_chat and 'prompt' not in payload:
+            # 不带提示词的generate只加载模型（预热）
+            load = mock.ensure_loaded(warm_up=True)
+            return self._send_json({'model': model, 'created_at': datetime.now(timezone.utc).isoformat(),
+                                    'response': '', 'done': True, 'done_reason': 'load',
+                                    'load_duration': int(load * 1e9)})
+
+        if is_chat:
+            messages = payload.get('messages', [])
+            prompt_text = "\n".join(str(message.get('content', '')) for message in messages)
+            user_text = next((str(m.get('content', '')) for m in reversed(messages) if m.get('role') == 'user'), "")
+        else:
+            prompt_text = user_text = str(payload.get('prompt', ''))
+        options = payload.get('options') or {}
+        start = time.perf_counter()
+        load = mock.ensure_loaded()
+        prefill = mock.sample(mock.latency)
+        time.sleep(prefill)
+
+        text = mock.responder.respond(user_text, json_mode=payload.get('format') == 'json')
+        text = _apply_stop(text, options.get('stop'))
+        pieces = _split_pieces(text)
+
+        def chunk(piece, done):
+            body = {'model': model, 'created_at': datetime.now(timezone.utc).isoformat(), 'done': done}
+            if is_chat:
+                body['message'] = {'role': 'assistant', 'content': piece}
+            else:
+                body['response'] = piece
+            return body
+
+        def final_stats(body):
+            eval_s = max(time.perf_counter() - start - load - prefill, 0)
+            body.update({
+                'done_reason': 'stop',
+                'total_duration': int((time.perf_counter() - start) * 1e9),
+                'load_duration': int(load * 1e9),
+                'prompt_eval_count': estimate_tokens(prompt_text),
+                'prompt_eval_duration': int(prefill * 1e9),
+                'eval_count': estimate_tokens(text),
+                'eval_duration': int(eval_s * 1e9),
+            })
+            return body
+
+        # Ollama 默认使用流式响应
+        if not payload.get('stream', True):
+            for _ in pieces:
+                time.sleep(mock.sample(mock.token_delay))
+            return self._send_json(final_stats(chunk(text, True)))
+
+        self._start_stream('application/x-ndjson')
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(mock.sample(mock.token_delay))
+            self._write_chunk(json.dumps(chunk(piece, False), ensure_ascii=False).encode('utf-8') + b"\n")
+        self._write_chunk(json.dumps(final_stats(chunk("", True))).encode('utf-8') + b"\n")
+        self._end_stream()
+
+    def _handle_openai(self, payload):
+        mock = self.mock
+        model = payload.get('model') or mock.models[0]
+        messages = payload.get('messages', [])
+
+        def content_text(message):
+            content = message.get('content', '')
+            # 带 cache_control 标记的消息内容为分段列表
+            if isinstance(content, list):
+                return "".join(part.get('text', '') for part in content if isinstance(part, dict))
+            return str(content)
+
+        prompt_text = "\n".join(content_text(message) for message in messages)
+        user_text = next((content_text(m) for m in reversed(messages) if m.get('role') == 'user'), "")
+        mock.ensure_loaded()
+        time.sleep(mock.sample(mock.latency))
+
+        json_mode = (payload.get('response_format') or {}).get('type') == 'json_object'
+        text = mock.responder.respond(user_text, json_mode=json_mode)
+        stop = payload.get('stop')
+        text = _apply_stop(text, [stop] if isinstance(stop, str) else stop)
+        completion_id = f"chatcmpl-mock-{int(time.time() * 1000)}"
+        created = int(time.time())
+        usage = {
+            'prompt_tokens': estimate_tokens(prompt_text),
+            'completion_tokens': estimate_tokens(text),
+            'total_tokens': estimate_tokens(prompt_text) + estimate_tokens(text),
+            'prompt_tokens_details': {'cached_tokens': 0},
+        }
+        pieces = _split_pieces(text)
+
+        if not payload.get('stream'):
+            for _ in pieces:
+                time.sleep(mock.sample(mock.token_delay))
+            return self._send_json({
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+
+        def event(choices, **extra):
+            body = dict({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                         'model': model, 'choices': choices}, **extra)
+            return f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        self._start_stream('text/event-stream')
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(mock.sample(mock.token_delay))
+            delta = {'role': 'assistant', 'content': piece} if index == 0 else {'content': piece}
+            self._write_chunk(event([{'index': 0, 'delta': delta, 'finish_reason': None}]))
+        self._write_chunk(event([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            self._write_chunk(event([], usage=usage))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+def main():
+    """命令行启动模拟服务"""
+    parser = argparse.ArgumentParser(description='模拟的 Ollama / OpenAI兼容 大模型服务（压力测试用）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=11434, help='监听端口（默认与Ollama相同）')
+    parser.add_argument('--latency', default='constant:0', help='首个token延迟分布（毫秒），如 lognormal:800,0.4')
+    parser.add_argument('--token-delay', default='constant:0', help='流式片段间隔分布（毫秒），如 uniform:5,20')
+    parser.add_argument('--load-latency', type=float, default=0, help='模型首次加载延迟（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500错误的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回429限流的比例')
+    parser.add_argument('--retry-after', type=int, default=1, help='429响应的 Retry-After 秒数')
+    parser.add_argument('--rules', help='规则文件（JSON：{"问题正则": "SQL模板"}）')
+    parser.add_argument('--snapshot', help='结构快照文件（JSON：get_schema_snapshot() 的结果），默认使用演示结构')
+    parser.add_argument('--default-sql', help='无法处理的问题返回的SQL')
+    parser.add_argument('--models', default='qwen2:latest,qwen-plus', help='模型名称列表，逗号分隔')
+    parser.add_argument('--no-explain', action='store_true', help='回复中不附带解释文字')
+    parser.add_argument('--seed', type=int, help='随机种子')
+    args = parser.parse_args()
+
+    snapshot = None
+    if args.snapshot:
+        with open(args.snapshot, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    responder = MockResponder(
+        snapshot=snapshot,
+        rules=load_rules(args.rules) if args.rules else None,
+        default_sql=args.default_sql,
+        explain=not args.no_explain
+    )
+    server = MockLLMServer(
+        args.host, args.port, responder,
+        latency=args.latency, token_delay=args.token_delay, load_latency=args.load_latency,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        models=[name.strip() for name in args.models.split(',') if name.strip()], seed=args.seed
+    )
+    print(f"🧪 [Mock] 模拟大模型服务: {server.url}")
+    print(f"   Ollama: python main.py --backend ollama --ollama-url {server.url}")
+    print(f"   通义千问: [llm] qwen_base_url = {server.url}/v1")
+    print(f"   统计: GET {server.url}/mock/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🧪 [Mock] 已停止")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型列表缓存
+Ollama（/api/tags）和Gemini（list_models）的可用模型列表变化很少，按后端缓存，所有后端共用一个缓存：
+未过期（ttl 内）时直接返回；过期但未超过 stale_ttl 时先返回旧列表，同时在后台刷新；
+超过 stale_ttl 或从未获取过时才同步请求。获取失败时继续使用旧列表，不缓存失败结果
+"""
+
+import asyncio
+import threading
+import time
+
+class ModelListCache:
+    """带过期时间、过期后后台刷新的模型列表缓存"""
+
+    def __init__(self, ttl=300, stale_ttl=3600):
+        """
+        Args:
+            ttl: 列表的有效期（秒），有效期内不发起请求
+            stale_ttl: 过期列表的最长使用时间（秒），在此之前先返回旧列表并在后台刷新
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def configure(self, ttl=None, stale_ttl=None):
+        """修改有效期设置（已缓存的列表按新设置判断是否过期）"""
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if stale_ttl is not None:
+                self.stale_ttl = max(stale_ttl, self.ttl)
+
+    def put(self, key, models):
+        """写入模型列表（如健康检查时顺带获取到的列表）"""
+        with self._lock:
+            self._entries[key] = (list(models), time.monotonic())
+
+    def invalidate(self, key=None):
+        """删除指定后端的列表，key为None时清空缓存"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _lookup(self, key):
+        """
+        查找缓存并更新统计
+
+        Returns:
+            tuple: (models, state)，state 为 'fresh'、'stale' 或 'miss'
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry[1] if entry else None
+            if entry and age < self.ttl:
+                self.hits += 1
+                return list(entry[0]), 'fresh'
+            if entry and age < self.stale_ttl:
+                self.stale_hits += 1
+                return list(entry[0]), 'stale'
+            self.misses += 1
+            return (list(entry[0]) if entry else None), 'miss'
+
+    def _claim_refresh(self, key):
+        """同一后端同时只进行一次后台刷新"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _finish_load(self, key, models, error):
+        """记录一次获取的结果，成功时写入缓存"""
+        with self._lock:
+            self._refreshing.discard(key)
+            if error is None and models is not None:
+                self._entries[key] = (list(models), time.monotonic())
+                self.refreshes += 1
+                return True
+            self.failures += 1
+        print(f"⚠️ [Models] 获取 {key} 的模型列表失败: {error}")
+        return False
+
+    def get(self, key, loader):
+        """
+        获取模型列表（同步接口）
+
+        Args:
+            key: 后端标识，如 'ollama:http://localhost:11434'
+            loader: 无参函数，返回模型列表，失败时抛出异常
+
+        Returns:
+            list: 模型列表；获取失败且没有旧列表时返回None
+        """
+        models, state = self._lookup(key)
+        if state == 'stale':
+            if self._claim_refresh(key):
+                threading.Thread(target=self._load, args=(key, loader), name="model-list-refresh", daemon=True).start()
+            return models
+        if state == 'miss':
+            with self._lock:
+                self._refreshing.add(key)
+            if self._load(key, loader):
+                return self._entries[key][0][:]
+        return models
+
+    def _load(self, key, loader):
+        try:
+            return self._finish_load(key, loader(), None)
+        except Exception as e:
+            return self._finish_load(key, None, e)
+
+    async def aget(self, key, loader):
+        """
+        获取模型列表（异步接口，后台刷新在当前事件循环中进行）
+
+        Args:
+            key: 后端标识
+            loader: 无参异步函数，返回模型列表，失败时抛出异常
+
+        Returns:
+            list: 模型列表；获取失败且没有旧列表时返回None
+        """
+        models, state = self._lookup(key)
+        if state == 'stale':
+            if self._claim_refresh(key):
+                task = asyncio.get_running_loop().create_task(self._aload(key, loader))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return models
+        if state == 'miss':
+            with self._lock:
+                self._refreshing.add(key)
+            if await self._aload(key, loader):
+                return self._entries[key][0][:]
+        return models
+
+    async def _aload(self, key, loader):
+        try:
+            return self._finish_load(key, await loader(), None)
+        except Exception as e:
+            return self._finish_load(key, None, e)
+
+    def get_stats(self):
+        """获取缓存统计"""
+        now = time.monotonic()
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'entries': {key: {'models': len(models), 'age_s': round(now - fetched_at, 1)}
+                            for key, (models, fetched_at) in self._entries.items()},
+                'lookups': lookups,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+            }
+
+_cache = ModelListCache()
+
+def get_model_list_cache():
+    """获取所有后端共用的模型列表缓存"""
+    return _cache
+
+if __name__ == '__main__':
+    calls = {'count': 0}
+
+    def slow_loader():
+        calls['count'] += 1
+        time.sleep(0.2)
+        return [f"qwen2:v{calls['count']}"]
+
+    cache = ModelListCache(ttl=0.5, stale_ttl=5)
+    for step in range(4):
+        start = time.perf_counter()
+        print(cache.get('demo', slow_loader), f"{(time.perf_counter() - start) * 1000:.1f}ms")
+        time.sleep(0.4)
+    print(cache.get_stats())
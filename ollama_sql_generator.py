@@ -5,56 +5,126 @@
 支持qwen2等本地部署的大模型
 """
 
-import requests
+import asyncio
 import json
 import time
+import threading
+from collections import deque
+from concurrent.futures import CancelledError
+from datetime import datetime, timezone
+import httpx
+from async_runtime import run_sync
+from llm_cassette import get_cassette
+from llm_metrics import LLMCall, current_call
+from model_list_cache import get_model_list_cache
+from sql_extractor import SQLStreamExtractor, extract_sql, get_stop_sequences
+from token_counter import estimate_tokens
 
 class OllamaLLMGenerator:
     """使用本地Ollama大模型生成SQL的类"""
     
-    def __init__(self, model_name="qwen2", api_url="http://localhost:11434"):
+    def __init__(self, model_name="qwen2", api_url="http://localhost:11434", stream=True,
+                 keep_alive="30m", num_ctx=8192):
         """
         初始化Ollama客户端
         
         Args:
             model_name: 模型名称，如 qwen2, llama3, mistral 等
             api_url: Ollama API的基础URL
+            stream: 是否使用流式生成（SQL完整后提前结束）
+            keep_alive: 请求结束后模型在内存中保留的时间，如 "30m"、"-1"（一直保留）
+            num_ctx: 上下文长度；每次请求保持相同，避免Ollama重新加载模型、丢弃已缓存的前缀
         """
         self.model_name = model_name
-        self.api_url = f"{api_url}/api/generate"
+        self.base_url = api_url.rstrip('/')
+        self.api_url = f"{self.base_url}/api/generate"
+        self.chat_url = f"{self.base_url}/api/chat"
+        self._models_cache_key = f"ollama:{self.base_url}"
         self.available_models = None
+        self.stream = stream
+        self.stop_sequences = get_stop_sequences('ollama')
+        # Ollama只把纯数字当作秒数，"-1" 这样的字符串需要转换为整数
+        if isinstance(keep_alive, str) and keep_alive.lstrip('-').isdigit():
+            keep_alive = int(keep_alive)
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        # 放进系统消息的完整数据库结构（set_stable_schema 设置），每次请求保持不变
+        self.stable_schema = None
         
+        # 最近请求的耗时记录（预填充、首个token、生成）
+        self._timings = deque(maxlen=200)
+        self._timings_lock = threading.Lock()
+
+        # 模型常驻状态（预热次数、最近一次 /api/ps 检查结果），由后台线程定期刷新
+        self._residency = {'loaded': None, 'expires_at': None, 'size_vram': None, 'last_check': None}
+        self._residency_lock = threading.Lock()
+        self._warm_ups = 0
+        self._last_warm_up = None
+        self._last_load_ms = None
+        self._keep_warm_interval = None
+        self._keep_warm_stop = threading.Event()
+        self._keep_warm_thread = None
+
+        # 异步HTTP客户端，首次请求时在所在的事件循环中创建
+        self._async_client = None
+        self._async_client_loop = None
+        
+    def _get_async_client(self):
+        """获取当前事件循环的异步HTTP客户端（连接池绑定事件循环，同一事件循环内复用连接）"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = httpx.AsyncClient(timeout=None)
+            self._async_client_loop = loop
+        return self._async_client
+    
+    async def aclose(self):
+        """关闭异步HTTP客户端"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_client_loop = None
+    
     def test_connection(self, max_retries=3, retry_delay=2):
+        """测试与Ollama的连接（同步接口）
+        
+        Args:
+            max_retries: 最大重试次数
+            retry_delay: 重试间隔（秒）
+        """
+        return run_sync(self.atest_connection(max_retries, retry_delay))
+    
+    async def atest_connection(self, max_retries=3, retry_delay=2):
         """测试与Ollama的连接
         
         Args:
             max_retries: 最大重试次数
             retry_delay: 重试间隔（秒）
         """
+        client = self._get_async_client()
         for attempt in range(max_retries):
             try:
                 # 1. 首先检查Ollama服务是否在运行
-                health_check = requests.get(
-                    "http://localhost:11434/",
+                health_check = await client.get(
+                    f"{self.base_url}/",
                     timeout=5
                 )
                 if health_check.status_code != 200:
                     print(f"⚠️ Ollama服务未正常运行 (状态码: {health_check.status_code})")
                     if attempt < max_retries - 1:
                         print(f"🔄 {attempt + 1}/{max_retries} 次重试中...")
-                        time.sleep(retry_delay)
+                        await asyncio.sleep(retry_delay)
                         continue
                     return False
                 
                 print("✅ Ollama服务连接成功")
                 
                 # 2. 获取可用模型列表
-                models = self.get_available_models()
+                models = await self.aget_available_models()
                 if not models:
                     print("⚠️ 无法获取模型列表")
                     if attempt < max_retries - 1:
                         print(f"🔄 {attempt + 1}/{max_retries} 次重试中...")
-                        time.sleep(retry_delay)
+                        await asyncio.sleep(retry_delay)
                         continue
                     return False
                 
@@ -78,7 +148,7 @@ class OllamaLLMGenerator:
                 test_prompt = "请回复：连接测试成功"
                 print(f"📤 [Ollama] 测试提示词: {test_prompt}")
                 
-                test_response = self._call_ollama(
+                test_response = await self._acall_ollama(
                     test_prompt,
                     timeout=10
                 )
@@ -90,24 +160,24 @@ class OllamaLLMGenerator:
                     print("⚠️ 模型响应测试失败")
                     if attempt < max_retries - 1:
                         print(f"🔄 {attempt + 1}/{max_retries} 次重试中...")
-                        time.sleep(retry_delay)
+                        await asyncio.sleep(retry_delay)
                         continue
                     return False
                     
-            except requests.exceptions.ConnectionError:
+            except httpx.ConnectError:
                 print("⚠️ 无法连接到Ollama服务")
                 print("💡 请确保Ollama服务正在运行: ollama serve")
                 if attempt < max_retries - 1:
                     print(f"🔄 {attempt + 1}/{max_retries} 次重试中...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     continue
                 return False
                 
-            except requests.exceptions.Timeout:
+            except httpx.TimeoutException:
                 print("⚠️ 连接超时")
                 if attempt < max_retries - 1:
                     print(f"🔄 {attempt + 1}/{max_retries} 次重试中...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     continue
                 return False
                 
@@ -115,70 +185,470 @@ class OllamaLLMGenerator:
                 print(f"⚠️ 连接测试失败: {str(e)}")
                 if attempt < max_retries - 1:
                     print(f"🔄 {attempt + 1}/{max_retries} 次重试中...")
-                    time.sleep(retry_delay)
+                    await asyncio.sleep(retry_delay)
                     continue
                 return False
         
         return False
     
-    def get_available_models(self):
-        """获取可用的模型列表"""
+    def health_check(self, timeout=3):
+        """轻量级健康检查（同步接口）"""
+        return run_sync(self.ahealth_check(timeout))
+    
+    async def ahealth_check(self, timeout=3):
+        """轻量级健康检查：只确认服务可达且模型已下载，不进行生成
+        
+        Args:
+            timeout: 超时时间（秒）
+            
+        Returns:
+            tuple: (healthy: bool, message: str)
+        """
         try:
-            response = requests.get(
-                "http://localhost:11434/api/tags",
-                timeout=5
-            )
-            if response.status_code == 200:
-                models_data = response.json().get('models', [])
-                # 提取模型名称
-                model_names = [model.get('name', '') for model in models_data if model.get('name')]
-                self.available_models = model_names
-                return model_names
-            return []
-        except Exception as e:
-            print(f"⚠️ 获取模型列表失败: {str(e)}")
+            response = await self._get_async_client().get(f"{self.base_url}/api/tags", timeout=timeout)
+            if response.status_code != 200:
+                return False, f"Ollama服务异常 (状态码: {response.status_code})"
+            models = [model.get('name', '') for model in response.json().get('models', [])]
+            self.available_models = models
+            # 顺带更新模型列表缓存，后台健康检查期间模型选择列表始终是新的
+            get_model_list_cache().put(self._models_cache_key, [model for model in models if model])
+            if not any(self.model_name in model for model in models):
+                return False, f"模型 '{self.model_name}' 未找到"
+            return True, "Ollama服务正常"
+        except httpx.HTTPError as e:
+            return False, f"无法连接到Ollama服务: {str(e)}"
+    
+    def get_available_models(self, refresh=False):
+        """获取可用的模型列表（同步接口）"""
+        return run_sync(self.aget_available_models(refresh))
+    
+    async def aget_available_models(self, refresh=False):
+        """获取可用的模型列表，优先使用模型列表缓存
+        
+        Args:
+            refresh: 是否忽略缓存重新获取（如刚下载了新模型）
+        """
+        cache = get_model_list_cache()
+        if refresh:
+            cache.invalidate(self._models_cache_key)
+        models = await cache.aget(self._models_cache_key, self._afetch_models)
+        if models is None:
             return []
+        self.available_models = models
+        return models
     
-    def _call_ollama(self, prompt, timeout=30):
-        """调用Ollama API
+    async def _afetch_models(self):
+        """请求 /api/tags 获取已下载的模型名称，失败时抛出异常"""
+        response = await self._get_async_client().get(
+            f"{self.base_url}/api/tags",
+            timeout=5
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"状态码: {response.status_code}")
+        return [model.get('name', '') for model in response.json().get('models', []) if model.get('name')]
+
+    def warm_up(self, timeout=120):
+        """预热模型（同步接口）"""
+        return run_sync(self.awarm_up(timeout))
+
+    async def awarm_up(self, timeout=120):
+        """预热模型：发送不带提示词的generate请求，让Ollama加载模型并按keep_alive保留在内存中
+
+        选项与正常请求相同（尤其是num_ctx），之后的请求不会因参数不同而重新加载模型
+
+        Args:
+            timeout: 超时时间（秒），首次加载大模型可能需要较长时间
+
+        Returns:
+            bool: 是否预热成功
+        """
+        payload = {
+            "model": self.model_name,
+            "keep_alive": self.keep_alive,
+            "options": self._request_options(),
+            "stream": False
+        }
+        start = time.perf_counter()
+        try:
+            response = await self._get_async_client().post(self.api_url, json=payload, timeout=timeout)
+        except httpx.HTTPError as e:
+            print(f"⚠️ [Ollama] 预热模型 {self.model_name} 失败: {str(e) or type(e).__name__}")
+            return False
+        if response.status_code != 200:
+            print(f"⚠️ [Ollama] 预热模型 {self.model_name} 失败 (状态码: {response.status_code})")
+            return False
+
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        load_ms = round(response.json().get('load_duration', 0) / 1e6, 1)
+        with self._residency_lock:
+            self._warm_ups += 1
+            self._last_warm_up = datetime.now().isoformat()
+            self._last_load_ms = load_ms
+            self._residency['loaded'] = True
+        print(f"🔥 [Ollama] 模型 {self.model_name} 已预热（耗时 {elapsed_ms}ms，加载 {load_ms}ms，保留 {self.keep_alive}）")
+        return True
+
+    def get_loaded_models(self, timeout=5):
+        """获取已加载到内存中的模型（同步接口）"""
+        return run_sync(self.aget_loaded_models(timeout))
+
+    async def aget_loaded_models(self, timeout=5):
+        """通过 /api/ps 获取已加载到内存中的模型
+
+        Returns:
+            list: [{'name', 'size', 'size_vram', 'expires_at'}, ...]，请求失败时返回None
+        """
+        try:
+            response = await self._get_async_client().get(f"{self.base_url}/api/ps", timeout=timeout)
+            if response.status_code != 200:
+                return None
+            return [
+                {
+                    'name': model.get('name', ''),
+                    'size': model.get('size', 0),
+                    'size_vram': model.get('size_vram', 0),
+                    'expires_at': model.get('expires_at'),
+                }
+                for model in response.json().get('models', [])
+            ]
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    def refresh_residency(self, margin=600):
+        """检查模型是否仍在内存中，必要时重新预热（同步接口）"""
+        return run_sync(self.arefresh_residency(margin))
+
+    async def arefresh_residency(self, margin=600):
+        """检查模型是否仍在内存中，未加载或即将被卸载时重新预热
+
+        Args:
+            margin: 距离卸载不足该秒数时重新预热，延长保留时间
+
+        Returns:
+            bool: 检查后模型是否在内存中
+        """
+        models = await self.aget_loaded_models()
+        if models is None:
+            return False
+
+        loaded = next((model for model in models if self.model_name in model['name']), None)
+        remaining = None
+        if loaded and loaded['expires_at']:
+            try:
+                expires_at = datetime.fromisoformat(loaded['expires_at'].replace('Z', '+00:00'))
+                remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+            except ValueError:
+                remaining = None
+        with self._residency_lock:
+            self._residency = {
+                'loaded': loaded is not None,
+                'expires_at': loaded['expires_at'] if loaded else None,
+                'size_vram': loaded['size_vram'] if loaded else None,
+                'last_check': datetime.now().isoformat(),
+            }
+
+        if loaded is not None and (remaining is None or remaining > margin):
+            return True
+        reason = "未加载" if loaded is None else f"将在 {max(remaining, 0):.0f} 秒后卸载"
+        print(f"🔥 [Ollama] 模型 {self.model_name} {reason}，重新预热")
+        return await self.awarm_up()
+
+    def start_keep_warm(self, interval=300):
+        """启动后台线程，定期检查模型是否常驻内存
+
+        Args:
+            interval: 检查间隔（秒）
+        """
+        if self._keep_warm_thread and self._keep_warm_thread.is_alive():
+            return
+        self._keep_warm_interval = interval
+        self._keep_warm_stop.clear()
+        self._keep_warm_thread = threading.Thread(target=self._keep_warm_loop, name="ollama-keep-warm", daemon=True)
+        self._keep_warm_thread.start()
+        print(f"🔥 [Ollama] 模型常驻检查已启动（间隔{interval}秒）")
+
+    def stop_keep_warm(self):
+        """停止后台常驻检查线程"""
+        self._keep_warm_stop.set()
+        if self._keep_warm_thread:
+            self._keep_warm_thread.join(timeout=5)
+            self._keep_warm_thread = None
+
+    def _keep_warm_loop(self):
+        """后台常驻检查循环：下一次检查之前可能被卸载时就提前续期"""
+        while not self._keep_warm_stop.wait(self._keep_warm_interval):
+            try:
+                self.refresh_residency(margin=self._keep_warm_interval * 2)
+            except Exception as e:
+                print(f"⚠️ [Ollama] 模型常驻检查失败: {e}")
+
+    def get_residency_status(self):
+        """获取模型常驻状态（读取最近一次检查的结果，不发起请求）"""
+        with self._residency_lock:
+            status = dict(self._residency)
+            status.update({
+                'model': self.model_name,
+                'keep_alive': self.keep_alive,
+                'warm_ups': self._warm_ups,
+                'last_warm_up': self._last_warm_up,
+                'last_load_ms': self._last_load_ms,
+                'keep_warm_interval': self._keep_warm_interval if self._keep_warm_thread else None,
+            })
+        return status
+
+    def _request_options(self):
+        """每次请求使用相同的选项，保证模型不会因参数变化而重新加载"""
+        return {
+            "stop": self.stop_sequences,
+            "num_ctx": self.num_ctx
+        }
+    
+    async def _acall_ollama(self, prompt, timeout=30, stream=None):
+        """调用Ollama generate API（单条提示词）
         
         Args:
             prompt: 提示词
             timeout: 超时时间（秒）
+            stream: 是否流式生成，为None时使用实例配置
         """
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "keep_alive": self.keep_alive,
+            "options": self._request_options()
+        }
+        return await self._apost(self.api_url, payload, timeout, stream)
+    
+    async def _acall_ollama_chat(self, messages, timeout=30, stream=None):
+        """调用Ollama chat API
+        
+        系统消息（数据库结构和要求）在多次请求之间保持不变，
+        Ollama可以复用上一次请求已计算好的前缀，只需处理新增的对话内容
+        
+        Args:
+            messages: 消息列表
+            timeout: 超时时间（秒）
+            stream: 是否流式生成，为None时使用实例配置
+        """
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "keep_alive": self.keep_alive,
+            "options": self._request_options()
+        }
+        return await self._apost(self.chat_url, payload, timeout, stream)
+    
+    def complete(self, messages, max_tokens=2048, json_mode=False, timeout=120):
+        """完整生成（同步接口）"""
+        return run_sync(self.acomplete(messages, max_tokens, json_mode, timeout))
+    
+    async def acomplete(self, messages, max_tokens=2048, json_mode=False, timeout=120):
+        """完整生成，不使用停止序列、不提前结束（用于批量生成等结构化输出场景）
+        
+        Args:
+            messages: 消息列表
+            max_tokens: 最多生成的token数
+            json_mode: 是否要求输出JSON
+            timeout: 超时时间（秒）
+            
+        Returns:
+            str: 模型原始文本，调用失败时返回None
+        """
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "keep_alive": self.keep_alive,
+            # num_ctx 与普通请求保持一致，避免模型重新加载
+            "options": {"num_ctx": self.num_ctx, "num_predict": max_tokens}
+        }
+        if json_mode:
+            payload["format"] = "json"
+        return await self._apost(self.chat_url, payload, timeout, stream=False)
+    
+    async def _apost(self, url, payload, timeout, stream):
+        """发送请求并返回生成的文本，失败时返回None（启用录制/回放时经过录制文件）"""
+        cassette = get_cassette()
+        if cassette is not None:
+            request = {key: payload[key] for key in ('prompt', 'messages', 'format') if key in payload}
+            return await cassette.acall('ollama', self.model_name, request,
+                                        lambda: self._asend(url, payload, timeout, stream))
+        return await self._asend(url, payload, timeout, stream)
+    
+    async def _asend(self, url, payload, timeout, stream):
+        """发送请求并返回生成的文本，失败时返回None"""
+        if stream is None:
+            stream = self.stream
+        payload["stream"] = stream
+        
+        call = current_call()
+        if call is not None:
+            call.prompt_text = self._payload_text(payload)
+        
         try:
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False
-            }
+            if stream:
+                text = await self._astream_ollama(url, payload, timeout)
+                if call is not None and text:
+                    call.completion_text = text
+                return text
             
-            response = requests.post(
-                self.api_url,
+            start = time.perf_counter()
+            response = await self._get_async_client().post(
+                url,
                 json=payload,
                 timeout=timeout
             )
             
             if response.status_code == 200:
-                return response.json().get('response', '')
+                data = response.json()
+                self._record_timing(start, None, data)
+                text = self._chunk_text(data)
+                if call is not None:
+                    call.completion_text = text
+                return text
             else:
                 print(f"⚠️ API调用失败 (状态码: {response.status_code})")
                 return None
                 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             print(f"⚠️ API调用超时 (>{timeout}秒)")
             return None
             
-        except Exception as e:
+        except httpx.HTTPError as e:
             print(f"⚠️ API调用错误: {str(e)}")
             return None
     
-    def create_sql_prompt(self, user_query, schema_description):
-        """创建用于生成SQL的提示词"""
-        prompt = f"""你是一个专业的SQL查询助手。请根据用户的自然语言查询需求，生成对应的MySQL SQL查询语句。
-
-数据库结构信息：
-{schema_description}
+    @staticmethod
+    def _payload_text(payload):
+        """取出请求中的提示词文本（generate接口的prompt或chat接口的全部消息）"""
+        return payload.get("prompt") or "\n".join(m['content'] for m in payload.get("messages", []))
+    
+    @staticmethod
+    def _chunk_text(data):
+        """取出generate或chat接口返回的文本"""
+        if 'message' in data:
+            return data['message'].get('content', '')
+        return data.get('response', '')
+    
+    async def _astream_ollama(self, url, payload, timeout):
+        """流式调用Ollama API，SQL语句完整后立即关闭连接
+        
+        任务被取消时同样会关闭连接，Ollama随即停止生成
+        
+        Args:
+            url: 接口地址
+            payload: 请求体
+            timeout: 超时时间（秒）
+        """
+        extractor = SQLStreamExtractor()
+        start = time.perf_counter()
+        first_token_at = None
+        final = None
+        
+        # 关闭连接后Ollama会停止继续生成
+        async with self._get_async_client().stream('POST', url, json=payload, timeout=timeout) as response:
+            if response.status_code != 200:
+                print(f"⚠️ API调用失败 (状态码: {response.status_code})")
+                return None
+            
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    if current_call() is not None:
+                        current_call().mark_first_token()
+                if data.get('done'):
+                    final = data
+                if extractor.feed(self._chunk_text(data)):
+                    print("⏹️ [Ollama] SQL语句已完整，提前结束生成")
+                    break
+                if final:
+                    break
+        
+        self._record_timing(start, first_token_at, final, self._payload_text(payload))
+        return extractor.text
+    
+    def _record_timing(self, start, first_token_at, final, prompt_text=None):
+        """
+        记录一次请求的耗时
+        
+        首个token的等待时间约等于模型加载加预填充时间；请求完整结束时
+        Ollama还会返回服务端统计（prompt_eval_count / prompt_eval_duration 等，单位纳秒）。
+        流式请求在SQL完整后提前结束时收不到服务端统计，按提示词文本估算token数，
+        以客户端测得的首个token时间作为预填充耗时，并标记 prefill_estimated
+        """
+        timing = {'total_ms': round((time.perf_counter() - start) * 1000, 1)}
+        if first_token_at is not None:
+            timing['first_token_ms'] = round((first_token_at - start) * 1000, 1)
+        if final:
+            timing['prompt_tokens'] = final.get('prompt_eval_count', 0)
+            timing['prefill_ms'] = round(final.get('prompt_eval_duration', 0) / 1e6, 1)
+            timing['load_ms'] = round(final.get('load_duration', 0) / 1e6, 1)
+            timing['eval_tokens'] = final.get('eval_count', 0)
+            timing['eval_ms'] = round(final.get('eval_duration', 0) / 1e6, 1)
+            call = current_call()
+            if call is not None:
+                call.set_usage(
+                    prompt_tokens=final.get('prompt_eval_count'),
+                    completion_tokens=final.get('eval_count'),
+                    generation_ms=timing['eval_ms'] or None
+                )
+        elif first_token_at is not None and prompt_text:
+            timing['prompt_tokens'] = estimate_tokens(prompt_text)
+            timing['prefill_ms'] = timing['first_token_ms']
+            timing['prefill_estimated'] = True
+        
+        with self._timings_lock:
+            self._timings.append(timing)
+        
+        parts = [f"总耗时 {timing['total_ms']}ms"]
+        if 'first_token_ms' in timing:
+            parts.append(f"首个token {timing['first_token_ms']}ms")
+        if 'prefill_ms' in timing:
+            parts.append(f"预填充 {timing['prefill_ms']}ms / {timing['prompt_tokens']} tokens"
+                         + ("（估算）" if timing.get('prefill_estimated') else ""))
+        print(f"⏱️ [Ollama] {', '.join(parts)}")
+    
+    def get_timing_stats(self):
+        """获取最近请求的耗时统计"""
+        with self._timings_lock:
+            timings = list(self._timings)
+        
+        def average(key):
+            values = [t[key] for t in timings if key in t]
+            return round(sum(values) / len(values), 1) if values else None
+        
+        return {
+            'requests': len(timings),
+            'avg_total_ms': average('total_ms'),
+            'avg_first_token_ms': average('first_token_ms'),
+            'avg_prefill_ms': average('prefill_ms'),
+            'avg_prompt_tokens': average('prompt_tokens'),
+            'estimated_prefill': sum(1 for t in timings if t.get('prefill_estimated')),
+            'last': timings[-1] if timings else None,
+            'keep_alive': self.keep_alive,
+            'num_ctx': self.num_ctx,
+        }
+    
+    def set_stable_schema(self, schema_description):
+        """
+        设置放进系统消息的完整数据库结构
+        
+        系统消息在所有问题之间保持不变，Ollama才能复用已计算好的前缀；
+        结构超过上下文长度的一半时不放进系统消息，每次只在当前问题前附上本次使用的结构
+        
+        Args:
+            schema_description: 完整的数据库结构描述，为None时清除
+        """
+        if schema_description and estimate_tokens(schema_description) > self.num_ctx // 2:
+            print(f"⚠️ [Ollama] 完整结构超过上下文长度（num_ctx={self.num_ctx}）的一半，不放进系统消息")
+            schema_description = None
+        self.stable_schema = schema_description or None
+    
+    def create_system_prompt(self):
+        """创建系统提示词（生成要求和完整数据库结构），与具体问题无关，所有请求之间保持不变"""
+        prompt = '''你是一个专业的SQL查询助手。请根据用户的自然语言查询需求，生成对应的MySQL SQL查询语句。
 
 重要要求：
 1. 只生成SELECT查询语句，不要生成INSERT、UPDATE、DELETE等修改数据的语句
@@ -187,44 +657,101 @@ class OllamaLLMGenerator:
 4. 如果查询涉及多表，请正确使用JOIN语句
 5. 只返回SQL语句，不要包含其他解释文字或markdown格式
 6. 如果无法理解用户查询或数据库中没有相关表，请返回"ERROR: 无法生成对应的SQL查询"
+7. 注意参考对话历史，理解用户可能的关联需求和上下文'''
+        if self.stable_schema:
+            prompt += f"\n\n数据库结构信息：\n{self.stable_schema}"
+        return prompt
 
-用户查询: {user_query}
-
-请生成对应的SQL查询语句："""
+    def create_messages(self, user_query, schema_description, conversation_manager=None, examples=None):
+        """
+        创建发送给 /api/chat 的消息列表
         
-        return prompt
+        固定的系统消息在前、历史对话在后，随问题变化的内容（相似示例）放在最后一条用户消息中，不影响前缀复用。
+        完整结构已在系统消息中时不再附上本次检索或选定的结构（它是完整结构的一部分，重复发送只会增加预填充的token）；
+        完整结构过大未放进系统消息时，才在问题前附上本次使用的结构
+        
+        Args:
+            user_query: 用户的自然语言查询
+            schema_description: 本次使用的数据库结构描述
+            conversation_manager: 对话管理器（可选，提供历史对话）
+            examples: 可选，相似问题和SQL的示例文本
+        """
+        messages = [{"role": "system", "content": self.create_system_prompt()}]
+        if conversation_manager:
+            messages.extend(conversation_manager.get_history_messages(user_query))
+        
+        parts = []
+        if schema_description and not self.stable_schema:
+            parts.append(f"数据库结构信息：\n{schema_description}")
+        if examples:
+            parts.append(examples)
+        content = "\n\n".join(parts + [f"当前问题: {user_query}"]) if parts else user_query
+        messages.append({"role": "user", "content": content})
+        return messages
     
-    def generate_sql(self, user_query, schema_description, conversation_manager=None):
+    def generate_sql(self, user_query, schema_description, conversation_manager=None, cancel_event=None,
+                     examples=None):
         """
-        根据用户查询和数据库结构生成SQL
+        根据用户查询和数据库结构生成SQL（同步接口，在后台事件循环中执行 agenerate_sql）
         
         Args:
             user_query: 用户的自然语言查询
             schema_description: 数据库结构描述
             conversation_manager: 对话管理器（可选，用于上下文支持）
+            cancel_event: 可选，被设置后取消请求并关闭连接（对冲请求落败时使用）
+            examples: 可选，相似问题和SQL的示例文本，放在当前问题之前
             
         Returns:
             tuple: (success: bool, sql_or_error: str)
         """
         try:
-            # 判断是否使用上下文模式
-            if conversation_manager:
-                # Ollama使用上下文提示词模式
-                prompt = conversation_manager.get_context_for_prompt(schema_description, user_query)
-                print("📤 [Ollama] 使用上下文对话模式")
-                print("📤 [Ollama] 发送的提示词（含历史上下文）:")
-            else:
-                # 使用传统单次对话模式
-                prompt = self.create_sql_prompt(user_query, schema_description)
-                print("📤 [Ollama] 使用单次对话模式")
-                print("📤 [Ollama] 发送的提示词:")
+            return run_sync(
+                self.agenerate_sql(user_query, schema_description, conversation_manager, examples=examples),
+                cancel_event=cancel_event
+            )
+        except CancelledError:
+            return False, "ERROR: 本地模型请求已取消"
+    
+    async def agenerate_sql(self, user_query, schema_description, conversation_manager=None, timeout=60,
+                           examples=None):
+        """
+        根据用户查询和数据库结构生成SQL，token用量和耗时记录到调用指标中
+        
+        Args:
+            user_query: 用户的自然语言查询
+            schema_description: 数据库结构描述
+            conversation_manager: 对话管理器（可选，用于上下文支持）
+            timeout: 整个生成过程的超时时间（秒），超时后关闭连接
+            examples: 可选，相似问题和SQL的示例文本，放在当前问题之前
             
+        Returns:
+            tuple: (success: bool, sql_or_error: str)
+        """
+        with LLMCall('ollama', self.model_name) as call:
+            success, result = await self._agenerate_sql(
+                user_query, schema_description, conversation_manager, timeout, examples
+            )
+            call.success = success
+            return success, result
+    
+    async def _agenerate_sql(self, user_query, schema_description, conversation_manager, timeout, examples=None):
+        """生成SQL的具体实现"""
+        try:
+            # 系统消息在前、历史对话在后，保证前缀稳定
+            messages = self.create_messages(user_query, schema_description, conversation_manager, examples)
+            print("📤 [Ollama] 使用上下文对话模式" if conversation_manager else "📤 [Ollama] 使用单次对话模式")
+            
+            print("📤 [Ollama] 发送的消息:")
             print("-" * 60)
-            print(prompt)
+            for message in messages:
+                print(f"[{message['role']}] {message['content']}")
             print("-" * 60)
             
             print(f"🤖 正在调用本地模型 {self.model_name} 生成SQL...")
-            generated_response = self._call_ollama(prompt)
+            try:
+                generated_response = await asyncio.wait_for(self._acall_ollama_chat(messages), timeout)
+            except asyncio.TimeoutError:
+                return False, f"ERROR: 本地模型调用失败 - 超时（>{timeout}秒）"
             
             if not generated_response:
                 return False, "ERROR: 本地模型调用失败"
@@ -252,49 +779,7 @@ class OllamaLLMGenerator:
     
     def _extract_sql_from_response(self, response):
         """从模型响应中提取SQL语句"""
-        cleaned_sql = response.strip()
-        
-        # 移除markdown代码块标记
-        if "```sql" in cleaned_sql:
-            # 提取SQL代码块
-            parts = cleaned_sql.split("```sql")
-            if len(parts) > 1:
-                sql_part = parts[1].split("```")[0]
-                cleaned_sql = sql_part.strip()
-        elif "```" in cleaned_sql:
-            # 提取一般代码块
-            parts = cleaned_sql.split("```")
-            if len(parts) >= 3:
-                sql_part = parts[1]
-                cleaned_sql = sql_part.strip()
-        
-        # 如果没有代码块，尝试查找SELECT语句
-        if not cleaned_sql.upper().startswith('SELECT'):
-            lines = cleaned_sql.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line.upper().startswith('SELECT'):
-                    cleaned_sql = line
-                    break
-        
-        # 移除常见的前缀词
-        prefixes_to_remove = [
-            "根据您的查询需求，生成的SQL语句如下：",
-            "SQL语句：",
-            "查询语句：",
-            "生成的SQL：",
-            "答案：",
-            "结果：",
-        ]
-        
-        for prefix in prefixes_to_remove:
-            if cleaned_sql.startswith(prefix):
-                cleaned_sql = cleaned_sql[len(prefix):].strip()
-        
-        # 移除末尾的分号（如果有的话，我们统一处理）
-        if cleaned_sql.endswith(';'):
-            cleaned_sql = cleaned_sql[:-1].strip()
-            
+        cleaned_sql = extract_sql(response)
         print(f"🧹 [Ollama] 清理后的SQL: {cleaned_sql}")
         return cleaned_sql
 
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在线大模型API的客户端限流
+突发请求会触发通义千问和Gemini的429/配额错误，直接重试只会让情况更糟。
+每个 API Key + 模型 共用一个限流器：
+- 令牌桶控制请求速率
+- AIMD自适应并发：成功时并发上限缓慢增加，收到429或延迟明显升高时成倍减小
+- 收到429时按 Retry-After 暂停该 Key 的所有请求，没有 Retry-After 时使用带随机抖动的指数退避
+
+限流器的状态用线程锁保护、等待使用 asyncio.sleep，可以在不同的事件循环之间共享
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+
+# Gemini 的配额错误在消息中给出重试间隔，如 "retry_delay { seconds: 20 }" 或 "Please retry in 20.5s"
+_RETRY_DELAY_PATTERN = re.compile(r'retry[_ ](?:delay\s*\{\s*seconds:\s*|in\s+)(\d+(?:\.\d+)?)', re.IGNORECASE)
+_RATE_LIMIT_MARKERS = ('429', 'rate limit', 'ratelimit', 'too many requests', 'resource_exhausted',
+                       'resource has been exhausted', 'quota', 'throttl')
+
+class RateLimitExceeded(RuntimeError):
+    """重试次数用尽后仍被限流"""
+
+def is_rate_limit_error(error):
+    """
+    判断异常是否为限流/配额错误
+
+    兼容 openai.RateLimitError、google.api_core.exceptions.ResourceExhausted
+    以及带 status_code / code 属性的其他HTTP异常
+    """
+    for attr in ('status_code', 'code'):
+        if getattr(error, attr, None) == 429:
+            return True
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _RATE_LIMIT_MARKERS)
+
+def get_retry_after(error):
+    """
+    从限流错误中取出服务端建议的等待时间（秒），没有时返回None
+
+    依次检查响应头 Retry-After 和错误消息中的 retry_delay
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is not None:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    if match:
+        return float(match.group(1))
+    return None
+
+class TokenBucket:
+    """令牌桶，按固定速率补充令牌，允许一定的突发"""
+
+    def __init__(self, rate, burst):
+        """
+        Args:
+            rate: 每秒补充的令牌数（即平均每秒请求数）
+            burst: 桶容量（最大突发请求数）
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def try_take(self, now):
+        """
+        尝试取出一个令牌（调用方负责加锁）
+
+        Returns:
+            float: 0表示成功取出，否则为需要等待的秒数
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # 允许浮点误差
+        if self.tokens >= 1 - 1e-9:
+            self.tokens = max(0.0, self.tokens - 1)
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdaptiveConcurrency:
+    """AIMD自适应并发上限（调用方负责加锁）"""
+
+    def __init__(self, initial=4, minimum=1, maximum=16, latency_factor=2.0, decrease=0.5):
+        """
+        Args:
+            initial: 初始并发上限
+            minimum: 并发上限的下限
+            maximum: 并发上限的上限
+            latency_factor: 延迟超过基线的该倍数时视为过载，小幅减小并发
+            decrease: 收到429时并发上限乘以的系数
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_factor = latency_factor
+        self.decrease = decrease
+        self.baseline = None
+
+    @property
+    def current(self):
+        return max(self.minimum, int(self.limit))
+
+    def on_success(self, latency):
+        """成功：延迟正常时加性增加，延迟明显升高时小幅减小"""
+        if self.baseline is None:
+            self.baseline = latency
+        if latency > self.baseline * self.latency_factor:
+            self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        # 基线跟随较低的延迟，缓慢向上漂移，适应模型整体变慢
+        self.baseline = min(self.baseline * 1.05, 0.9 * self.baseline + 0.1 * latency)
+
+    def on_rate_limited(self):
+        """收到429：乘性减小"""
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+class APIRateLimiter:
+    """单个 API Key + 模型 的限流器"""
+
+    def __init__(self, name, rate=5.0, burst=10, initial_concurrency=4, max_concurrency=16,
+                 max_retries=3, base_delay=1.0, max_delay=30.0, latency_factor=2.0):
+        """
+        Args:
+            name: 限流器名称（日志和统计用，不包含API Key）
+            rate: 平均每秒请求数
+            burst: 最大突发请求数
+            initial_concurrency: 初始并发上限
+            max_concurrency: 并发上限的上限
+            max_retries: 被限流后的最大重试次数
+            base_delay: 指数退避的基础等待时间（秒）
+            max_delay: 单次等待时间上限（秒）
+            latency_factor: 延迟超过基线的该倍数时减小并发
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, 1, max_concurrency, latency_factor)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._paused_until = 0.0
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.wait_seconds = 0.0
+
+    def _try_acquire(self):
+        """尝试占用一个并发名额和一个令牌，返回需要等待的秒数（0表示成功）"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= self.concurrency.current:
+                return 0.02
+            wait = self.bucket.try_take(now)
+            if wait:
+                return wait
+            self._in_flight += 1
+            return 0.0
+
+    async def acquire(self):
+        """等待直到可以发送请求"""
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                break
+            await asyncio.sleep(min(wait, 1.0))
+        waited = time.monotonic() - start
+        with self._lock:
+            self.wait_seconds += waited
+
+    def release(self, latency=None, rate_limited=False):
+        """释放并发名额，并根据结果调整并发上限"""
+        with self._lock:
+            self._in_flight -= 1
+            if rate_limited:
+                self.concurrency.on_rate_limited()
+            elif latency is not None:
+                self.concurrency.on_success(latency)
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """
+        计算第 attempt 次重试前的等待时间
+
+        有 Retry-After 时以其为准（加少量抖动避免同时恢复），否则使用带完全抖动的指数退避
+        """
+        if retry_after is not None:
+            return min(self.max_delay, retry_after + random.uniform(0, self.base_delay))
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, fn):
+        """
+        在限流下执行异步调用，被限流时退避重试
+
+        Args:
+            fn: 无参数的协程函数，每次重试都会重新调用
+
+        Returns:
+            fn 的返回值（非限流异常原样抛出）
+
+        Raises:
+            RateLimitExceeded: 重试次数用尽后仍被限流
+        """
+        with self._lock:
+            self.requests += 1
+        for attempt in range(self.max_retries + 1):
+            await self.acquire()
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    self.release()
+                    raise
+                self.release(rate_limited=True)
+                retry_after = get_retry_after(e)
+                delay = self.backoff_delay(attempt, retry_after)
+                with self._lock:
+                    self.rate_limited += 1
+                    # 同一 Key 的其他请求也暂停，避免继续触发限流
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.exhausted += 1
+                    raise RateLimitExceeded(f"请求过于频繁，重试{self.max_retries}次后仍被限流: {e}") from e
+                with self._lock:
+                    self.retries += 1
+                print(f"🚦 [RateLimit] {self.name} 被限流，{delay:.1f} 秒后重试"
+                      f"（第{attempt + 1}/{self.max_retries}次，并发上限降为 {self.concurrency.current}）")
+                continue
+            except BaseException:
+                # 任务被取消
+                self.release()
+                raise
+            self.release(latency=time.monotonic() - start)
+            return result
+
+    def get_stats(self):
+        """获取限流统计"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'in_flight': self._in_flight,
+                'concurrency_limit': self.concurrency.current,
+                'rate': self.bucket.rate,
+                'burst': self.bucket.burst,
+                'rate_limited': self.rate_limited,
+                'retries': self.retries,
+                'exhausted': self.exhausted,
+                'paused_seconds': round(max(0.0, self._paused_until - time.monotonic()), 1),
+                'wait_seconds': round(self.wait_seconds, 2),
+            }
+
+# 按 API Key + 模型 共享的限流器
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(config, backend, api_key, model_name):
+    """
+    获取（必要时创建）API Key + 模型 对应的限流器
+
+    读取配置文件 [rate_limit] 段，每个选项都可以加 _后端名 后缀单独设置，如 requests_per_second_gemini
+
+    Args:
+        config: ConfigParser 对象
+        backend: 后端名称（qwen_api / gemini）
+        api_key: API Key（只用于区分限流器，不会保存原文）
+        model_name: 模型名称
+
+    Returns:
+        APIRateLimiter: 未启用限流时返回None
+    """
+    def option(key, fallback, getter=config.getfloat):
+        return getter('rate_limit', f'{key}_{backend}', fallback=getter('rate_limit', key, fallback=fallback))
+
+    if not option('enabled', True, config.getboolean):
+        return None
+
+    key_id = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:8]
+    name = f"{backend}:{model_name}#{key_id}"
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = APIRateLimiter(
+                name,
+                rate=option('requests_per_second', 5.0),
+                burst=option('burst', 10, config.getint),
+                initial_concurrency=option('initial_concurrency', 4, config.getint),
+                max_concurrency=option('max_concurrency', 16, config.getint),
+                max_retries=option('max_retries', 3, config.getint),
+                base_delay=option('base_delay', 1.0),
+                max_delay=option('max_delay', 30.0),
+            )
+        return _limiters[name]
+
+def get_rate_limiter_stats():
+    """获取所有限流器的统计"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.get_stats() for name, limiter in limiters.items()}
+
+if __name__ == '__main__':
+    class DemoRateLimitError(Exception):
+        status_code = 429
+
+    calls = {'count': 0}
+
+    async def flaky():
+        calls['count'] += 1
+        if calls['count'] % 4 == 0:
+            raise DemoRateLimitError("429 Too Many Requests")
+        await asyncio.sleep(0.05)
+        return calls['count']
+
+    async def main():
+        limiter = APIRateLimiter("demo", rate=20, burst=5, base_delay=0.1)
+        start = time.monotonic()
+        results = await asyncio.gather(*[limiter.run(flaky) for _ in range(20)])
+        print(f"{len(results)} 个请求耗时 {time.monotonic() - start:.2f} 秒")
+        print(limiter.get_stats())
+
+    asyncio.run(main())
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+规则解析：不调用大模型，直接回答简单问题
+很多问题只是“查询所有X”“X表前10条”“统计X的数量”“X中Y最大的记录”，
+按表名/字段名和注释在数据库结构中匹配，命中时直接生成SQL；
+表名或字段名匹配不唯一、问题里还有其他条件、或者像是追问时一律放弃，交给大模型处理
+"""
+
+import re
+import threading
+import time
+import unicodedata
+
+# 问题中可以忽略的标点和空白
+_PUNCTUATION = re.compile(r'[\s，。！？!?,.；;：:、"“”\'‘’]+')
+
+# 追问的标志词：需要结合上一条SQL理解，交给大模型
+_FOLLOW_UP_MARKERS = ('其中', '它们', '他们', '她们', '这些', '那些', '上面', '上述', '刚才', '之前', '刚刚',
+                      '再', '还有', '呢', '另外', '除了', '按照', '分别', '每个', '每种', '并且', '以及')
+
+_VERB = r'(?P<verb>(?:请|帮我|麻烦)*(?:查询|查找|查看|显示|列出|获取|返回|给出|给我|看看|看一下|查一下|查出|查)(?:一下)?)?'
+_ALL = r'(?P<all>所有|全部|全体)?(?:的)?'
+_TAIL = r'(?:表)?(?:的)?(?:所有|全部)?(?:数据|记录|信息|列表|内容|明细)?'
+_UNIT = r'(?:条|个|行|笔|项)'
+
+_CHINESE_DIGITS = {'一': 1, '两': 2, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9, '十': 10}
+_NUMBER = r'(?P<n>\d+|[一两二三四五六七八九十]{1,3})'
+
+_LIST_ALL = re.compile(rf'^{_VERB}{_ALL}(?P<table>.+?){_TAIL}$')
+_TOP_N = [
+    re.compile(rf'^{_VERB}(?P<table>.+?){_TAIL}(?:中|里|里面)?(?:的)?(?:前|最前面的?){_NUMBER}{_UNIT}(?:的)?(?:数据|记录)?$'),
+    re.compile(rf'^{_VERB}(?:前){_NUMBER}{_UNIT}(?:的)?(?P<table>.+?){_TAIL}$'),
+]
+_COUNT = [
+    re.compile(r'^(?:统计|查询|计算|查看|查一下)?(?:一下)?(?P<table>.+?)(?:表)?(?:的|中的|里的)?'
+               r'(?:总)?(?:数量|数目|个数|总数|条数|记录数|总量|行数)(?:是多少|有多少)?$'),
+    re.compile(r'^(?P<table>.+?)(?:表)?(?:中|里|里面)?(?:一共|总共|共)?有多少(?:条|个|行|笔)?(?:数据|记录)?$'),
+    re.compile(r'^(?:统计|查询)?(?:一下)?(?:一共|总共|共)?有多少(?:个|条|位|名)?(?P<table>.+?)$'),
+]
+_DIRECTIONS = {'最大': 'DESC', '最高': 'DESC', '最多': 'DESC', '最晚': 'DESC', '最新': 'DESC', '最近': 'DESC',
+               '最小': 'ASC', '最低': 'ASC', '最少': 'ASC', '最早': 'ASC'}
+_DIRECTION = '(?P<direction>' + '|'.join(_DIRECTIONS) + ')'
+# “X中Y最大的记录”：X和Y之间的分割位置不确定，逐个尝试
+_EXTREME_ROW = re.compile(rf'^{_VERB}(?P<body>.+?){_DIRECTION}的(?:那?一?(?:条|个|行))?(?:数据|记录|信息)?(?:是哪条|是什么|是谁)?$')
+# “Y最大的X”
+_EXTREME_ENTITY = re.compile(rf'^{_VERB}(?P<column>.+?){_DIRECTION}的(?:一?(?:条|个|位|名))?(?P<table>.+?){_TAIL}$')
+_TABLE_SEPARATOR = re.compile(r'(?:表)?(?:中|里|里面|当中)?(?:的)?$')
+
+def normalize_question(question):
+    """全角转半角、小写，去掉标点和空白"""
+    text = unicodedata.normalize('NFKC', question or '').lower()
+    return _PUNCTUATION.sub('', text)
+
+def parse_number(text):
+    """解析阿拉伯数字或“十”以内组合的中文数字（如“二十”“十五”）"""
+    if text.isdigit():
+        return int(text)
+    if len(text) == 1:
+        return _CHINESE_DIGITS.get(text)
+    if '十' not in text:
+        return None
+    tens, _, ones = text.partition('十')
+    tens_value = _CHINESE_DIGITS.get(tens, 0) if tens else 1
+    ones_value = _CHINESE_DIGITS.get(ones, 0) if ones else 0
+    return tens_value * 10 + ones_value if tens_value < 10 and ones_value < 10 else None
+
+def _clean_comment(comment):
+    """去掉注释中的括号说明和空格后的补充说明，如“用户性别（0男 1女 2未知）” → “用户性别”"""
+    comment = unicodedata.normalize('NFKC', comment or '').lower()
+    comment = re.split(r'[(\s,;:]', comment, maxsplit=1)[0]
+    return comment.strip()
+
+def add_alias(aliases, alias, target, score):
+    """记录名称 → (目标, 置信度)；同一名称以相同置信度指向多个目标时标记为歧义（目标为None）"""
+    if not alias:
+        return
+    existing = aliases.get(alias)
+    if existing is None or (existing[0] != target and score > existing[1]):
+        aliases[alias] = (target, score)
+    elif existing[0] != target and score == existing[1]:
+        aliases[alias] = (None, score)
+
+def table_aliases(table, comment):
+    """表的可匹配名称及置信度：表名、注释、去掉“表”“信息表”等后缀的注释"""
+    names = {table.lower(): 1.0}
+    comment = _clean_comment(comment)
+    if comment:
+        names.setdefault(comment, 0.95)
+        for suffix in ('信息表', '数据表', '记录表', '表'):
+            if comment.endswith(suffix) and len(comment) > len(suffix):
+                names.setdefault(comment[:-len(suffix)], 0.9)
+    return names
+
+# 字段注释中常见的主语前缀，与表名无关（如 sys_user 的“帐号状态”）
+_SUBJECT_PREFIXES = ('帐号', '账号', '帐户', '账户', '用户')
+
+def column_aliases(column, table_names):
+    """
+    字段的可匹配名称及置信度：字段名、注释，以及去掉表名或“帐号”“用户”等前缀的注释
+    （如“用户昵称” → “昵称”、“帐号状态” → “状态”）
+    """
+    names = {column['field'].lower(): 1.0}
+    comment = _clean_comment(column.get('comment', ''))
+    if comment:
+        names.setdefault(comment, 0.95)
+        for prefix in list(table_names) + list(_SUBJECT_PREFIXES):
+            if comment.startswith(prefix) and len(comment) > len(prefix) + 1:
+                names.setdefault(comment[len(prefix):], 0.85)
+    return names
+
+class RuleBasedParser:
+    """基于规则的简单问题解析器"""
+
+    def __init__(self, snapshot, min_confidence=0.85, max_limit=1000):
+        """
+        Args:
+            snapshot: DatabaseConnector.get_schema_snapshot() 的结果
+            min_confidence: 表名和字段名匹配的最低置信度，低于该值时交给大模型
+            max_limit: “前N条”中N的上限，超过时交给大模型
+        """
+        self.snapshot = snapshot
+        self.min_confidence = min_confidence
+        self.max_limit = max_limit
+        self._table_aliases = {}
+        self._column_aliases = {}
+        for table, info in snapshot.items():
+            names = table_aliases(table, info.get('comment', ''))
+            for alias, score in names.items():
+                add_alias(self._table_aliases, alias, table, score)
+            columns = {}
+            for column in info['columns']:
+                for alias, score in column_aliases(column, names).items():
+                    add_alias(columns, alias, column['field'], score)
+            self._column_aliases[table] = columns
+
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rules = {}
+
+    def _resolve_table(self, text, tables):
+        """把问题中的名称解析为表，返回 (表名, 置信度)，无法唯一确定时返回None"""
+        text = _TABLE_SEPARATOR.sub('', text) or text
+        for candidate in (text, text[:-1] if text.endswith('表') else None):
+            if not candidate:
+                continue
+            table, score = self._table_aliases.get(candidate, (None, 0))
+            if table is not None and (tables is None or table in tables):
+                return table, score
+        return None
+
+    def _resolve_column(self, table, text):
+        """把问题中的名称解析为指定表的字段，返回 (字段名, 置信度)，无法唯一确定时返回None"""
+        text = text.removeprefix('的')
+        column, score = self._column_aliases[table].get(text, (None, 0))
+        return (column, score) if column is not None else None
+
+    def _match(self, text, tables):
+        """
+        逐条规则匹配，返回所有可能的 (规则名, SQL, 置信度)
+
+        同一问题可能被多条规则以不同方式解释，由调用方判断是否唯一
+        """
+        candidates = []
+
+        for pattern in _TOP_N:
+            match = pattern.match(text)
+            if not match:
+                continue
+            limit = parse_number(match.group('n'))
+            resolved = self._resolve_table(match.group('table'), tables)
+            if resolved and limit and limit <= self.max_limit:
+                table, score = resolved
+                candidates.append(('top_n', f"SELECT * FROM `{table}` LIMIT {limit}", score))
+
+        for pattern in _COUNT:
+            match = pattern.match(text)
+            resolved = match and self._resolve_table(match.group('table'), tables)
+            if resolved:
+                table, score = resolved
+                candidates.append(('count', f"SELECT COUNT(*) AS total FROM `{table}`", score))
+
+        match = _EXTREME_ROW.match(text)
+        if match:
+            body = match.group('body')
+            direction = _DIRECTIONS[match.group('direction')]
+            for split in range(1, len(body)):
+                resolved = self._resolve_table(body[:split], tables)
+                if not resolved:
+                    continue
+                table, table_score = resolved
+                column = self._resolve_column(table, body[split:])
+                if column:
+                    candidates.append(('extreme', f"SELECT * FROM `{table}` ORDER BY `{column[0]}` {direction} LIMIT 1",
+                                       min(table_score, column[1])))
+
+        match = _EXTREME_ENTITY.match(text)
+        if match:
+            resolved = self._resolve_table(match.group('table'), tables)
+            column = resolved and self._resolve_column(resolved[0], match.group('column'))
+            if column:
+                direction = _DIRECTIONS[match.group('direction')]
+                candidates.append(('extreme', f"SELECT * FROM `{resolved[0]}` ORDER BY `{column[0]}` {direction} LIMIT 1",
+                                   min(resolved[1], column[1])))
+
+        if not candidates:
+            # “查询所有X”需要动词或“所有/全部”，避免把一个单独的名词当成查询
+            match = _LIST_ALL.match(text)
+            if match and (match.group('verb') or match.group('all')):
+                resolved = self._resolve_table(match.group('table'), tables)
+                if resolved:
+                    candidates.append(('list_all', f"SELECT * FROM `{resolved[0]}`", resolved[1]))
+
+        return candidates
+
+    def parse(self, question, selected_tables=None):
+        """
+        尝试直接把问题转换为SQL
+
+        Args:
+            question: 用户的自然语言查询
+            selected_tables: 可选，只在这些表中匹配
+
+        Returns:
+            str: 生成的SQL，置信度不够时返回None（交给大模型）
+        """
+        start = time.perf_counter()
+        text = normalize_question(question)
+        rule = None
+        sql = None
+        if text and not any(marker in text for marker in _FOLLOW_UP_MARKERS):
+            tables = set(selected_tables) if selected_tables else None
+            candidates = self._match(text, tables)
+            # 多条规则给出不同的SQL时说明问题有歧义
+            if len({candidate[1] for candidate in candidates}) == 1:
+                rule, sql, confidence = candidates[0]
+                if confidence < self.min_confidence:
+                    rule, sql = None, None
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.lookups += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if sql:
+                self.hits += 1
+                self.rules[rule] = self.rules.get(rule, 0) + 1
+        if sql:
+            print(f"⚡ [Rules] 规则 {rule} 命中（{elapsed_ms:.2f}ms）: {sql}")
+        return sql
+
+    def get_stats(self):
+        """获取规则解析统计"""
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'deferred': self.lookups - self.hits,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'avg_ms': round(self.total_ms / self.lookups, 3) if self.lookups else 0.0,
+                'max_ms': round(self.max_ms, 3),
+                'rules': dict(self.rules),
+            }
+
+if __name__ == '__main__':
+    from schema_formatter import _demo_snapshot
+
+    parser = RuleBasedParser(_demo_snapshot())
+    for question in ["查询所有用户", "sys_dept表前10条", "统计角色的数量", "用户中最后登录时间最晚的记录",
+                     "部门一共有多少条数据", "查询所有状态正常的用户", "其中有多少个部门"]:
+        print(f"{question} -> {parser.parse(question)}")
+    print(parser.get_stats())
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库结构描述的序列化格式
+verbose：原有的逐字段多行格式；
+compact：每个表一行 table(col:type*, col:type?)，类型缩写，多个表共有的字段只列一次，
+并可指定token预算，超出预算时按价值从低到高依次省略细节
+"""
+
+import re
+from token_counter import estimate_tokens
+
+# 紧凑格式的细节级别，超出预算时从前往后依次省略
+DETAIL_LEVELS = [
+    {'sizes': True, 'column_comments': True, 'types': True, 'table_comments': True},
+    {'sizes': False, 'column_comments': True, 'types': True, 'table_comments': True},
+    {'sizes': False, 'column_comments': False, 'types': True, 'table_comments': True},
+    {'sizes': False, 'column_comments': False, 'types': False, 'table_comments': True},
+    {'sizes': False, 'column_comments': False, 'types': False, 'table_comments': False},
+]
+
+_TYPE_ALIASES = {
+    'integer': 'int', 'mediumint': 'int', 'smallint': 'int',
+    'varchar': 'str', 'char': 'str',
+    'tinytext': 'text', 'mediumtext': 'text', 'longtext': 'text',
+    'timestamp': 'datetime',
+    'decimal': 'dec', 'numeric': 'dec',
+    'double': 'float',
+}
+
+_COMPACT_HEADER = "数据库表结构（每行一个表: 表名(字段:类型)，*主键，?可为空，\"\"内为字段说明）：\n"
+
+def format_schema_verbose(schema):
+    """
+    原有的多行格式
+
+    Args:
+        schema: {表名: [字段信息, ...]}
+    """
+    description = "数据库表结构信息：\n\n"
+
+    for table_name, columns in schema.items():
+        description += f"表名: {table_name}\n"
+        description += "字段信息:\n"
+        for col in columns:
+            description += f"  - {col['field']} ({col['type']}) {col['key']} {col['null']}\n"
+        description += "\n"
+
+    return description
+
+def abbreviate_type(col_type, keep_size=True):
+    """
+    缩写字段类型，如 varchar(50) -> str(50)，bigint(20) unsigned -> bigint，tinyint(1) -> bool
+    """
+    col_type = (col_type or '').lower().strip()
+    match = re.match(r'([a-z]+)\s*(\((.*)\))?', col_type)
+    if not match:
+        return col_type
+    base, args = match.group(1), match.group(3)
+
+    if base == 'tinyint' and args == '1':
+        return 'bool'
+    base = _TYPE_ALIASES.get(base, base)
+    # 整数显示宽度没有实际意义；字符串长度、小数精度和枚举值保留
+    if keep_size and args and base in ('str', 'dec', 'enum', 'set'):
+        return f"{base}({args})"
+    return base
+
+def _clean_comment(comment):
+    """去掉注释中会破坏格式的字符"""
+    return re.sub(r'[\s,()"]+', ' ', comment or '').strip()
+
+def find_common_columns(snapshot, min_tables=3):
+    """
+    找出多个表共有的非主键字段（字段名、类型、可空和说明都相同），如 create_time、update_by
+
+    至少在 min_tables 个表且一半以上的表中出现才算公共字段
+
+    Returns:
+        list: 公共字段信息列表（取第一次出现的定义）
+    """
+    threshold = max(min_tables, (len(snapshot) + 1) // 2)
+    counts = {}
+    first_seen = {}
+    for info in snapshot.values():
+        for col in info['columns']:
+            if col.get('key') == 'PRI':
+                continue
+            signature = _column_signature(col)
+            counts[signature] = counts.get(signature, 0) + 1
+            first_seen.setdefault(signature, col)
+    return [first_seen[sig] for sig, count in counts.items() if count >= threshold]
+
+def _column_signature(col):
+    """判断字段定义是否相同的签名"""
+    return (col['field'], abbreviate_type(col['type']), col.get('null'), _clean_comment(col.get('comment')))
+
+def _format_column(col, level):
+    """按细节级别格式化单个字段"""
+    text = col['field']
+    if level['types']:
+        text += ':' + abbreviate_type(col['type'], keep_size=level['sizes'])
+    if col.get('key') == 'PRI':
+        text += '*'
+    elif level['sizes'] and col.get('null') == 'YES':
+        text += '?'
+    comment = _clean_comment(col.get('comment'))
+    if level['column_comments'] and comment:
+        text += f'"{comment}"'
+    return text
+
+def _format_compact(snapshot, level, common, omitted=None):
+    """按细节级别生成紧凑格式"""
+    common_signatures = {_column_signature(c) for c in common}
+    lines = []
+    uses_common = False
+
+    for table, info in snapshot.items():
+        signatures = {_column_signature(c) for c in info['columns']}
+        has_common = bool(common_signatures) and common_signatures <= signatures
+        parts = [
+            _format_column(col, level) for col in info['columns']
+            if not (has_common and _column_signature(col) in common_signatures)
+        ]
+        if has_common:
+            parts.append('@common')
+            uses_common = True
+        line = f"{table}({', '.join(parts)})"
+        comment = _clean_comment(info.get('comment'))
+        if level['table_comments'] and comment:
+            line += f" {comment}"
+        lines.append(line)
+
+    text = _COMPACT_HEADER
+    if uses_common:
+        text += f"@common = {', '.join(_format_column(col, level) for col in common)}\n"
+    text += '\n'.join(lines) + '\n'
+    if omitted:
+        text += f"（另有 {len(omitted)} 个表未列出: {', '.join(omitted)}）\n"
+    return text
+
+def format_schema_compact(snapshot, token_budget=0):
+    """
+    紧凑格式
+
+    Args:
+        snapshot: {表名: {'comment': str, 'columns': [字段信息, ...]}}，表按重要程度排序
+        token_budget: 估算token数上限，0表示不限制。超出时依次省略类型长度和可空标记、
+            字段说明、字段类型、表说明，仍然超出则从末尾开始只保留表名
+
+    Returns:
+        str: 结构描述
+    """
+    common = find_common_columns(snapshot) if len(snapshot) >= 3 else []
+
+    text = None
+    for level in DETAIL_LEVELS:
+        text = _format_compact(snapshot, level, common)
+        if not token_budget or estimate_tokens(text) <= token_budget:
+            return text
+
+    # 仍然超出预算：末尾的表只保留表名，至少保留一个表的字段
+    tables = list(snapshot)
+    for keep in range(len(tables) - 1, 0, -1):
+        kept = {table: snapshot[table] for table in tables[:keep]}
+        text = _format_compact(kept, DETAIL_LEVELS[-1], common, omitted=tables[keep:])
+        if estimate_tokens(text) <= token_budget:
+            break
+    return text
+
+def format_schema(snapshot, style='verbose', token_budget=0):
+    """
+    按指定格式生成结构描述
+
+    verbose 格式超出预算时改用紧凑格式
+    """
+    if style != 'compact':
+        text = format_schema_verbose({table: info['columns'] for table, info in snapshot.items()})
+        if not token_budget or estimate_tokens(text) <= token_budget:
+            return text
+    return format_schema_compact(snapshot, token_budget)
+
+def _demo_snapshot():
+    """若依风格的系统表结构，用于演示和比较不同格式的token数"""
+    def col(field, col_type, comment, key='', null='YES'):
+        return {'field': field, 'type': col_type, 'key': key, 'null': null, 'comment': comment}
+
+    audit = [
+        col('create_by', 'varchar(64)', '创建者'), col('create_time', 'datetime', '创建时间'),
+        col('update_by', 'varchar(64)', '更新者'), col('update_time', 'datetime', '更新时间'),
+        col('remark', 'varchar(500)', '备注'),
+    ]
+    tables = {
+        'sys_user': ('用户信息表', [
+            col('user_id', 'bigint(20)', '用户ID', 'PRI', 'NO'), col('dept_id', 'bigint(20)', '部门ID', 'MUL'),
+            col('user_name', 'varchar(30)', '用户账号', null='NO'), col('nick_name', 'varchar(30)', '用户昵称', null='NO'),
+            col('email', 'varchar(50)', '用户邮箱'), col('phonenumber', 'varchar(11)', '手机号码'),
+            col('sex', "char(1)", '用户性别（0男 1女 2未知）'), col('status', 'char(1)', '帐号状态（0正常 1停用）'),
+            col('del_flag', 'char(1)', '删除标志'), col('login_date', 'datetime', '最后登录时间'),
+        ]),
+        'sys_dept': ('部门表', [
+            col('dept_id', 'bigint(20)', '部门id', 'PRI', 'NO'), col('parent_id', 'bigint(20)', '父部门id'),
+            col('dept_name', 'varchar(30)', '部门名称'), col('leader', 'varchar(20)', '负责人'),
+            col('status', 'char(1)', '部门状态'), col('del_flag', 'char(1)', '删除标志'),
+        ]),
+        'sys_role': ('角色信息表', [
+            col('role_id', 'bigint(20)', '角色ID', 'PRI', 'NO'), col('role_name', 'varchar(30)', '角色名称', null='NO'),
+            col('role_key', 'varchar(100)', '角色权限字符串', null='NO'), col('status', 'char(1)', '角色状态', null='NO'),
+            col('del_flag', 'char(1)', '删除标志'),
+        ]),
+        'sys_menu': ('菜单权限表', [
+            col('menu_id', 'bigint(20)', '菜单ID', 'PRI', 'NO'), col('menu_name', 'varchar(50)', '菜单名称', null='NO'),
+            col('parent_id', 'bigint(20)', '父菜单ID'), col('path', 'varchar(200)', '路由地址'),
+            col('menu_type', 'char(1)', '菜单类型（M目录 C菜单 F按钮）'), col('perms', 'varchar(100)', '权限标识'),
+            col('status', 'char(1)', '菜单状态'),
+        ]),
+        'sys_post': ('岗位信息表', [
+            col('post_id', 'bigint(20)', '岗位ID', 'PRI', 'NO'), col('post_code', 'varchar(64)', '岗位编码', null='NO'),
+            col('post_name', 'varchar(50)', '岗位名称', null='NO'), col('status', 'char(1)', '状态', null='NO'),
+        ]),
+        'sys_notice': ('通知公告表', [
+            col('notice_id', 'int(4)', '公告ID', 'PRI', 'NO'), col('notice_title', 'varchar(50)', '公告标题', null='NO'),
+            col('notice_type', 'char(1)', '公告类型（1通知 2公告）', null='NO'), col('notice_content', 'longblob', '公告内容'),
+            col('status', 'char(1)', '公告状态'),
+        ]),
+        'sys_oper_log': ('操作日志记录', [
+            col('oper_id', 'bigint(20)', '日志主键', 'PRI', 'NO'), col('title', 'varchar(50)', '模块标题'),
+            col('business_type', 'int(2)', '业务类型'), col('oper_name', 'varchar(50)', '操作人员'),
+            col('oper_url', 'varchar(255)', '请求URL'), col('status', 'int(1)', '操作状态'),
+            col('oper_time', 'datetime', '操作时间', 'MUL'), col('cost_time', 'bigint(20)', '消耗时间'),
+        ]),
+    }
+    snapshot = {}
+    for name, (comment, columns) in tables.items():
+        extra = audit if name != 'sys_oper_log' else []
+        snapshot[name] = {'comment': comment, 'columns': columns + extra}
+    return snapshot
+
+if __name__ == '__main__':
+    snapshot = _demo_snapshot()
+    verbose = format_schema(snapshot, 'verbose')
+    compact = format_schema(snapshot, 'compact')
+    print(compact)
+    print(f"verbose: {estimate_tokens(verbose)} tokens")
+    print(f"compact: {estimate_tokens(compact)} tokens")
+    for index, level in enumerate(DETAIL_LEVELS[1:], 1):
+        print(f"compact (细节级别 {index}): {estimate_tokens(_format_compact(snapshot, level, find_common_columns(snapshot)))} tokens")
+    for budget in (300, 200, 120):
+        text = format_schema_compact(snapshot, budget)
+        print(f"compact (预算 {budget}): {estimate_tokens(text)} tokens")
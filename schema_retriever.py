@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库结构检索
+对表名、字段名以及表/字段注释建立BM25倒排索引（中文按单字和双字切分，
+英文标识符按下划线和驼峰拆分），根据问题挑选最相关的表和字段，
+只把这部分结构放进提示词，避免大型数据库的结构描述撑满上下文
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+_CJK_RUN = re.compile(r'[一-鿿㐀-䶿豈-﫿]+')
+_WORD = re.compile(r'[A-Za-z]+|\d+')
+_CAMEL = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+# 问题中常见、但不表示具体表或字段的词
+STOP_TERMS = {
+    '的', '了', '和', '与', '及', '或', '在', '是', '有', '为', '中', '把', '被', '给', '按', '每', '各',
+    '查询', '查找', '查看', '显示', '列出', '获取', '统计', '所有', '全部', '哪些', '多少', '一下',
+    '信息', '数据', '情况', '记录', '请问', '帮我', '最近', '前', '个', '条',
+    'select', 'from', 'where', 'the', 'of', 'all', 'and', 'show', 'list', 'get',
+}
+
+# 各部分文本在索引中的权重（通过重复词项实现）
+FIELD_WEIGHTS = {'table_name': 3, 'table_comment': 2, 'column_name': 1, 'column_comment': 1}
+
+def tokenize(text):
+    """
+    切分文本为检索词项
+
+    中文连续片段产生单字和相邻双字；英文和标识符按下划线、驼峰拆分并转为小写，
+    同时保留完整的标识符
+    """
+    text = unicodedata.normalize('NFKC', text or '')
+    terms = []
+
+    for run in _CJK_RUN.findall(text):
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    for identifier in re.findall(r'[A-Za-z0-9_]+', text):
+        parts = [p.lower() for word in _WORD.findall(identifier) for p in _CAMEL.findall(word)]
+        terms.extend(parts)
+        if len(parts) > 1:
+            terms.append(identifier.lower())
+
+    return [term for term in terms if term not in STOP_TERMS]
+
+class SchemaRetriever:
+    """基于BM25的表和字段检索"""
+
+    def __init__(self, snapshot, k1=1.2, b=0.75):
+        """
+        建立检索索引
+
+        Args:
+            snapshot: DatabaseConnector.get_schema_snapshot() 的结果
+            k1: BM25词频饱和参数
+            b: BM25文档长度归一化参数
+        """
+        self.snapshot = snapshot
+        self.k1 = k1
+        self.b = b
+
+        self._doc_terms = {}
+        self._column_terms = {}
+        document_frequency = Counter()
+
+        for table, info in snapshot.items():
+            terms = Counter()
+            for term in tokenize(table):
+                terms[term] += FIELD_WEIGHTS['table_name']
+            for term in tokenize(info.get('comment', '')):
+                terms[term] += FIELD_WEIGHTS['table_comment']
+
+            column_terms = {}
+            for col in info['columns']:
+                col_terms = set(tokenize(col['field'])) | set(tokenize(col.get('comment', '')))
+                column_terms[col['field']] = col_terms
+                for term in tokenize(col['field']):
+                    terms[term] += FIELD_WEIGHTS['column_name']
+                for term in tokenize(col.get('comment', '')):
+                    terms[term] += FIELD_WEIGHTS['column_comment']
+
+            self._doc_terms[table] = terms
+            self._column_terms[table] = column_terms
+            document_frequency.update(terms.keys())
+
+        self._doc_lengths = {table: sum(terms.values()) for table, terms in self._doc_terms.items()}
+        self._avg_length = (sum(self._doc_lengths.values()) / len(self._doc_lengths)) if self._doc_lengths else 0.0
+
+        total = len(self._doc_terms)
+        self._idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+        self._postings = defaultdict(list)
+        for table, terms in self._doc_terms.items():
+            for term, tf in terms.items():
+                self._postings[term].append((table, tf))
+
+    def score_tables(self, question):
+        """
+        计算每个表与问题的BM25得分
+
+        Returns:
+            list: [(table, score), ...]，按得分降序，只包含得分大于0的表
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(question)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for table, tf in self._postings[term]:
+                length_norm = 1 - self.b + self.b * self._doc_lengths[table] / (self._avg_length or 1)
+                scores[table] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def select_columns(self, table, question_terms, max_columns):
+        """
+        选择表中与问题相关的字段
+
+        字段数不超过 max_columns 时保留全部；否则保留主键/索引字段和命中问题词项的字段，
+        剩余名额按原有顺序补齐
+        """
+        columns = self.snapshot[table]['columns']
+        if not max_columns or len(columns) <= max_columns:
+            return columns
+
+        column_terms = self._column_terms[table]
+        keep = {col['field'] for col in columns if col.get('key')}
+        matched = sorted(
+            (col for col in columns if column_terms[col['field']] & question_terms),
+            key=lambda col: -len(column_terms[col['field']] & question_terms)
+        )
+        for col in matched:
+            if len(keep) >= max_columns:
+                break
+            keep.add(col['field'])
+        for col in columns:
+            if len(keep) >= max_columns:
+                break
+            keep.add(col['field'])
+
+        return [col for col in columns if col['field'] in keep]
+
+    def retrieve(self, question, top_k=5, max_columns=30, min_relative_score=0.2, required_tables=None):
+        """
+        检索与问题相关的表和字段
+
+        Args:
+            question: 用户的自然语言查询
+            top_k: 最多保留的表数量
+            max_columns: 每个表最多保留的字段数，0表示不限制
+            min_relative_score: 得分低于最高分该比例的表不保留
+            required_tables: 必须保留的表（如上一条SQL中用到的表，用于追问）
+
+        Returns:
+            dict: {'tables': {表名: 字段列表}, 'scores': {表名: 得分}}；
+                没有任何表命中时返回None，调用方应使用完整结构
+        """
+        ranked = self.score_tables(question)
+        required = [table for table in (required_tables or []) if table in self.snapshot]
+        if not ranked and not required:
+            return None
+
+        top_score = ranked[0][1] if ranked else 0.0
+        chosen = list(required)
+        for table, score in ranked:
+            if len(chosen) >= max(top_k, len(required)):
+                break
+            if score < top_score * min_relative_score:
+                break
+            if table not in chosen:
+                chosen.append(table)
+
+        question_terms = set(tokenize(question))
+        scores = dict(ranked)
+        return {
+            'tables': {table: self.select_columns(table, question_terms, max_columns) for table in chosen},
+            'scores': {table: round(scores.get(table, 0.0), 4) for table in chosen},
+        }
+
+def find_referenced_tables(sql, tables):
+    """找出SQL中引用到的表"""
+    if not sql:
+        return []
+    identifiers = set()
+    for quoted, bare in re.findall(r'`([^`]+)`|\b([A-Za-z_][A-Za-z0-9_]*)\b', sql):
+        identifiers.add((quoted or bare).lower())
+    return [table for table in tables if table.lower() in identifiers]
+
+if __name__ == '__main__':
+    demo_snapshot = {
+        'sys_user': {'comment': '用户信息表', 'columns': [
+            {'field': 'id', 'type': 'int', 'key': 'PRI', 'null': 'NO', 'comment': '用户ID'},
+            {'field': 'user_name', 'type': 'varchar(50)', 'key': '', 'null': 'NO', 'comment': '姓名'},
+            {'field': 'email', 'type': 'varchar(100)', 'key': '', 'null': 'YES', 'comment': '邮箱'},
+        ]},
+        'order_info': {'comment': '订单表', 'columns': [
+            {'field': 'id', 'type': 'int', 'key': 'PRI', 'null': 'NO', 'comment': '订单ID'},
+            {'field': 'user_id', 'type': 'int', 'key': 'MUL', 'null': 'NO', 'comment': '下单用户'},
+            {'field': 'amount', 'type': 'decimal(10,2)', 'key': '', 'null': 'NO', 'comment': '订单金额'},
+        ]},
+        'product': {'comment': '商品表', 'columns': [
+            {'field': 'id', 'type': 'int', 'key': 'PRI', 'null': 'NO', 'comment': '商品ID'},
+            {'field': 'price', 'type': 'decimal(10,2)', 'key': '', 'null': 'NO', 'comment': '价格'},
+        ]},
+    }
+    retriever = SchemaRetriever(demo_snapshot)
+    for q in ["查询所有用户的姓名和邮箱", "统计每个用户的订单金额", "最贵的商品"]:
+        print(q, retriever.retrieve(q)['scores'])
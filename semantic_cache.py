@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语义查询缓存
+对问题文本做向量化，在历史成功生成记录中检索语义相近的问题并复用其SQL，
+可使用Ollama的embedding接口或本地哈希向量化器，向量索引按数据库结构指纹隔离
+"""
+
+import hashlib
+import heapq
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from operator import itemgetter, mul
+import requests
+
+# 问题中的字面量（数字、引号内的字符串），语义相近但字面量不同的问题不能复用SQL
+_LITERAL_PATTERN = re.compile(r'\d+(?:\.\d+)?|[\'"“‘「『]([^\'"”’」』]+)[\'"”’」』]')
+
+def _normalize_vector(vector):
+    """L2归一化"""
+    norm = math.sqrt(sum(map(mul, vector, vector)))
+    if norm == 0:
+        return list(vector)
+    return [x / norm for x in vector]
+
+def _dot(a, b):
+    """向量点积"""
+    return sum(map(mul, a, b))
+
+def _selector(indices):
+    """返回按下标取出多个分量（元组）的函数"""
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda vector: (vector[index],)
+    if not indices:
+        return lambda vector: ()
+    return itemgetter(*indices)
+
+def extract_literals(question):
+    """提取问题中的字面量"""
+    text = unicodedata.normalize('NFKC', question or '')
+    return sorted(match.group(0) for match in _LITERAL_PATTERN.finditer(text))
+
+class OllamaEmbedder:
+    """通过Ollama的embedding接口向量化文本"""
+
+    def __init__(self, model_name="nomic-embed-text", api_url="http://localhost:11434", timeout=5):
+        """
+        Args:
+            model_name: embedding模型名称（需先执行 ollama pull）
+            api_url: Ollama API的基础URL
+            timeout: 超时时间（秒）
+        """
+        self.model_name = model_name
+        self.api_url = f"{api_url.rstrip('/')}/api/embeddings"
+        self.timeout = timeout
+
+    def embed(self, text):
+        """返回文本的向量（已归一化）"""
+        response = requests.post(
+            self.api_url,
+            json={"model": self.model_name, "prompt": text},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return _normalize_vector(response.json()['embedding'])
+
+class HashingEmbedder:
+    """本地哈希向量化器：字符n-gram哈希到固定维度，无需任何模型服务"""
+
+    def __init__(self, dim=256, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed(self, text):
+        """返回文本的向量（已归一化）"""
+        text = unicodedata.normalize('NFKC', text or '').lower()
+        text = ''.join(ch for ch in text if not ch.isspace() and not unicodedata.category(ch).startswith('P'))
+
+        vector = [0.0] * self.dim
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(text) - n + 1):
+                digest = hashlib.md5(text[i:i + n].encode('utf-8')).digest()
+                index = int.from_bytes(digest[:4], 'little') % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vector[index] += sign * n  # 较长的n-gram权重更高
+        return _normalize_vector(vector)
+
+class VectorIndex:
+    """
+    余弦相似度向量索引
+
+    向量在添加时归一化一次，以 float32 紧凑存储（array('f')，每个分量4字节）。
+    条目较少时直接暴力检索；条目较多时使用稀疏随机超平面LSH（多表 + 单比特多探测）
+    筛选候选集再精确计算相似度，保证十万级条目下检索仍在毫秒级。
+    每个超平面只取约 2*sqrt(dim) 个维度、系数为±1，计算签名只需对这些分量求和
+    """
+
+    def __init__(self, dim, n_bits=16, n_tables=8, brute_force_limit=512, seed=42):
+        self.dim = dim
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        self.brute_force_limit = brute_force_limit
+
+        rng = random.Random(seed)
+        nonzeros = min(dim, max(16, 2 * math.isqrt(dim)))
+        self._planes = []
+        for _ in range(n_tables):
+            planes = []
+            for _ in range(n_bits):
+                indices = rng.sample(range(dim), nonzeros)
+                # 前一半维度系数为+1，后一半为-1
+                planes.append((_selector(indices[:nonzeros // 2]), _selector(indices[nonzeros // 2:])))
+            self._planes.append(planes)
+        self._buckets = [{} for _ in range(n_tables)]
+        self._vectors = []
+        self._payloads = []
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def _signatures(self, vector):
+        """计算向量在每个哈希表中的签名"""
+        signatures = []
+        for planes in self._planes:
+            signature = 0
+            for bit, (positive, negative) in enumerate(planes):
+                if sum(positive(vector)) >= sum(negative(vector)):
+                    signature |= 1 << bit
+            signatures.append(signature)
+        return signatures
+
+    def add(self, vector, payload):
+        """添加向量（不要求已归一化）"""
+        vector = _normalize_vector(vector)
+        position = len(self._vectors)
+        self._vectors.append(array('f', vector))
+        self._payloads.append(payload)
+        for table, signature in zip(self._buckets, self._signatures(vector)):
+            table.setdefault(signature, []).append(position)
+
+    def _candidates(self, vector):
+        """通过LSH获取候选条目"""
+        candidates = set()
+        for table, signature in zip(self._buckets, self._signatures(vector)):
+            candidates.update(table.get(signature, ()))
+            # 多探测：同时检查只差一个比特的相邻桶，提高召回率
+            for bit in range(self.n_bits):
+                candidates.update(table.get(signature ^ (1 << bit), ()))
+        return candidates
+
+    def search(self, vector, top_k=1):
+        """
+        检索最相似的条目
+
+        Returns:
+            list: [(similarity, payload), ...]，按相似度降序
+        """
+        if not self._vectors:
+            return []
+        vector = _normalize_vector(vector)
+        if len(self._vectors) <= self.brute_force_limit:
+            positions = range(len(self._vectors))
+        else:
+            positions = self._candidates(vector)
+
+        vectors = self._vectors
+        scored = heapq.nlargest(top_k, ((_dot(vector, vectors[pos]), pos) for pos in positions))
+        return [(similarity, self._payloads[pos]) for similarity, pos in scored]
+
+class SemanticCache:
+    """语义查询缓存"""
+
+    def __init__(self, embedder, threshold=0.92, max_entries_per_scope=100000):
+        """
+        初始化语义缓存
+
+        Args:
+            embedder: 向量化器，需实现 embed(text) -> list[float]
+            threshold: 复用SQL所需的最低余弦相似度
+            max_entries_per_scope: 每个作用域（数据库结构）的最大条目数
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.rejected_literals = 0
+        self.embed_errors = 0
+        self.embed_ms_total = 0.0
+        self.search_ms_total = 0.0
+        self.lookups = 0
+
+    @staticmethod
+    def make_scope(schema_fp, context=None):
+        """生成作用域：同一数据库结构和对话上下文下的条目才能互相复用"""
+        context_fp = hashlib.sha1((context or '').encode('utf-8')).hexdigest()[:8]
+        return f"{schema_fp}:{context_fp}"
+
+    def embed(self, question):
+        """向量化问题，失败时返回None"""
+        start = time.perf_counter()
+        try:
+            return self.embedder.embed(question)
+        except Exception as e:
+            self.embed_errors += 1
+            print(f"⚠️ [SemanticCache] 向量化失败: {e}")
+            return None
+        finally:
+            self.embed_ms_total += (time.perf_counter() - start) * 1000
+
+    def lookup(self, question, scope, vector=None):
+        """
+        检索语义相近的历史问题
+
+        Args:
+            question: 用户的自然语言查询
+            scope: 作用域（见 make_scope）
+            vector: 可选，已计算好的问题向量
+
+        Returns:
+            dict: {'sql', 'question', 'similarity'}，未命中时返回None
+        """
+        self.lookups += 1
+        if vector is None:
+            vector = self.embed(question)
+        if vector is None:
+            self.misses += 1
+            return None
+
+        start = time.perf_counter()
+        with self._lock:
+            index = self._indexes.get(scope)
+            results = index.search(vector, top_k=3) if index else []
+        self.search_ms_total += (time.perf_counter() - start) * 1000
+
+        literals = extract_literals(question)
+        for similarity, payload in results:
+            if similarity < self.threshold:
+                break
+            # 数字、名称等字面量不同的问题语义再接近也不能复用
+            if payload['literals'] != literals:
+                self.rejected_literals += 1
+                continue
+            self.hits += 1
+            return {'sql': payload['sql'], 'question': payload['question'], 'similarity': round(similarity, 4)}
+
+        self.misses += 1
+        return None
+
+    def add(self, question, sql, scope, vector=None):
+        """记录一次成功的生成"""
+        if vector is None:
+            vector = self.embed(question)
+        if vector is None:
+            return
+
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None:
+                index = VectorIndex(len(vector))
+                self._indexes[scope] = index
+            if len(index) >= self.max_entries_per_scope:
+                return
+            index.add(vector, {'question': question, 'sql': sql, 'literals': extract_literals(question)})
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            size = sum(len(index) for index in self._indexes.values())
+            scopes = len(self._indexes)
+        return {
+            'size': size,
+            'scopes': scopes,
+            'threshold': self.threshold,
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            'rejected_literals': self.rejected_literals,
+            'embed_errors': self.embed_errors,
+            'avg_embed_ms': round(self.embed_ms_total / self.lookups, 3) if self.lookups else 0.0,
+            'avg_search_ms': round(self.search_ms_total / self.lookups, 3) if self.lookups else 0.0,
+        }
+
+def create_embedder(name, api_url="http://localhost:11434", model_name="nomic-embed-text"):
+    """
+    根据配置创建向量化器
+
+    Args:
+        name: 'ollama' 或 'hashing'
+    """
+    if name == 'hashing':
+        return HashingEmbedder()
+    return OllamaEmbedder(model_name, api_url)
+
+if __name__ == '__main__':
+    cache = SemanticCache(HashingEmbedder(), threshold=0.6)
+    scope = SemanticCache.make_scope("demo")
+    cache.add("列出所有用户邮箱", "SELECT `email` FROM `users`", scope)
+
+    print(cache.lookup("列出所有用户的邮箱", scope))
+    print(cache.lookup("查找年龄大于25岁的用户", scope))
+
+    # 大规模检索性能
+    index = VectorIndex(64)
+    rng = random.Random(0)
+    for i in range(5000):
+        index.add(_normalize_vector([rng.gauss(0, 1) for _ in range(64)]), i)
+    query = _normalize_vector([rng.gauss(0, 1) for _ in range(64)])
+    start = time.perf_counter()
+    index.search(query)
+    print(f"5000条向量检索耗时: {(time.perf_counter() - start) * 1000:.2f}ms")
+    print(cache.get_stats())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL响应提取模块
+从大模型的响应（完整或流式）中提取SQL语句，
+流式模式下一旦语句或代码块完整即可提前结束生成
+"""
+
+import re
+
+# 模型常用的前缀说明文字
+PREFIXES_TO_REMOVE = [
+    "根据您的查询需求，生成的SQL语句如下：",
+    "SQL语句：",
+    "查询语句：",
+    "生成的SQL：",
+    "答案：",
+    "结果：",
+]
+
+# 各后端的停止序列：SQL之后的解释性文字通常以这些内容开头
+# 注意：OpenAI兼容接口最多支持4个停止序列，Gemini最多支持5个
+STOP_SEQUENCES = {
+    'ollama': ["\n\n说明", "\n\n解释", "\n\n注意", "<|im_end|>"],
+    'qwen_api': ["\n\n说明", "\n\n解释", "\n\n注意", "\n\n这条"],
+    'gemini': ["\n\n说明", "\n\n解释", "\n\n注意", "\n\n**", "\n\nExplanation"],
+}
+
+_SELECT_PATTERN = re.compile(r'(?:^|[:：]\s*)(SELECT\b)', re.IGNORECASE | re.MULTILINE)
+
+
+def get_stop_sequences(backend):
+    """获取指定后端的停止序列"""
+    return list(STOP_SEQUENCES.get(backend, []))
+
+
+def _find_statement_end(text, start=0):
+    """
+    查找SQL语句的结束位置（引号外的分号或空行）
+
+    Returns:
+        int: 结束位置（不含），未结束时返回 -1
+    """
+    quote = None
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == '\\' and quote != '`':
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', '`'):
+            quote = ch
+        elif ch == ';':
+            return i
+        elif ch == '\n' and (text.startswith('\n\n', i) or text.startswith('\n\r\n', i)):
+            return i
+        i += 1
+    return -1
+
+
+def _find_fenced_block(text):
+    """
+    查找markdown代码块
+
+    Returns:
+        tuple: (content, closed)，没有代码块时返回 (None, False)
+    """
+    open_pos = text.find("```")
+    if open_pos == -1:
+        return None, False
+
+    # 代码块内容从开始标记所在行的下一行开始（跳过 ```sql 等语言标记）
+    newline_pos = text.find("\n", open_pos + 3)
+    if newline_pos == -1:
+        return "", False
+    content_start = newline_pos + 1
+
+    close_pos = text.find("```", content_start)
+    if close_pos == -1:
+        return text[content_start:], False
+    return text[content_start:close_pos], True
+
+
+def _strip_prefixes(text):
+    """移除常见的前缀说明文字"""
+    for prefix in PREFIXES_TO_REMOVE:
+        if text.startswith(prefix):
+            text = text[len(prefix):].strip()
+    return text
+
+
+def extract_sql(response):
+    """
+    从模型完整响应中提取纯SQL语句
+
+    Args:
+        response: 模型原始响应文本
+
+    Returns:
+        str: 提取出的SQL语句（末尾不带分号），或以 "ERROR:" 开头的错误信息
+    """
+    cleaned_sql = (response or "").strip()
+
+    # 优先提取markdown代码块
+    fenced, _ = _find_fenced_block(cleaned_sql)
+    if fenced is not None and fenced.strip():
+        cleaned_sql = fenced.strip()
+
+    cleaned_sql = _strip_prefixes(cleaned_sql)
+
+    # 模型明确表示无法生成时只保留错误信息那一行
+    if cleaned_sql.startswith("ERROR:"):
+        return cleaned_sql.split("\n", 1)[0].strip()
+
+    # 查找SELECT语句的起始位置，去掉前面的说明文字
+    if not cleaned_sql.upper().startswith('SELECT'):
+        match = _SELECT_PATTERN.search(cleaned_sql)
+        if match:
+            cleaned_sql = cleaned_sql[match.start(1):]
+
+    # 截断到语句结束位置，去掉后面的解释文字
+    if cleaned_sql.upper().startswith('SELECT'):
+        end = _find_statement_end(cleaned_sql)
+        if end != -1:
+            cleaned_sql = cleaned_sql[:end]
+
+    cleaned_sql = cleaned_sql.strip()
+
+    # 移除末尾的分号（如果有的话，我们统一处理）
+    if cleaned_sql.endswith(';'):
+        cleaned_sql = cleaned_sql[:-1].strip()
+
+    return cleaned_sql
+
+
+class SQLStreamExtractor:
+    """流式SQL提取器，增量接收模型输出并判断SQL语句是否已经完整"""
+
+    def __init__(self):
+        self.text = ""
+        self.is_complete = False
+
+    def feed(self, chunk):
+        """
+        追加一段流式输出
+
+        Args:
+            chunk: 新收到的文本片段
+
+        Returns:
+            bool: SQL语句是否已经完整（为True时调用方可以关闭流）
+        """
+        if chunk:
+            self.text += chunk
+        if not self.is_complete:
+            self.is_complete = self._check_complete()
+        return self.is_complete
+
+    def _check_complete(self):
+        """判断当前缓冲区中的SQL是否已经完整"""
+        stripped = self.text.lstrip()
+
+        # 1. 代码块：等待结束标记
+        if stripped.startswith("`"):
+            fenced, closed = _find_fenced_block(stripped)
+            if fenced is None:
+                return False
+            return closed and bool(fenced.strip())
+
+        # 2. 错误信息：收到整行即可
+        if _strip_prefixes(stripped).startswith("ERROR:"):
+            return "\n" in _strip_prefixes(stripped)
+
+        # 3. 代码块可能出现在说明文字之后
+        if "```" in stripped:
+            fenced, closed = _find_fenced_block(stripped)
+            return closed and bool(fenced and fenced.strip())
+
+        # 4. 普通SQL：引号外的分号或空行表示语句结束
+        match = _SELECT_PATTERN.search(stripped)
+        if not match:
+            return False
+        return _find_statement_end(stripped, match.start(1)) != -1
+
+    def get_sql(self):
+        """获取提取出的SQL语句"""
+        return extract_sql(self.text)
+
+
+if __name__ == '__main__':
+    # 模拟流式输出
+    chunks = ["```", "sql\nSELECT `name`, `email`\n", "FROM `users`;\n", "```", "\n\n这条SQL语句查询了..."]
+    extractor = SQLStreamExtractor()
+    for i, chunk in enumerate(chunks, 1):
+        if extractor.feed(chunk):
+            print(f"第{i}个片段后SQL已完整，提前结束")
+            break
+    print(f"提取的SQL: {extractor.get_sql()}")
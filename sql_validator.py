@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地SQL校验与修正
+在执行前把SQL中引用的每个表和字段与结构快照比对：
+- 拼写接近的表名/字段名（大小写、下划线、编辑距离、中文注释、注释拼音）在本地直接修正
+- 作为字段使用的MySQL保留字自动加上反引号
+- 不存在的表/字段、有歧义的字段直接拒绝，并给出具体原因和可能的候选
+
+不需要再请求数据库或大模型，大部分“字段名写错”类的失败可以在本地解决
+"""
+
+import re
+import unicodedata
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    # 可选依赖：未安装时不使用注释拼音匹配
+    lazy_pinyin = None
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<ws>\s+|--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`(?:[^`]|``)+`)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+  | (?P<variable>@@?[A-Za-z0-9_.$]+)
+  | (?P<word>[A-Za-z_一-鿿][A-Za-z0-9_$一-鿿]*)
+  | (?P<op><=>|<=|>=|<>|!=|\|\||&&|:=|[(),.;*=<>+\-/%!~^&|?])
+""", re.VERBOSE | re.DOTALL)
+
+# 不会是字段名的SQL关键字和不带括号的函数（与字段同名时以字段为准）
+SQL_KEYWORDS = {
+    'SELECT', 'FROM', 'WHERE', 'AND', 'OR', 'NOT', 'IN', 'IS', 'NULL', 'LIKE', 'BETWEEN', 'EXISTS',
+    'AS', 'ON', 'USING', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'OUTER', 'CROSS', 'NATURAL', 'STRAIGHT_JOIN',
+    'GROUP', 'ORDER', 'BY', 'HAVING', 'LIMIT', 'OFFSET', 'ASC', 'DESC', 'DISTINCT', 'DISTINCTROW', 'ALL',
+    'ANY', 'SOME', 'UNION', 'WITH', 'RECURSIVE', 'ROLLUP', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END',
+    'TRUE', 'FALSE', 'UNKNOWN', 'INTERVAL', 'REGEXP', 'RLIKE', 'ESCAPE', 'DIV', 'MOD', 'XOR', 'BINARY',
+    'COLLATE', 'SEPARATOR', 'OVER', 'PARTITION', 'ROWS', 'RANGE', 'UNBOUNDED', 'PRECEDING', 'FOLLOWING',
+    'CURRENT', 'ROW', 'WINDOW', 'FOR', 'SHARE', 'LOCK', 'MODE', 'SQL_CALC_FOUND_ROWS', 'HIGH_PRIORITY',
+    'CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP', 'CURRENT_USER', 'LOCALTIME', 'LOCALTIMESTAMP',
+    'UTC_DATE', 'UTC_TIME', 'UTC_TIMESTAMP',
+    'MICROSECOND', 'SECOND', 'MINUTE', 'HOUR', 'DAY', 'WEEK', 'MONTH', 'QUARTER', 'YEAR',
+    'SECOND_MICROSECOND', 'MINUTE_SECOND', 'HOUR_MINUTE', 'HOUR_SECOND', 'DAY_HOUR', 'DAY_MINUTE',
+    'DAY_SECOND', 'YEAR_MONTH',
+    'CHAR', 'SIGNED', 'UNSIGNED', 'DECIMAL', 'DATE', 'DATETIME', 'TIME', 'JSON', 'DOUBLE', 'FLOAT',
+    'INTEGER', 'INT', 'NCHAR', 'UTF8MB4',
+}
+
+# 作为标识符使用时必须加反引号的MySQL保留字（常被用作字段名的部分）
+RESERVED_WORDS = {
+    'ORDER', 'GROUP', 'KEY', 'DESC', 'ASC', 'RANGE', 'RANK', 'CONDITION', 'INTERVAL', 'READ', 'USAGE',
+    'OPTION', 'SCHEMA', 'DATABASE', 'TABLE', 'INDEX', 'CHECK', 'COLUMN', 'CHANGE', 'LIMIT', 'LEFT',
+    'RIGHT', 'LINES', 'RELEASE', 'REPEAT', 'REPLACE', 'REQUIRE', 'SIGNAL', 'SQL', 'SYSTEM',
+    'TO', 'TRIGGER', 'UNDO', 'USE', 'VALUES', 'WRITE', 'GROUPS', 'ROWS', 'ROW_NUMBER', 'DIV', 'MOD',
+    'CASE', 'MATCH', 'DEFAULT', 'DUAL', 'FUNCTION', 'LEAD', 'LAG', 'OF', 'OUT', 'OVER', 'WINDOW',
+}
+
+# 保留字前后出现这些符号时视为标识符（如 SELECT key, ... / WHERE order = 1）
+_IDENT_BEFORE = {'SELECT', ',', '(', 'WHERE', 'AND', 'OR', 'ON', 'BY', 'NOT', 'DISTINCT', 'HAVING',
+                 '=', '<', '>', '<=', '>=', '<>', '!=', '+', '-', '*', '/'}
+_IDENT_AFTER = {',', ')', 'FROM', '=', '<', '>', '<=', '>=', '<>', '!=', 'AS', 'AND', 'OR', 'ASC', 'DESC',
+                'IS', 'IN', 'LIKE', 'BETWEEN', 'NOT', ';', None}
+
+# 开始新子句的关键字（ORDER / GROUP 需要后跟 BY）
+_CLAUSES = {'SELECT': 'select', 'FROM': 'from', 'WHERE': 'where', 'HAVING': 'having', 'LIMIT': 'limit',
+            'ON': 'on', 'USING': 'using', 'WINDOW': 'window'}
+_JOIN_WORDS = {'JOIN', 'STRAIGHT_JOIN'}
+_COLUMN_CLAUSES = {'select', 'where', 'on', 'group', 'having', 'order'}
+
+def normalize_name(name):
+    """归一化名称：全角转半角、小写，去掉下划线、连字符和空白"""
+    name = unicodedata.normalize('NFKC', name or '').lower()
+    return re.sub(r'[_\-\s]', '', name)
+
+def _clean_comment(comment):
+    """去掉注释中括号内的取值说明，如 '用户性别（0男 1女 2未知）' -> '用户性别'"""
+    comment = unicodedata.normalize('NFKC', comment or '')
+    return re.sub(r'\(.*?\)', '', comment).strip()
+
+def edit_distance(a, b, limit=None):
+    """Damerau-Levenshtein距离（相邻字符交换算一次编辑），超过limit时提前返回limit+1"""
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+class FuzzyIndex:
+    """名称的模糊匹配索引：大小写、下划线、中文注释、注释拼音和编辑距离"""
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries: [(name, comment), ...]
+        """
+        self.names = {}
+        self.lower = {}
+        self.normalized = {}
+        self.aliases = {}
+        for name, comment in entries:
+            self.names[name] = comment
+            self.lower.setdefault(name.lower(), name)
+            self.normalized.setdefault(normalize_name(name), set()).add(name)
+            comment = _clean_comment(comment)
+            if comment:
+                self.aliases.setdefault(normalize_name(comment), set()).add(name)
+                if lazy_pinyin is not None and re.search(r'[一-鿿]', comment):
+                    self.aliases.setdefault(normalize_name(''.join(lazy_pinyin(comment))), set()).add(name)
+
+    def exact(self, word):
+        """不区分大小写的精确匹配，没有时返回None"""
+        return self.lower.get(word.lower())
+
+    def match(self, word):
+        """
+        查找与word最接近的名称
+
+        Returns:
+            tuple: (name, method)，没有唯一候选时 name 为None，method 为候选列表
+        """
+        name = self.exact(word)
+        if name:
+            return name, 'case'
+        key = normalize_name(word)
+        for method, index in (('normalized', self.normalized), ('comment', self.aliases)):
+            candidates = index.get(key, set())
+            if len(candidates) == 1:
+                return next(iter(candidates)), method
+            if len(candidates) > 1:
+                return None, sorted(candidates)
+
+        limit = 1 if len(key) <= 4 else 2 if len(key) <= 10 else 3
+        scored = sorted(
+            (edit_distance(key, normalized, limit), normalized) for normalized in self.normalized
+        )
+        best = [normalized for distance, normalized in scored if distance == scored[0][0]] if scored else []
+        if scored and scored[0][0] <= limit:
+            names = sorted(name for normalized in best for name in self.normalized[normalized])
+            if len(names) == 1:
+                return names[0], 'edit_distance'
+            return None, names
+        return None, self.suggest(key)
+
+    def suggest(self, key, count=3):
+        """编辑距离最近的几个名称，用于错误提示"""
+        scored = sorted((edit_distance(key, normalize_name(name)), name) for name in self.names)
+        return [name for _, name in scored[:count]]
+
+class _Scope:
+    """一个SELECT的作用域：引用的表、别名、字段引用"""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.tables = {}            # 别名或表名（小写） -> 表名；派生表/CTE为None
+        self.names = {}             # 别名或表名（小写） -> 原始写法
+        self.table_refs = []        # 表名所在的token下标
+        self.columns = []           # (字段token下标, 限定符token下标或None)
+        self.reserved = []          # 可能是字段名的保留字token下标
+        self.select_aliases = set()
+        self.using_columns = set()
+        self.natural = False
+
+class SQLValidator:
+    """基于结构快照的SQL校验与修正"""
+
+    def __init__(self, snapshot):
+        """
+        Args:
+            snapshot: DatabaseConnector.get_schema_snapshot() 的结果
+        """
+        self.snapshot = snapshot
+        self.table_index = FuzzyIndex((table, info.get('comment', '')) for table, info in snapshot.items())
+        self.column_index = {
+            table: FuzzyIndex((col['field'], col.get('comment', '')) for col in info['columns'])
+            for table, info in snapshot.items()
+        }
+
+        self.validated = 0
+        self.repaired = 0
+        self.rejected = 0
+
+    # ---------- 词法和作用域分析 ----------
+
+    @staticmethod
+    def _tokenize(sql):
+        tokens = []
+        position = 0
+        while position < len(sql):
+            match = _TOKEN_PATTERN.match(sql, position)
+            if not match:
+                # 无法识别的字符按单个符号处理
+                tokens.append(('op', sql[position], position, position + 1))
+                position += 1
+                continue
+            if match.lastgroup != 'ws':
+                tokens.append((match.lastgroup, match.group(0), match.start(), match.end()))
+            position = match.end()
+        return tokens
+
+    @staticmethod
+    def _name(token):
+        """标识符token的名称（去掉反引号）"""
+        kind, text = token[0], token[1]
+        return text[1:-1].replace('``', '`') if kind == 'quoted' else text
+
+    def _analyze(self, tokens):
+        """扫描token，划分作用域，收集表引用和字段引用"""
+        def upper(i):
+            return tokens[i][1].upper() if 0 <= i < len(tokens) and tokens[i][0] == 'word' else None
+
+        def text(i):
+            if not 0 <= i < len(tokens):
+                return None
+            return tokens[i][1].upper() if tokens[i][0] in ('word', 'op') else tokens[i][1]
+
+        def is_ident(i):
+            return 0 <= i < len(tokens) and (
+                tokens[i][0] == 'quoted' or (tokens[i][0] == 'word' and tokens[i][1].upper() not in SQL_KEYWORDS)
+            )
+
+        scopes = []
+        scope = _Scope()
+        scopes.append(scope)
+        ctes = set()
+        clause = 'with' if upper(0) == 'WITH' else None
+        expect_table = expect_alias = False
+        alias_source = None
+        parens = []     # (是否子查询, 外层子句, 外层作用域)
+        i = 0
+        while i < len(tokens):
+            kind, value = tokens[i][0], tokens[i][1]
+            word = value.upper() if kind == 'word' else None
+
+            if value == '(':
+                subquery = upper(i + 1) in ('SELECT', 'WITH')
+                if clause == 'with' and tokens[i - 1][1].upper() == 'AS' and i >= 2 and is_ident(i - 2):
+                    ctes.add(self._name(tokens[i - 2]).lower())
+                parens.append((subquery, clause, scope, expect_table))
+                if subquery:
+                    scope = _Scope(scope)
+                    scopes.append(scope)
+                    clause = None
+                expect_table = False
+                i += 1
+                continue
+            if value == ')':
+                if parens:
+                    subquery, clause, outer, was_table = parens.pop()
+                    if subquery:
+                        scope = outer
+                        if was_table:
+                            # 派生表，其后是别名
+                            expect_alias, alias_source = True, None
+                i += 1
+                continue
+
+            if word == 'UNION':
+                # UNION 的每个分支都是独立作用域
+                scope = _Scope(scope.parent)
+                scopes.append(scope)
+                clause = None
+                i += 1
+                continue
+            if word in ('ORDER', 'GROUP', 'PARTITION') and upper(i + 1) == 'BY':
+                clause = word.lower() if word != 'PARTITION' else 'order'
+                expect_table = expect_alias = False
+                i += 2
+                continue
+            if word in _CLAUSES and not (clause == 'with' and word != 'SELECT'):
+                clause = _CLAUSES[word]
+                expect_table = clause == 'from'
+                expect_alias = False
+                i += 1
+                continue
+            if word in _JOIN_WORDS:
+                clause = 'from'
+                expect_table, expect_alias = True, False
+                i += 1
+                continue
+            if word == 'NATURAL':
+                scope.natural = True
+                i += 1
+                continue
+
+            if clause == 'from':
+                if expect_table and (kind == 'quoted' or (kind == 'word' and word not in SQL_KEYWORDS)):
+                    # 库名.表名 只校验表名部分
+                    if text(i + 1) == '.' and i + 2 < len(tokens) and tokens[i + 2][0] in ('word', 'quoted'):
+                        i += 2
+                    name = self._name(tokens[i])
+                    scope.table_refs.append(i)
+                    alias_source = None if name.lower() in ctes else name
+                    scope.tables[name.lower()] = alias_source
+                    scope.names[name.lower()] = name
+                    expect_table, expect_alias = False, True
+                    i += 1
+                    continue
+                if expect_alias:
+                    if word == 'AS':
+                        i += 1
+                        continue
+                    if is_ident(i):
+                        alias = self._name(tokens[i])
+                        scope.tables[alias.lower()] = alias_source
+                        scope.names[alias.lower()] = alias
+                        expect_alias = False
+                        i += 1
+                        continue
+                    expect_alias = False
+                if value == ',':
+                    expect_table = True
+                i += 1
+                continue
+
+            if clause == 'using' and is_ident(i):
+                scope.using_columns.add(self._name(tokens[i]).lower())
+                i += 1
+                continue
+
+            if clause in _COLUMN_CLAUSES:
+                if kind in ('word', 'quoted') and text(i + 1) == '.':
+                    # 限定名 qualifier.column、qualifier.* 或 库名.表名.字段
+                    if text(i + 3) == '.' and i + 4 < len(tokens) and tokens[i + 2][0] in ('word', 'quoted'):
+                        i += 2
+                    if i + 2 < len(tokens) and tokens[i + 2][0] in ('word', 'quoted'):
+                        scope.columns.append((i + 2, i))
+                        i += 3
+                        continue
+                    scope.columns.append((None, i))
+                    i += 2
+                    continue
+                if kind in ('word', 'quoted'):
+                    previous, following = text(i - 1), text(i + 1)
+                    if following == '(' and kind == 'word':
+                        # 函数调用
+                        i += 1
+                        continue
+                    if previous == 'AS':
+                        if clause == 'select':
+                            scope.select_aliases.add(self._name(tokens[i]).lower())
+                        i += 1
+                        continue
+                    if clause == 'select' and following in (',', 'FROM', None) and i > 0 and \
+                            (tokens[i - 1][0] in ('word', 'quoted', 'number', 'string') or previous == ')') and \
+                            (previous not in SQL_KEYWORDS or previous == 'END') and previous != ',':
+                        # 省略AS的输出别名
+                        scope.select_aliases.add(self._name(tokens[i]).lower())
+                        i += 1
+                        continue
+                    if kind == 'word' and word in SQL_KEYWORDS:
+                        if word in RESERVED_WORDS and previous in _IDENT_BEFORE and following in _IDENT_AFTER:
+                            scope.reserved.append(i)
+                        i += 1
+                        continue
+                    scope.columns.append((i, None))
+            i += 1
+        return scopes
+
+    # ---------- 校验与修正 ----------
+
+    def _lookup_qualifier(self, scope, qualifier):
+        """在当前及外层作用域中查找限定符，返回 (作用域, 表名或None)，找不到时作用域为None"""
+        current = scope
+        while current is not None:
+            if qualifier in current.tables:
+                return current, current.tables[qualifier]
+            current = current.parent
+        return None, None
+
+    def _visible_qualifiers(self, scope):
+        """当前及外层作用域中可用的表名和别名（原始写法）"""
+        names = []
+        current = scope
+        while current is not None:
+            names.extend(current.names.values())
+            current = current.parent
+        return names
+
+    def validate(self, sql, quiet=False):
+        """
+        校验SQL中的表和字段，能修正的在本地修正
+
+        Args:
+            sql: 通过安全检查的SELECT语句
+            quiet: 为True时不打印日志、不计入统计（用于校验示例SQL等内部用途）
+
+        Returns:
+            tuple: (ok: bool, sql_or_error: str, repairs: list)
+                ok为True时返回（可能已修正的）SQL，repairs 为修正记录 [{'from', 'to', 'kind', 'method'}, ...]；
+                ok为False时返回具体的错误原因
+        """
+        if not quiet:
+            self.validated += 1
+        tokens = self._tokenize(sql)
+        scopes = self._analyze(tokens)
+        replacements = {}
+        repairs = []
+
+        def repair(index, new_name, kind, method):
+            old = self._name(tokens[index])
+            replacements[index] = f"`{new_name}`"
+            if old != new_name or method == 'quote':
+                repairs.append({'from': old, 'to': new_name, 'kind': kind, 'method': method})
+
+        def reject(message):
+            if not quiet:
+                self.rejected += 1
+                print(f"⛔ [Validator] {message}")
+            return False, message, repairs
+
+        # 1. 表名
+        renamed = {}
+        for scope in scopes:
+            for index in scope.table_refs:
+                name = self._name(tokens[index])
+                if name in self.snapshot or scope.tables.get(name.lower(), name) is None:
+                    continue
+                table, method = self.table_index.match(name)
+                if table is None:
+                    hint = f"，可能是: {', '.join(method)}" if method else ""
+                    return reject(f"表 `{name}` 不存在{hint}")
+                repair(index, table, 'table', method)
+                renamed[name.lower()] = table
+                for alias, source in list(scope.tables.items()):
+                    if source == name:
+                        scope.tables[alias] = table
+                scope.tables[table.lower()] = table
+                scope.names[table.lower()] = table
+                if name.lower() != table.lower():
+                    scope.tables.pop(name.lower(), None)
+                    scope.names.pop(name.lower(), None)
+
+        # 2. 字段
+        for scope in scopes:
+            known_tables = [table for table in dict.fromkeys(scope.tables.values()) if table is not None]
+            has_unknown_source = any(table is None for table in scope.tables.values())
+
+            for column_index, qualifier_index in scope.columns:
+                if qualifier_index is not None:
+                    qualifier = self._name(tokens[qualifier_index])
+                    if qualifier.lower() in renamed:
+                        # 未使用别名时，限定符与被修正的表名写法相同
+                        repair(qualifier_index, renamed[qualifier.lower()], 'table', 'case')
+                        qualifier = renamed[qualifier.lower()]
+                    owner, table = self._lookup_qualifier(scope, qualifier.lower())
+                    if owner is None:
+                        visible = self._visible_qualifiers(scope)
+                        match, _ = FuzzyIndex((name, '') for name in visible).match(qualifier)
+                        if match is None:
+                            return reject(f"未知的表或别名 `{qualifier}`"
+                                          + (f"，当前可用: {', '.join(visible)}" if visible else ""))
+                        repair(qualifier_index, match, 'alias', 'edit_distance')
+                        owner, table = self._lookup_qualifier(scope, match.lower())
+                    if column_index is None or table is None:
+                        continue
+                    error = self._check_column(tokens, column_index, [table], repair)
+                    if error:
+                        return reject(error)
+                    continue
+
+                name = self._name(tokens[column_index])
+                lowered = name.lower()
+                owners = [table for table in known_tables if self.column_index[table].exact(name)]
+                if len(owners) == 1:
+                    if tokens[column_index][0] == 'word' and name.upper() in RESERVED_WORDS:
+                        # 与保留字同名的字段需要加反引号（限定名中的不需要）
+                        repair(column_index, self.column_index[owners[0]].exact(name), 'column', 'quote')
+                    continue
+                if len(owners) > 1:
+                    if scope.natural or lowered in scope.using_columns or lowered in scope.select_aliases:
+                        continue
+                    return reject(f"字段 `{name}` 同时存在于 {', '.join(owners)}，请用表名或别名限定")
+                if lowered in scope.select_aliases or lowered in scope.tables:
+                    continue
+                if self._visible_in_parents(scope, name):
+                    continue
+                if has_unknown_source or not known_tables:
+                    # 来自派生表或CTE的字段无法校验
+                    continue
+                error = self._check_column(tokens, column_index, known_tables, repair)
+                if error:
+                    return reject(error)
+
+            # 3. 作为字段使用的保留字加反引号
+            for index in scope.reserved:
+                name = tokens[index][1]
+                owners = [table for table in known_tables if self.column_index[table].exact(name)]
+                if owners:
+                    repair(index, self.column_index[owners[0]].exact(name), 'column', 'quote')
+
+        if not replacements:
+            return True, sql, repairs
+
+        parts = []
+        position = 0
+        for index in sorted(replacements):
+            _, _, start, end = tokens[index]
+            parts.append(sql[position:start])
+            parts.append(replacements[index])
+            position = end
+        parts.append(sql[position:])
+        fixed_sql = ''.join(parts)
+
+        if quiet:
+            return True, fixed_sql, repairs
+        self.repaired += 1
+        summary = ', '.join(f"{r['from']} → {r['to']}" for r in repairs)
+        print(f"🔧 [Validator] 本地修正: {summary}")
+        return True, fixed_sql, repairs
+
+    def _visible_in_parents(self, scope, name):
+        """关联子查询可以引用外层作用域的字段"""
+        current = scope.parent
+        while current is not None:
+            for table in current.tables.values():
+                if table is not None and self.column_index[table].exact(name):
+                    return True
+            current = current.parent
+        return False
+
+    def _check_column(self, tokens, index, tables, repair):
+        """
+        在给定的表中查找字段，找到近似名称时修正
+
+        Returns:
+            str: 无法修正时的错误信息，否则为None
+        """
+        name = self._name(tokens[index])
+        for table in tables:
+            if self.column_index[table].exact(name):
+                return None
+
+        found = []
+        suggestions = []
+        for table in tables:
+            column, method = self.column_index[table].match(name)
+            if column is not None:
+                found.append((table, column, method))
+            else:
+                suggestions.extend(method)
+
+        columns = {column for _, column, _ in found}
+        if len(columns) == 1:
+            column_tables = [table for table, column, _ in found]
+            if len(column_tables) > 1 and len(tables) > 1:
+                return f"字段 `{name}` 不存在，近似字段 `{found[0][1]}` 同时存在于 {', '.join(column_tables)}"
+            repair(index, found[0][1], 'column', found[0][2])
+            return None
+
+        scope_desc = '、'.join(tables)
+        candidates = sorted(columns) or suggestions[:3]
+        hint = f"，可能是: {', '.join(candidates)}" if candidates else ""
+        return f"字段 `{name}` 不存在于 {scope_desc}{hint}"
+
+    def get_stats(self):
+        """获取校验统计"""
+        return {
+            'validated': self.validated,
+            'repaired': self.repaired,
+            'rejected': self.rejected,
+            'pinyin': lazy_pinyin is not None,
+        }
+
+if __name__ == '__main__':
+    from schema_formatter import _demo_snapshot
+
+    validator = SQLValidator(_demo_snapshot())
+    for sample in [
+        "SELECT user_name, emial FROM sys_user WHERE status = '0'",
+        "SELECT u.userName, d.dept_name FROM Sys_User u JOIN sys_dept d ON u.dept_id = d.dept_id",
+        "SELECT 用户邮箱 FROM sys_user",
+        "SELECT status FROM sys_user u JOIN sys_dept d ON u.dept_id = d.dept_id",
+        "SELECT salary FROM sys_user",
+        "SELECT * FROM sys_customer",
+    ]:
+        print(sample)
+        print("  ->", validator.validate(sample)[:2])
+    print(validator.get_stats())
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参数化SQL模板缓存
+从问题和生成的SQL中提取字面量（数字、日期、引号内的名称、条数限制），
+学习两者之间的对应关系；问题骨架相同、只有字面量不同时直接在本地填入新值，
+无需再次调用大模型。对应关系存在歧义时放弃复用，交给大模型处理
+"""
+
+import re
+import threading
+import unicodedata
+from generation_cache import normalize_question
+
+# 问题中的日期：2024-01-01、2024/1/1、2024年1月1日
+_QUESTION_DATE = re.compile(r'(\d{4})\s*[-/年]\s*(\d{1,2})\s*[-/月]\s*(\d{1,2})\s*日?')
+# 问题中引号内的名称
+_QUESTION_STRING = re.compile(r'[\'"“‘「『]([^\'"”’」』]+)[\'"”’」』]')
+# 问题中的数字（可带正负号，紧跟在数字或字母后面的减号视为连接符，如 1-5）
+_QUESTION_NUMBER = re.compile(r'(?:(?<![0-9A-Za-z.])[-+])?\d+(?:\.\d+)?')
+
+# SQL中的字符串字面量、标识符和数字（数字前的负号单独捕获，是否为一元负号由前一个字符判断）
+_SQL_TOKEN = re.compile(r"'(?:[^'\\]|\\.|'')*'|`[^`]*`|\"(?:[^\"\\]|\\.)*\"|(-\s*)?\b\d+(?:\.\d+)?\b|[A-Za-z_][A-Za-z0-9_]*")
+
+_PLACEHOLDERS = {'date': '<DATE>', 'str': '<STR>', 'num': '<NUM>'}
+
+def extract_question_literals(question):
+    """
+    提取问题中的字面量
+
+    Returns:
+        tuple: (skeleton, literals) 问题骨架和按出现顺序排列的字面量列表，
+            每个字面量为 {'type': 'date'|'str'|'num', 'value': str}
+    """
+    text = unicodedata.normalize('NFKC', question or '')
+    spans = []
+
+    for match in _QUESTION_DATE.finditer(text):
+        year, month, day = match.groups()
+        spans.append((match.start(), match.end(), 'date', f"{year}-{int(month):02d}-{int(day):02d}"))
+
+    def overlaps(start, end):
+        return any(start < s_end and end > s_start for s_start, s_end, _, _ in spans)
+
+    for match in _QUESTION_STRING.finditer(text):
+        if not overlaps(match.start(), match.end()):
+            spans.append((match.start(), match.end(), 'str', match.group(1)))
+
+    for match in _QUESTION_NUMBER.finditer(text):
+        if not overlaps(match.start(), match.end()):
+            spans.append((match.start(), match.end(), 'num', match.group(0).lstrip('+')))
+
+    spans.sort()
+    parts = []
+    literals = []
+    last = 0
+    for start, end, literal_type, value in spans:
+        parts.append(text[last:start])
+        parts.append(_PLACEHOLDERS[literal_type])
+        literals.append({'type': literal_type, 'value': value})
+        last = end
+    parts.append(text[last:])
+
+    return normalize_question(''.join(parts)), literals
+
+def extract_sql_literals(sql):
+    """
+    提取SQL中的字符串和数字字面量（忽略反引号内的标识符）
+
+    Returns:
+        list: [{'start', 'end', 'kind': 'str'|'num', 'value', 'quote'}]
+    """
+    literals = []
+    for match in _SQL_TOKEN.finditer(sql):
+        token = match.group(0)
+        if token[0] in ("'", '"'):
+            literals.append({
+                'start': match.start(), 'end': match.end(), 'kind': 'str',
+                'value': token[1:-1].replace("''", "'"), 'quote': token[0]
+            })
+        elif token[0].isdigit() or token[0] == '-':
+            start = match.start()
+            if match.group(1):
+                # 减号前面是标识符、字面量或右括号时为减法运算，不属于数字
+                previous = sql[:start].rstrip()[-1:]
+                if previous.isalnum() or previous in ('_', '`', ')', "'", '"'):
+                    start = match.start() + len(match.group(1))
+                    token = sql[start:match.end()]
+                else:
+                    token = '-' + token[len(match.group(1)):]
+            literals.append({
+                'start': start, 'end': match.end(), 'kind': 'num',
+                'value': token, 'quote': ''
+            })
+    return literals
+
+def _literal_matches(question_literal, sql_literal):
+    """判断问题字面量与SQL字面量是否对应"""
+    q_type, q_value = question_literal['type'], question_literal['value']
+    if q_type == 'num':
+        if sql_literal['kind'] != 'num':
+            return False
+        return float(q_value) == float(sql_literal['value'])
+    if sql_literal['kind'] != 'str':
+        return False
+    if q_type == 'date':
+        return sql_literal['value'].startswith(q_value)
+    return sql_literal['value'] == q_value
+
+class SQLTemplate:
+    """由一次成功生成学习到的参数化SQL模板"""
+
+    def __init__(self, sql, question_literals, sql_literals):
+        self.sql = sql
+        self.question_literals = question_literals
+        # slot_map[i] = 问题第i个字面量在SQL中对应的字面量，None表示该值必须保持不变
+        self.slot_map = []
+        self.hits = 0
+
+        for q_literal in question_literals:
+            matches = [s for s in sql_literals if _literal_matches(q_literal, s)]
+            # 恰好对应一个SQL字面量时才能安全替换；没有对应或对应多个都视为固定值
+            self.slot_map.append(matches[0] if len(matches) == 1 else None)
+
+        used = [id(s) for s in self.slot_map if s is not None]
+        if len(used) != len(set(used)):
+            # 多个问题字面量对应同一个SQL字面量，无法判断该用哪个值
+            self.slot_map = [None] * len(question_literals)
+
+    @property
+    def parameter_count(self):
+        """可替换的参数个数"""
+        return sum(1 for s in self.slot_map if s is not None)
+
+    def shape(self):
+        """SQL结构（可替换参数位置替换为占位符），用于检测同一问题骨架的冲突"""
+        return self.render_positions({i: '?' for i, s in enumerate(self.slot_map) if s is not None}, raw=True)
+
+    def render_positions(self, values, raw=False):
+        """按位置替换SQL中的字面量"""
+        replacements = []
+        for index, sql_literal in enumerate(self.slot_map):
+            if sql_literal is None or index not in values:
+                continue
+            value = values[index]
+            if not raw:
+                value = self._format_value(value, self.question_literals[index], sql_literal)
+            replacements.append((sql_literal['start'], sql_literal['end'], value))
+
+        sql = self.sql
+        for start, end, value in sorted(replacements, reverse=True):
+            sql = sql[:start] + value + sql[end:]
+        return sql
+
+    @staticmethod
+    def _format_value(value, question_literal, sql_literal):
+        """把问题中的新值格式化为SQL字面量"""
+        if question_literal['type'] == 'num':
+            return value
+        if question_literal['type'] == 'date':
+            # 保留原SQL中日期后面的时间部分，如 ' 00:00:00'
+            suffix = sql_literal['value'][len(question_literal['value']):]
+            value = value + suffix
+        quote = sql_literal['quote'] or "'"
+        # 先转义反斜杠（MySQL中反斜杠是转义符），否则结尾的反斜杠会转义掉闭合引号
+        return quote + value.replace("\\", "\\\\").replace(quote, quote * 2) + quote
+
+    def fill(self, new_literals):
+        """
+        使用新问题中的字面量生成SQL
+
+        Returns:
+            str: 生成的SQL；无法安全替换时返回None
+        """
+        if len(new_literals) != len(self.question_literals):
+            return None
+
+        values = {}
+        for index, (old, new) in enumerate(zip(self.question_literals, new_literals)):
+            if old['type'] != new['type']:
+                return None
+            if self.slot_map[index] is None:
+                # 该值在SQL中没有唯一对应位置，只有值不变时才能复用
+                if old['value'] != new['value']:
+                    return None
+                continue
+            if old['type'] == 'num' and ('.' in old['value']) != ('.' in new['value']):
+                # 整数和小数不能互换（如 LIMIT 不接受小数）
+                return None
+            if old['type'] == 'num' and old['value'].startswith('-') != new['value'].startswith('-'):
+                # 正负号不同时SQL中负号的位置无法确定（如 > -5 与 > 10）
+                return None
+            values[index] = new['value']
+
+        return self.render_positions(values)
+
+class TemplateCache:
+    """参数化SQL模板缓存"""
+
+    def __init__(self, max_templates=5000):
+        """
+        Args:
+            max_templates: 最大模板数量
+        """
+        self.max_templates = max_templates
+        self._templates = {}
+        # 同一问题骨架学到不同SQL结构时记录为冲突，不再使用
+        self._conflicts = set()
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.learned = 0
+
+    def lookup(self, question, scope):
+        """
+        根据问题骨架查找模板并填入新值
+
+        Args:
+            question: 用户的自然语言查询
+            scope: 作用域（数据库结构和对话上下文）
+
+        Returns:
+            str: 生成的SQL，未命中或存在歧义时返回None
+        """
+        self.lookups += 1
+        skeleton, literals = extract_question_literals(question)
+        if not literals:
+            # 没有字面量的问题由精确缓存处理
+            return None
+
+        with self._lock:
+            key = (scope, skeleton)
+            template = self._templates.get(key)
+            if template is None or key in self._conflicts:
+                return None
+            sql = template.fill(literals)
+            if sql is None:
+                self.fallbacks += 1
+                return None
+            template.hits += 1
+            self.hits += 1
+            return sql
+
+    def learn(self, question, sql, scope):
+        """从一次成功的生成中学习模板"""
+        skeleton, question_literals = extract_question_literals(question)
+        if not question_literals:
+            return
+
+        template = SQLTemplate(sql, question_literals, extract_sql_literals(sql))
+        if template.parameter_count == 0:
+            return
+
+        with self._lock:
+            key = (scope, skeleton)
+            existing = self._templates.get(key)
+            if existing is not None and existing.shape() != template.shape():
+                print(f"⚠️ [TemplateCache] 问题骨架对应了不同的SQL结构，停用该模板: {skeleton}")
+                self._conflicts.add(key)
+                return
+            if existing is None and len(self._templates) >= self.max_templates:
+                return
+            self._templates[key] = template
+            self.learned += 1
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                'templates': len(self._templates),
+                'conflicts': len(self._conflicts),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'fallbacks': self.fallbacks,
+                'learned': self.learned,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            }
+
+if __name__ == '__main__':
+    cache = TemplateCache()
+    cache.learn("查找年龄大于25岁的用户", "SELECT * FROM `users` WHERE `age` > 25", "demo")
+
+    print(cache.lookup("查找年龄大于30岁的用户", "demo"))
+    print(cache.lookup("查找年龄大于30.5岁的用户", "demo"))
+    print(cache.get_stats())
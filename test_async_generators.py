@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试异步生成接口：并发请求、超时、取消（关闭连接），以及同步接口作为包装继续可用
+使用本地模拟的 Ollama 接口，不需要真实模型
+"""
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import CancelledError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from async_runtime import run_sync
+from ollama_sql_generator import OllamaLLMGenerator
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """模拟 Ollama 的 /api/tags、/api/ps 和流式 /api/chat 接口"""
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+    chunk_delay = 0.0
+    disconnects = 0
+    warm_ups = 0
+    loaded = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            return self._send_json({'models': [{'name': 'qwen2:latest'}]})
+        if self.path == '/api/ps':
+            return self._send_json({'models': StubOllamaHandler.loaded})
+        self._send_json({})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        StubOllamaHandler.requests.append((self.path, payload))
+        time.sleep(self.delay)
+        if self.path == '/api/generate' and 'prompt' not in payload:
+            # 不带提示词的generate只加载模型
+            StubOllamaHandler.warm_ups += 1
+            expires_at = time.strftime('%Y-%m-%dT%H:%M:%S.123456789Z', time.gmtime(time.time() + 1800))
+            StubOllamaHandler.loaded = [{'name': 'qwen2:latest', 'size': 4_000_000_000,
+                                         'size_vram': 0, 'expires_at': expires_at}]
+            return self._send_json({'model': payload['model'], 'response': '', 'done': True,
+                                    'load_duration': 1_500_000_000})
+        if 'prompt' in payload:
+            # /api/generate 仅用于连接测试
+            if not payload.get('stream'):
+                return self._send_json({'response': "连接测试成功", 'done': True})
+            pieces = ["连接测试成功"]
+        else:
+            question = payload['messages'][-1]['content'].rsplit("当前问题: ", 1)[-1]
+            if not payload.get('stream'):
+                return self._send_json({
+                    'message': {'content': f"SELECT * FROM `sys_user` -- {question}"}, 'done': True,
+                    'prompt_eval_count': 10, 'prompt_eval_duration': 200_000_000,
+                    'eval_count': 5, 'eval_duration': 50_000_000
+                })
+            pieces = ["SELECT * ", "FROM `sys_user` ", f"-- {question}\n", "\n说明：", "查询所有用户"] + ["..."] * 50
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for piece in pieces:
+                chunk = {'response': piece} if 'prompt' in payload else {'message': {'content': piece}}
+                line = json.dumps(dict(chunk, done=False)).encode('utf-8') + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+                time.sleep(self.chunk_delay)
+            final = json.dumps({'done': True, 'prompt_eval_count': 10}).encode() + b"\n"
+            self.wfile.write(f"{len(final):x}\r\n".encode() + final + b"\r\n0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            StubOllamaHandler.disconnects += 1
+
+class StubServer(ThreadingHTTPServer):
+    # 默认的监听队列只有5个连接，并发请求较多时部分连接要等待重传（约1秒）
+    request_queue_size = 64
+
+def start_stub_server(delay=0.0, chunk_delay=0.0):
+    StubOllamaHandler.delay = delay
+    StubOllamaHandler.chunk_delay = chunk_delay
+    StubOllamaHandler.disconnects = 0
+    StubOllamaHandler.warm_ups = 0
+    StubOllamaHandler.loaded = []
+    StubOllamaHandler.requests = []
+    server = StubServer(('127.0.0.1', 0), StubOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def test_sync_wrappers():
+    """同步接口通过后台事件循环执行异步实现"""
+    print("=== 测试同步接口 ===\n")
+    server, url = start_stub_server()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url)
+        assert generator.health_check() == (True, "Ollama服务正常")
+        assert generator.get_available_models() == ['qwen2:latest']
+        assert generator.test_connection(max_retries=1)
+        assert generator.generate_sql("查询用户", "数据库结构信息") == (True, "SELECT * FROM `sys_user` -- 查询用户")
+        assert generator.get_timing_stats()['requests'] >= 1
+    finally:
+        server.shutdown()
+
+def test_concurrent_async_requests():
+    """同一事件循环中的并发请求不会互相阻塞"""
+    print("=== 测试并发异步请求 ===\n")
+    server, url = start_stub_server(delay=0.3)
+    try:
+        generator = OllamaLLMGenerator("qwen2", url)
+
+        async def run_all():
+            start = time.perf_counter()
+            results = await asyncio.gather(*[
+                generator.agenerate_sql(f"问题{i}", "数据库结构信息") for i in range(8)
+            ])
+            elapsed = time.perf_counter() - start
+            await generator.aclose()
+            return results, elapsed
+
+        results, elapsed = asyncio.run(run_all())
+        print(f"8个并发请求耗时 {elapsed:.2f} 秒")
+        assert all(success for success, _ in results)
+        assert results[3][1] == "SELECT * FROM `sys_user` -- 问题3"
+        assert elapsed < 8 * 0.3 / 2
+    finally:
+        server.shutdown()
+
+def test_timeout_and_cancellation():
+    """超时返回错误，取消时关闭连接"""
+    print("=== 测试超时和取消 ===\n")
+    server, url = start_stub_server(delay=1.0)
+    try:
+        generator = OllamaLLMGenerator("qwen2", url)
+        success, error = run_sync(generator.agenerate_sql("查询用户", "数据库结构信息", timeout=0.2))
+        assert not success and "超时" in error and "调用失败" in error
+    finally:
+        server.shutdown()
+
+    server, url = start_stub_server(chunk_delay=0.2)
+    try:
+        generator = OllamaLLMGenerator("qwen2", url, stream=True)
+        # SQL之后还有解释文字：不取消也会在SQL完整后提前断开；这里在第一个片段后立即取消
+        cancel_event = threading.Event()
+        threading.Timer(0.1, cancel_event.set).start()
+        start = time.perf_counter()
+        success, error = generator.generate_sql("查询用户", "数据库结构信息", cancel_event=cancel_event)
+        assert not success and "取消" in error
+        assert time.perf_counter() - start < 0.5
+
+        try:
+            run_sync(asyncio.sleep(5), timeout=0.1)
+            assert False, "应当超时"
+        except TimeoutError:
+            pass
+
+        try:
+            event = threading.Event()
+            event.set()
+            run_sync(asyncio.sleep(5), cancel_event=event)
+            assert False, "应当被取消"
+        except CancelledError:
+            pass
+
+        time.sleep(0.5)
+        assert StubOllamaHandler.disconnects >= 1
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    test_sync_wrappers()
+    test_concurrent_async_requests()
+    test_timeout_and_cancellation()
+    print("\n=== 测试完成 ===")
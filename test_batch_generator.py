@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量SQL生成：响应解析、自适应分批、只重试失败的问题
+"""
+
+import json
+from batch_generator import BatchSQLGenerator, parse_batch_response, create_batch_user_content
+
+class FakeBatchModel:
+    """按问题内容返回SQL的模拟模型，可模拟输出截断和漏答"""
+
+    def __init__(self, truncate_over=None, skip_once=(), fail_calls=0):
+        self.truncate_over = truncate_over
+        self.skip_once = set(skip_once)
+        self.fail_calls = fail_calls
+        self.batch_sizes = []
+
+    def complete(self, messages, max_tokens=2048, json_mode=False):
+        assert json_mode and messages[0]['role'] == 'system' and '数据库结构信息' in messages[0]['content']
+        items = json.loads(messages[1]['content'])
+        self.batch_sizes.append(len(items))
+        if self.fail_calls:
+            self.fail_calls -= 1
+            raise RuntimeError("连接被重置")
+
+        results = []
+        for item in items:
+            if item['question'] in self.skip_once:
+                self.skip_once.discard(item['question'])
+                continue
+            if '删除' in item['question']:
+                results.append({'id': item['id'], 'sql': "ERROR: 无法生成对应的SQL查询"})
+            else:
+                results.append({'id': item['id'], 'sql': f"SELECT * FROM `t` WHERE `q` = '{item['question']}';"})
+        text = json.dumps({'results': results}, ensure_ascii=False)
+        if self.truncate_over and len(items) > self.truncate_over:
+            # 模拟输出长度不足，后半部分被截断
+            text = text[:len(text) // 2]
+        return text
+
+def test_parse_batch_response():
+    """测试各种响应形式的解析"""
+    assert parse_batch_response('{"results": [{"id": 1, "sql": "SELECT 1"}, {"id": "2", "sql": "SELECT 2"}]}') == \
+        {1: "SELECT 1", 2: "SELECT 2"}
+    assert parse_batch_response('```json\n[{"id": 1, "sql": "SELECT 1"}]\n```') == {1: "SELECT 1"}
+    assert parse_batch_response('{"1": "SELECT 1", "2": "SELECT 2"}') == {1: "SELECT 1", 2: "SELECT 2"}
+    # 被截断的JSON只保留已完整的项
+    truncated = '{"results": [{"id": 1, "sql": "SELECT \\"a\\""}, {"id": 2, "sql": "SELE'
+    assert parse_batch_response(truncated) == {1: 'SELECT "a"'}
+    assert parse_batch_response("无法回答") == {}
+    assert json.loads(create_batch_user_content([(1, "查询用户")])) == [{'id': 1, 'question': "查询用户"}]
+
+def test_batch_generation_and_token_saving():
+    """问题按批打包，结果按原顺序返回，估算prompt token大幅减少"""
+    print("=== 测试批量生成 ===\n")
+    model = FakeBatchModel()
+    questions = [f"问题{i}" for i in range(45)] + ["删除所有用户"]
+    batch = BatchSQLGenerator(model, context_tokens=32768, max_batch=20)
+    results = batch.generate_batch(questions, "数据库结构信息：" + "表t(q) " * 300)
+
+    assert len(results) == len(questions)
+    assert results[3] == (True, "SELECT * FROM `t` WHERE `q` = '问题3'")
+    assert results[-1] == (False, "ERROR: 无法生成对应的SQL查询")
+    assert model.batch_sizes == [20, 20, 6]
+
+    stats = batch.get_stats()
+    print(f"统计: {stats}")
+    assert stats['calls'] == 3 and stats['retried'] == 0
+    assert stats['prompt_token_saving'] > 0.8
+
+def test_context_window_limits_batch_size():
+    """上下文窗口较小时每批的问题数随之减少"""
+    batch = BatchSQLGenerator(FakeBatchModel(), context_tokens=2000, max_batch=50, answer_tokens=100)
+    items = list(enumerate([f"问题{i}" for i in range(30)]))
+    sizes = [len(b) for b in batch.plan_batches(items, system_tokens=1000)]
+    assert sum(sizes) == 30 and max(sizes) < 10
+
+def test_retry_only_failed_items():
+    """漏答的问题在下一轮单独重试，截断时自动减小批大小"""
+    model = FakeBatchModel(skip_once={"问题2"})
+    batch = BatchSQLGenerator(model, max_batch=10)
+    results = batch.generate_batch([f"问题{i}" for i in range(5)], "数据库结构信息")
+    assert all(success for success, _ in results)
+    assert model.batch_sizes == [5, 1] and batch.get_stats()['retried'] == 1
+
+    model = FakeBatchModel(truncate_over=4)
+    batch = BatchSQLGenerator(model, max_batch=8)
+    results = batch.generate_batch([f"问题{i}" for i in range(8)], "数据库结构信息")
+    assert all(success for success, _ in results)
+    assert model.batch_sizes[0] == 8 and max(model.batch_sizes[1:]) <= 4
+
+def test_failed_calls_shrink_batches():
+    """整批失败时批大小减半，超过最大轮数后返回错误"""
+    model = FakeBatchModel(fail_calls=1)
+    batch = BatchSQLGenerator(model, max_batch=8)
+    results = batch.generate_batch([f"问题{i}" for i in range(8)], "数据库结构信息")
+    assert all(success for success, _ in results)
+    assert model.batch_sizes == [8, 4, 4]
+
+    model = FakeBatchModel(fail_calls=100)
+    batch = BatchSQLGenerator(model, max_batch=4, max_rounds=2)
+    results = batch.generate_batch(["问题"], "数据库结构信息")
+    assert results == [(False, "ERROR: 批量结果中缺少该问题")]
+    assert batch.get_stats()['failed_calls'] == 2
+
+if __name__ == '__main__':
+    test_parse_batch_response()
+    test_batch_generation_and_token_saving()
+    test_context_window_limits_batch_size()
+    test_retry_only_failed_items()
+    test_failed_calls_shrink_batches()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试服务端上下文缓存的生命周期（创建、续期、失效），使用本地模拟的 cachedContents 接口
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from context_cache import (ContextCacheManager, GeminiCacheClient, mark_cache_control, should_cache_full_schema,
+                           to_gemini_contents)
+from token_counter import estimate_tokens
+
+class StubCacheHandler(BaseHTTPRequestHandler):
+    """模拟 Gemini cachedContents 接口"""
+    calls = []
+    caches = {}
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body or {}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_POST(self):
+        body = self._body()
+        self.calls.append(('create', body['model'], body['ttl']))
+        if 'FAIL' in body['systemInstruction']['parts'][0]['text']:
+            return self._reply(400, {'error': 'content too short'})
+        name = f"cachedContents/c{len(self.caches) + 1}"
+        self.caches[name] = body
+        self._reply(200, {'name': name})
+
+    def do_PATCH(self):
+        name = self.path.split('?')[0][len('/v1beta/'):]
+        self.calls.append(('refresh', name, self._body()['ttl']))
+        self._reply(200 if name in self.caches else 404, {'name': name})
+
+    def do_DELETE(self):
+        name = self.path[len('/v1beta/'):]
+        self.calls.append(('delete', name))
+        self.caches.pop(name, None)
+        self._reply(200)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub_server():
+    StubCacheHandler.calls = []
+    StubCacheHandler.caches = {}
+    server = HTTPServer(('127.0.0.1', 0), StubCacheHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def test_gemini_cache_lifecycle():
+    """测试创建、复用、续期和结构变化后失效"""
+    print("=== 测试服务端缓存生命周期 ===\n")
+    server, base_url = start_stub_server()
+    try:
+        client = GeminiCacheClient("test-key", "gemini-1.5-flash-001", base_url=base_url)
+        manager = ContextCacheManager(client.create, client.refresh, client.delete, ttl=3600, name="Gemini")
+
+        name = manager.get("数据库结构信息：表A")
+        assert name == "cachedContents/c1"
+        assert StubCacheHandler.calls == [('create', 'models/gemini-1.5-flash-001', '3600s')]
+
+        # 相同结构直接复用，不再请求服务端
+        assert manager.get("数据库结构信息：表A") == name
+        assert len(StubCacheHandler.calls) == 1
+
+        # 剩余有效期不足时续期
+        manager.refresh_margin = 7200
+        assert manager.get("数据库结构信息：表A") == name
+        assert StubCacheHandler.calls[-1] == ('refresh', name, '3600s')
+
+        # 结构变化时使用新的缓存，失效时删除服务端缓存
+        other = manager.get("数据库结构信息：表B")
+        assert other == "cachedContents/c2"
+        manager.invalidate()
+        assert ('delete', name) in StubCacheHandler.calls and ('delete', other) in StubCacheHandler.calls
+        assert StubCacheHandler.caches == {}
+
+        stats = manager.get_stats()
+        print(f"统计: {stats}")
+        assert stats['creates'] == 2 and stats['refreshes'] == 1 and stats['invalidations'] == 2
+    finally:
+        server.shutdown()
+
+def test_failures_and_eviction():
+    """测试创建失败后退避、内容过短不缓存、超出数量时淘汰"""
+    server, base_url = start_stub_server()
+    try:
+        client = GeminiCacheClient("test-key", "gemini-1.5-flash-001", base_url=base_url)
+        manager = ContextCacheManager(client.create, client.refresh, client.delete, max_entries=1, retry_after=600)
+
+        assert manager.get("FAIL") is None
+        assert manager.get("FAIL") is None
+        assert [c[0] for c in StubCacheHandler.calls] == ['create']  # 退避期内不再重试
+
+        manager.get("结构1")
+        manager.get("结构2")
+        assert StubCacheHandler.calls[-1][0] == 'delete'  # 淘汰最久未使用的缓存
+        assert manager.get_stats()['entries'] == 1
+
+        short = ContextCacheManager(client.create, min_tokens=1000)
+        assert short.get("很短的结构") is None and short.get_stats()['skipped_short'] == 1
+    finally:
+        server.shutdown()
+
+def test_concurrent_create():
+    """测试创建请求在锁外进行，同一内容并发请求时只创建一次"""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_create(content, ttl):
+        calls.append(content)
+        # 创建期间锁未被占用，其他内容的缓存仍可正常使用
+        assert not manager._lock.locked()
+        started.set()
+        release.wait(5)
+        return f"cachedContents/{content}"
+
+    manager = ContextCacheManager(slow_create, max_entries=1, name="Test")
+    results = []
+    worker = threading.Thread(target=lambda: results.append(manager.get("结构A")))
+    worker.start()
+    assert started.wait(5)
+
+    # 正在创建时其他请求不重复创建，直接使用完整内容
+    assert manager.get("结构A") is None
+    assert manager.get_stats()['creating'] == 1
+    release.set()
+    worker.join(5)
+    assert results == ["cachedContents/结构A"] and calls == ["结构A"]
+    assert manager.get("结构A") == "cachedContents/结构A"
+
+    # 淘汰时的删除请求同样在锁外进行
+    deleted = []
+    manager.delete_fn = lambda handle: deleted.append((handle, manager._lock.locked()))
+    manager.get("结构B")
+    assert deleted == [("cachedContents/结构A", False)]
+
+def test_full_schema_budget():
+    """完整结构在缓存最小长度和上限之间才直接使用，大型结构启用缓存时仍按问题检索"""
+    manager = ContextCacheManager(lambda content, ttl: "cachedContents/1", min_tokens=1024, name="Test")
+    table = "表名: sys_user_{}\n字段: user_id (bigint), user_name (varchar), dept_id (bigint), status (char)\n\n"
+    medium = "".join(table.format(i) for i in range(60))
+    large = "".join(table.format(i) for i in range(2000))
+    medium_tokens, large_tokens = estimate_tokens(medium), estimate_tokens(large)
+    print(f"中等结构 {medium_tokens} tokens，大型结构 {large_tokens} tokens")
+    assert 1024 <= medium_tokens <= 8000 < large_tokens
+
+    assert should_cache_full_schema(manager, medium_tokens, 8000)
+    assert not should_cache_full_schema(manager, large_tokens, 8000)
+    # 低于缓存最小长度、未启用缓存、上限为0时都不使用完整结构
+    assert not should_cache_full_schema(manager, 500, 8000)
+    assert not should_cache_full_schema(None, medium_tokens, 8000)
+    assert not should_cache_full_schema(manager, medium_tokens, 0)
+    # 结构token预算比上限更小时以预算为准
+    assert not should_cache_full_schema(manager, medium_tokens, min(8000, medium_tokens - 1))
+
+def test_message_helpers():
+    """测试通义千问缓存标记和Gemini消息格式转换"""
+    messages = [
+        {"role": "system", "content": "结构"},
+        {"role": "user", "content": "查询用户"},
+        {"role": "user", "content": "只要前5条"},
+        {"role": "assistant", "content": "SELECT 1"},
+    ]
+    marked = mark_cache_control(messages)
+    assert marked[0]['content'][0]['cache_control'] == {'type': 'ephemeral'}
+    assert marked[1] == messages[1] and messages[0]['content'] == "结构"
+
+    contents = to_gemini_contents(messages)
+    assert contents == [
+        {'role': 'user', 'parts': ["查询用户", "只要前5条"]},
+        {'role': 'model', 'parts': ["SELECT 1"]},
+    ]
+
+if __name__ == '__main__':
+    test_gemini_cache_lifecycle()
+    test_failures_and_eviction()
+    test_concurrent_create()
+    test_full_schema_budget()
+    test_message_helpers()
+    print("\n=== 测试完成 ===")
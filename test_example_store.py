@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试少样本示例库：从对话导出文件加载、相似示例检索、token预算，以及注入到提示词
+"""
+
+import time
+from conversation_manager import ConversationManager
+from example_store import ExampleStore, is_standalone_question, load_conversation_export, format_examples
+
+EXAMPLES = [
+    ("查询每个部门的用户数量", "SELECT d.dept_name, COUNT(*) AS total FROM sys_user u "
+                        "JOIN sys_dept d ON u.dept_id = d.dept_id GROUP BY d.dept_name"),
+    ("查询最近7天登录过的用户", "SELECT * FROM sys_user WHERE login_date >= DATE_SUB(NOW(), INTERVAL 7 DAY)"),
+    ("统计每个角色的用户数量", "SELECT r.role_name, COUNT(*) FROM sys_user_role ur "
+                        "JOIN sys_role r ON ur.role_id = r.role_id GROUP BY r.role_name"),
+    ("查询状态为停用的菜单", "SELECT * FROM sys_menu WHERE status = '1'"),
+]
+
+def test_load_export():
+    """对话导出文件中只有能单独理解的问题作为示例"""
+    print("=== 测试加载对话导出文件 ===\n")
+    pairs = load_conversation_export('context_test_export.json')
+    print(pairs)
+    assert pairs == [("查询所有用户的用户名和真实姓名", "SELECT `loginname`, `name` FROM `sys_user`")]
+    assert not is_standalone_question("只要前5条")
+    assert not is_standalone_question("按创建时间倒序排列")
+    assert is_standalone_question("查询所有用户的邮箱")
+
+    store = ExampleStore()
+    assert store.load_export('context_test_export.json') == 1
+    # 与当前数据库结构不符的示例不加入
+    assert store.load_export('context_test_export.json', validator=lambda sql: 'loginname' not in sql) == 0
+    assert store.load_export('not_exists_export.json') == 0
+
+def test_search_and_budget():
+    """按相似度检索，跳过完全相同的问题，并按token预算截取"""
+    print("\n=== 测试示例检索 ===\n")
+    store = ExampleStore()
+    assert store.add_many(EXAMPLES) == len(EXAMPLES)
+
+    results = store.search("查询每个部门的用户人数")
+    print(results)
+    assert results[0]['question'] == "查询每个部门的用户数量"
+    assert len(results) <= 3 and all(r['similarity'] >= store.min_similarity for r in results)
+    assert store.search("查询最近30天登录的用户")[0]['question'] == "查询最近7天登录过的用户"
+    assert all(r['question'] != "查询状态为停用的菜单" for r in store.search("查询状态为停用的菜单"))
+    assert store.search("订单金额超过一万的客户") == []
+
+    assert len(store.select("查询每个部门的用户人数", top_k=3, token_budget=80)) == 1
+    assert store.select("查询每个部门的用户人数", top_k=3, token_budget=10) == []
+
+def test_index_latency_and_eviction():
+    """大量示例下检索仍然很快，超出上限时淘汰最早的示例"""
+    store = ExampleStore(max_examples=2000)
+    for i in range(2500):
+        store.add(f"查询编号为{i}的部门{i % 37}的用户{i % 11}信息", f"SELECT {i}")
+    assert store.get_stats()['size'] == 2000
+
+    start = time.perf_counter()
+    for _ in range(100):
+        store.search("查询部门5的用户3信息")
+    average_ms = (time.perf_counter() - start) * 1000 / 100
+    print(f"2000个示例平均检索耗时 {average_ms:.3f}ms")
+    assert average_ms < 5
+
+def test_prompt_injection():
+    """示例放在当前问题之前，系统消息不变，不传示例时不附带"""
+    print("\n=== 测试示例注入 ===\n")
+    store = ExampleStore()
+    store.add_many(EXAMPLES)
+    manager = ConversationManager()
+    manager.add_user_query("查询每个部门的用户人数")
+
+    plain = manager.get_messages_for_openai_format("表结构", "查询每个部门的用户人数")
+    examples = format_examples(store.select("查询每个部门的用户人数"))
+    messages = manager.get_messages_for_openai_format("表结构", "查询每个部门的用户人数", examples)
+    prompt = manager.get_context_for_prompt("表结构", "查询每个部门的用户人数", examples)
+    print(messages[-1]['content'])
+    assert messages[0] == plain[0] and len(messages) == len(plain) == 2
+    assert "问题: 查询每个部门的用户数量" in messages[-1]['content']
+    assert messages[-1]['content'].endswith("当前问题: 查询每个部门的用户人数")
+    assert prompt.index("SQL: SELECT d.dept_name") < prompt.index("当前用户查询")
+    assert manager.get_messages_for_openai_format("表结构", "查询每个部门的用户人数") == plain
+
+if __name__ == '__main__':
+    test_load_export()
+    test_search_and_budget()
+    test_index_latency_and_eviction()
+    test_prompt_injection()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试后端降级链和熔断器
+"""
+
+import time
+from fallback_chain import CircuitBreaker, FallbackChain, parse_chain
+
+class FakeGenerator:
+    """按预设结果依次返回的生成器"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def generate_sql(self, user_query, schema_description, conversation_manager=None):
+        self.calls += 1
+        result = self.results[min(self.calls, len(self.results)) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+DOWN = (False, "ERROR: 本地模型调用失败")
+TIMEOUT = (False, "ERROR: Gemini API请求超时，请稍后重试")
+OK = (True, "SELECT * FROM sys_user")
+
+def test_parse_chain():
+    """测试降级链配置解析"""
+    assert parse_chain("") == []
+    assert parse_chain("qwen_api:qwen-turbo, gemini") == [('qwen_api', 'qwen-turbo'), ('gemini', 'gemini-1.5-flash')]
+    try:
+        parse_chain("openai:gpt-4o")
+        assert False, "应拒绝不支持的后端"
+    except ValueError:
+        pass
+
+def test_circuit_breaker_states():
+    """测试熔断、半开试探和恢复"""
+    breaker = CircuitBreaker("ollama", failure_threshold=2, recovery_timeout=0.1)
+    assert breaker.allow_request()
+    breaker.record_failure("超时")
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure("超时")
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow_request()
+
+    time.sleep(0.15)
+    assert breaker.allow_request()          # 只放行一个试探请求
+    assert not breaker.allow_request()
+    breaker.record_failure("仍然超时")       # 试探失败，重新熔断
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 2
+
+    time.sleep(0.15)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+
+def test_fallback_within_request():
+    """主后端不可用时在同一次请求内切换，熔断后不再调用主后端"""
+    print("=== 测试后端降级链 ===\n")
+    primary, secondary, third = FakeGenerator(DOWN), FakeGenerator(TIMEOUT), FakeGenerator(OK)
+    reports = []
+    chain = FallbackChain(
+        [('ollama:qwen2', primary), ('gemini:gemini-1.5-flash', secondary), ('qwen_api:qwen-plus', third)],
+        failure_threshold=2, recovery_timeout=60,
+        report_fn=lambda name, success, result: reports.append((name, success))
+    )
+
+    assert chain.generate_sql_with_backend("查询用户", "结构") == (True, OK[1], 'qwen_api:qwen-plus')
+    assert reports == [('ollama:qwen2', False), ('gemini:gemini-1.5-flash', False), ('qwen_api:qwen-plus', True)]
+
+    assert chain.generate_sql("查询用户", "结构") == OK
+    assert chain.generate_sql("查询用户", "结构") == OK
+    # 前两个后端连续失败2次后熔断，第三次请求直接使用第三个后端
+    assert primary.calls == 2 and secondary.calls == 2 and third.calls == 3
+
+    stats = chain.get_stats()
+    print(f"统计: {stats}")
+    assert stats['fallbacks'] == 3 and stats['served']['qwen_api:qwen-plus'] == 3
+    assert stats['breakers']['ollama:qwen2']['state'] == 'open'
+    assert chain.available_backends() == ['qwen_api:qwen-plus']
+
+def test_model_errors_do_not_fall_back():
+    """模型正常返回但不是SELECT时不切换后端，也不计入熔断"""
+    primary = FakeGenerator((False, "ERROR: 生成的不是SELECT查询语句"))
+    secondary = FakeGenerator(OK)
+    chain = FallbackChain([('a', primary), ('b', secondary)], failure_threshold=1)
+    assert chain.generate_sql_with_backend("删除用户", "结构") == (False, "ERROR: 生成的不是SELECT查询语句", 'a')
+    assert secondary.calls == 0 and chain.breakers['a'].state == CircuitBreaker.CLOSED
+
+def test_all_backends_down():
+    """所有后端都不可用时返回汇总错误；生成器抛出的异常按调用失败处理"""
+    chain = FallbackChain([('a', FakeGenerator(DOWN)), ('b', FakeGenerator(RuntimeError("连接被拒绝")))])
+    success, error, backend = chain.generate_sql_with_backend("查询", "结构")
+    assert not success and backend is None
+    assert "所有大模型后端均调用失败" in error and "连接被拒绝" in error
+    assert chain.get_stats()['exhausted'] == 1
+
+def test_examples_forwarded():
+    """示例文本作为参数传给各后端，没有示例时不传（兼容不接受该参数的生成器）"""
+    received = []
+
+    class ExampleGenerator(FakeGenerator):
+        def generate_sql(self, user_query, schema_description, conversation_manager=None, examples=None):
+            received.append(examples)
+            return super().generate_sql(user_query, schema_description, conversation_manager)
+
+    chain = FallbackChain([('ollama:qwen2', ExampleGenerator(DOWN)), ('qwen_api:qwen-plus', ExampleGenerator(OK))])
+    assert chain.generate_sql("查询", "结构", examples="问题: 查询用户\nSQL: SELECT 1") == OK
+    assert received == ["问题: 查询用户\nSQL: SELECT 1"] * 2
+
+    plain = FallbackChain([('ollama:qwen2', FakeGenerator(OK))])
+    assert plain.generate_sql("查询", "结构", examples="") == OK
+
+if __name__ == '__main__':
+    test_parse_chain()
+    test_circuit_breaker_states()
+    test_fallback_within_request()
+    test_model_errors_do_not_fall_back()
+    test_all_backends_down()
+    test_examples_forwarded()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试追问的本地改写：条数限制、排序、增减字段、简单筛选，无法完整处理时交给大模型
+"""
+
+from followup_rewriter import FollowUpRewriter, SelectQuery
+from schema_formatter import _demo_snapshot
+
+PREVIOUS = "SELECT `user_name`, `nick_name` FROM `sys_user` WHERE `del_flag` = '0'"
+JOINED = "SELECT u.user_name, d.dept_name FROM sys_user u LEFT JOIN sys_dept d ON u.dept_id = d.dept_id"
+GROUPED = "SELECT dept_id, COUNT(*) AS total FROM sys_user GROUP BY dept_id"
+
+def test_parse_clauses():
+    """按顶层子句拆分，重新拼接后语义不变"""
+    query = SelectQuery.parse("SELECT DISTINCT a, IFNULL(b, 'x, y') AS c FROM t WHERE a = 1 OR b = 2 "
+                              "ORDER BY a DESC LIMIT 10;")
+    assert query.distinct and query.columns == ["a", "IFNULL(b, 'x, y') AS c"]
+    assert query.where == "a = 1 OR b = 2" and query.order_by == "a DESC" and query.limit == "10"
+    query.add_condition("`c` = 3")
+    assert query.to_sql() == ("SELECT DISTINCT a, IFNULL(b, 'x, y') AS c FROM t WHERE (a = 1 OR b = 2) AND `c` = 3 "
+                              "ORDER BY a DESC LIMIT 10")
+    assert SelectQuery.parse("SELECT a FROM t UNION SELECT b FROM u") is None
+    assert SelectQuery.parse("SELECT 1; SELECT 2") is None
+
+def test_rewrite_refinements():
+    """常见追问直接改写上一条SQL"""
+    print("=== 测试追问改写 ===\n")
+    rewriter = FollowUpRewriter(_demo_snapshot())
+    cases = [
+        ("只要前5条", PREVIOUS, PREVIOUS + " LIMIT 5"),
+        ("按最后登录时间降序排列", PREVIOUS, PREVIOUS + " ORDER BY `login_date` DESC"),
+        ("再加上邮箱字段", PREVIOUS, "SELECT `user_name`, `nick_name`, `email` FROM `sys_user` WHERE `del_flag` = '0'"),
+        ("去掉用户昵称", PREVIOUS, "SELECT `user_name` FROM `sys_user` WHERE `del_flag` = '0'"),
+        ("只看帐号状态为正常的", PREVIOUS, PREVIOUS + " AND `status` = '0'"),
+        ("只看状态为正常的", PREVIOUS, PREVIOUS + " AND `status` = '0'"),    # 注释“帐号状态”去掉前缀
+        ("用户ID大于100的", PREVIOUS, PREVIOUS + " AND `user_id` > 100"),
+        ("按邮箱排序，只要前3条", PREVIOUS, PREVIOUS + " ORDER BY `email` ASC LIMIT 3"),
+        ("再加上邮箱", JOINED, "SELECT u.user_name, d.dept_name, u.`email` FROM sys_user u "
+                           "LEFT JOIN sys_dept d ON u.dept_id = d.dept_id"),
+        ("部门名称是研发部", JOINED, JOINED + " WHERE d.`dept_name` = '研发部'"),
+        ("按total降序", GROUPED, GROUPED + " ORDER BY total DESC"),
+    ]
+    for question, previous, expected in cases:
+        sql = rewriter.rewrite(question, previous)
+        print(f"{question} -> {sql}")
+        assert sql == expected, (question, sql)
+
+    stats = rewriter.get_stats()
+    assert stats['hits'] == len(cases) and stats['intents']['limit'] == 2 and stats['intents']['filter'] == 4
+
+def test_defer_to_llm():
+    """无法识别或无法唯一确定字段的追问交给大模型"""
+    print("\n=== 测试交给大模型 ===\n")
+    rewriter = FollowUpRewriter(_demo_snapshot())
+    cases = [
+        ("按部门统计一下人数", PREVIOUS),
+        ("查询所有用户", PREVIOUS),
+        ("再加上邮箱", GROUPED),                  # 聚合查询不能直接加字段
+        ("帐号状态为未知", PREVIOUS),             # 不在注释的取值说明中
+        ("状态为正常", JOINED),                  # 用户和部门都有状态字段
+        ("用户ID大于一百", PREVIOUS),             # 数值字段的值不是数字
+        ("只要前5条，按部门统计人数", PREVIOUS),   # 有一部分无法识别
+        ("只要前5条", None),
+        ("只要前5条", "SELECT a FROM t UNION SELECT b FROM u"),
+    ]
+    for question, previous in cases:
+        assert rewriter.rewrite(question, previous) is None, question
+    assert rewriter.get_stats()['deferred'] == len(cases)
+
+if __name__ == '__main__':
+    test_parse_clauses()
+    test_rewrite_refinements()
+    test_defer_to_llm()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试SQL生成缓存（归一化、LRU淘汰、持久化），不依赖外部服务
+"""
+
+import os
+import sqlite3
+import tempfile
+from generation_cache import GenerationCache, normalize_question, schema_fingerprint
+
+def test_normalize_question():
+    """测试问题文本归一化"""
+    print("=== 测试问题归一化 ===\n")
+
+    assert normalize_question("查询所有用户的姓名和邮箱") == normalize_question(" 查询所有用户的姓名和邮箱？")
+    assert normalize_question("查询ＩＤ为１的用户") == normalize_question("查询id为1的用户")
+    assert normalize_question("年龄 > 25") != normalize_question("年龄 < 25")
+    # 数值中的小数点、负号和日期分隔符不能去掉
+    assert normalize_question("价格大于1.5") != normalize_question("价格大于15")
+    assert normalize_question("余额大于-100") != normalize_question("余额大于100")
+    assert normalize_question("2024-01-05之后注册的用户") != normalize_question("20240105之后注册的用户")
+    assert normalize_question("价格大于1.5。") == normalize_question("价格大于1.5")
+    assert normalize_question("用户-部门关系") == normalize_question("用户部门关系")
+    print("✓ 归一化测试通过")
+
+def test_cache_key_scope():
+    """测试缓存键包含结构指纹、选定表、后端和模型"""
+    fp = schema_fingerprint("表名: users")
+    base = GenerationCache.make_key("查询所有用户", fp, ['users'], 'ollama', 'qwen2')
+
+    assert base == GenerationCache.make_key("查询所有用户。", fp, ['users'], 'ollama', 'qwen2')
+    assert GenerationCache.make_key("价格大于1.5的商品", fp) != GenerationCache.make_key("价格大于15的商品", fp)
+    assert base != GenerationCache.make_key("查询所有用户", schema_fingerprint("表名: orders"), ['users'], 'ollama', 'qwen2')
+    assert base != GenerationCache.make_key("查询所有用户", fp, None, 'ollama', 'qwen2')
+    assert base != GenerationCache.make_key("查询所有用户", fp, ['users'], 'gemini', 'qwen2')
+    assert base != GenerationCache.make_key("查询所有用户", fp, ['users'], 'ollama', 'llama3')
+    assert base != GenerationCache.make_key("查询所有用户", fp, ['users'], 'ollama', 'qwen2', context="SELECT 1")
+
+def test_lru_eviction():
+    """测试LRU淘汰"""
+    cache = GenerationCache(max_entries=2)
+    cache.put('a', 'qa', 'SELECT 1')
+    cache.put('b', 'qb', 'SELECT 2')
+    assert cache.get('a') == 'SELECT 1'  # a 变为最近使用
+    cache.put('c', 'qc', 'SELECT 3')     # 淘汰 b
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'SELECT 1'
+    assert cache.get('c') == 'SELECT 3'
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 3 and stats['misses'] == 1 and stats['evictions'] == 1
+
+def test_persistence():
+    """测试缓存重启后仍然有效"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'cache.db')
+
+        cache = GenerationCache(max_entries=10, db_path=db_path)
+        cache.put('key', '查询所有用户', 'SELECT * FROM `users`')
+        cache.close()
+
+        reopened = GenerationCache(max_entries=10, db_path=db_path)
+        assert reopened.get('key') == 'SELECT * FROM `users`'
+        reopened.close()
+
+        # 命中时更新使用时间，重启后按最近使用顺序保留条目
+        cache = GenerationCache(max_entries=10, db_path=db_path)
+        cache.put('old', '查询所有部门', 'SELECT * FROM `dept`')
+        cache.put('new', '查询所有角色', 'SELECT * FROM `role`')
+        assert cache.get('key') == 'SELECT * FROM `users`'
+        # 命中不写入持久化存储，下次写入缓存或关闭时批量更新使用时间
+        def last_used(key):
+            conn = sqlite3.connect(db_path)
+            try:
+                return conn.execute("SELECT last_used FROM generation_cache WHERE cache_key = ?", (key,)).fetchone()[0]
+            finally:
+                conn.close()
+
+        assert last_used('key') < last_used('new')
+        cache.close()
+        assert last_used('key') > last_used('new')
+
+        reopened = GenerationCache(max_entries=2, db_path=db_path)
+        assert reopened.get('old') is None
+        assert reopened.get('key') == 'SELECT * FROM `users`' and reopened.get('new') == 'SELECT * FROM `role`'
+        reopened.close()
+    print("✓ 持久化测试通过")
+
+if __name__ == '__main__':
+    test_normalize_question()
+    test_cache_key_scope()
+    test_lru_eviction()
+    test_persistence()
+    print("\n=== 测试完成 ===")
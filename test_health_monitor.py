@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试大模型后端健康监控：探测结果缓存、请求路径的按需探测、调用失败后唤醒后台线程，
+以及 /api/status 只读取缓存状态
+"""
+
+import threading
+import time
+from health_monitor import BackendHealthMonitor, is_backend_failure
+
+class FakeGenerator:
+    """记录健康检查次数的生成器"""
+
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.checks = 0
+        self.checked = threading.Event()
+
+    def health_check(self):
+        self.checks += 1
+        self.checked.set()
+        return self.healthy, "服务正常" if self.healthy else "连接失败"
+
+def wait_until(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_probe_caching():
+    """探测结果被缓存，读取状态不会发起检查"""
+    print("=== 测试探测结果缓存 ===\n")
+    monitor = BackendHealthMonitor()
+    generator = FakeGenerator()
+    monitor.register('ollama', generator)
+
+    assert monitor.is_healthy('ollama') is None
+    assert monitor.is_healthy('gemini') is None          # 未注册的后端同样视为未检查
+    assert monitor.get_status()['ollama']['message'] == '尚未检查'
+
+    assert monitor.probe('ollama')
+    for _ in range(5):
+        assert monitor.is_healthy('ollama')
+        status = monitor.get_status()
+    print(status)
+    assert generator.checks == 1
+    assert status['ollama']['healthy'] and status['ollama']['last_check'] and status['ollama']['latency_ms'] is not None
+
+    # 返回的是副本，修改不影响缓存
+    status['ollama']['healthy'] = False
+    assert monitor.is_healthy('ollama')
+    assert not monitor.probe('gemini')
+
+def test_ensure_healthy():
+    """缓存状态健康时不探测，异常或未检查时重新探测一次"""
+    monitor = BackendHealthMonitor()
+    generator = FakeGenerator()
+    monitor.register('qwen_api', generator)
+
+    assert monitor.ensure_healthy('qwen_api') and generator.checks == 1
+    assert monitor.ensure_healthy('qwen_api') and generator.checks == 1
+
+    monitor.report_failure('qwen_api', "ERROR: 大模型调用失败 - 连接被拒绝")
+    assert monitor.is_healthy('qwen_api') is False
+    assert monitor.get_status()['qwen_api']['consecutive_failures'] == 1
+
+    generator.healthy = False
+    assert not monitor.ensure_healthy('qwen_api') and generator.checks == 2
+    assert monitor.get_status()['qwen_api']['consecutive_failures'] == 2
+
+    generator.healthy = True
+    assert monitor.ensure_healthy('qwen_api') and generator.checks == 3
+    assert monitor.get_status()['qwen_api']['consecutive_failures'] == 0
+
+    monitor.report_failure('qwen_api')
+    monitor.report_success('qwen_api')
+    assert monitor.is_healthy('qwen_api') and generator.checks == 3
+
+def test_report_failure_wakes_thread():
+    """后台线程启动时跳过刚探测过的后端，调用失败后立即重新探测"""
+    print("\n=== 测试后台探测线程 ===\n")
+    monitor = BackendHealthMonitor(interval=60, failure_interval=60)
+    generator = FakeGenerator()
+    monitor.register('ollama', generator)
+
+    # 初始化时已经探测过，后台线程第一轮不再重复探测
+    monitor.probe('ollama')
+    generator.checked.clear()
+    monitor.start()
+    try:
+        assert not generator.checked.wait(0.3)
+        assert generator.checks == 1
+
+        monitor.report_failure('ollama', "ERROR: 本地模型调用失败")
+        assert generator.checked.wait(2)
+        assert wait_until(lambda: monitor.is_healthy('ollama'))
+        assert generator.checks == 2
+    finally:
+        monitor.stop()
+
+def test_start_probes_unchecked_backends():
+    """没有探测过的后端在后台线程启动后立即探测"""
+    monitor = BackendHealthMonitor(interval=60)
+    generator = FakeGenerator(healthy=False)
+    monitor.register('gemini', generator)
+    monitor.start()
+    try:
+        assert generator.checked.wait(2)
+        assert wait_until(lambda: monitor.is_healthy('gemini') is False)
+    finally:
+        monitor.stop()
+
+def test_status_read_path():
+    """/api/status 的读取方式：只读取缓存状态，任一后端健康即视为已连接"""
+    monitor = BackendHealthMonitor()
+    primary, fallback = FakeGenerator(healthy=False), FakeGenerator()
+    monitor.register('ollama', primary)
+    monitor.register('qwen_api', fallback)
+    backends = ['ollama', 'qwen_api']
+
+    assert not any(monitor.is_healthy(backend) for backend in backends)
+    monitor.probe_all()
+    ai_status = monitor.get_status()
+    ai_connected = any(monitor.is_healthy(backend) for backend in backends)
+    assert ai_connected and ai_status['ollama']['healthy'] is False
+    assert primary.checks == fallback.checks == 1
+
+def test_backend_failure_markers():
+    """只有后端不可用类的错误才计入健康状态"""
+    assert is_backend_failure("ERROR: 本地模型调用失败 - 超时（>60秒）")
+    assert is_backend_failure("ERROR: Gemini API请求超时，请稍后重试")
+    assert not is_backend_failure("ERROR: 无法生成对应的SQL查询")
+    assert not is_backend_failure(None)
+
+if __name__ == '__main__':
+    test_probe_caching()
+    test_ensure_healthy()
+    test_report_failure_wakes_thread()
+    test_start_probes_unchecked_backends()
+    test_status_read_path()
+    test_backend_failure_markers()
+    print("\n=== 测试完成 ===")
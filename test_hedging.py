@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试对冲请求：P90等待时间、先返回有效SELECT的一方胜出、落败方被取消、成本统计
+"""
+
+import threading
+import time
+from hedging import HedgedGenerator, LatencyTracker
+
+class FakeGenerator:
+    """按固定耗时返回结果的生成器"""
+
+    def __init__(self, delay, result=(True, "SELECT * FROM sys_user")):
+        self.delay = delay
+        self.result = result
+        self.calls = 0
+        self.cancelled = threading.Event()
+
+    def generate_sql(self, user_query, schema_description, conversation_manager=None, cancel_event=None):
+        self.calls += 1
+        if cancel_event is not None and cancel_event.wait(self.delay):
+            self.cancelled.set()
+            return False, "ERROR: 已取消"
+        return self.result
+
+class LegacyGenerator:
+    """不支持 cancel_event 参数的生成器"""
+
+    def generate_sql(self, user_query, schema_description, conversation_manager=None):
+        return True, "SELECT 1"
+
+def test_latency_tracker():
+    """测试分位数计算"""
+    tracker = LatencyTracker(window=10)
+    assert tracker.percentile(0.9) is None
+    for seconds in range(1, 11):
+        tracker.record(seconds)
+    assert tracker.percentile(0.9) == 9
+    assert tracker.percentile(0.5) == 5
+    tracker.record(100)  # 窗口只保留最近10个样本
+    assert tracker.count() == 10 and tracker.percentile(0.9) == 10
+
+def test_primary_fast_no_hedge():
+    """主生成器在等待时间内返回时不发出对冲请求"""
+    primary, secondary = FakeGenerator(0.01), FakeGenerator(0.01)
+    hedged = HedgedGenerator(primary, secondary, "p", "s", initial_delay=1.0)
+    try:
+        assert hedged.generate_sql_with_winner("查询用户", "结构") == (True, "SELECT * FROM sys_user", "p")
+        assert secondary.calls == 0
+        stats = hedged.get_stats()
+        assert stats['hedges'] == 0 and stats['primary_wins'] == 1 and stats['extra_calls'] == 0
+    finally:
+        hedged.shutdown()
+
+def test_slow_primary_is_hedged_and_cancelled():
+    """主生成器超过等待时间时对冲，备用生成器胜出后主生成器被取消"""
+    print("=== 测试对冲请求 ===\n")
+    primary = FakeGenerator(5.0, (True, "SELECT 'slow'"))
+    secondary = FakeGenerator(0.05, (True, "SELECT 'fast'"))
+    hedged = HedgedGenerator(primary, secondary, "p", "s", initial_delay=0.1)
+    try:
+        start = time.perf_counter()
+        success, sql, winner = hedged.generate_sql_with_winner("查询用户", "数据库结构信息")
+        elapsed = time.perf_counter() - start
+        assert success and sql == "SELECT 'fast'" and winner == "s"
+        assert elapsed < 1.0
+        assert primary.cancelled.wait(1.0)
+
+        stats = hedged.get_stats()
+        print(f"统计: {stats}")
+        assert stats['hedges'] == 1 and stats['hedge_wins'] == 1 and stats['cancelled'] == 1
+        assert stats['extra_prompt_tokens'] > 0
+        # 被取消的调用不计入耗时统计
+        assert stats['latency']['p']['samples'] == 0 and stats['latency']['s']['samples'] == 1
+    finally:
+        hedged.shutdown()
+
+def test_hedge_delay_follows_p90():
+    """样本足够后等待时间取主生成器P90，并限制在上下限之间"""
+    hedged = HedgedGenerator(LegacyGenerator(), LegacyGenerator(), "p", "s",
+                             initial_delay=5.0, min_delay=1.0, max_delay=15.0, min_samples=5)
+    try:
+        assert hedged.hedge_delay() == 5.0
+        for seconds in [2, 2, 3, 3, 4, 4, 4, 4, 6, 8]:
+            hedged.latency['p'].record(seconds)
+        assert hedged.hedge_delay() == 6
+        hedged.latency['p'].record(0.1)
+        hedged.min_delay = 7.0
+        assert hedged.hedge_delay() == 7.0
+        # 不支持取消参数的生成器也能正常调用
+        assert hedged.generate_sql("查询", "结构") == (True, "SELECT 1")
+    finally:
+        hedged.shutdown()
+
+def test_failures():
+    """主生成器失败时立即改用备用生成器；非SELECT结果不算胜出；双方都失败时返回错误"""
+    primary = FakeGenerator(0.01, (False, "ERROR: 本地模型调用失败"))
+    secondary = FakeGenerator(0.01, (True, "SELECT 2"))
+    hedged = HedgedGenerator(primary, secondary, "p", "s", initial_delay=5.0)
+    try:
+        start = time.perf_counter()
+        assert hedged.generate_sql("查询", "结构") == (True, "SELECT 2")
+        assert time.perf_counter() - start < 1.0
+
+        secondary.result = (True, "DELETE FROM sys_user")
+        success, error, winner = hedged.generate_sql_with_winner("查询", "结构")
+        assert not success and winner is None and error.startswith("ERROR")
+        assert hedged.get_stats()['failures'] == 1
+    finally:
+        hedged.shutdown()
+
+def test_overall_timeout():
+    """双方都超过总超时时间时返回超时错误"""
+    hedged = HedgedGenerator(FakeGenerator(5.0), FakeGenerator(5.0), "p", "s", initial_delay=0.05, timeout=0.2)
+    try:
+        success, error = hedged.generate_sql("查询", "结构")
+        assert not success and "超时" in error
+    finally:
+        hedged.shutdown()
+
+if __name__ == '__main__':
+    test_latency_tracker()
+    test_primary_fast_no_hedge()
+    test_slow_primary_is_hedged_and_cancelled()
+    test_hedge_delay_follows_p90()
+    test_failures()
+    test_overall_timeout()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试表关联关系图（外键、字段名推断、最短路径），不依赖数据库
+"""
+
+from join_graph import JoinGraph, describe_edges
+
+def make_table(comment, *columns):
+    return {'comment': comment, 'columns': [
+        {'field': field, 'type': 'bigint', 'key': key, 'null': 'NO', 'comment': ''} for field, key in columns
+    ]}
+
+SNAPSHOT = {
+    'sys_user': make_table('用户', ('user_id', 'PRI'), ('dept_id', 'MUL'), ('user_name', '')),
+    'sys_dept': make_table('部门', ('dept_id', 'PRI'), ('parent_id', '')),
+    'sys_role': make_table('角色', ('role_id', 'PRI'), ('role_name', '')),
+    'sys_user_role': make_table('用户角色', ('user_id', 'PRI'), ('role_id', 'PRI')),
+    'orders': make_table('订单', ('id', 'PRI'), ('customer_id', 'MUL')),
+    'crm_customer': make_table('客户', ('id', 'PRI'), ('name', '')),
+}
+
+def test_inferred_edges():
+    """测试没有外键时按字段名推断关联"""
+    print("=== 测试推断关联 ===\n")
+    graph = JoinGraph(SNAPSHOT)
+    print(describe_edges(graph.edges))
+
+    conditions = {(e['from_table'], e['to_table'], tuple(e['columns'])) for e in graph.edges}
+    assert ('sys_user', 'sys_dept', (('dept_id', 'dept_id'),)) in conditions
+    assert ('sys_user_role', 'sys_user', (('user_id', 'user_id'),)) in conditions
+    assert ('orders', 'crm_customer', (('customer_id', 'id'),)) in conditions
+    # parent_id 没有对应的表，不推断
+    assert not any(e['columns'][0][0] == 'parent_id' for e in graph.edges)
+
+def test_declared_foreign_keys():
+    """测试有外键时只使用外键"""
+    foreign_keys = [{'constraint': 'fk_dept', 'table': 'sys_user', 'column': 'dept_id',
+                     'referenced_table': 'sys_dept', 'referenced_column': 'dept_id'}]
+    graph = JoinGraph(SNAPSHOT, foreign_keys)
+    assert len(graph.edges) == 1 and not graph.edges[0]['inferred']
+
+def test_join_path():
+    """测试最短路径和连接多个表"""
+    print("\n=== 测试关联路径 ===\n")
+    graph = JoinGraph(SNAPSHOT)
+
+    path = graph.find_join_path('sys_role', 'sys_dept')
+    assert [(e['from_table'], e['to_table']) for e in path] == [
+        ('sys_user_role', 'sys_role'), ('sys_user_role', 'sys_user'), ('sys_user', 'sys_dept')
+    ]
+    assert graph.find_join_path('sys_role', 'orders') is None
+
+    # 用户和角色之间需要经过中间表
+    edges, bridges = graph.connect(['sys_user', 'sys_role'])
+    print(describe_edges(edges))
+    assert bridges == ['sys_user_role'] and len(edges) == 2
+
+    # 不允许中间表时只保留直接关联
+    edges, bridges = graph.connect(['sys_user', 'sys_role', 'sys_dept'], allow_bridges=False)
+    assert bridges == [] and len(edges) == 1
+
+if __name__ == '__main__':
+    test_inferred_edges()
+    test_declared_foreign_keys()
+    test_join_path()
+    print("\n=== 测试完成 ===")
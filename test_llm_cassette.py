@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试大模型响应的录制与回放：录制后关闭服务仍能回放、保留原始耗时或立即返回、提示词变化时按问题匹配
+使用本地模拟的大模型服务，不需要真实模型
+"""
+
+import configparser
+import os
+import tempfile
+import time
+from llm_cassette import CassetteMiss, LLMCassette, configure_cassette, request_question, set_cassette
+from llm_metrics import collect_llm_calls
+from mock_llm_server import MockLLMServer
+from ollama_sql_generator import OllamaLLMGenerator
+
+QUESTIONS = ["查询所有用户", "统计角色的数量", "前5条用户数据"]
+
+def _record(path):
+    """通过模拟服务录制几次生成"""
+    server = MockLLMServer(port=0, latency='constant:150')
+    url = server.start()
+    set_cassette(LLMCassette(path, 'record'))
+    try:
+        generator = OllamaLLMGenerator("qwen2", url)
+        results = [generator.generate_sql(question, "表结构") for question in QUESTIONS]
+    finally:
+        set_cassette(None)
+        server.stop()
+    return url, results
+
+def test_record_and_replay():
+    """回放时不访问服务，SQL与录制时相同，可以保留原始耗时或立即返回"""
+    print("=== 测试录制与回放 ===\n")
+    path = os.path.join(tempfile.mkdtemp(), 'cassette.jsonl')
+    url, recorded = _record(path)
+    assert all(success for success, _ in recorded)
+    with open(path, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == len(QUESTIONS)
+
+    generator = OllamaLLMGenerator("qwen2", url)   # 服务已关闭
+    try:
+        set_cassette(LLMCassette(path, 'replay', latency='original'))
+        start = time.perf_counter()
+        with collect_llm_calls() as calls:
+            assert generator.generate_sql(QUESTIONS[0], "表结构") == recorded[0]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"原始耗时回放: {elapsed_ms:.0f}ms")
+        assert elapsed_ms >= 140
+        assert calls[0]['prompt_tokens'] > 0 and calls[0]['first_token_ms'] is not None
+
+        cassette = LLMCassette(path, 'replay', latency='zero')
+        set_cassette(cassette)
+        start = time.perf_counter()
+        assert [generator.generate_sql(question, "表结构") for question in QUESTIONS] == recorded
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"零耗时回放: {elapsed_ms:.0f}ms")
+        assert elapsed_ms < 140
+
+        # 数据库结构描述不同，按同一问题匹配
+        assert generator.generate_sql(QUESTIONS[1], "另一种结构格式") == recorded[1]
+        # 没有录制的问题
+        success, error = generator.generate_sql("查询所有订单", "表结构")
+        assert not success and "录制文件中没有该请求" in error
+        stats = cassette.get_stats()
+        print(stats)
+        assert stats['replayed'] == 4 and stats['fuzzy_hits'] == 1 and stats['misses'] == 1
+    finally:
+        set_cassette(None)
+
+def test_configure_and_question():
+    """配置文件启用录制/回放，重复配置时沿用同一实例"""
+    path = os.path.join(tempfile.mkdtemp(), 'cassette.jsonl')
+    config = configparser.ConfigParser()
+    config.read_dict({'llm': {'cassette_mode': 'record', 'cassette_path': path}})
+    try:
+        cassette = configure_cassette(config)
+        assert cassette.mode == 'record' and configure_cassette(config) is cassette
+        config.set('llm', 'cassette_mode', 'off')
+        assert configure_cassette(config) is None
+    finally:
+        set_cassette(None)
+
+    assert request_question({'messages': [{'role': 'system', 'content': "表结构"},
+                                          {'role': 'user', 'content': "示例\n\n当前问题: 查询所有用户"}]}) == "查询所有用户"
+    assert request_question({'prompt': "表结构\n\n用户查询: 有多少个部门\n\n请生成对应的SQL查询语句："}) == "有多少个部门"
+    try:
+        LLMCassette(path, 'playback')
+        assert False
+    except ValueError:
+        pass
+    assert issubclass(CassetteMiss, RuntimeError)
+
+if __name__ == '__main__':
+    test_record_and_replay()
+    test_configure_and_question()
+    print("\n=== 测试完成 ===")
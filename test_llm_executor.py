@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试大模型调用线程池：工作线程和排队数上限、超时取消排队任务、超时后仍在运行的任务统计
+"""
+
+import asyncio
+import threading
+import time
+from llm_executor import LLMExecutor
+
+def wait_until(condition, timeout=2):
+    """等待条件成立（工作线程的启动和结束是异步的）"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_bound_and_rejection():
+    """运行和排队的任务总数达到 max_workers + max_pending 后拒绝新任务"""
+    print("=== 测试线程池上限 ===\n")
+    executor = LLMExecutor(max_workers=2, max_pending=1, name="test")
+    release = threading.Event()
+    try:
+        futures = [executor.submit(release.wait, 5) for _ in range(3)]
+        assert wait_until(lambda: executor.get_metrics()['running'] == 2)
+        metrics = executor.get_metrics()
+        assert metrics['queued'] == 1 and metrics['thread_count'] == 2
+
+        try:
+            executor.submit(release.wait, 5)
+            assert False, "应拒绝超出上限的任务"
+        except RuntimeError as e:
+            print(f"拒绝: {e}")
+            assert "线程池已满" in str(e)
+        assert executor.get_metrics()['rejected'] == 1
+
+        # 任务完成后可以继续提交
+        release.set()
+        assert all(future.result(2) for future in futures)
+        assert executor.run(lambda: "ok", timeout=1) == "ok"
+    finally:
+        release.set()
+        executor.shutdown()
+
+def test_timeout_cancels_queued_task():
+    """排队中的任务超时后被取消，不会再占用工作线程"""
+    print("\n=== 测试超时取消排队任务 ===\n")
+    executor = LLMExecutor(max_workers=1, max_pending=4, name="test")
+    release = threading.Event()
+    ran = []
+    try:
+        blocker = executor.submit(release.wait, 5)
+        assert wait_until(lambda: executor.get_metrics()['running'] == 1)
+
+        try:
+            executor.run(ran.append, "排队任务", timeout=0.1)
+            assert False, "应超时"
+        except TimeoutError as e:
+            print(f"超时: {e}")
+
+        metrics = executor.get_metrics()
+        assert metrics['timed_out'] == 1 and metrics['cancelled'] == 1
+        assert metrics['leaked'] == 0 and metrics['queued'] == 0
+
+        release.set()
+        blocker.result(2)
+        time.sleep(0.05)
+        assert ran == []
+    finally:
+        release.set()
+        executor.shutdown()
+
+def test_leaked_thread_accounting():
+    """已开始运行的任务超时后记为泄漏，结束后从当前泄漏数中移除"""
+    print("\n=== 测试超时任务统计 ===\n")
+    executor = LLMExecutor(max_workers=2, max_pending=2, name="test")
+    release = threading.Event()
+    try:
+        try:
+            executor.run(release.wait, 5, timeout=0.1)
+            assert False, "应超时"
+        except TimeoutError:
+            pass
+
+        metrics = executor.get_metrics()
+        print(metrics)
+        assert metrics['timed_out'] == 1 and metrics['cancelled'] == 0
+        assert metrics['leaked'] == 1 and metrics['leaked_total'] == 1 and metrics['running'] == 1
+
+        release.set()
+        assert wait_until(lambda: executor.get_metrics()['leaked'] == 0)
+        metrics = executor.get_metrics()
+        assert metrics['leaked_total'] == 1 and metrics['completed'] == 1 and metrics['running'] == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+def test_metrics_counters():
+    """完成、失败的任务分别计数，函数抛出的异常原样抛出"""
+    executor = LLMExecutor(max_workers=2, max_pending=2, name="metrics")
+    try:
+        assert executor.run(lambda x: x * 2, 21, timeout=1) == 42
+        try:
+            executor.run(lambda: 1 / 0, timeout=1)
+            assert False, "应抛出原异常"
+        except ZeroDivisionError:
+            pass
+
+        assert wait_until(lambda: executor.get_metrics()['completed'] + executor.get_metrics()['failed'] == 2)
+        metrics = executor.get_metrics()
+        assert metrics['name'] == "metrics" and metrics['max_workers'] == 2 and metrics['max_pending'] == 2
+        assert metrics['submitted'] == 2 and metrics['completed'] == 1 and metrics['failed'] == 1
+        assert metrics['running'] == 0 and metrics['queued'] == 0 and metrics['rejected'] == 0
+    finally:
+        executor.shutdown()
+
+def test_async_run():
+    """异步等待线程池任务：结果正常返回，超时后仍在运行的任务计入泄漏，不占用额外线程"""
+    print("\n=== 测试异步执行 ===\n")
+    executor = LLMExecutor(max_workers=1, max_pending=2, name="async")
+    release = threading.Event()
+
+    async def scenario():
+        assert await executor.arun(lambda x: x + 1, 41, timeout=1) == 42
+        try:
+            await executor.arun(release.wait, 5, timeout=0.1)
+            assert False, "应超时"
+        except TimeoutError as e:
+            print(f"超时: {e}")
+        # 唯一的工作线程仍被占用，排队任务超时后被取消
+        try:
+            await executor.arun(lambda: "不会运行", timeout=0.1)
+            assert False, "应超时"
+        except TimeoutError:
+            pass
+
+    try:
+        asyncio.run(scenario())
+        metrics = executor.get_metrics()
+        print(metrics)
+        assert metrics['thread_count'] == 1 and metrics['timed_out'] == 2
+        assert metrics['leaked'] == 1 and metrics['cancelled'] == 1 and metrics['queued'] == 0
+
+        release.set()
+        assert wait_until(lambda: executor.get_metrics()['leaked'] == 0)
+        assert executor.get_metrics()['completed'] == 2
+    finally:
+        release.set()
+        executor.shutdown()
+
+if __name__ == '__main__':
+    test_bound_and_rejection()
+    test_timeout_cancels_queued_task()
+    test_leaked_thread_accounting()
+    test_metrics_counters()
+    test_async_run()
+    print("\n=== 测试完成 ===")
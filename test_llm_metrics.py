@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试大模型调用指标：token用量、首个token时间、生成速度、排队时间，
+以及一次查询内调用记录的收集（跨事件循环和线程池）
+"""
+
+import asyncio
+import time
+from llm_executor import LLMExecutor
+from llm_metrics import LLMCall, LLMMetricsRegistry, collect_llm_calls, get_llm_metrics, summarize_calls
+from ollama_sql_generator import OllamaLLMGenerator
+from test_async_generators import start_stub_server
+
+def test_call_record():
+    """服务端用量优先，没有用量时按文本估算"""
+    registry = LLMMetricsRegistry()
+    with LLMCall('qwen_api', 'qwen-plus', registry) as call:
+        call.mark_first_token()
+        time.sleep(0.05)
+        call.set_usage(prompt_tokens=800, completion_tokens=20, cached_tokens=600)
+        call.success = True
+    with LLMCall('qwen_api', 'qwen-plus', registry) as call:
+        call.prompt_text = "查询所有用户"
+        call.completion_text = "SELECT * FROM `sys_user`"
+
+    stats = registry.get_stats()['qwen_api:qwen-plus']
+    print(f"统计: {stats}")
+    assert stats['calls'] == 2 and stats['errors'] == 1
+    assert stats['prompt_tokens'] == 800 + 6 and stats['cached_tokens'] == 600
+    assert stats['last']['estimated'] and stats['last']['status'] == 'error'
+    # 20个token在约50ms内生成
+    assert 200 < stats['tokens_per_second_p50'] < 500
+
+    async def cancelled():
+        with LLMCall('gemini', 'gemini-pro', registry):
+            await asyncio.sleep(5)
+
+    async def run():
+        task = asyncio.ensure_future(cancelled())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert registry.get_stats()['gemini:gemini-pro']['cancelled'] == 1
+
+def test_generator_usage_collected():
+    """同步接口在后台事件循环中执行，调用记录仍能被调用方收集"""
+    print("=== 测试生成器用量统计 ===\n")
+    server, url = start_stub_server()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url, stream=False)
+        with collect_llm_calls() as calls:
+            assert generator.generate_sql("查询用户", "数据库结构信息")[0]
+        stats = summarize_calls(calls)
+        print(f"本次查询: {stats}")
+        record = stats['details'][0]
+        assert stats['calls'] == 1 and stats['prompt_tokens'] == 10 and stats['completion_tokens'] == 5
+        assert record['tokens_per_second'] == 100.0 and not record['estimated']
+        assert record['status'] == 'ok' and record['queue_ms'] >= 0
+
+        # 流式提前结束时没有服务端用量，按文本估算，并记录首个token时间
+        generator = OllamaLLMGenerator("qwen2", url, stream=True)
+        with collect_llm_calls() as calls:
+            generator.generate_sql("查询用户", "数据库结构信息")
+        assert calls[0]['estimated'] and calls[0]['first_token_ms'] is not None
+        assert calls[0]['prompt_tokens'] > 0 and calls[0]['completion_tokens'] > 0
+
+        assert get_llm_metrics().get_stats()['ollama:qwen2']['calls'] >= 2
+    finally:
+        server.shutdown()
+
+def test_queue_time_through_executor():
+    """线程池中排队的时间计入调用的排队时间"""
+    server, url = start_stub_server()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url, stream=False)
+        executor = LLMExecutor(max_workers=1, max_pending=4, name="test")
+        with collect_llm_calls() as calls:
+            blocker = executor.submit(time.sleep, 0.3)
+            future = executor.submit(generator.generate_sql, "查询用户", "数据库结构信息")
+            assert future.result(timeout=5)[0]
+            blocker.result()
+        print(f"排队时间: {calls[0]['queue_ms']}ms")
+        assert len(calls) == 1 and calls[0]['queue_ms'] >= 200
+        executor.shutdown()
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    test_call_record()
+    test_generator_usage_collected()
+    test_queue_time_through_executor()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试模拟大模型服务：Ollama生成器直接连接、OpenAI兼容接口的流式格式、错误和限流注入、规则文件和批量JSON输出
+"""
+
+import json
+import time
+import httpx
+from mock_llm_server import LatencyDistribution, MockLLMServer, MockResponder
+from ollama_sql_generator import OllamaLLMGenerator
+
+RULES = {r"前(\d+)个部门": r"SELECT * FROM `sys_dept` LIMIT \1"}
+
+def test_latency_distribution():
+    """延迟分布的解析和抽样"""
+    import random
+    rng = random.Random(1)
+    assert LatencyDistribution('constant:200').sample(rng) == 0.2
+    samples = [LatencyDistribution('uniform:100,300').sample(rng) for _ in range(100)]
+    assert all(0.1 <= value <= 0.3 for value in samples)
+    assert LatencyDistribution('normal:10,100').sample(rng) >= 0
+    assert LatencyDistribution('lognormal:300,0.5').sample(rng) > 0
+    for spec in ('gamma:1', 'uniform:1', 'constant:abc'):
+        try:
+            LatencyDistribution(spec)
+            assert False, spec
+        except ValueError:
+            pass
+
+def test_ollama_generator():
+    """Ollama生成器通过URL连接模拟服务：连接测试、预热、流式和非流式生成"""
+    print("=== 测试Ollama协议 ===\n")
+    server = MockLLMServer(port=0, responder=MockResponder(rules=RULES), latency='constant:20',
+                           token_delay='constant:1', load_latency=100)
+    url = server.start()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url)
+        assert generator.test_connection(max_retries=1)
+        assert generator.warm_up() and generator.get_loaded_models()[0]['name'] == 'qwen2:latest'
+
+        success, sql = generator.generate_sql("查询所有用户", "表结构")
+        assert (success, sql) == (True, "SELECT * FROM `sys_user`")
+        generator.stream = False
+        assert generator.generate_sql("前3个部门", "表结构") == (True, "SELECT * FROM `sys_dept` LIMIT 3")
+        assert generator.get_timing_stats()['last']['prompt_tokens'] > 0
+
+        # 批量生成使用JSON输出
+        items = json.dumps([{'id': 1, 'question': "统计角色的数量"}, {'id': 2, 'question': "随便说点什么"}],
+                           ensure_ascii=False)
+        results = json.loads(generator.complete([{'role': 'user', 'content': items}], json_mode=True))['results']
+        assert results[0]['sql'] == "SELECT COUNT(*) AS total FROM `sys_role`"
+        assert results[1]['sql'] == "SELECT * FROM `sys_user` LIMIT 10"
+
+        stats = server.get_stats()
+        print(stats)
+        assert stats['warm_ups'] == 1 and stats['requests']['/api/chat'] == 3 and stats['in_flight'] == 0
+    finally:
+        server.stop()
+
+def test_openai_protocol():
+    """OpenAI兼容接口：非流式、SSE流式（带用量统计）和停止序列"""
+    print("\n=== 测试OpenAI兼容协议 ===\n")
+    server = MockLLMServer(port=0)
+    url = server.start()
+    try:
+        request = {'model': 'qwen-plus', 'messages': [
+            {'role': 'system', 'content': [{'type': 'text', 'text': "表结构", 'cache_control': {'type': 'ephemeral'}}]},
+            {'role': 'user', 'content': "以下是相似示例\n\n当前问题: 有多少个用户"}], 'stop': ["\n\n说明"]}
+        body = httpx.post(f"{url}/v1/chat/completions", json=request).json()
+        assert body['choices'][0]['message']['content'] == "SELECT COUNT(*) AS total FROM `sys_user`;"
+        assert body['usage']['prompt_tokens'] > 0
+
+        request.update(stream=True, stream_options={'include_usage': True}, stop=None)
+        with httpx.stream('POST', f"{url}/v1/chat/completions", json=request) as response:
+            events = [line[6:] for line in response.iter_lines() if line.startswith('data: ')]
+        assert events[-1] == '[DONE]'
+        chunks = [json.loads(event) for event in events[:-1]]
+        text = "".join(chunk['choices'][0]['delta'].get('content', '') for chunk in chunks if chunk['choices'])
+        print(text)
+        assert text.startswith("SELECT COUNT(*) AS total FROM `sys_user`;\n\n说明")
+        assert chunks[-1]['choices'] == [] and chunks[-1]['usage']['completion_tokens'] > 0
+        assert httpx.get(f"{url}/v1/models").json()['data'][0]['id'] == 'qwen2:latest'
+    finally:
+        server.stop()
+
+def test_error_injection():
+    """按比例注入500和429，相同种子可复现"""
+    print("\n=== 测试错误注入 ===\n")
+    server = MockLLMServer(port=0, rate_limit_rate=1.0, retry_after=3)
+    url = server.start()
+    try:
+        response = httpx.post(f"{url}/v1/chat/completions", json={'messages': [{'role': 'user', 'content': "x"}]})
+        assert response.status_code == 429 and response.headers['Retry-After'] == '3'
+        assert response.json()['error']['type'] == 'rate_limit_error'
+        assert OllamaLLMGenerator("qwen2", url).generate_sql("查询所有用户", "表结构")[0] is False
+    finally:
+        server.stop()
+
+    def statuses(seed):
+        server = MockLLMServer(port=0, error_rate=0.3, rate_limit_rate=0.2, seed=seed)
+        url = server.start()
+        try:
+            return [httpx.post(f"{url}/api/chat", json={'messages': [], 'stream': False}).status_code
+                    for _ in range(30)], server.get_stats()
+        finally:
+            server.stop()
+
+    first, stats = statuses(7)
+    second, _ = statuses(7)
+    print(stats)
+    assert first == second and {200, 429, 500} <= set(first)
+    assert stats['errors'] == first.count(500) and stats['rate_limited'] == first.count(429)
+
+if __name__ == '__main__':
+    test_latency_distribution()
+    test_ollama_generator()
+    test_openai_protocol()
+    test_error_injection()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试模型列表缓存：有效期内不重复请求、过期后先返回旧列表并在后台刷新、获取失败时继续使用旧列表
+"""
+
+import asyncio
+import time
+from model_list_cache import ModelListCache, get_model_list_cache
+from ollama_sql_generator import OllamaLLMGenerator
+from test_async_generators import start_stub_server
+
+class CountingLoader:
+    """每次调用返回新版本的列表，可以设置为失败"""
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("服务不可用")
+        return [f"qwen2:v{self.calls}"]
+
+def test_ttl_and_stale_while_revalidate():
+    """过期的列表立即返回，后台刷新完成后返回新列表"""
+    print("=== 测试过期后后台刷新 ===\n")
+    cache = ModelListCache(ttl=0.2, stale_ttl=5)
+    loader = CountingLoader(delay=0.1)
+    assert cache.get('ollama', loader) == ["qwen2:v1"]
+    assert cache.get('ollama', loader) == ["qwen2:v1"] and loader.calls == 1
+
+    time.sleep(0.25)
+    start = time.perf_counter()
+    assert cache.get('ollama', loader) == ["qwen2:v1"]       # 旧列表，不等待刷新
+    assert cache.get('ollama', loader) == ["qwen2:v1"]       # 刷新进行中不重复刷新
+    assert (time.perf_counter() - start) * 1000 < 50
+    time.sleep(0.2)
+    assert cache.get('ollama', loader) == ["qwen2:v2"] and loader.calls == 2
+
+    stats = cache.get_stats()
+    print(stats)
+    assert stats['hits'] == 2 and stats['stale_hits'] == 2 and stats['misses'] == 1 and stats['refreshes'] == 2
+
+def test_failures_and_expiry():
+    """获取失败时不缓存失败结果，继续使用旧列表；超过最长使用时间后重新同步获取"""
+    print("\n=== 测试获取失败 ===\n")
+    cache = ModelListCache(ttl=0.1, stale_ttl=0.3)
+    loader = CountingLoader()
+    loader.fail = True
+    assert cache.get('gemini', loader) is None
+    loader.fail = False
+    assert cache.get('gemini', loader) == ["qwen2:v2"]
+
+    loader.fail = True
+    time.sleep(0.35)
+    assert cache.get('gemini', loader) == ["qwen2:v2"]       # 已超过最长使用时间，请求失败时仍返回旧列表
+    assert cache.get_stats()['failures'] == 2
+    cache.invalidate('gemini')
+    assert cache.get('gemini', loader) is None
+
+    cache.put('gemini', ["gemini-1.5-flash"])
+    assert cache.get('gemini', loader) == ["gemini-1.5-flash"]
+
+def test_async_and_ollama():
+    """异步接口在当前事件循环中刷新；Ollama健康检查顺带更新缓存，服务暂时不可用时模型选择列表仍然可用"""
+    print("\n=== 测试异步接口和Ollama ===\n")
+    cache = ModelListCache(ttl=0.1, stale_ttl=5)
+    calls = {'count': 0}
+
+    async def loader():
+        calls['count'] += 1
+        await asyncio.sleep(0.05)
+        return [f"v{calls['count']}"]
+
+    async def scenario():
+        assert await cache.aget('ollama', loader) == ["v1"]
+        await asyncio.sleep(0.15)
+        assert await cache.aget('ollama', loader) == ["v1"]
+        await asyncio.sleep(0.1)
+        return await cache.aget('ollama', loader)
+
+    assert asyncio.run(scenario()) == ["v2"]
+
+    server, url = start_stub_server()
+    generator = OllamaLLMGenerator("qwen2", url)
+    get_model_list_cache().invalidate(f"ollama:{url}")
+    assert generator.health_check()[0]
+    server.shutdown()
+    server.server_close()
+    # 新实例没有可复用的连接，能拿到列表说明没有发起请求
+    assert OllamaLLMGenerator("qwen2", url).get_available_models() == ['qwen2:latest']
+    assert OllamaLLMGenerator("qwen2", url).get_available_models(refresh=True) == []
+
+if __name__ == '__main__':
+    test_ttl_and_stale_while_revalidate()
+    test_failures_and_expiry()
+    test_async_and_ollama()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试Ollama /api/chat 请求：系统消息在不同问题之间保持不变（前缀复用），
+请求带上相同的 keep_alive 和 num_ctx，并记录预填充和首个token耗时
+使用本地模拟的 Ollama 接口，不需要真实模型
+"""
+
+from conversation_manager import ConversationManager
+from ollama_sql_generator import OllamaLLMGenerator
+from test_async_generators import StubOllamaHandler, start_stub_server
+
+FULL_SCHEMA = "表名: sys_user\n字段: user_id, user_name, dept_id\n\n表名: sys_dept\n字段: dept_id, dept_name"
+USER_SCHEMA = "表名: sys_user\n字段: user_id, user_name, dept_id"
+DEPT_SCHEMA = "表名: sys_dept\n字段: dept_id, dept_name"
+
+def chat_payloads():
+    return [payload for path, payload in StubOllamaHandler.requests if path == '/api/chat']
+
+def test_stable_system_message():
+    """不同问题（检索到的结构不同）的系统消息逐字节相同，不重复附上结构，示例放在最后一条用户消息中"""
+    print("=== 测试系统消息保持不变 ===\n")
+    server, url = start_stub_server()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url, stream=False)
+        generator.set_stable_schema(FULL_SCHEMA)
+        manager = ConversationManager()
+        manager.add_user_query("查询所有用户")
+        manager.add_assistant_response("SELECT * FROM `sys_user`", True)
+
+        assert generator.generate_sql("查询用户数量", USER_SCHEMA, manager)[0]
+        assert generator.generate_sql("查询部门列表", DEPT_SCHEMA, manager, examples="问题: 查询部门\nSQL: SELECT 1")[0]
+
+        first, second = chat_payloads()
+        system_first = first['messages'][0]['content'].encode('utf-8')
+        system_second = second['messages'][0]['content'].encode('utf-8')
+        assert system_first == system_second
+        assert FULL_SCHEMA in first['messages'][0]['content']
+
+        # 历史对话紧跟系统消息，随问题变化的内容都在最后
+        assert second['messages'][1:3] == [
+            {'role': 'user', 'content': "查询所有用户"},
+            {'role': 'assistant', 'content': "SELECT * FROM `sys_user`"},
+        ]
+        last = second['messages'][-1]['content']
+        print(last)
+        assert "SQL: SELECT 1" in last and last.endswith("当前问题: 查询部门列表")
+        # 完整结构已在系统消息中，检索到的结构不再重复发送
+        assert "数据库结构" not in last and DEPT_SCHEMA not in last
+        assert first['messages'][-1] == {'role': 'user', 'content': "查询用户数量"}
+
+        generator.generate_sql("查询用户", FULL_SCHEMA)
+        assert chat_payloads()[-1]['messages'] == [
+            {'role': 'system', 'content': first['messages'][0]['content']},
+            {'role': 'user', 'content': "查询用户"},
+        ]
+    finally:
+        server.shutdown()
+
+def test_schema_too_large():
+    """完整结构超过上下文长度一半时不放进系统消息，系统消息仍保持不变"""
+    generator = OllamaLLMGenerator("qwen2", num_ctx=64)
+    generator.set_stable_schema(FULL_SCHEMA * 20)
+    assert generator.stable_schema is None
+    first = generator.create_messages("查询用户", USER_SCHEMA)
+    second = generator.create_messages("查询部门", DEPT_SCHEMA)
+    assert first[0] == second[0] and "数据库结构信息" not in first[0]['content']
+    assert first[-1]['content'].startswith(f"数据库结构信息：\n{USER_SCHEMA}")
+
+def test_chat_payload_and_timing():
+    """请求带上固定的 keep_alive、num_ctx 和停止词，记录服务端返回的预填充耗时"""
+    print("\n=== 测试请求参数和耗时记录 ===\n")
+    server, url = start_stub_server()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url, stream=False, keep_alive="-1", num_ctx=4096)
+        assert generator.generate_sql("查询用户", USER_SCHEMA) == (True, "SELECT * FROM `sys_user` -- 查询用户")
+        generator.generate_sql("查询部门", DEPT_SCHEMA)
+
+        payloads = chat_payloads()
+        assert len(payloads) == 2
+        for payload in payloads:
+            assert payload['model'] == "qwen2" and payload['stream'] is False
+            assert payload['keep_alive'] == -1
+            assert payload['options']['num_ctx'] == 4096 and payload['options']['stop']
+        assert payloads[0]['options'] == payloads[1]['options']
+
+        stats = generator.get_timing_stats()
+        print(stats)
+        assert stats['requests'] == 2 and stats['keep_alive'] == -1 and stats['num_ctx'] == 4096
+        assert stats['avg_prefill_ms'] == 200.0 and stats['avg_prompt_tokens'] == 10
+        assert stats['last']['eval_tokens'] == 5 and stats['last']['eval_ms'] == 50.0
+
+        # 流式请求记录首个token时间；SQL完整后提前结束时收不到服务端统计，
+        # 按提示词估算token数、以首个token时间作为预填充耗时，仍计入预填充统计
+        streaming = OllamaLLMGenerator("qwen2", url)
+        assert streaming.generate_sql("查询用户", USER_SCHEMA)[0]
+        assert chat_payloads()[-1]['stream'] is True
+        stats = streaming.get_timing_stats()
+        last = stats['last']
+        print(stats)
+        assert last['first_token_ms'] <= last['total_ms']
+        assert last['prefill_estimated'] and last['prefill_ms'] == last['first_token_ms']
+        assert last['prompt_tokens'] > 0 and 'eval_tokens' not in last
+        assert stats['estimated_prefill'] == 1 and stats['avg_prefill_ms'] is not None
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    test_stable_system_message()
+    test_schema_too_large()
+    test_chat_payload_and_timing()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试Ollama模型预热和常驻检查：预热加载模型、通过 /api/ps 读取已加载的模型、即将卸载时自动续期
+使用本地模拟的 Ollama 接口，不需要真实模型
+"""
+
+import time
+from ollama_sql_generator import OllamaLLMGenerator
+from test_async_generators import StubOllamaHandler, start_stub_server
+
+def test_warm_up_and_ps():
+    """预热使用与正常请求相同的选项，之后 /api/ps 中可以看到模型"""
+    print("=== 测试模型预热 ===\n")
+    server, url = start_stub_server()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url, keep_alive="-1")
+        assert generator.get_loaded_models() == []
+        assert generator.warm_up()
+        assert StubOllamaHandler.warm_ups == 1
+
+        models = generator.get_loaded_models()
+        print(models)
+        assert models[0]['name'] == 'qwen2:latest' and models[0]['expires_at']
+
+        status = generator.get_residency_status()
+        print(status)
+        assert status['loaded'] and status['warm_ups'] == 1 and status['last_load_ms'] == 1500.0
+        assert status['keep_alive'] == -1 and status['keep_warm_interval'] is None
+    finally:
+        server.shutdown()
+
+def test_refresh_residency():
+    """模型未加载或即将被卸载时重新预热，仍在内存中时不重复预热"""
+    print("\n=== 测试常驻检查 ===\n")
+    server, url = start_stub_server()
+    try:
+        generator = OllamaLLMGenerator("qwen2", url)
+        assert generator.refresh_residency(margin=600)        # 未加载 → 预热
+        assert StubOllamaHandler.warm_ups == 1
+        assert generator.refresh_residency(margin=600)        # 还有30分钟 → 不预热
+        assert StubOllamaHandler.warm_ups == 1
+        assert generator.refresh_residency(margin=3600)       # 不足1小时 → 续期
+        assert StubOllamaHandler.warm_ups == 2
+        assert generator.get_residency_status()['last_check'] is not None
+
+        # 后台线程定期检查，模型被卸载后自动重新加载
+        generator.start_keep_warm(interval=0.2)
+        StubOllamaHandler.loaded = []
+        time.sleep(0.5)
+        generator.stop_keep_warm()
+        assert StubOllamaHandler.warm_ups == 3
+        assert generator.get_residency_status()['loaded']
+    finally:
+        server.shutdown()
+
+def test_server_unreachable():
+    """Ollama服务不可用时预热失败但不抛出异常"""
+    generator = OllamaLLMGenerator("qwen2", "http://127.0.0.1:9")
+    assert not generator.warm_up(timeout=2)
+    assert generator.get_loaded_models() is None
+    assert not generator.refresh_residency()
+
+if __name__ == '__main__':
+    test_warm_up_and_ps()
+    test_refresh_residency()
+    test_server_unreachable()
+    print("\n=== 测试完成 ===")
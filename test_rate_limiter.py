@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试客户端限流：令牌桶、AIMD自适应并发、Retry-After 退避重试、按 API Key + 模型 共享
+"""
+
+import asyncio
+import configparser
+import time
+from rate_limiter import (APIRateLimiter, AdaptiveConcurrency, RateLimitExceeded, TokenBucket,
+                          get_rate_limiter, get_retry_after, is_rate_limit_error)
+
+class FakeResponse:
+    def __init__(self, status_code=429, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeAPIError(Exception):
+    """模拟SDK抛出的HTTP异常"""
+    def __init__(self, message, status_code=429, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = FakeResponse(status_code, headers)
+
+def test_error_classification():
+    """识别429/配额错误并取出服务端建议的等待时间"""
+    assert is_rate_limit_error(FakeAPIError("Too Many Requests"))
+    assert is_rate_limit_error(Exception("429 Resource has been exhausted (e.g. check quota)."))
+    assert not is_rate_limit_error(FakeAPIError("Invalid API key", status_code=401))
+    assert get_retry_after(FakeAPIError("Too Many Requests", headers={'retry-after': '2'})) == 2.0
+    assert get_retry_after(Exception("429 Quota exceeded. retry_delay { seconds: 17 }")) == 17.0
+    assert get_retry_after(Exception("Please retry in 3.5s.")) == 3.5
+    assert get_retry_after(FakeAPIError("Too Many Requests")) is None
+
+def test_token_bucket_and_aimd():
+    """令牌桶限制速率，AIMD在429时减半、成功时缓慢恢复"""
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.updated
+    assert bucket.try_take(now) == 0 and bucket.try_take(now) == 0
+    assert abs(bucket.try_take(now) - 0.1) < 1e-6
+    assert bucket.try_take(now + 0.1) == 0
+
+    concurrency = AdaptiveConcurrency(initial=8, maximum=16)
+    concurrency.on_rate_limited()
+    assert concurrency.current == 4
+    for _ in range(20):
+        concurrency.on_success(0.5)
+    assert 4 < concurrency.current <= 16
+    before = concurrency.limit
+    concurrency.on_success(5.0)  # 延迟明显升高
+    assert concurrency.limit < before
+
+def test_retry_after_and_backoff():
+    """被限流时按 Retry-After 等待后重试，其他错误直接抛出"""
+    print("=== 测试限流重试 ===\n")
+    limiter = APIRateLimiter("test", rate=100, burst=10, base_delay=0.05, max_retries=2)
+    attempts = []
+
+    async def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise FakeAPIError("Too Many Requests", headers={'retry-after': '0.3'})
+        return "SELECT 1"
+
+    assert asyncio.run(limiter.run(flaky)) == "SELECT 1"
+    assert len(attempts) == 2 and attempts[1] - attempts[0] >= 0.3
+    stats = limiter.get_stats()
+    assert stats['rate_limited'] == 1 and stats['retries'] == 1 and stats['in_flight'] == 0
+
+    async def always_limited():
+        raise FakeAPIError("Too Many Requests")
+
+    try:
+        asyncio.run(limiter.run(always_limited))
+        assert False, "应当抛出 RateLimitExceeded"
+    except RateLimitExceeded as e:
+        assert "重试2次" in str(e)
+    assert limiter.get_stats()['exhausted'] == 1
+
+    async def bad_request():
+        raise ValueError("参数错误")
+
+    calls = limiter.get_stats()['rate_limited']
+    try:
+        asyncio.run(limiter.run(bad_request))
+        assert False, "应当抛出 ValueError"
+    except ValueError:
+        pass
+    assert limiter.get_stats()['rate_limited'] == calls and limiter.get_stats()['in_flight'] == 0
+
+def test_concurrency_and_rate_limits():
+    """突发请求不超过并发上限和速率"""
+    limiter = APIRateLimiter("burst", rate=20, burst=5, initial_concurrency=3, max_concurrency=3)
+    state = {'running': 0, 'peak': 0}
+
+    async def request():
+        state['running'] += 1
+        state['peak'] = max(state['peak'], state['running'])
+        await asyncio.sleep(0.05)
+        state['running'] -= 1
+
+    async def burst():
+        start = time.monotonic()
+        await asyncio.gather(*[limiter.run(request) for _ in range(15)])
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(burst())
+    print(f"15个请求耗时 {elapsed:.2f} 秒，最大并发 {state['peak']}")
+    assert state['peak'] <= 3
+    # 桶中初始5个令牌，其余10个按每秒20个补充
+    assert elapsed >= 0.45
+
+def test_shared_per_key_and_model():
+    """同一 API Key + 模型 共用限流器，支持按后端覆盖配置"""
+    config = configparser.ConfigParser()
+    config.read_string("[rate_limit]\nrequests_per_second = 5\nrequests_per_second_gemini = 1\n")
+    a = get_rate_limiter(config, 'gemini', 'key-1', 'gemini-1.5-flash')
+    assert a is get_rate_limiter(config, 'gemini', 'key-1', 'gemini-1.5-flash')
+    assert a is not get_rate_limiter(config, 'gemini', 'key-2', 'gemini-1.5-flash')
+    assert a.bucket.rate == 1.0 and 'key-1' not in a.name
+    assert get_rate_limiter(config, 'qwen_api', 'key-1', 'qwen-plus').bucket.rate == 5.0
+
+    config.read_string("[rate_limit]\nenabled = false\n")
+    assert get_rate_limiter(config, 'qwen_api', 'key-1', 'qwen-max') is None
+
+if __name__ == '__main__':
+    test_error_classification()
+    test_token_bucket_and_aimd()
+    test_retry_after_and_backoff()
+    test_concurrency_and_rate_limits()
+    test_shared_per_key_and_model()
+    print("\n=== 测试完成 ===")
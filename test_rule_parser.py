@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试规则解析：简单问题直接生成SQL，置信度不够或存在歧义时交给大模型
+"""
+
+from rule_parser import RuleBasedParser, normalize_question, parse_number
+from schema_formatter import _demo_snapshot
+
+def test_helpers():
+    """问题归一化和中文数字解析"""
+    assert normalize_question("查询 所有用户？") == "查询所有用户"
+    assert [parse_number(n) for n in ('10', '五', '十五', '二十', '九十九')] == [10, 5, 15, 20, 99]
+    assert parse_number('一百') is None
+
+def test_simple_questions():
+    """常见的简单问题"""
+    print("=== 测试简单问题 ===\n")
+    parser = RuleBasedParser(_demo_snapshot())
+    cases = {
+        "查询所有用户": "SELECT * FROM `sys_user`",
+        "显示sys_dept表的数据": "SELECT * FROM `sys_dept`",
+        "sys_dept表前10条": "SELECT * FROM `sys_dept` LIMIT 10",
+        "查询部门表中前二十条记录": "SELECT * FROM `sys_dept` LIMIT 20",
+        "前5条用户数据": "SELECT * FROM `sys_user` LIMIT 5",
+        "统计角色的数量": "SELECT COUNT(*) AS total FROM `sys_role`",
+        "部门一共有多少条数据？": "SELECT COUNT(*) AS total FROM `sys_dept`",
+        "有多少个用户": "SELECT COUNT(*) AS total FROM `sys_user`",
+        "用户中最后登录时间最晚的记录": "SELECT * FROM `sys_user` ORDER BY `login_date` DESC LIMIT 1",
+        "最后登录时间最早的用户": "SELECT * FROM `sys_user` ORDER BY `login_date` ASC LIMIT 1",
+        "sys_user的login_date最早的一条": "SELECT * FROM `sys_user` ORDER BY `login_date` ASC LIMIT 1",
+    }
+    for question, expected in cases.items():
+        sql = parser.parse(question)
+        print(f"{question} -> {sql}")
+        assert sql == expected, (question, sql)
+
+    stats = parser.get_stats()
+    assert stats['hits'] == stats['lookups'] == len(cases)
+    assert stats['rules']['count'] == 3 and stats['avg_ms'] < 5
+
+def test_defer_to_llm():
+    """带条件、追问、名称不明确的问题交给大模型"""
+    print("\n=== 测试交给大模型 ===\n")
+    parser = RuleBasedParser(_demo_snapshot())
+    for question in ["查询所有状态正常的用户", "查询所有部门名称", "统计每个部门的用户数量", "其中有多少个部门",
+                     "查询所有用户和部门", "用户表", "用户表前100000条", "查询昵称最长的用户", "查询所有订单"]:
+        assert parser.parse(question) is None, question
+
+    # 限定表时只在选定的表中匹配
+    assert parser.parse("查询所有用户", ['sys_dept']) is None
+    assert parser.parse("查询所有用户", ['sys_user']) == "SELECT * FROM `sys_user`"
+
+    # 只能通过去掉表名前缀的注释匹配到的字段（“用户昵称” → “昵称”）置信度较低
+    assert parser.parse("昵称最大的用户") == "SELECT * FROM `sys_user` ORDER BY `nick_name` DESC LIMIT 1"
+    strict = RuleBasedParser(_demo_snapshot(), min_confidence=0.9)
+    assert strict.parse("昵称最大的用户") is None
+
+    stats = parser.get_stats()
+    assert stats['deferred'] == 10 and 0 < stats['hit_rate'] < 1
+
+if __name__ == '__main__':
+    test_helpers()
+    test_simple_questions()
+    test_defer_to_llm()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试紧凑结构描述格式和token预算，不依赖数据库
+"""
+
+from schema_formatter import (abbreviate_type, find_common_columns, format_schema,
+                              format_schema_compact, _demo_snapshot)
+from token_counter import estimate_tokens
+
+def test_abbreviate_type():
+    """测试类型缩写"""
+    print("=== 测试类型缩写 ===\n")
+    assert abbreviate_type("varchar(50)") == "str(50)"
+    assert abbreviate_type("varchar(50)", keep_size=False) == "str"
+    assert abbreviate_type("bigint(20) unsigned") == "bigint"
+    assert abbreviate_type("tinyint(1)") == "bool"
+    assert abbreviate_type("decimal(10,2)") == "dec(10,2)"
+    assert abbreviate_type("enum('a','b')") == "enum('a','b')"
+
+def test_compact_format():
+    """测试紧凑格式比原格式短且保留表和字段"""
+    print("\n=== 测试紧凑格式 ===\n")
+    snapshot = _demo_snapshot()
+    verbose = format_schema(snapshot, 'verbose')
+    compact = format_schema(snapshot, 'compact')
+    print(f"verbose: {estimate_tokens(verbose)} tokens, compact: {estimate_tokens(compact)} tokens")
+
+    assert estimate_tokens(compact) < estimate_tokens(verbose)
+    assert "sys_user(user_id:bigint*" in compact
+    assert 'email:str(50)?"用户邮箱"' in compact
+
+    # 公共字段只列一次，不同表中定义不同的字段不合并
+    common = [col['field'] for col in find_common_columns(snapshot)]
+    assert 'create_time' in common and 'status' not in common
+    assert compact.count('create_time') == 1
+
+def test_token_budget():
+    """测试超出预算时逐步省略细节"""
+    snapshot = _demo_snapshot()
+
+    text = format_schema_compact(snapshot, token_budget=500)
+    assert estimate_tokens(text) <= 500
+    assert '"用户邮箱"' not in text and 'sys_user(' in text
+
+    text = format_schema_compact(snapshot, token_budget=200)
+    assert estimate_tokens(text) <= 200
+    assert '未列出' in text
+
+    # verbose 超出预算时改用紧凑格式
+    text = format_schema(snapshot, 'verbose', token_budget=500)
+    assert '表名:' not in text and estimate_tokens(text) <= 500
+
+if __name__ == '__main__':
+    test_abbreviate_type()
+    test_compact_format()
+    test_token_budget()
+    print("\n=== 测试完成 ===")
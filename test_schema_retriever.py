@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试数据库结构检索（BM25 + 中文n-gram），不依赖数据库
+"""
+
+from schema_retriever import SchemaRetriever, find_referenced_tables, tokenize
+from token_counter import estimate_tokens
+
+def make_column(field, comment='', key=''):
+    return {'field': field, 'type': 'varchar(50)', 'key': key, 'null': 'YES', 'comment': comment}
+
+SNAPSHOT = {
+    'sys_user': {'comment': '用户信息表', 'columns': [
+        make_column('id', '用户ID', 'PRI'), make_column('user_name', '姓名'), make_column('email', '邮箱'),
+    ]},
+    'order_info': {'comment': '订单表', 'columns': [
+        make_column('id', '订单ID', 'PRI'), make_column('user_id', '下单用户', 'MUL'), make_column('amount', '订单金额'),
+    ]},
+    'product': {'comment': '商品表', 'columns': [
+        make_column('id', '商品ID', 'PRI'), make_column('price', '价格'),
+    ]},
+    'sys_log': {'comment': '操作日志', 'columns': [
+        make_column('id', '', 'PRI'), make_column('content', '日志内容'),
+    ]},
+}
+
+def test_tokenize():
+    """测试中文n-gram和标识符拆分"""
+    print("=== 测试分词 ===\n")
+    assert '邮箱' in tokenize("查询用户邮箱")
+    assert '查询' not in tokenize("查询用户邮箱")
+    assert tokenize("orderInfo") == ['order', 'info', 'orderinfo']
+    assert tokenize("sys_user") == ['sys', 'user', 'sys_user']
+
+def test_retrieve_tables():
+    """测试按问题检索相关的表"""
+    print("\n=== 测试表检索 ===\n")
+    retriever = SchemaRetriever(SNAPSHOT)
+
+    result = retriever.retrieve("查询所有用户的姓名和邮箱")
+    print(f"用户问题: {result['scores']}")
+    assert list(result['tables'])[0] == 'sys_user'
+
+    result = retriever.retrieve("统计每个用户的订单金额")
+    print(f"订单问题: {result['scores']}")
+    assert list(result['tables'])[0] == 'order_info'
+    assert 'sys_log' not in result['tables']
+
+    # 没有命中时返回None，由调用方使用完整结构
+    assert retriever.retrieve("今天天气怎么样") is None
+
+    # 追问时保留上一条SQL用到的表
+    required = find_referenced_tables("SELECT `email` FROM `sys_user` LIMIT 5", SNAPSHOT)
+    assert required == ['sys_user']
+    result = retriever.retrieve("只要前5条", required_tables=required)
+    assert list(result['tables']) == ['sys_user']
+
+def test_column_pruning():
+    """测试宽表只保留主键和相关字段"""
+    columns = [make_column('id', '', 'PRI')] + [make_column(f'col_{i}', f'备用字段{i}') for i in range(50)]
+    columns.append(make_column('mobile', '手机号码'))
+    retriever = SchemaRetriever({'customer': {'comment': '客户表', 'columns': columns}})
+
+    result = retriever.retrieve("查询客户手机号码", max_columns=5)
+    fields = [col['field'] for col in result['tables']['customer']]
+    print(f"保留字段: {fields}")
+    assert len(fields) == 5 and 'id' in fields and 'mobile' in fields
+
+def test_estimate_tokens():
+    """测试token估算"""
+    assert estimate_tokens("用户") == 2
+    assert estimate_tokens("user_name") == 3
+    assert estimate_tokens("") == 0
+
+if __name__ == '__main__':
+    test_tokenize()
+    test_retrieve_tables()
+    test_column_pruning()
+    test_estimate_tokens()
+    print("\n=== 测试完成 ===")
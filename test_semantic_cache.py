@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试语义查询缓存（本地哈希向量化器），不依赖外部服务
+"""
+
+import random
+import time
+import tracemalloc
+from semantic_cache import HashingEmbedder, SemanticCache, VectorIndex, extract_literals
+
+def test_paraphrase_hit():
+    """测试相似问题命中、作用域隔离"""
+    print("=== 测试语义缓存 ===\n")
+
+    cache = SemanticCache(HashingEmbedder(), threshold=0.6)
+    scope = SemanticCache.make_scope("schema-a")
+    cache.add("列出所有用户邮箱", "SELECT `email` FROM `users`", scope)
+
+    hit = cache.lookup("列出所有用户的邮箱", scope)
+    print(f"相似问题: {hit}")
+    assert hit and hit['sql'] == "SELECT `email` FROM `users`"
+
+    # 不同数据库结构或不同对话上下文互不影响
+    assert cache.lookup("列出所有用户的邮箱", SemanticCache.make_scope("schema-b")) is None
+    assert cache.lookup("列出所有用户的邮箱", SemanticCache.make_scope("schema-a", "SELECT 1")) is None
+
+def test_literal_guard():
+    """测试字面量不同的问题不会复用"""
+    assert extract_literals("查找年龄大于25岁的用户") == ["25"]
+
+    cache = SemanticCache(HashingEmbedder(), threshold=0.5)
+    scope = SemanticCache.make_scope("schema-a")
+    cache.add("查找年龄大于25岁的用户", "SELECT * FROM `users` WHERE `age` > 25", scope)
+
+    assert cache.lookup("查找年龄大于30岁的用户", scope) is None
+    assert cache.get_stats()['rejected_literals'] == 1
+
+def test_lsh_recall():
+    """测试LSH检索能找回近邻向量"""
+    rng = random.Random(1)
+    dim = 32
+    index = VectorIndex(dim, brute_force_limit=0)
+
+    vectors = []
+    for i in range(2000):
+        vector = [rng.gauss(0, 1) for _ in range(dim)]
+        norm = sum(x * x for x in vector) ** 0.5
+        vectors.append([x / norm for x in vector])
+        index.add(vectors[-1], i)
+
+    found = 0
+    for i in range(50):
+        # 在已有向量上加少量噪声作为查询
+        noisy = [x + rng.gauss(0, 0.05) for x in vectors[i]]
+        norm = sum(x * x for x in noisy) ** 0.5
+        results = index.search([x / norm for x in noisy])
+        if results and results[0][1] == i:
+            found += 1
+
+    print(f"LSH召回: {found}/50")
+    assert found >= 45
+
+def test_index_size_and_latency():
+    """测试768维向量的内存占用（float32紧凑存储）以及添加、检索耗时"""
+    print("\n=== 测试向量索引内存和耗时 ===\n")
+    rng = random.Random(2)
+    dim = 768
+
+    # 每条约 4*dim 字节（Python浮点数列表约为 32*dim 字节）
+    tracemalloc.start()
+    index = VectorIndex(dim)
+    baseline = tracemalloc.get_traced_memory()[0]
+    for i in range(200):
+        index.add([rng.random() - 0.5 for _ in range(dim)], i)
+    per_entry = (tracemalloc.get_traced_memory()[0] - baseline) / 200
+    tracemalloc.stop()
+    print(f"每条内存: {per_entry:.0f} 字节")
+    assert per_entry < dim * 8
+
+    vectors = [[rng.random() - 0.5 for _ in range(dim)] for _ in range(3000)]
+    index = VectorIndex(dim)
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        index.add(vector, i)
+    add_ms = (time.perf_counter() - start) * 1000 / len(vectors)
+
+    queries = [[x + rng.gauss(0, 0.02) for x in vectors[i]] for i in range(50)]
+    start = time.perf_counter()
+    found = sum(1 for i, query in enumerate(queries) if index.search(query)[0][1] == i)
+    search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"添加: {add_ms:.3f}ms/条，检索: {search_ms:.3f}ms/次，召回: {found}/50")
+    assert add_ms < 3 and search_ms < 20
+    assert found >= 45
+
+if __name__ == '__main__':
+    test_paraphrase_hit()
+    test_literal_guard()
+    test_lsh_recall()
+    test_index_size_and_latency()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试SQL提取功能（完整响应和流式响应），不依赖外部服务
+"""
+
+from sql_extractor import SQLStreamExtractor, extract_sql, get_stop_sequences
+
+def test_extract_sql():
+    """测试从完整响应中提取SQL"""
+    print("=== 测试完整响应提取 ===\n")
+
+    test_cases = [
+        ("SELECT * FROM `users`;", "SELECT * FROM `users`"),
+        ("```sql\nSELECT `name` FROM `users`\n```", "SELECT `name` FROM `users`"),
+        ("```\nSELECT 1\n```\n\n解释：这条语句...", "SELECT 1"),
+        ("SQL语句：SELECT `id` FROM `orders`", "SELECT `id` FROM `orders`"),
+        ("好的，查询如下：\nSELECT `id`\nFROM `orders`\n\n这条SQL查询了订单ID", "SELECT `id`\nFROM `orders`"),
+        ("SELECT * FROM `t` WHERE `name` = 'a;b'; 说明", "SELECT * FROM `t` WHERE `name` = 'a;b'"),
+        ("ERROR: 无法生成对应的SQL查询\n因为数据库中没有相关表", "ERROR: 无法生成对应的SQL查询"),
+    ]
+
+    for i, (response, expected) in enumerate(test_cases, 1):
+        result = extract_sql(response)
+        status = "✓ 通过" if result == expected else "✗ 失败"
+        print(f"测试 {i}: {status} - {result!r}")
+        assert result == expected
+
+def test_stream_early_stop():
+    """测试流式提取在SQL完整后提前结束"""
+    print("\n=== 测试流式提前结束 ===\n")
+
+    test_cases = [
+        (["```sql\n", "SELECT `name`\n", "FROM `users`\n", "```", "\n\n这条SQL..."], 4),
+        (["SELECT `name` ", "FROM `users`", ";", " 这条SQL..."], 3),
+        (["SELECT `name` FROM `users`", "\n\n", "说明：..."], 2),
+        (["ERROR: 无法生成", "对应的SQL查询\n", "原因..."], 2),
+        (["SELECT * FROM `t` WHERE `a` = '", ";", "'", ";"], 4),
+    ]
+
+    for i, (chunks, expected_stop) in enumerate(test_cases, 1):
+        extractor = SQLStreamExtractor()
+        stopped_at = None
+        for n, chunk in enumerate(chunks, 1):
+            if extractor.feed(chunk):
+                stopped_at = n
+                break
+        status = "✓ 通过" if stopped_at == expected_stop else "✗ 失败"
+        print(f"测试 {i}: {status} - 第{stopped_at}个片段后结束, SQL: {extractor.get_sql()!r}")
+        assert stopped_at == expected_stop
+
+def test_incomplete_stream():
+    """测试流式输出未结束时不会误判"""
+    extractor = SQLStreamExtractor()
+    assert not extractor.feed("```sql\nSELECT `name` FROM `users`")
+    assert not extractor.feed("\nWHERE `age` > 25\n")
+    assert extractor.get_sql() == "SELECT `name` FROM `users`\nWHERE `age` > 25"
+
+def test_stop_sequences():
+    """测试各后端停止序列数量不超过接口限制"""
+    assert len(get_stop_sequences('qwen_api')) <= 4
+    assert len(get_stop_sequences('gemini')) <= 5
+    assert get_stop_sequences('unknown') == []
+
+if __name__ == '__main__':
+    test_extract_sql()
+    test_stream_early_stop()
+    test_incomplete_stream()
+    test_stop_sequences()
+    print("\n=== 测试完成 ===")
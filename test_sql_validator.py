@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试执行前的SQL结构校验：近似名称的本地修正、不存在的表/字段直接拒绝，以及别名、子查询、CTE等写法不误报
+"""
+
+from schema_formatter import _demo_snapshot
+from sql_validator import SQLValidator, edit_distance, normalize_name
+
+def create_validator():
+    snapshot = _demo_snapshot()
+    snapshot['sys_config'] = {'comment': '参数配置表', 'columns': [
+        {'field': 'config_id', 'type': 'int(5)', 'key': 'PRI', 'null': 'NO', 'comment': '参数主键'},
+        {'field': 'key', 'type': 'varchar(100)', 'key': '', 'null': 'YES', 'comment': '参数键名'},
+        {'field': 'order', 'type': 'int(4)', 'key': '', 'null': 'YES', 'comment': '显示顺序'},
+    ]}
+    return SQLValidator(snapshot)
+
+def test_helpers():
+    """名称归一化和编辑距离"""
+    assert normalize_name('User-Name') == normalize_name('username')
+    assert edit_distance('emial', 'email') == 1
+    assert edit_distance('user_nme', 'user_name') == 1
+    assert edit_distance('abcdef', 'uvwxyz', limit=2) > 2
+
+def test_repair_near_misses():
+    """大小写、下划线、拼写错误和注释名称在本地修正"""
+    print("=== 测试近似名称修正 ===\n")
+    validator = create_validator()
+
+    ok, sql, repairs = validator.validate("SELECT emial, User_Name FROM sys_user WHERE DelFlag = '0'")
+    assert ok
+    # MySQL字段名不区分大小写，User_Name 不需要修改
+    assert sql == "SELECT `email`, User_Name FROM sys_user WHERE `del_flag` = '0'"
+    assert {(r['from'], r['to']) for r in repairs} == {('emial', 'email'), ('DelFlag', 'del_flag')}
+
+    ok, sql, repairs = validator.validate("SELECT u.user_name FROM sys_users u JOIN sys_dept d ON u.dept_id = d.dept_id")
+    assert ok and "FROM `sys_user` u" in sql
+    assert repairs[0]['kind'] == 'table'
+
+    ok, sql, _ = validator.validate("SELECT 用户账号 FROM sys_user")
+    assert ok and sql == "SELECT `user_name` FROM sys_user"
+
+    ok, sql, _ = validator.validate("SELECT key, order FROM sys_config WHERE key = 'a' ORDER BY order")
+    assert ok and sql == "SELECT `key`, `order` FROM sys_config WHERE `key` = 'a' ORDER BY `order`"
+
+    assert validator.get_stats()['repaired'] == 4
+
+def test_reject_impossible():
+    """不存在的表、字段和有歧义的字段直接拒绝，并给出可能的名称"""
+    print("=== 测试拒绝无效SQL ===\n")
+    validator = create_validator()
+
+    ok, error, _ = validator.validate("SELECT login_time FROM sys_user")
+    assert not ok and "login_time" in error and "login_date" in error
+
+    ok, error, _ = validator.validate("SELECT * FROM sys_user_role")
+    assert not ok and "sys_user_role" in error
+
+    ok, error, _ = validator.validate("SELECT status FROM sys_user u JOIN sys_dept d ON u.dept_id = d.dept_id")
+    assert not ok and "status" in error
+
+    ok, error, _ = validator.validate("SELECT usr.user_name FROM sys_user u")
+    assert not ok and "usr" in error
+
+    assert validator.get_stats()['rejected'] == 4
+
+def test_valid_queries_unchanged():
+    """别名、子查询、CTE、派生表、字符串和函数不会被误改"""
+    print("=== 测试合法SQL保持不变 ===\n")
+    validator = create_validator()
+    queries = [
+        "SELECT COUNT(*) AS cnt, d.dept_name FROM sys_user u LEFT JOIN sys_dept d ON u.dept_id = d.dept_id "
+        "GROUP BY d.dept_name ORDER BY cnt DESC",
+        "SELECT user_name FROM sys_user WHERE dept_id IN (SELECT dept_id FROM sys_dept WHERE dept_name = '研发部')",
+        "SELECT t.user_name FROM (SELECT user_name, email FROM sys_user) t WHERE t.email LIKE '%qq%'",
+        "WITH active AS (SELECT user_id, user_name FROM sys_user WHERE status = '0') SELECT user_name FROM active",
+        "SELECT user_name, CASE WHEN sex = '0' THEN '男' ELSE '女' END gender FROM sys_user ORDER BY gender",
+        "SELECT * FROM sys_user WHERE create_time >= DATE_SUB(NOW(), INTERVAL 7 DAY)",
+        "SELECT user_name FROM sys_user UNION SELECT dept_name FROM sys_dept",
+        "SELECT status FROM sys_user JOIN sys_dept USING (dept_id, status)",
+        "SELECT ry.sys_user.user_name FROM ry.sys_user",
+        "SELECT c.key FROM sys_config c",
+        "SELECT user_name, ROW_NUMBER() OVER (PARTITION BY dept_id ORDER BY login_date DESC) AS rn FROM sys_user",
+        "SELECT user_name FROM sys_user WHERE user_name = 'emial' AND status = \"0\"",
+    ]
+    for query in queries:
+        ok, sql, repairs = validator.validate(query)
+        assert ok and sql == query and not repairs, (query, sql)
+
+if __name__ == '__main__':
+    test_helpers()
+    test_repair_near_misses()
+    test_reject_impossible()
+    test_valid_queries_unchanged()
+    print("\n=== 测试完成 ===")
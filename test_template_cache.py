@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试参数化SQL模板缓存，不依赖外部服务
+"""
+
+from template_cache import TemplateCache, extract_question_literals, extract_sql_literals
+
+def test_extract_literals():
+    """测试字面量提取"""
+    print("=== 测试字面量提取 ===\n")
+
+    skeleton, literals = extract_question_literals("查询2024年1月5日之后“张三”的前10条订单")
+    print(f"骨架: {skeleton}, 字面量: {literals}")
+    assert [l['type'] for l in literals] == ['date', 'str', 'num']
+    assert literals[0]['value'] == '2024-01-05'
+
+    sql_literals = extract_sql_literals("SELECT `t1`.`id` FROM `t1` WHERE `name` = 'O''Neil' LIMIT 10")
+    assert [(l['kind'], l['value']) for l in sql_literals] == [('str', "O'Neil"), ('num', '10')]
+
+def test_fill_template():
+    """测试学习模板并填入新值"""
+    print("\n=== 测试模板填值 ===\n")
+
+    cache = TemplateCache()
+    cache.learn("查找年龄大于25岁的用户", "SELECT * FROM `users` WHERE `age` > 25", "s")
+    cache.learn("查询“张三”在2024-01-05之后的前10条订单",
+                "SELECT * FROM `orders` WHERE `user_name` = '张三' AND `created_at` > '2024-01-05 00:00:00' LIMIT 10", "s")
+
+    result = cache.lookup("查找年龄大于30岁的用户", "s")
+    print(f"数字替换: {result}")
+    assert result == "SELECT * FROM `users` WHERE `age` > 30"
+
+    result = cache.lookup("查询“李四”在2024/2/1之后的前5条订单", "s")
+    print(f"多参数替换: {result}")
+    assert result == ("SELECT * FROM `orders` WHERE `user_name` = '李四' "
+                      "AND `created_at` > '2024-02-01 00:00:00' LIMIT 5")
+
+    # 其他作用域不会命中
+    assert cache.lookup("查找年龄大于30岁的用户", "other") is None
+
+def test_ambiguity_fallback():
+    """测试存在歧义时放弃复用"""
+    cache = TemplateCache()
+
+    # 问题中的1在SQL中出现了两次，无法确定替换哪一个
+    cache.learn("查询1号部门的用户", "SELECT * FROM `users` WHERE `dept_id` = 1 AND `status` = 1", "s")
+    assert cache.lookup("查询2号部门的用户", "s") is None
+
+    # 数字在SQL中找不到对应位置
+    cache.learn("查询最近7天的订单", "SELECT * FROM `orders` WHERE `created_at` > NOW() - INTERVAL 1 WEEK", "s")
+    assert cache.lookup("查询最近30天的订单", "s") is None
+
+    # 整数和小数不能互换
+    cache.learn("查询前10条用户", "SELECT * FROM `users` LIMIT 10", "s")
+    assert cache.lookup("查询前2.5条用户", "s") is None
+
+    # 同一骨架学到不同结构后停用
+    cache.learn("查询金额大于100的订单", "SELECT * FROM `orders` WHERE `amount` > 100", "s")
+    cache.learn("查询金额大于200的订单", "SELECT * FROM `orders` WHERE `total` > 200", "s")
+    assert cache.lookup("查询金额大于300的订单", "s") is None
+    assert cache.get_stats()['conflicts'] == 1
+
+def test_negative_numbers():
+    """测试负数保留符号，正负号不同时放弃复用"""
+    print("\n=== 测试负数 ===\n")
+
+    _, literals = extract_question_literals("余额大于-5且编号在1-3之间")
+    assert [l['value'] for l in literals] == ['-5', '1', '3']
+    sql_literals = extract_sql_literals("SELECT `a` - 5, `b` FROM `t` WHERE `balance` > -5 AND `c` IN (- 2)")
+    assert [l['value'] for l in sql_literals] == ['5', '-5', '-2']
+
+    cache = TemplateCache()
+    cache.learn("余额大于-5的用户", "SELECT * FROM `users` WHERE `balance` > -5", "s")
+
+    result = cache.lookup("余额大于-10的用户", "s")
+    print(f"负数替换: {result}")
+    assert result == "SELECT * FROM `users` WHERE `balance` > -10"
+
+    # 正负号不同，不能只替换数字部分（否则会得到 > -10）
+    assert cache.lookup("余额大于10的用户", "s") is None
+
+    cache.learn("余额小于100的用户", "SELECT * FROM `users` WHERE `balance` < 100", "s")
+    assert cache.lookup("余额小于-100的用户", "s") is None
+    assert cache.lookup("余额小于200的用户", "s") == "SELECT * FROM `users` WHERE `balance` < 200"
+
+def test_escape_string_values():
+    """测试字符串值中的反斜杠被转义，结尾的反斜杠不会转义掉闭合引号"""
+    cache = TemplateCache()
+    cache.learn('查询名字为"张三"的用户', "SELECT * FROM `users` WHERE `name` = '张三'", "s")
+
+    result = cache.lookup('查询名字为"ab\\"的用户', "s")
+    print(f"反斜杠转义: {result}")
+    assert result == "SELECT * FROM `users` WHERE `name` = 'ab\\\\'"
+
+    result = cache.lookup('查询名字为“C:\\temp”的用户', "s")
+    assert result == "SELECT * FROM `users` WHERE `name` = 'C:\\\\temp'"
+
+if __name__ == '__main__':
+    test_extract_literals()
+    test_fill_template()
+    test_ambiguity_fallback()
+    test_negative_numbers()
+    test_escape_string_values()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提示词token数估算
+不依赖具体模型的分词器，按中文字符、英文单词、数字和符号分别估算，
+用于比较不同结构描述方式的提示词长度
+"""
+
+import re
+
+_TOKEN_PATTERN = re.compile(r'[一-鿿㐀-䶿豈-﫿]|[A-Za-z]+|\d+|\S')
+
+def estimate_tokens(text):
+    """
+    估算文本的token数
+
+    中文每个字约1个token，英文单词每4个字母约1个token，数字每3位约1个token，
+    其他符号每个1个token
+    """
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text or ''):
+        token = match.group(0)
+        if token[0].isascii() and token[0].isalpha():
+            count += (len(token) + 3) // 4
+        elif token[0].isdigit():
+            count += (len(token) + 2) // 3
+        else:
+            count += 1
+    return count
+
+if __name__ == '__main__':
+    for sample in ["查询所有用户的姓名和邮箱", "SELECT `name`, `email` FROM `users` LIMIT 100"]:
+        print(f"{estimate_tokens(sample):>4}  {sample}")
@@ -10,6 +10,12 @@ from flask_cors import CORS
 import json
 import configparser
 from main import NaturalLanguageToSQL
+from llm_executor import get_llm_executor
+from llm_metrics import get_llm_metrics
+from rate_limiter import get_rate_limiter_stats
+from model_list_cache import get_model_list_cache
+from llm_cassette import get_cassette
+from join_graph import format_join_condition
 import os
 import threading
 import time
@@ -21,6 +27,16 @@ CORS(app)
 sql_tool = None
 tool_lock = threading.Lock()
 
+def get_ollama_url(config='config.ini'):
+    """读取Ollama服务地址：配置文件 [llm] ollama_url，其次环境变量 OLLAMA_URL，默认本机11434端口"""
+    config_parser = configparser.ConfigParser()
+    try:
+        config_parser.read(config, encoding='utf-8')
+    except configparser.Error as e:
+        print(f"🚀 [Web] 读取配置文件失败: {e}")
+    url = config_parser.get('llm', 'ollama_url', fallback='').strip()
+    return url or os.getenv('OLLAMA_URL') or 'http://localhost:11434'
+
 def initialize_tool(backend='ollama', model='qwen2', config='config.ini', api_key=None):
     """初始化SQL工具"""
     global sql_tool
@@ -54,12 +70,32 @@ def initialize_tool(backend='ollama', model='qwen2', config='config.ini', api_ke
                 except Exception as e:
                     print(f"🚀 [Web] 读取配置文件失败: {e}，将使用环境变量")
                 
+            # 停止旧实例的后台健康监控，清除其服务端上下文缓存
+            if sql_tool:
+                sql_tool.health_monitor.stop()
+                for generator in sql_tool.local_generators():
+                    generator.stop_keep_warm()
+                if hasattr(sql_tool.sql_generator, 'invalidate_context_cache'):
+                    sql_tool.sql_generator.invalidate_context_cache()
+                if sql_tool.hedged_generator is not None:
+                    sql_tool.hedged_generator.shutdown()
+            
             print("🚀 [Web] 创建 NaturalLanguageToSQL 实例...")
-            sql_tool = NaturalLanguageToSQL(config, backend, model, "http://localhost:11434", api_key)
+            ollama_url = get_ollama_url(config)
+            print(f"🚀 [Web] Ollama服务地址: {ollama_url}")
+            sql_tool = NaturalLanguageToSQL(config, backend, model, ollama_url, api_key)
             
             print("🚀 [Web] 调用工具初始化方法...")
             success = sql_tool.initialize()
             
+            # 初始化成功后才在后台定期探测AI模型状态，请求路径只读取缓存结果
+            if success:
+                sql_tool.health_monitor.start()
+            
+            # 后台预先获取模型列表，打开模型选择时直接使用缓存
+            if sql_tool.llm_backend in ('ollama', 'gemini'):
+                threading.Thread(target=sql_tool.sql_generator.get_available_models, daemon=True).start()
+            
             # 即使AI模型连接失败，也检查数据库连接是否成功
             print("🚀 [Web] 检查数据库连接状态...")
             db_connected = False
@@ -167,21 +203,13 @@ def api_query():
                         'error': f'数据库连接失败: {str(e)}'
                     })
                     
-            # 检查AI模型连接状态
-            if not sql_tool.sql_generator.test_connection():
-                print("🔄 AI模型连接失败，尝试重新连接...")
-                try:
-                    # 重新测试连接
-                    if not sql_tool.sql_generator.test_connection():
-                        return jsonify({
-                            'success': False,
-                            'error': 'AI模型连接失败，请检查Ollama服务是否正常运行'
-                        })
-                except Exception as e:
-                    return jsonify({
-                        'success': False,
-                        'error': f'AI模型连接失败: {str(e)}'
-                    })
+            # 检查AI模型连接状态（读取健康监控缓存，仅在状态异常时重新探测；配置了降级链时任一后端可用即可）
+            ai_available, ai_message = sql_tool.ensure_llm_available()
+            if not ai_available:
+                return jsonify({
+                    'success': False,
+                    'error': f"AI模型连接失败: {ai_message}"
+                })
                     
             # 直接使用新的Web专用方法处理查询
             result = sql_tool.process_query_for_web(user_query, selected_tables)
@@ -250,7 +278,7 @@ def api_tables():
 
 @app.route('/api/models', methods=['GET'])
 def api_models():
-    """获取可用模型API"""
+    """获取可用模型API（使用模型列表缓存，?refresh=1 时重新获取）"""
     global sql_tool
     
     if not sql_tool:
@@ -259,10 +287,11 @@ def api_models():
             'error': '工具未初始化，请先初始化'
         })
     
+    refresh = request.args.get('refresh') in ('1', 'true')
     try:
         with tool_lock:
             if sql_tool.llm_backend == 'ollama':
-                models = sql_tool.sql_generator.get_available_models()
+                models = sql_tool.sql_generator.get_available_models(refresh)
                 return jsonify({
                     'success': True,
                     'backend': 'ollama',
@@ -270,7 +299,7 @@ def api_models():
                     'current': sql_tool.model_name
                 })
             elif sql_tool.llm_backend == 'gemini':
-                models = sql_tool.sql_generator.get_available_models()
+                models = sql_tool.sql_generator.get_available_models(refresh)
                 return jsonify({
                     'success': True,
                     'backend': 'gemini',
@@ -315,6 +344,44 @@ def api_table_columns(table_name):
             'error': f'获取表字段信息失败: {str(e)}'
         })
 
+@app.route('/api/join-path', methods=['GET'])
+def api_join_path():
+    """在本地计算两个表之间的最短关联路径API"""
+    global sql_tool
+
+    if not sql_tool:
+        return jsonify({
+            'success': False,
+            'error': '工具未初始化，请先初始化'
+        })
+
+    source = request.args.get('from', '')
+    target = request.args.get('to', '')
+    if not source or not target:
+        return jsonify({
+            'success': False,
+            'error': '请提供 from 和 to 两个表名'
+        })
+
+    try:
+        with tool_lock:
+            path = sql_tool.find_join_path(source, target)
+        if path is None:
+            return jsonify({
+                'success': False,
+                'error': f'未找到 {source} 与 {target} 之间的关联路径'
+            })
+        return jsonify({
+            'success': True,
+            'path': [format_join_condition(edge) for edge in path],
+            'edges': path
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'计算关联路径失败: {str(e)}'
+        })
+
 @app.route('/api/execute-sql', methods=['POST'])
 def api_execute_sql():
     """直接执行SQL查询API"""
@@ -600,7 +667,7 @@ def api_get_model_config():
         config = {
             'backend': 'ollama',
             'model': 'qwen2',
-            'ollama_url': 'http://localhost:11434',
+            'ollama_url': get_ollama_url(config_file),
             'api_key': ''
         }
         
@@ -608,6 +675,7 @@ def api_get_model_config():
         if sql_tool:
             config['backend'] = sql_tool.llm_backend
             config['model'] = sql_tool.model_name
+            config['ollama_url'] = sql_tool.ollama_url
         
         # 从配置文件读取API Key
         if os.path.exists(config_file):
@@ -697,11 +765,9 @@ def api_status():
     except:
         db_connected = False
         
-    ai_connected = False
-    try:
-        ai_connected = sql_tool.sql_generator.test_connection()
-    except:
-        ai_connected = False
+    # 读取后台健康监控的缓存状态，不在此处调用模型
+    ai_status = sql_tool.health_monitor.get_status()
+    ai_connected = any(sql_tool.health_monitor.is_healthy(backend) for backend in sql_tool.llm_backends())
     
     return jsonify({
         'initialized': True,
@@ -709,9 +775,50 @@ def api_status():
         'model': sql_tool.model_name,
         'database': database_name,
         'db_connected': db_connected,
-        'ai_connected': ai_connected
+        'ai_connected': ai_connected,
+        'ai_status': ai_status
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """获取运行指标API"""
+    metrics = {
+        'success': True,
+        'executor': get_llm_executor().get_metrics(),
+        'llm': get_llm_metrics().get_stats()
+    }
+    if sql_tool and sql_tool.generation_cache is not None:
+        metrics['generation_cache'] = sql_tool.generation_cache.get_stats()
+    if sql_tool and sql_tool.template_cache is not None:
+        metrics['template_cache'] = sql_tool.template_cache.get_stats()
+    if sql_tool and sql_tool.semantic_cache is not None:
+        metrics['semantic_cache'] = sql_tool.semantic_cache.get_stats()
+    if sql_tool and hasattr(sql_tool.sql_generator, 'get_cache_stats'):
+        metrics['context_cache'] = sql_tool.sql_generator.get_cache_stats()
+    if sql_tool and hasattr(sql_tool.sql_generator, 'get_timing_stats'):
+        metrics['llm_timing'] = sql_tool.sql_generator.get_timing_stats()
+    if sql_tool and sql_tool.local_generators():
+        metrics['residency'] = [generator.get_residency_status() for generator in sql_tool.local_generators()]
+    if sql_tool and sql_tool.hedged_generator is not None:
+        metrics['hedging'] = sql_tool.hedged_generator.get_stats()
+    if sql_tool and sql_tool.fallback_chain is not None:
+        metrics['fallback'] = sql_tool.fallback_chain.get_stats()
+    if sql_tool and sql_tool.example_store is not None:
+        metrics['examples'] = sql_tool.example_store.get_stats()
+    if sql_tool and sql_tool.followup_rewriter is not None:
+        metrics['followup'] = sql_tool.followup_rewriter.get_stats()
+    if sql_tool and sql_tool.rule_parser is not None:
+        metrics['rules'] = sql_tool.rule_parser.get_stats()
+    if sql_tool and sql_tool.sql_validator is not None:
+        metrics['sql_validator'] = sql_tool.sql_validator.get_stats()
+    metrics['model_lists'] = get_model_list_cache().get_stats()
+    if get_cassette() is not None:
+        metrics['cassette'] = get_cassette().get_stats()
+    rate_limits = get_rate_limiter_stats()
+    if rate_limits:
+        metrics['rate_limit'] = rate_limits
+    return jsonify(metrics)
+
 if __name__ == '__main__':
     import argparse
     